@@ -25,6 +25,11 @@ locals {
   "dynamodb_results_pull_interval_sec" : ${var.dynamodb_results_pull_interval_sec},
   "agent_task_visibility_timeout_sec" : ${var.agent_task_visibility_timeout_sec},
   "task_input_passed_via_external_storage" : ${var.task_input_passed_via_external_storage},
+  "payload_codec" : "${var.payload_codec}",
+  "task_input_deduplication" : ${var.task_input_deduplication},
+  "agent_cache_memory_size_mb" : ${var.agent_cache_memory_size_mb},
+  "agent_cache_dir" : "${var.agent_cache_dir}",
+  "agent_cache_disk_size_mb" : ${var.agent_cache_disk_size_mb},
   "lambda_name_ttl_checker": "${local.lambda_name_ttl_checker}",
   "lambda_name_submit_tasks": "${local.lambda_name_submit_tasks}",
   "lambda_name_get_results": "${local.lambda_name_get_results}",
@@ -32,6 +37,14 @@ locals {
   "s3_bucket": "${module.control_plane.htc_data_bucket_name}",
   "s3_kms_key_id": "${module.control_plane.htc_data_bucket_key_arn}",
   "grid_storage_service" : "${var.grid_storage_service}",
+  "grid_storage_compression" : ${jsonencode(var.grid_storage_compression)},
+  "grid_storage_transfer" : ${jsonencode(var.grid_storage_transfer)},
+  "grid_storage_redis_pool" : ${jsonencode(var.grid_storage_redis_pool)},
+  "grid_storage_ttl" : ${jsonencode(var.grid_storage_ttl)},
+  "grid_storage_blob_expiration_days" : ${var.grid_storage_blob_expiration_days},
+  "grid_storage_local_dir" : "${var.grid_storage_local_dir}",
+  "grid_storage_local_hard_links" : ${var.grid_storage_local_hard_links},
+  "grid_storage_write_behind" : ${var.grid_storage_write_behind},
   "task_queue_service" : "${var.task_queue_service}",
   "task_queue_config" : "${var.task_queue_config}",
   "tasks_queue_name": "${local.tasks_queue_name}",
@@ -42,6 +55,11 @@ locals {
   "error_logging_stream" : "${local.error_logging_stream}",
   "metrics_are_enabled": "${local.metrics_are_enabled_effective}",
   "metrics_grafana_private_ip": "influxdb.influxdb",
+  "metrics_background_flush": ${var.metrics_background_flush},
+  "metrics_summary": ${jsonencode(var.metrics_summary)},
+  "tracing": ${jsonencode(var.tracing)},
+  "profiler": ${jsonencode(var.agent_profiler)},
+  "logging": ${jsonencode(var.agent_logging)},
   "metrics_submit_tasks_lambda_connection_string": "${var.metrics_submit_tasks_lambda_connection_string}",
   "metrics_cancel_tasks_lambda_connection_string": "${var.metrics_cancel_tasks_lambda_connection_string}",
   "metrics_pre_agent_connection_string": "${var.metrics_pre_agent_connection_string}",
@@ -56,7 +56,8 @@ resource "aws_iam_policy" "htc_agent_permissions" {
         "s3:DeleteObject",
         "s3:GetObject",
         "s3:PutObject",
-        "s3:PutObjectAcl"
+        "s3:PutObjectAcl",
+        "s3:PutObjectTagging"
       ],
       "Resource": ${jsonencode([for k in local.s3_bucket_arns : "${k}/*"])},
       "Effect": "Allow"
@@ -183,7 +184,8 @@ resource "aws_iam_policy" "lambda_data_policy" {
         "s3:DeleteObject",
         "s3:GetObject",
         "s3:PutObject",
-        "s3:PutObjectAcl"
+        "s3:PutObjectAcl",
+        "s3:PutObjectTagging"
       ],
       "Resource": ${jsonencode([for k in local.s3_bucket_arns : "${k}/*"])},
       "Effect": "Allow"
@@ -116,6 +116,7 @@ module "get_results" {
     REDIS_URL                                    = aws_elasticache_replication_group.htc_data_cache.primary_endpoint_address,
     REDIS_PASSWORD                               = random_password.htc_data_cache_password.result,
     GRID_STORAGE_SERVICE                         = var.grid_storage_service,
+    TRACING_CONFIG                               = var.tracing,
     TASK_QUEUE_SERVICE                           = var.task_queue_service,
     TASK_QUEUE_CONFIG                            = var.task_queue_config,
     METRICS_ARE_ENABLED                          = var.metrics_are_enabled,
@@ -106,19 +106,20 @@ module "scaling_metrics" {
   tracing_mode          = "Active"
 
   environment_variables = {
-    STATE_TABLE_CONFIG   = var.ddb_state_table,
-    NAMESPACE            = var.namespace_metrics,
-    DIMENSION_NAME       = var.dimension_name_metrics,
-    DIMENSION_VALUE      = var.cluster_name,
-    PERIOD               = var.period_metrics,
-    METRICS_NAME         = var.metric_name,
-    SQS_QUEUE_NAME       = var.sqs_queue,
-    REGION               = var.region
-    TASK_QUEUE_SERVICE   = var.task_queue_service,
-    TASK_QUEUE_CONFIG    = var.task_queue_config,
-    ERROR_LOG_GROUP      = var.error_log_group,
-    ERROR_LOGGING_STREAM = var.error_logging_stream,
-    TASKS_QUEUE_NAME     = var.tasks_queue_name,
+    STATE_TABLE_CONFIG        = var.ddb_state_table,
+    NAMESPACE                 = var.namespace_metrics,
+    DIMENSION_NAME            = var.dimension_name_metrics,
+    DIMENSION_VALUE           = var.cluster_name,
+    PERIOD                    = var.period_metrics,
+    METRICS_NAME              = var.metric_name,
+    SQS_QUEUE_NAME            = var.sqs_queue,
+    REGION                    = var.region
+    TASK_QUEUE_SERVICE        = var.task_queue_service,
+    TASK_QUEUE_CONFIG         = var.task_queue_config,
+    ERROR_LOG_GROUP           = var.error_log_group,
+    ERROR_LOGGING_STREAM      = var.error_logging_stream,
+    TASKS_QUEUE_NAME          = var.tasks_queue_name,
+    QUEUE_DEPTH_CACHE_TTL_SEC = var.queue_depth_cache_ttl_sec,
   }
 
   tags = {
@@ -117,6 +117,8 @@ module "submit_task" {
     ERROR_LOGGING_STREAM                          = var.error_logging_stream,
     TASK_INPUT_PASSED_VIA_EXTERNAL_STORAGE        = var.task_input_passed_via_external_storage,
     GRID_STORAGE_SERVICE                          = var.grid_storage_service,
+    GRID_STORAGE_COMPRESSION                      = var.grid_storage_compression,
+    TRACING_CONFIG                                = var.tracing,
     TASK_QUEUE_SERVICE                            = var.task_queue_service,
     TASK_QUEUE_CONFIG                             = var.task_queue_config,
     S3_BUCKET                                     = module.htc_data_bucket.s3_bucket_id, #aws_s3_bucket.htc_data_bucket.id,
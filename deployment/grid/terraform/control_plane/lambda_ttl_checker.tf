@@ -118,6 +118,7 @@ module "ttl_checker" {
     ERROR_LOG_GROUP                              = var.error_log_group,
     ERROR_LOGGING_STREAM                         = var.error_logging_stream,
     METRICS_GRAFANA_PRIVATE_IP                   = var.nlb_influxdb,
+    QUEUE_DEPTH_CACHE_TTL_SEC                    = var.queue_depth_cache_ttl_sec,
     REGION                                       = var.region
   }
 
@@ -88,6 +88,24 @@ module "htc_data_bucket" {
     mfa_delete = false
   }
 
+  # Content addressed blobs are shared between sessions and kept by purge_session, clients
+  # tag them and upload them again once half of this expiration has elapsed
+  lifecycle_rule = var.grid_storage_blob_expiration_days > 0 ? [
+    {
+      id      = "expire-blobs"
+      enabled = true
+      filter = {
+        tags = { htc_grid_value = "blob" }
+      }
+      expiration = {
+        days = var.grid_storage_blob_expiration_days
+      }
+      noncurrent_version_expiration = {
+        days = 1
+      }
+    }
+  ] : []
+
   server_side_encryption_configuration = {
     rule = {
       apply_server_side_encryption_by_default = {
@@ -53,6 +53,21 @@ variable "grid_storage_service" {
   type        = string
 }
 
+variable "grid_storage_compression" {
+  description = "JSON compression configuration of the values stored in the data plane"
+  type        = string
+}
+
+variable "grid_storage_blob_expiration_days" {
+  description = "Days after which the content addressed blobs are deleted from the S3 bucket, 0 keeps them"
+  type        = number
+}
+
+variable "tracing" {
+  description = "JSON configuration of the distributed tracing of the tasks"
+  type        = string
+}
+
 variable "task_queue_service" {
   description = "Configuration string for the type of queuing service to use"
   type        = string
@@ -268,6 +283,11 @@ variable "dimension_name_metrics" {
   type        = string
 }
 
+variable "queue_depth_cache_ttl_sec" {
+  description = "How long the TTL checker and scaling metrics Lambdas reuse a sweep of the task queue depth"
+  type        = number
+}
+
 variable "period_metrics" {
   description = "Period for metrics in minutes"
   type        = number
@@ -170,8 +170,12 @@ module "control_plane" {
   sqs_dlq                                = local.sqs_dlq
   s3_bucket                              = local.s3_bucket
   grid_storage_service                   = var.grid_storage_service
+  grid_storage_compression               = var.grid_storage_compression
+  grid_storage_blob_expiration_days      = var.grid_storage_blob_expiration_days
+  tracing                                = var.tracing
   task_queue_service                     = var.task_queue_service
   task_queue_config                      = var.task_queue_config
+  queue_depth_cache_ttl_sec              = var.queue_depth_cache_ttl_sec
   state_table_service                    = var.state_table_service
   state_table_config                     = var.state_table_config
   task_input_passed_via_external_storage = var.task_input_passed_via_external_storage
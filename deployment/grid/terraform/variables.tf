@@ -199,6 +199,48 @@ variable "grid_storage_service" {
   default     = "S3 htc-data-bucket-1"
 }
 
+variable "grid_storage_compression" {
+  description = "JSON compression configuration of the values stored in the data plane, e.g. {\"algorithm\": \"zstd\", \"threshold_bytes\": 1024}"
+  type        = string
+  default     = "{}"
+}
+
+variable "grid_storage_transfer" {
+  description = "JSON S3 transfer configuration of the data plane, e.g. {\"profile\": \"large_results\", \"max_concurrency\": 16}"
+  type        = string
+  default     = "{}"
+}
+
+variable "grid_storage_redis_pool" {
+  description = "JSON configuration of the redis connection pool of the data plane, e.g. {\"max_connections\": 64, \"socket_timeout_sec\": 2, \"cluster\": true}"
+  type        = string
+  default     = "{}"
+}
+
+variable "grid_storage_ttl" {
+  description = "JSON expiration in seconds of the values kept in redis by kind (input, payload, output, error, blob, consumed_output), e.g. {\"input\": 86400, \"output\": 86400, \"consumed_output\": 300}"
+  type        = string
+  default     = "{}"
+}
+
+variable "grid_storage_blob_expiration_days" {
+  description = "Days after which the content addressed blobs (deduplicated task inputs and shared data) are deleted from the S3 bucket, blobs still referenced by new sessions are uploaded again before. 0 keeps them"
+  type        = number
+  default     = 30
+}
+
+variable "grid_storage_local_dir" {
+  description = "With the LOCAL grid_storage_service, root directory of the values on a filesystem shared by the agents and the clients"
+  type        = string
+  default     = ""
+}
+
+variable "grid_storage_local_hard_links" {
+  description = "With the LOCAL grid_storage_service, hard link the files put and got by the agents and the clients instead of copying them (1) or copy them (0)"
+  type        = number
+  default     = 0
+}
+
 variable "state_table_service" {
   description = "State Table service type"
   type        = string
@@ -241,6 +283,36 @@ variable "metrics_are_enabled" {
   default     = 1
 }
 
+variable "metrics_background_flush" {
+  description = "If set to 1 the agents submit their metrics from a background thread, off the task completion path"
+  type        = number
+  default     = 1
+}
+
+variable "metrics_summary" {
+  description = "JSON configuration of the percentile summaries of the agent metrics (interval_sec, raw_sample_rate, percentiles, include_buckets), e.g. {\"interval_sec\": 60, \"raw_sample_rate\": 0.01}, disabled if empty"
+  type        = string
+  default     = "{}"
+}
+
+variable "tracing" {
+  description = "JSON configuration of the distributed tracing of the tasks (sample_rate, file, otlp_endpoint, service_name), e.g. {\"sample_rate\": 0.01, \"otlp_endpoint\": \"http://otel-collector:4318\"}"
+  type        = string
+  default     = "{}"
+}
+
+variable "agent_profiler" {
+  description = "JSON configuration of the sampling profiler of the agents (enabled, interval_ms, flush_interval_sec, directory, data_plane, max_depth, all_threads), e.g. {\"directory\": \"/tmp/profiles\"}. Profiling starts if enabled or on SIGUSR2"
+  type        = string
+  default     = "{}"
+}
+
+variable "agent_logging" {
+  description = "JSON configuration of the logging of the agents (level, loggers, max_payload_chars, format), e.g. {\"level\": \"WARNING\", \"format\": \"json\"}"
+  type        = string
+  default     = "{}"
+}
+
 variable "metrics_submit_tasks_lambda_connection_string" {
   description = "The type and the connection string for the downstream"
   type        = string
@@ -325,6 +397,12 @@ variable "lambda_name_node_drainer" {
   default     = "node_drainer"
 }
 
+variable "queue_depth_cache_ttl_sec" {
+  description = "How long the TTL checker and scaling metrics Lambdas reuse a sweep of the task queue depth, 0 disables caching"
+  type        = number
+  default     = 5
+}
+
 variable "period_metrics" {
   description = "Period for metrics in minutes"
   type        = string
@@ -432,14 +510,50 @@ variable "task_input_passed_via_external_storage" {
   default     = 1
 }
 
+variable "task_input_deduplication" {
+  description = "Store identical task inputs once under their content hash (1) or once per task (0)"
+  type        = number
+  default     = 0
+}
+
+variable "grid_storage_write_behind" {
+  description = "With S3+REDIS, agents acknowledge outputs once written to Redis and persist them to S3 in background (1) or synchronously (0)"
+  type        = number
+  default     = 0
+}
+
+variable "agent_cache_memory_size_mb" {
+  description = "Size of the in-memory cache of shared task inputs of each agent"
+  type        = number
+  default     = 16
+}
+
+variable "agent_cache_dir" {
+  description = "Directory of the on-disk cache of shared task inputs, shared by the agents of a node (disabled if empty)"
+  type        = string
+  default     = ""
+}
+
+variable "agent_cache_disk_size_mb" {
+  description = "Size of the on-disk cache of shared task inputs, for the whole node when agent_cache_dir is shared by its agents"
+  type        = number
+  default     = 1024
+}
+
+variable "payload_codec" {
+  description = "Codec of the task payloads written to the grid storage: base64 (legacy), json, msgpack, pickle or raw"
+  type        = string
+  default     = "base64"
+}
+
 variable "metrics_pre_agent_connection_string" {
-  description = "pre agent connection string for monitoring"
+  description = "pre agent connection string for monitoring, \"prometheus <port> <metric_prefix>\" to serve the metrics on http://<pod>:<port>/metrics instead of pushing them"
   type        = string
   default     = "influxdb 8086 measurementsdb agent_pre"
 }
 
 variable "metrics_post_agent_connection_string" {
-  description = "post agent connection string for monitoring"
+  description = "post agent connection string for monitoring, \"prometheus <port> <metric_prefix>\" to serve the metrics on http://<pod>:<port>/metrics instead of pushing them"
   type        = string
   default     = "influxdb 8086 measurementsdb agent_post"
 }
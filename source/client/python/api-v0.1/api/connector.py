@@ -11,8 +11,20 @@ import botocore
 import requests
 import logging
 
-from api.in_out_manager import in_out_manager
+from api.in_out_manager import in_out_manager, content_key, shared_data_ref
+from utils.grid_tracing import Tracer, tracer_from_config
+from utils.stage_clock import NS_PER_MS, new_task_stats, wall_clock_ns
+from utils.grid_logging import truncated
 from utils.state_table_common import TASK_STATE_FINISHED
+from utils.payload_codec import (
+    PAYLOAD_CODEC_JSON,
+    PAYLOAD_CODEC_LEGACY,
+    PAYLOAD_CODEC_MSGPACK,
+    decode_payload,
+    encode_payload,
+    get_payload_codec,
+    validate_payload_codec,
+)
 from warrant_lite import WarrantLite
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -34,7 +46,8 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
     level=logging.INFO,
 )
-logging.info("Init AWS Grid Connector")
+logger = logging.getLogger(__name__)
+logger.info("Init AWS Grid Connector")
 
 
 # where we read these settings, they must be configurable from clients code
@@ -78,10 +91,13 @@ class AWSConnector:
         self.__configuration = None
         self.__api_client = None
         self.__default_api_client = None
+        self.__tracer = Tracer()
+        # Root span context of the traced sessions, parent of the get_results spans
+        self.__trace_contexts = {}
 
     def refresh(self):
         """This method refreshes an expired JWT. The new JWT  overrides the existing one"""
-        logging.info("starting cognito refresh")
+        logger.info("starting cognito refresh")
         try:
             tokens = self.__cognito_client.initiate_auth(
                 ClientId=self.__user_pool_client_id,
@@ -91,9 +107,9 @@ class AWSConnector:
                 },
             )
             self.__user_token_id = tokens["AuthenticationResult"]["IdToken"]
-            logging.info("successfully cognito token refreshed")
+            logger.info("successfully cognito token refreshed")
         except botocore.exceptions.ClientError:
-            logging.exception("Failed while refreshing cognito token")
+            logger.exception("Failed while refreshing cognito token")
 
     def init(
         self,
@@ -116,7 +132,7 @@ class AWSConnector:
         Returns:
             Nothing
         """
-        logging.info("AGENT:", agent_config_data)
+        logger.info("AGENT: %s", agent_config_data)
         self.in_out_manager = in_out_manager(
             agent_config_data["grid_storage_service"],
             agent_config_data["s3_bucket"],
@@ -126,6 +142,16 @@ class AWSConnector:
             s3_region=agent_config_data["region"],
             s3_custom_resource=s3_custom_resource,
             redis_custom_connection=redis_custom_connection,
+            compression_config=agent_config_data.get("grid_storage_compression"),
+            transfer_config=agent_config_data.get("grid_storage_transfer"),
+            redis_pool_config=agent_config_data.get("grid_storage_redis_pool"),
+            ttl_config=agent_config_data.get("grid_storage_ttl"),
+            local_dir=agent_config_data.get("grid_storage_local_dir"),
+            local_hard_links=agent_config_data.get("grid_storage_local_hard_links", 0)
+            == 1,
+            blob_expiration_days=agent_config_data.get(
+                "grid_storage_blob_expiration_days", 0
+            ),
         )
         self.__api_gateway_endpoint = ""
         self.__public_api_gateway_endpoint = agent_config_data["public_api_gateway_url"]
@@ -143,6 +169,26 @@ class AWSConnector:
         self.__task_input_passed_via_external_storage = agent_config_data[
             "task_input_passed_via_external_storage"
         ]
+        # Codec used to write task inputs and session submissions, see utils.payload_codec.
+        # The legacy (base64) default keeps payloads readable by agents and lambdas that
+        # predate the framed payload format.
+        self.__payload_codec = agent_config_data.get(
+            "payload_codec", PAYLOAD_CODEC_LEGACY
+        )
+        validate_payload_codec(self.__payload_codec)
+        # Task outputs are only unpickled when explicitly enabled: anyone able to write to
+        # the data plane controls their content.
+        self.__payload_allow_pickle_outputs = agent_config_data.get(
+            "payload_allow_pickle_outputs", 0
+        )
+        # When enabled, identical task inputs are uploaded once under their content hash
+        self.__task_input_deduplication = agent_config_data.get(
+            "task_input_deduplication", 0
+        )
+        # Sessions are traced across the grid, see utils.grid_tracing
+        self.__tracer = tracer_from_config(
+            agent_config_data.get("tracing"), background=True
+        )
         self.__user_token_id = None
         if cognitoidp_client is None:
             self.__cognito_client = boto3.client(
@@ -151,9 +197,9 @@ class AWSConnector:
         else:
             self.__cognito_client = cognitoidp_client
         self.__intra_vpc = False
-        logging.warning("Check Private Mode")
+        logger.warning("Check Private Mode")
         if os.environ.get("INTRA_VPC"):
-            logging.warning("The client is running inside the VPC")
+            logger.warning("The client is running inside the VPC")
             self.__intra_vpc = True
         self.__authorization_headers = {}
         if self.__intra_vpc:
@@ -165,27 +211,27 @@ class AWSConnector:
             self.__configuration = Configuration(host=self.__api_gateway_endpoint)
 
         self.__scheduler = BackgroundScheduler()
-        logging.info("LAMBDA_ENDPOINT_URL:{}".format(self.__api_gateway_endpoint))
-        logging.info(
+        logger.info("LAMBDA_ENDPOINT_URL:{}".format(self.__api_gateway_endpoint))
+        logger.info(
             "dynamodb_results_pull_interval_sec:{}".format(
                 self.__dynamodb_results_pull_intervall
             )
         )
-        logging.info(
+        logger.info(
             "task_input_passed_via_external_storage:{}".format(
                 self.__task_input_passed_via_external_storage
             )
         )
-        logging.info(
+        logger.info(
             "grid_storage_service:{}".format(agent_config_data["grid_storage_service"])
         )
-        logging.info("AWSConnector Initialized")
-        logging.info("init with {}".format(self.__user_pool_client_id))
-        logging.info("init with {}".format(self.__cognito_client))
+        logger.info("AWSConnector Initialized")
+        logger.info("init with {}".format(self.__user_pool_client_id))
+        logger.info("init with {}".format(self.__cognito_client))
 
     def authenticate(self):
         """This method authenticates against a Cognito User Pool. The JWT is stored as attribute of the class"""
-        logging.info("authenticate with {}".format(self.__user_pool_client_id))
+        logger.info("authenticate with {}".format(self.__user_pool_client_id))
         if not self.__intra_vpc:
             try:
                 aws = WarrantLite(
@@ -200,7 +246,7 @@ class AWSConnector:
                 self.__user_refresh_token = tokens["AuthenticationResult"][
                     "RefreshToken"
                 ]
-                logging.info(
+                logger.info(
                     "authentication successful for user {}".format(self.__user_token_id)
                 )
                 self.__scheduler.add_job(
@@ -211,7 +257,7 @@ class AWSConnector:
                 )
                 self.__scheduler.start()
             except Exception as e:
-                logging.error("Cannot authenticate user {}".format(self.__username))
+                logger.error("Cannot authenticate user {}".format(self.__username))
                 raise e
             self.__configuration.api_key[
                 "htc_cognito_authorizer"
@@ -228,28 +274,66 @@ class AWSConnector:
 
         """
 
-        time_start_ms = int(round(time.time() * 1000))
+        time_start_ns = wall_clock_ns()
 
         session_id = "None"
 
         binary_tasks_list = []
+        input_refs = []
 
         if self.__task_input_passed_via_external_storage == 1:
             session_id = get_safe_session_id()
-            logging.info("Local session id: {}".format(session_id))
+            logger.info("Local session id: {}".format(session_id))
+
+            # Content key of the inputs already handled in this session, by object identity
+            # (lists built with the same object n times are encoded once) and by content.
+            # The object is kept next to its key: once freed, its id could be reused by
+            # another input, e.g. temporaries returned by a generator backed sequence.
+            blob_key_by_object_id = {}
+            stored_blob_keys = set()
 
             for i, data in enumerate(tasks_list):
                 task_id = session_id + "_" + str(i)
 
-                data = json.dumps(data).encode("utf-8")
-
-                b64data = base64.b64encode(data)
-
-                self.in_out_manager.put_input_from_bytes(task_id, b64data)
+                if self.__task_input_deduplication == 1:
+                    seen = blob_key_by_object_id.get(id(data))
+                    if seen is not None and seen[0] is data:
+                        blob_key = seen[1]
+                    else:
+                        payload = encode_payload(data, self.__payload_codec)
+                        blob_key = content_key(payload)
+                        blob_key_by_object_id[id(data)] = (data, blob_key)
+
+                        if blob_key not in stored_blob_keys:
+                            if not self.in_out_manager.has_blob(blob_key):
+                                self.in_out_manager.put_blob_from_bytes(
+                                    blob_key, payload
+                                )
+                            stored_blob_keys.add(blob_key)
+
+                    input_refs.append(blob_key)
+                else:
+                    self.in_out_manager.put_input_from_bytes(
+                        task_id, encode_payload(data, self.__payload_codec)
+                    )
 
                 # We are no longer passing the actual task definition
                 binary_tasks_list.append(task_id)
 
+            if self.__task_input_deduplication == 1:
+                logger.info(
+                    "{} tasks share {} unique inputs".format(
+                        len(binary_tasks_list), len(stored_blob_keys)
+                    )
+                )
+
+        trace_span = self.__tracer.start_trace(
+            "grid_api.generate_user_task_json",
+            session_id=session_id,
+            attributes={"session_id": session_id, "tasks": len(tasks_list)},
+            start_ms=time_start_ns // NS_PER_MS,
+        )
+
         # creation message with tasks_list
         user_task_json = {
             "session_id": session_id,
@@ -259,41 +343,7 @@ class AWSConnector:
                 "tstamp_api_grid_connector_ms": 0,
                 "tstamp_agent_read_from_sqs_ms": 0,
             },
-            "stats": {
-                "stage1_grid_api_01_task_creation_tstmp": {
-                    "label": " ",
-                    "tstmp": time_start_ms,
-                },
-                "stage1_grid_api_02_task_submission_tstmp": {
-                    "label": "upload_data_to_storage",
-                    "tstmp": int(round(time.time() * 1000)),
-                },
-                "stage2_sbmtlmba_01_invocation_tstmp": {
-                    "label": "grid_api_2_lambda_ms",
-                    "tstmp": 0,
-                },
-                "stage2_sbmtlmba_02_before_batch_write_tstmp": {
-                    "label": "task_construction_ms",
-                    "tstmp": 0,
-                },
-                # "stage2_sbmtlmba_03_invocation_over_tstmp":    {"label": "dynamo_db_submit_ms", "tstmp" : 0},
-                "stage3_agent_01_task_acquired_sqs_tstmp": {
-                    "label": "sqs_queuing_time_ms",
-                    "tstmp": 0,
-                },
-                "stage3_agent_02_task_acquired_ddb_tstmp": {
-                    "label": "ddb_task_claiming_time_ms",
-                    "tstmp": 0,
-                },
-                "stage4_agent_01_user_code_finished_tstmp": {
-                    "label": "user_code_exec_time_ms",
-                    "tstmp": 0,
-                },
-                "stage4_agent_02_S3_stdout_delivered_tstmp": {
-                    "label": "S3_stdout_upload_time_ms",
-                    "tstmp": 0,
-                },
-            },
+            "stats": new_task_stats(time_start_ns),
             "tasks_list": {
                 "tasks": binary_tasks_list
                 if self.__task_input_passed_via_external_storage == 1
@@ -301,6 +351,15 @@ class AWSConnector:
             },
         }
 
+        if input_refs:
+            user_task_json["tasks_list"]["input_refs"] = input_refs
+
+        trace_span.end()
+        if trace_span.recording:
+            # Parent of the spans of the submit_tasks lambda and of the agents
+            user_task_json["trace_context"] = trace_span.traceparent()
+            self.__trace_contexts[session_id] = trace_span.context
+
         return user_task_json
 
     # TODO implements this method
@@ -315,6 +374,37 @@ class AWSConnector:
         """
         pass
 
+    def purge_session(self, session_id):
+        """This method deletes from the data plane the payload, inputs, outputs and errors
+        of a session once its results have been retrieved. Shared data is kept.
+
+        Args:
+          session_id (str): the id of the session
+
+        Returns:
+          int: the number of values deleted
+
+        """
+        return self.in_out_manager.purge_session(session_id)
+
+    def put_shared_data(self, data):
+        """This method uploads data shared by the tasks of a session (e.g. market data or
+        model parameters). The returned reference can be embedded anywhere in the inputs
+        of the tasks, the agents replace it by the data which is fetched once per node.
+
+        Args:
+          data: a JSON serializable object
+
+        Returns:
+          dict: the reference to the shared data
+
+        """
+        payload = encode_payload(data, PAYLOAD_CODEC_JSON)
+        blob_key = content_key(payload)
+        if not self.in_out_manager.has_blob(blob_key):
+            self.in_out_manager.put_blob_from_bytes(blob_key, payload)
+        return shared_data_ref(blob_key)
+
     # TODO raise exception when the  task list is above a given threshold
     # TODO create a response object instead of  dictionary
     def send(self, tasks_list):  # returns TaskID[]
@@ -327,13 +417,13 @@ class AWSConnector:
           dict: the response from the endpoint of the HTC grid
 
         """
-        logging.info("Init send {} tasks".format(len(tasks_list)))
+        logger.info("Init send %s tasks", len(tasks_list))
         user_task_json_request = self.generate_user_task_json(tasks_list)
-        logging.info("user_task_json_request: {}".format(user_task_json_request))
+        logger.info("user_task_json_request: %s", truncated(user_task_json_request))
         # print(user_task_json_request)
 
         json_response = self.submit(user_task_json_request)
-        logging.info("json_response = {}".format(json_response))
+        logger.info("json_response = %s", truncated(json_response))
         return json_response
 
     def get_results(self, submission_response: dict, timeout_sec=0):
@@ -347,16 +437,24 @@ class AWSConnector:
           str: the result of the submission
 
         """
-        logging.info("Init get_results")
+        logger.info("Init get_results")
         start_time = time.time()
 
+        session_id = submission_response["session_id"]
+        trace_span = self.__tracer.start_span(
+            "grid_api.get_results",
+            self.__trace_contexts.pop(session_id, None),
+            attributes={"session_id": session_id},
+        )
+        get_results_request = {"session_id": session_id}
+        if trace_span.recording:
+            get_results_request["trace_context"] = trace_span.traceparent()
+
         session_tasks_count: int = len(submission_response["task_ids"])
-        logging.info("session_tasks_count: {}".format(session_tasks_count))
+        logger.info("session_tasks_count: %s", session_tasks_count)
         while True:
-            session_results = self.invoke_get_results_lambda(
-                {"session_id": submission_response["session_id"]}
-            )
-            logging.info("session_results: {}".format(session_results))
+            session_results = self.invoke_get_results_lambda(get_results_request)
+            logger.info("session_results: %s", truncated(session_results))
             # print("session_results: {}".format(session_results))
 
             if (
@@ -367,7 +465,7 @@ class AWSConnector:
                 break
             elif 0 < timeout_sec < time.time() - start_time:
                 # We have timed out!
-                logging.error("Get Results Timed Out")
+                logger.error("Get Results Timed Out")
                 break
             time.sleep(self.__dynamodb_results_pull_intervall)
 
@@ -375,11 +473,21 @@ class AWSConnector:
             stdout_bytes = self.in_out_manager.get_output_to_bytes(completed_task)
             # print("stdout_bytes: {}".format(stdout_bytes))
 
-            output = base64.b64decode(stdout_bytes).decode("utf-8")
+            if get_payload_codec(stdout_bytes) == PAYLOAD_CODEC_LEGACY:
+                # Legacy outputs are the base64 encoded stdout, not a JSON document.
+                output = base64.b64decode(stdout_bytes).decode("utf-8")
+            else:
+                output = decode_payload(
+                    stdout_bytes,
+                    allow_pickle=bool(self.__payload_allow_pickle_outputs),
+                )
+                if isinstance(output, bytes):
+                    output = output.decode("utf-8")
 
             session_results[TASK_STATE_FINISHED + "_OUTPUT"][i] = output
 
-        logging.info("Finish get_results")
+        trace_span.end()
+        logger.info("Finish get_results")
         return session_results
 
     # TODO this should be private
@@ -393,13 +501,25 @@ class AWSConnector:
           dict: the submission ids of the jobs
 
         """
-        logging.info("Start submit")
-        # logging.warning("jobs = {}".format(jobs))
+        logger.info("Start submit")
+        # logger.warning("jobs = {}".format(jobs))
         raw_response: requests.Response
+        trace_span = self.__tracer.start_span(
+            "grid_api.submit", jobs.get("trace_context")
+        )
         if self.__task_input_passed_via_external_storage == 1:
-            submission_payload_bytes = base64.urlsafe_b64encode(
-                json.dumps(jobs).encode("utf-8")
-            )
+            if self.__payload_codec == PAYLOAD_CODEC_LEGACY:
+                submission_payload_bytes = base64.urlsafe_b64encode(
+                    json.dumps(jobs).encode("utf-8")
+                )
+            else:
+                # The session is decoded by the submit_tasks lambda, which does not unpickle.
+                submission_payload_bytes = encode_payload(
+                    jobs,
+                    PAYLOAD_CODEC_MSGPACK
+                    if self.__payload_codec == PAYLOAD_CODEC_MSGPACK
+                    else PAYLOAD_CODEC_JSON,
+                )
             session_id = jobs["session_id"]
             if session_id is None or session_id == "None":
                 raise Exception("Invalid configuration : session id must be set")
@@ -411,12 +531,14 @@ class AWSConnector:
             api_instance = default_api.DefaultApi(api_client)
             try:
                 raw_response = api_instance.submit_post(str(session_id))
-                logging.warning(raw_response)
+                logger.debug("submit_post response: %s", truncated(raw_response))
             except ApiException as e:
-                logging.error("Exception when calling DefaultApi->ca_post: %s\n" % e)
+                logger.error("Exception when calling DefaultApi->ca_post: %s\n" % e)
+                trace_span.end(error=e)
                 raise e
 
-        logging.info("Finish submit")
+        trace_span.end()
+        logger.info("Finish submit")
         return raw_response
 
     # TODO make it private
@@ -441,7 +563,7 @@ class AWSConnector:
           dict: the result of the job
 
         """
-        logging.info("Init get_results")
+        logger.info("Init get_results")
         submission_payload_string = base64.urlsafe_b64encode(
             json.dumps(session_id).encode("utf-8")
         ).decode("utf-8")
@@ -450,9 +572,9 @@ class AWSConnector:
             api_instance = default_api.DefaultApi(api_client)
             try:
                 raw_response = api_instance.result_get(str(submission_payload_string))
-                logging.warning(raw_response)
+                logger.debug("result_get response: %s", truncated(raw_response))
             except ApiException as e:
-                logging.error("Exception when calling DefaultApi->result_get: %s\n" % e)
+                logger.error("Exception when calling DefaultApi->result_get: %s\n" % e)
                 raise e
 
         return raw_response
@@ -486,7 +608,7 @@ class AWSConnector:
 
         """
 
-        logging.info("Init cancel session")
+        logger.info("Init cancel session")
 
         cancellation_request = {"session_ids_to_cancel": session_ids}
         submission_payload_string = base64.urlsafe_b64encode(
@@ -497,12 +619,12 @@ class AWSConnector:
             api_instance = default_api.DefaultApi(api_client)
             try:
                 raw_response = api_instance.cancel_post(str(submission_payload_string))
-                logging.warning(raw_response)
+                logger.debug("cancel_post response: %s", truncated(raw_response))
             except ApiException as e:
-                logging.error(
+                logger.error(
                     "Exception when calling DefaultApi->cancel_post: %s\n" % e
                 )
                 raise e
 
-        logging.info("Finish cancel session")
+        logger.info("Finish cancel session")
         return raw_response
@@ -0,0 +1,234 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, agents sharing a directory run on Linux nodes
+    fcntl = None
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MEMORY_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+
+# Lock file serializing the evictions of the agents sharing a disk tier
+DISK_LOCK_FILE = ".lock"
+TMP_FILE_PREFIX = ".tmp-"
+# Temporary files older than this were left behind by a failed write (e.g. an agent killed
+# while writing) and are removed by the next eviction
+STALE_TMP_FILE_AGE_SEC = 300
+
+CACHE_STATS = [
+    "hits_memory",
+    "hits_disk",
+    "misses",
+    "evictions_memory",
+    "evictions_disk",
+]
+
+
+class TieredCache:
+    """Local cache of immutable values read from the data plane (e.g. content-addressed blobs).
+
+    Values are looked up in memory first, then in an optional directory on local disk, then
+    loaded from the data plane. Both tiers are bounded in bytes and evict the least recently
+    used values. The disk tier can be shared by every agent of a node (e.g. a hostPath volume),
+    so a value is fetched once per node: files are written atomically and a value evicted by
+    another agent is simply a miss. Its size is enforced for the whole directory: after each
+    write the agent scans the directory under an exclusive lock and removes the files with the
+    oldest modification time (updated on every read) until they fit in disk_max_bytes.
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes=DEFAULT_CACHE_MEMORY_MAX_BYTES,
+        disk_dir=None,
+        disk_max_bytes=DEFAULT_CACHE_DISK_MAX_BYTES,
+    ):
+        """
+        Args:
+            memory_max_bytes(int): size of the memory tier, 0 disables it
+            disk_dir(string): directory of the disk tier, None disables it
+            disk_max_bytes(int): size of the disk tier, shared by every agent using disk_dir
+        """
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.stats = dict.fromkeys(CACHE_STATS, 0)
+
+        if self.disk_dir is not None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get_or_load(self, key, loader):
+        """Returns the value of key, calling loader() to fetch it on a miss
+
+        Args:
+            key(string): storage key or content hash of the value
+            loader(function): returns the value (bytes) from the data plane
+
+        Returns:
+            bytes: the value
+        """
+        data = self.get(key)
+        if data is None:
+            data = loader()
+            self.put(key, data)
+        return data
+
+    def get(self, key):
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.stats["hits_memory"] += 1
+                return data
+
+        data = self.__read_from_disk(key)
+
+        with self.lock:
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits_disk"] += 1
+
+        self.__put_in_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        self.__put_in_memory(key, data)
+        self.__write_to_disk(key, data)
+
+    def __len__(self):
+        return len(self.memory)
+
+    def get_and_reset_stats(self):
+        """Returns hits_memory, hits_disk, misses, evictions_memory and evictions_disk since
+        the last call and resets them"""
+        with self.lock:
+            stats = self.stats
+            self.stats = dict.fromkeys(CACHE_STATS, 0)
+        return stats
+
+    def __put_in_memory(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+
+        with self.lock:
+            previous = self.memory.pop(key, None)
+            if previous is not None:
+                self.memory_bytes -= len(previous)
+
+            self.memory[key] = data
+            self.memory_bytes += len(data)
+
+            while self.memory_bytes > self.memory_max_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+                self.stats["evictions_memory"] += 1
+
+    def __disk_path(self, key):
+        return os.path.join(
+            self.disk_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+
+    def __read_from_disk(self, key):
+        if self.disk_dir is None:
+            return None
+
+        path = self.__disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # The modification time records the last access for agents sharing the directory
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def __write_to_disk(self, key, data):
+        if self.disk_dir is None or len(data) > self.disk_max_bytes:
+            return
+
+        path = self.__disk_path(key)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=TMP_FILE_PREFIX)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(
+                "TieredCache: cannot write [{}] to disk: [{}]".format(key, e)
+            )
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+
+        try:
+            self.__evict_from_disk()
+        except OSError as e:
+            logger.warning("TieredCache: cannot evict from disk: [{}]".format(e))
+
+    def __evict_from_disk(self):
+        """Removes the least recently used files of the directory beyond disk_max_bytes,
+        whichever agent wrote them. Temporary files of writes in progress count towards the
+        size, the stale ones are removed."""
+        with open(os.path.join(self.disk_dir, DISK_LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            entries = []
+            disk_bytes = 0
+            stale_tmp_mtime_ns = (time.time() - STALE_TMP_FILE_AGE_SEC) * 1e9
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    is_tmp_file = entry.name.startswith(TMP_FILE_PREFIX)
+                    if entry.name.startswith(".") and not is_tmp_file:
+                        continue
+                    try:
+                        st = entry.stat()
+                        if is_tmp_file and st.st_mtime_ns < stale_tmp_mtime_ns:
+                            os.remove(entry.path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    disk_bytes += st.st_size
+                    if not is_tmp_file:
+                        entries.append((st.st_mtime_ns, entry.name, st.st_size))
+
+            evictions = 0
+            for _, name, size in sorted(entries):
+                if disk_bytes <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except FileNotFoundError:
+                    pass
+                disk_bytes -= size
+                evictions += 1
+
+        if evictions:
+            with self.lock:
+                self.stats["evictions_disk"] += evictions
@@ -0,0 +1,264 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import json
+import logging
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_LZ4 = "lz4"
+
+COMPRESSION_ALGORITHM_IDS = {
+    COMPRESSION_ZLIB: 1,
+    COMPRESSION_ZSTD: 2,
+    COMPRESSION_LZ4: 3,
+}
+COMPRESSION_ALGORITHM_NAMES = {i: a for a, i in COMPRESSION_ALGORITHM_IDS.items()}
+
+DEFAULT_COMPRESSION_THRESHOLD_BYTES = 1024
+
+# Compressed values start with COMPRESSION_MAGIC, the algorithm id and the CRC32 of the
+# dictionary (0 without dictionary). Values without this header are returned as stored,
+# so compressed and uncompressed values can be mixed in the same bucket or cache.
+COMPRESSION_MAGIC = b"\xfeHZ"
+_HEADER = struct.Struct("!3sBI")
+
+
+def in_out_compressor(compression_config=None):
+    """Creates the compressor used by the data plane from the "grid_storage_compression"
+    configuration, a JSON document (or dict) such as:
+
+    {"algorithm": "zstd", "level": 3, "threshold_bytes": 1024, "dictionary_file": "/etc/agent/dict"}
+
+    "algorithm" is one of none (default), zlib, zstd (requires zstandard) or lz4 (requires lz4).
+    Values smaller than "threshold_bytes" are stored uncompressed. "dictionary_file" is an
+    optional dictionary (e.g. trained with `zstd --train`), every reader must use the same file.
+
+    Args:
+        compression_config(str or dict): the compression configuration, None disables compression
+
+    Returns:
+        InOutCompressor: the compressor
+    """
+    if not compression_config:
+        compression_config = {}
+    elif isinstance(compression_config, str):
+        compression_config = json.loads(compression_config)
+
+    dictionary = None
+    if compression_config.get("dictionary_file"):
+        with open(compression_config["dictionary_file"], "rb") as f:
+            dictionary = f.read()
+
+    return InOutCompressor(
+        algorithm=compression_config.get("algorithm", COMPRESSION_NONE),
+        level=compression_config.get("level"),
+        threshold_bytes=compression_config.get(
+            "threshold_bytes", DEFAULT_COMPRESSION_THRESHOLD_BYTES
+        ),
+        dictionary=dictionary,
+    )
+
+
+class InOutCompressor:
+    """Transparent compression of the values stored by InOutS3 and InOutRedis.
+
+    Decompression does not depend on the configured algorithm: any value carrying the
+    compression header is decompressed, so readers do not need the writer's configuration
+    unless a dictionary is used.
+    """
+
+    def __init__(
+        self,
+        algorithm=COMPRESSION_NONE,
+        level=None,
+        threshold_bytes=DEFAULT_COMPRESSION_THRESHOLD_BYTES,
+        dictionary=None,
+    ):
+        if algorithm != COMPRESSION_NONE and algorithm not in COMPRESSION_ALGORITHM_IDS:
+            raise Exception(
+                "InOutCompressor: unknown algorithm [{}], valid algorithms are {}".format(
+                    algorithm, [COMPRESSION_NONE] + list(COMPRESSION_ALGORITHM_IDS)
+                )
+            )
+        if algorithm == COMPRESSION_ZSTD and zstandard is None:
+            raise Exception("InOutCompressor: zstd requires the zstandard package")
+        if algorithm == COMPRESSION_LZ4 and lz4 is None:
+            raise Exception("InOutCompressor: lz4 requires the lz4 package")
+
+        self.algorithm = algorithm
+        self.level = level
+        self.threshold_bytes = threshold_bytes
+        self.dictionary = dictionary
+        self.dictionary_id = zlib.crc32(dictionary) if dictionary else 0
+
+        if self.dictionary and zstandard is not None:
+            self.zstd_dictionary = zstandard.ZstdCompressionDict(self.dictionary)
+        else:
+            self.zstd_dictionary = None
+
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def enabled(self):
+        return self.algorithm != COMPRESSION_NONE
+
+    def compress(self, data):
+        """Returns the value to store for data, data itself if it is below the threshold
+        or does not compress"""
+        if not self.enabled or len(data) < self.threshold_bytes:
+            return data
+
+        t_start = time.perf_counter()
+
+        body = self.__compress_body(data)
+
+        compressed = (
+            _HEADER.pack(
+                COMPRESSION_MAGIC,
+                COMPRESSION_ALGORITHM_IDS[self.algorithm],
+                self.dictionary_id,
+            )
+            + body
+        )
+
+        if len(compressed) >= len(data):
+            compressed = data
+
+        self.__record(
+            "compress_time_ms",
+            (time.perf_counter() - t_start) * 1000,
+            bytes_in=len(data),
+            bytes_out=len(compressed),
+        )
+        return compressed
+
+    def decompress(self, data):
+        """Returns the original value of a stored value, compressed or not"""
+        if not self.is_compressed(data):
+            return data
+
+        t_start = time.perf_counter()
+
+        _, algorithm_id, dictionary_id = _HEADER.unpack_from(data)
+        if algorithm_id not in COMPRESSION_ALGORITHM_NAMES:
+            raise Exception(
+                "InOutCompressor: unknown algorithm id [{}]".format(algorithm_id)
+            )
+        if dictionary_id != self.dictionary_id:
+            raise Exception(
+                "InOutCompressor: value was compressed with dictionary [{}], configured dictionary is [{}]".format(
+                    dictionary_id, self.dictionary_id
+                )
+            )
+
+        header_size = _HEADER.size
+        decompressed = self.__decompress_body(
+            COMPRESSION_ALGORITHM_NAMES[algorithm_id], memoryview(data)[header_size:]
+        )
+
+        self.__record("decompress_time_ms", (time.perf_counter() - t_start) * 1000)
+        return decompressed
+
+    @staticmethod
+    def is_compressed(data):
+        return len(data) >= _HEADER.size and bytes(data[:3]) == COMPRESSION_MAGIC
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "compress_time_ms": 0.0,
+                "decompress_time_ms": 0.0,
+            }
+
+    def get_and_reset_stats(self):
+        """Returns the compression statistics since the last call and resets them
+
+        Returns:
+            dict: bytes_in and bytes_out of the compressed values, compression_ratio,
+                compress_time_ms and decompress_time_ms
+        """
+        with self.stats_lock:
+            stats = self.stats
+            self.stats = {k: type(v)() for k, v in stats.items()}
+
+        stats["compression_ratio"] = (
+            round(stats["bytes_in"] / stats["bytes_out"], 2) if stats["bytes_out"] else 0
+        )
+        return stats
+
+    def __record(self, timer, elapsed_ms, bytes_in=0, bytes_out=0):
+        with self.stats_lock:
+            self.stats[timer] += elapsed_ms
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+
+    def __compress_body(self, data):
+        if self.algorithm == COMPRESSION_ZLIB:
+            compressor = zlib.compressobj(
+                self.level if self.level is not None else zlib.Z_DEFAULT_COMPRESSION,
+                **({"zdict": self.dictionary} if self.dictionary else {})
+            )
+            return compressor.compress(data) + compressor.flush()
+
+        elif self.algorithm == COMPRESSION_ZSTD:
+            # ZstdCompressor objects are not thread safe, they are cheap to create.
+            return zstandard.ZstdCompressor(
+                level=self.level if self.level is not None else 3,
+                dict_data=self.zstd_dictionary,
+            ).compress(data)
+
+        else:
+            if self.level is not None:
+                return lz4.block.compress(
+                    data,
+                    mode="high_compression",
+                    compression=self.level,
+                    dict=self.dictionary,
+                )
+            return lz4.block.compress(data, dict=self.dictionary)
+
+    def __decompress_body(self, algorithm, body):
+        if algorithm == COMPRESSION_ZLIB:
+            decompressor = zlib.decompressobj(
+                **({"zdict": self.dictionary} if self.dictionary else {})
+            )
+            return decompressor.decompress(body) + decompressor.flush()
+
+        elif algorithm == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise Exception("InOutCompressor: zstd requires the zstandard package")
+            return zstandard.ZstdDecompressor(dict_data=self.zstd_dictionary).decompress(
+                body
+            )
+
+        else:
+            if lz4 is None:
+                raise Exception("InOutCompressor: lz4 requires the lz4 package")
+            return lz4.block.decompress(body, dict=self.dictionary)
@@ -0,0 +1,149 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import datetime
+import json
+import re
+
+import redis
+
+# Expiration (seconds) of the values kept in Redis by kind, 0 keeps them until evicted.
+# "consumed_output" shortens the expiration of an output once read, when S3 holds a copy.
+DEFAULT_KEY_TTLS = {
+    "input": 0,
+    "payload": 0,
+    "output": 0,
+    "error": 0,
+    "blob": 0,
+    "consumed_output": 0,
+}
+
+# Tag of the content addressed blobs in S3, the lifecycle rule of the data bucket expires the
+# objects with this tag after grid_storage_blob_expiration_days (see control_plane/s3.tf)
+BLOB_TAGGING = "htc_grid_value=blob"
+
+SHARED_BLOBS = "<shared blobs>"
+OTHER_KEYS = "<other>"
+
+_SESSION_KEY = re.compile(
+    r"^(?P<session>.+?)(?:_\d+)?-(?:input|output|error|payload)(?:-chunk-[0-9a-f]+-\d+)?$"
+)
+_BLOB_KEY = re.compile(r"-blob(?:-chunk-[0-9a-f]+-\d+)?$")
+_GLOB_SPECIAL = re.compile(r"([\\*?\[\]])")
+
+
+def key_ttl_config(ttl_config=None):
+    """Returns the expiration by kind from the "grid_storage_ttl" configuration, a JSON
+    document (or dict) overriding DEFAULT_KEY_TTLS such as:
+
+    {"input": 86400, "output": 86400, "consumed_output": 300}
+    """
+    if not ttl_config:
+        ttl_config = {}
+    elif isinstance(ttl_config, str):
+        ttl_config = json.loads(ttl_config)
+
+    unknown = set(ttl_config) - set(DEFAULT_KEY_TTLS)
+    if unknown:
+        raise Exception(
+            "grid_storage_ttl: unknown kinds {}, valid kinds are {}".format(
+                sorted(unknown), list(DEFAULT_KEY_TTLS)
+            )
+        )
+
+    ttls = dict(DEFAULT_KEY_TTLS)
+    ttls.update(ttl_config)
+    return {kind: int(ttl) for kind, ttl in ttls.items()}
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def blob_is_fresh(last_modified, blob_expiration_days):
+    """Returns False once a blob stored in S3 at last_modified has lived half of its
+    lifetime, so that writers upload it again instead of referencing it: the upload restarts
+    its expiration and the tasks referencing it have at least half the lifetime to run"""
+    if not blob_expiration_days:
+        return True
+    age = _utc_now() - last_modified
+    return age < datetime.timedelta(days=blob_expiration_days) / 2
+
+
+def session_key_prefixes(session_id, prefix=""):
+    """Returns the prefixes of the keys of a session: the payload of the session and the
+    inputs, outputs and errors of its tasks (<session_id>_<i>), chunks included"""
+    return [prefix + session_id + "_", prefix + session_id + "-payload"]
+
+
+def session_key_patterns(session_id, prefix=""):
+    """Returns the redis MATCH patterns of the keys of a session"""
+    return [
+        _GLOB_SPECIAL.sub(r"\\\1", key_prefix) + "*"
+        for key_prefix in session_key_prefixes(session_id, prefix)
+    ]
+
+
+def session_of_key(key, prefix=""):
+    """Returns the session owning key, SHARED_BLOBS for content addressed blobs and
+    OTHER_KEYS for the keys not written by the data plane"""
+    if prefix:
+        if not key.startswith(prefix):
+            return OTHER_KEYS
+        key = key[len(prefix):]
+
+    match = _SESSION_KEY.match(key)
+    if match:
+        return match.group("session")
+    if _BLOB_KEY.search(key):
+        return SHARED_BLOBS
+    return OTHER_KEYS
+
+
+def redis_memory_by_session(redis_cache, sample_size=1000, prefix=""):
+    """Estimates the Redis memory used by each session from a random sample of keys.
+
+    Returns:
+        dict: "total_keys", "sampled_keys" and "sessions", the estimated bytes by session
+            (largest first), extrapolated from the sample to the whole keyspace
+    """
+    total_keys = redis_cache.dbsize()
+    sample_size = min(sample_size, total_keys)
+    sampled_bytes = {}
+    use_memory_usage = [True]
+
+    for _ in range(sample_size):
+        key = redis_cache.randomkey()
+        if key is None:
+            break
+        size = _key_size(redis_cache, key, use_memory_usage)
+        if size is None:
+            # expired since sampled
+            continue
+
+        session = session_of_key(key.decode("utf-8", "replace"), prefix)
+        sampled_bytes[session] = sampled_bytes.get(session, 0) + size
+
+    scale = total_keys / sample_size if sample_size else 0
+    sessions = sorted(sampled_bytes.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "total_keys": total_keys,
+        "sampled_keys": sample_size,
+        "sessions": {session: int(size * scale) for session, size in sessions},
+    }
+
+
+def _key_size(redis_cache, key, use_memory_usage):
+    if use_memory_usage[0]:
+        try:
+            return redis_cache.memory_usage(key)
+        except redis.ResponseError:
+            # MEMORY USAGE is not available on every server, value sizes are used instead
+            use_memory_usage[0] = False
+
+    try:
+        return len(key) + redis_cache.strlen(key)
+    except redis.ResponseError:
+        # not a string (e.g. the write-behind queue)
+        return len(key)
@@ -0,0 +1,301 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import io
+import logging
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+
+from api.in_out_compression import InOutCompressor
+from api.in_out_lifecycle import session_key_prefixes
+from api.in_out_stream import LocalFileWriter, create_temporary_file
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+
+INPUT_POSTFIX = "-input"
+OUTPUT_POSTFIX = "-output"
+ERROR_POSTFIX = "-error"
+PAYLOAD_POSTFIX = "-payload"
+BLOB_POSTFIX = "-blob"
+
+DEFAULT_LOCAL_DIR = os.path.join(tempfile.gettempdir(), "htc-grid-data")
+
+
+class InOutLocal:
+    """Local (or shared) filesystem based handler for putting and retrieving large values
+    associated with taskIDs, for single node runs, benchmarks and agents sharing a
+    filesystem with their clients"""
+
+    # For the local implementation, namespace and subnamespace are directories
+    namespace = None
+    subnamespace = None
+
+    def __init__(
+        self,
+        namespace,
+        local_dir=None,
+        subnamespace=None,
+        compressor=None,
+        hard_links=False,
+        file_mode=None,
+    ):
+        """Initialize a dataplane backed by the directory <local_dir>/<namespace>
+
+        Values are written to a temporary file renamed over the value, so readers see either
+        the previous or the new value, and read through mmap.
+
+        Args:
+            namespace(string): directory of the values under local_dir
+            local_dir(string): root directory of the data plane, DEFAULT_LOCAL_DIR by default
+            subnamespace(string): subdirectory of the values
+            compressor(InOutCompressor): compression of the stored values, none by default
+            hard_links(bool): put_*_from_file and get_*_to_file hard link the files instead of
+                copying them (files must then not be modified in place)
+            file_mode(int): mode of the written values, 0o666 less the umask by default
+        """
+        self.namespace = namespace
+        self.subnamespace = subnamespace
+        self.local_dir = local_dir or DEFAULT_LOCAL_DIR
+        self.compressor = compressor if compressor is not None else InOutCompressor()
+        self.hard_links = hard_links
+        self.file_mode = file_mode
+
+        self.root = os.path.realpath(os.path.join(self.local_dir, str(namespace)))
+        self.directory = self.root
+        if subnamespace is not None:
+            self.directory = os.path.join(self.root, str(subnamespace))
+        os.makedirs(self.directory, exist_ok=True)
+        logger.info("InOutLocal: values stored in {}".format(self.directory))
+
+    def put_input_from_file(self, task_id, file_name):
+        return self.__put_from_file(task_id, file_name, INPUT_POSTFIX)
+
+    def put_output_from_file(self, task_id, file_name):
+        return self.__put_from_file(task_id, file_name, OUTPUT_POSTFIX)
+
+    def put_error_from_file(self, task_id, file_name):
+        return self.__put_from_file(task_id, file_name, ERROR_POSTFIX)
+
+    def get_input_to_file(self, task_id, file_name):
+        return self.__get_to_file(task_id, file_name, INPUT_POSTFIX)
+
+    def get_output_to_file(self, task_id, file_name):
+        return self.__get_to_file(task_id, file_name, OUTPUT_POSTFIX)
+
+    def get_error_to_file(self, task_id, file_name):
+        return self.__get_to_file(task_id, file_name, ERROR_POSTFIX)
+
+    def put_input_from_bytes(self, task_id, data):
+        return self.__put_from_bytes(task_id, data, INPUT_POSTFIX)
+
+    def put_output_from_bytes(self, task_id, data):
+        return self.__put_from_bytes(task_id, data, OUTPUT_POSTFIX)
+
+    def put_error_from_bytes(self, task_id, data):
+        return self.__put_from_bytes(task_id, data, ERROR_POSTFIX)
+
+    def get_input_to_utf8_string(self, task_id):
+        return self.__get_to_utf8_string(task_id, INPUT_POSTFIX)
+
+    def get_output_to_utf8_string(self, task_id):
+        return self.__get_to_utf8_string(task_id, OUTPUT_POSTFIX)
+
+    def get_error_to_utf8_string(self, task_id):
+        return self.__get_to_utf8_string(task_id, ERROR_POSTFIX)
+
+    def get_input_to_bytes(self, task_id):
+        return self.__get_to_bytes(task_id, INPUT_POSTFIX)
+
+    def get_output_to_bytes(self, task_id):
+        return self.__get_to_bytes(task_id, OUTPUT_POSTFIX)
+
+    def get_error_to_bytes(self, task_id):
+        return self.__get_to_bytes(task_id, ERROR_POSTFIX)
+
+    def put_payload_from_bytes(self, task_id, data):
+        return self.__put_from_bytes(task_id, data, PAYLOAD_POSTFIX)
+
+    def put_payload_from_file(self, task_id, file_name):
+        return self.__put_from_file(task_id, file_name, PAYLOAD_POSTFIX)
+
+    def get_payload_to_utf8_string(self, task_id):
+        return self.__get_to_utf8_string(task_id, PAYLOAD_POSTFIX)
+
+    def get_payload_to_bytes(self, task_id):
+        return self.__get_to_bytes(task_id, PAYLOAD_POSTFIX)
+
+    def put_blob_from_bytes(self, blob_key, data):
+        return self.__put_from_bytes(blob_key, data, BLOB_POSTFIX)
+
+    def get_blob_to_bytes(self, blob_key):
+        return self.__get_to_bytes(blob_key, BLOB_POSTFIX)
+
+    def has_blob(self, blob_key):
+        return os.path.isfile(self.__get_full_path(blob_key, BLOB_POSTFIX))
+
+    def flush(self, timeout_sec=30):
+        """Writes are synchronous, nothing is pending"""
+        return True
+
+    def purge_session(self, session_id):
+        """Deletes the payload of a session and the inputs, outputs and errors of its tasks,
+        shared blobs are kept
+
+        Returns:
+            int: the number of files deleted
+        """
+        prefixes = tuple(session_key_prefixes(str(session_id)))
+        deleted = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(prefixes):
+                    os.remove(entry.path)
+                    deleted += 1
+        return deleted
+
+    def open_input_stream(self, task_id):
+        return self.__open_stream(task_id, INPUT_POSTFIX)
+
+    def open_output_stream(self, task_id):
+        return self.__open_stream(task_id, OUTPUT_POSTFIX)
+
+    def open_input_writer(self, task_id):
+        return LocalFileWriter(
+            self.__get_full_path(task_id, INPUT_POSTFIX), file_mode=self.file_mode
+        )
+
+    def open_output_writer(self, task_id):
+        return LocalFileWriter(
+            self.__get_full_path(task_id, OUTPUT_POSTFIX), file_mode=self.file_mode
+        )
+
+    def __open_stream(self, task_id, postfix):
+        """Returns a file-like object reading the value from its memory mapping, compressed
+        values are decompressed in memory"""
+        with open(self.__get_full_path(task_id, postfix), "rb") as f_data:
+            if os.fstat(f_data.fileno()).st_size == 0:
+                return io.BytesIO(b"")
+            mapping = mmap.mmap(f_data.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.compressor.is_compressed(mapping[:16]):
+            with mapping:
+                return io.BytesIO(self.compressor.decompress(mapping))
+        return mapping
+
+    def __put_from_file(self, task_id, file_name, postfix):
+        if self.compressor.enabled:
+            with open(file_name, "rb") as in_file:
+                return self.__put_from_bytes(task_id, in_file.read(), postfix)
+
+        try:
+            self.__install(file_name, self.__get_full_path(task_id, postfix))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
+
+    def __get_to_file(self, task_id, file_name, postfix):
+        path = self.__get_full_path(task_id, postfix)
+        try:
+            with open(path, "rb") as f_data:
+                compressed = self.compressor.is_compressed(f_data.read(16))
+
+            if compressed:
+                with open(file_name, "wb") as f_out:
+                    f_out.write(self.__get_to_bytes(task_id, postfix))
+            else:
+                self.__install(path, file_name)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
+
+    def __put_from_bytes(self, task_id, data, postfix):
+        try:
+            data = self.compressor.compress(data)
+            path = self.__get_full_path(task_id, postfix)
+            with LocalFileWriter(path, file_mode=self.file_mode) as writer:
+                writer.write(data)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
+
+    def __get_to_utf8_string(self, task_id, postfix):
+        try:
+            return self.__get_to_bytes(task_id, postfix).decode("utf-8")
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
+
+    def __get_to_bytes(self, task_id, postfix):
+        try:
+            with open(self.__get_full_path(task_id, postfix), "rb") as f_data:
+                if os.fstat(f_data.fileno()).st_size == 0:
+                    return b""
+                with mmap.mmap(f_data.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    if self.compressor.is_compressed(mapping[:16]):
+                        # decompressed straight from the mapping
+                        return self.compressor.decompress(mapping)
+                    return mapping[:]
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
+
+    def __install(self, source, destination):
+        """Atomically replaces destination by a hard link to, or an in-kernel copy of,
+        source"""
+        directory = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_name = create_temporary_file(directory, self.file_mode)
+        os.close(fd)
+        try:
+            linked = False
+            if self.hard_links:
+                try:
+                    os.remove(tmp_name)
+                    os.link(source, tmp_name)
+                    linked = True
+                except OSError:
+                    # e.g. across filesystems
+                    pass
+            if not linked:
+                # sendfile(2) on Linux, into the temporary file which keeps its mode (a
+                # hard link keeps the mode of source)
+                shutil.copyfile(source, tmp_name)
+            os.replace(tmp_name, destination)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def __get_full_path(self, key, postfix):
+        path = os.path.normpath(os.path.join(self.directory, str(key) + str(postfix)))
+        if not path.startswith(self.root + os.sep):
+            raise Exception(
+                "InOutLocal: key [{}] is outside of the namespace".format(key)
+            )
+        return path
+
+    def mv_to_another_namespace(
+        self, key, new_namespace, new_subnamespace=None, new_key=None
+    ):
+        # Local implementation: namespace and subnamespace are directories
+        try:
+            target_directory = os.path.join(self.local_dir, str(new_namespace))
+            if new_subnamespace is not None:
+                target_directory = os.path.join(target_directory, str(new_subnamespace))
+            target = os.path.join(
+                target_directory, str(new_key) if new_key is not None else str(key)
+            )
+            self.__install(os.path.join(self.root, str(key)), target)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            raise e
@@ -2,10 +2,15 @@
 # SPDX-License-Identifier: Apache-2.0
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
+import hashlib
 import logging
+import re
 
 from api.in_out_s3 import InOutS3
+from api.in_out_local import InOutLocal
 from api.in_out_redis import InOutRedis
+from api.in_out_compression import in_out_compressor
+from api.in_out_transfer import s3_transfer_profile
 
 """
 This function will create appropriate InOut Storage Object depending on the configuration string.
@@ -14,6 +19,7 @@ Valid Configurations <service type>
 "grid_storage_service" : "S3"
 "grid_storage_service" : "REDIS"
 "grid_storage_service" : "S3+REDIS"
+"grid_storage_service" : "LOCAL"
 
 
 """
@@ -25,6 +31,65 @@ logging.basicConfig(
 )
 logging.info("Init AWS Grid Connector")
 
+# Tasks whose input is stored once under its content hash (see content_key) carry a
+# reference to that blob in their task_definition instead of having a -input value.
+TASK_INPUT_BLOB_PREFIX = "blob:"
+
+
+def content_key(data):
+    """Returns the key under which data is stored in content-addressed mode"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def task_input_blob_ref(blob_key):
+    """Returns the task_definition of a task whose input is the blob blob_key"""
+    return TASK_INPUT_BLOB_PREFIX + blob_key
+
+
+def parse_task_input_blob_ref(task_definition):
+    """Returns the blob key referenced by a task_definition, None if the input of the task
+    is stored under its task_id"""
+    if isinstance(task_definition, str) and task_definition.startswith(
+        TASK_INPUT_BLOB_PREFIX
+    ):
+        return task_definition.partition(TASK_INPUT_BLOB_PREFIX)[2]
+    return None
+
+
+# Data shared by the tasks of a session (market data, curves, model parameters...) is stored
+# once as a blob and referenced from the task inputs by {SHARED_DATA_REF_KEY: <blob key>}.
+# Agents replace the reference by the data, fetched once per node through their local cache.
+SHARED_DATA_REF_KEY = "__htc_shared_data__"
+_SHARED_DATA_REF = re.compile(
+    rb'\{\s*"'
+    + SHARED_DATA_REF_KEY.encode("utf-8")
+    + rb'"\s*:\s*"([0-9a-f]{64})"\s*\}'
+)
+
+
+def shared_data_ref(blob_key):
+    """Returns the reference to embed in task inputs to the shared data blob_key"""
+    return {SHARED_DATA_REF_KEY: blob_key}
+
+
+def resolve_shared_data_refs(json_payload, get_json_data):
+    """Replaces the shared data references of a JSON task input by the data itself
+
+    The references are substituted in the serialized payload, which is not parsed.
+
+    Args:
+        json_payload(bytes): the JSON task input
+        get_json_data(function): returns the JSON (bytes) of a shared data blob key
+
+    Returns:
+        bytes: the JSON task input with the shared data inlined
+    """
+    if SHARED_DATA_REF_KEY.encode("utf-8") not in json_payload:
+        return json_payload
+    return _SHARED_DATA_REF.sub(
+        lambda match: get_json_data(match.group(1).decode("ascii")), json_payload
+    )
+
 
 def in_out_manager(
     grid_storage_service,
@@ -35,6 +100,14 @@ def in_out_manager(
     s3_region=None,
     s3_custom_resource=None,
     redis_custom_connection=None,
+    compression_config=None,
+    write_behind=False,
+    transfer_config=None,
+    redis_pool_config=None,
+    ttl_config=None,
+    local_dir=None,
+    local_hard_links=False,
+    blob_expiration_days=0,
 ):
     """This function returns a connection to the data plane. This connection will be used for uploading and
        downloading the payload associated to the tasks
@@ -48,6 +121,14 @@ def in_out_manager(
         redis_password(string): the authentication password of the redis cluster (valid only if redis has been deployed with data plane)
         s3_custom_resource(object): override the default connection to AWS S3 service (valid only if an S3 bucket has been deployed with data plane)
         redis_custom_connection(object): override the default connection to the redis cluster (valid only if redis has been deployed with data plane)
+        compression_config(string): JSON compression configuration of the stored values, see in_out_compressor (disabled by default)
+        write_behind(bool): with S3+REDIS, persist values to S3 in the background once written to Redis (disabled by default)
+        transfer_config(string): JSON S3 transfer configuration (profile, multipart and concurrency), see s3_transfer_profile
+        redis_pool_config(string): JSON settings of the redis connection pool, see redis_pool_config
+        ttl_config(string): JSON expiration of the values kept in redis by kind, see key_ttl_config
+        local_dir(string): with LOCAL, root directory of the values, s3_bucket being the directory of the namespace
+        local_hard_links(bool): with LOCAL, hard link the files put and got instead of copying them (disabled by default)
+        blob_expiration_days(int): expiration of the content addressed blobs by the lifecycle rule of the S3 bucket, 0 if they do not expire
 
     Returns:
         object: a connection to the data plane
@@ -57,9 +138,17 @@ def in_out_manager(
             grid_storage_service, s3_bucket, s3_kms_key_id, redis_url
         )
     )
+    compressor = in_out_compressor(compression_config)
+    transfer_profile = s3_transfer_profile(transfer_config)
+
     if grid_storage_service == "S3":
         return InOutS3(
-            namespace=s3_bucket, region=s3_region, s3_kms_key_id=s3_kms_key_id
+            namespace=s3_bucket,
+            region=s3_region,
+            s3_kms_key_id=s3_kms_key_id,
+            compressor=compressor,
+            transfer_profile=transfer_profile,
+            blob_expiration_days=blob_expiration_days,
         )
 
     elif grid_storage_service == "REDIS":
@@ -71,6 +160,9 @@ def in_out_manager(
             s3_kms_key_id=s3_kms_key_id,
             s3_custom_resource=s3_custom_resource,
             redis_custom_connection=redis_custom_connection,
+            compressor=compressor,
+            redis_pool_config=redis_pool_config,
+            ttl_config=ttl_config,
         )
 
     elif grid_storage_service == "S3+REDIS":
@@ -83,6 +175,20 @@ def in_out_manager(
             region=s3_region,
             s3_custom_resource=s3_custom_resource,
             redis_custom_connection=redis_custom_connection,
+            compressor=compressor,
+            write_behind=write_behind,
+            transfer_profile=transfer_profile,
+            redis_pool_config=redis_pool_config,
+            ttl_config=ttl_config,
+            blob_expiration_days=blob_expiration_days,
+        )
+
+    elif grid_storage_service == "LOCAL":
+        return InOutLocal(
+            namespace=s3_bucket,
+            local_dir=local_dir,
+            compressor=compressor,
+            hard_links=local_hard_links,
         )
 
     else:
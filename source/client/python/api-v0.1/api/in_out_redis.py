@@ -3,14 +3,49 @@
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
 import boto3
+import botocore
 import sys
 import io
-import redis
+import shutil
+
+from api.in_out_compression import InOutCompressor
+from api.in_out_lifecycle import (
+    BLOB_TAGGING,
+    blob_is_fresh,
+    key_ttl_config,
+    redis_memory_by_session,
+    session_key_patterns,
+    session_key_prefixes,
+)
+from api.in_out_redis_pool import redis_connection
+from api.in_out_stream import (
+    ChunkEvictedException,
+    DEFAULT_REDIS_CHUNK_SIZE,
+    RedisChunkReader,
+    RedisChunkWriter,
+    S3ObjectWriter,
+    chunk_key,
+    open_s3_object_stream,
+    parse_chunk_manifest,
+    read_chunk_manifest,
+    retire_chunks,
+)
+from api.in_out_transfer import S3TransferProfile
+from api.in_out_write_behind import S3WriteBehind
 
 INPUT_POSTFIX = "-input"
 OUTPUT_POSTFIX = "-output"
 ERROR_POSTFIX = "-error"
 PAYLOAD_POSTFIX = "-payload"
+BLOB_POSTFIX = "-blob"
+
+_TTL_KINDS = {
+    INPUT_POSTFIX: "input",
+    OUTPUT_POSTFIX: "output",
+    ERROR_POSTFIX: "error",
+    PAYLOAD_POSTFIX: "payload",
+    BLOB_POSTFIX: "blob",
+}
 
 
 class InOutRedis:
@@ -37,6 +72,13 @@ class InOutRedis:
         region=None,
         s3_custom_resource=None,
         redis_custom_connection=None,
+        compressor=None,
+        write_behind=False,
+        transfer_profile=None,
+        stream_chunk_size=DEFAULT_REDIS_CHUNK_SIZE,
+        redis_pool_config=None,
+        ttl_config=None,
+        blob_expiration_days=0,
     ):
         """
         Initialize a connection with data plane backed by a Redis cluster and optionally a S3 Bucket
@@ -50,15 +92,40 @@ class InOutRedis:
             region(string): region where the s3 bucket has been created
             s3_custom_resource(object): override default S3 resource
             redis_custom_connection(object): override default redis connection
+            compressor(InOutCompressor): compression of the stored values, none by default.
+                Values are compressed once and stored compressed in both Redis and S3.
+            write_behind(bool): with use_S3, values are acknowledged once written to Redis
+                and persisted to S3 in the background (see S3WriteBehind)
+            transfer_profile(S3TransferProfile): multipart and concurrency settings of S3
+            stream_chunk_size(int): values written by open_*_writer or from files are stored
+                in chunks of this size, see RedisChunkWriter
+            redis_pool_config(string): JSON settings of the shared connection pool (size,
+                timeouts, health checks, retries, cluster mode), see redis_pool_config
+            ttl_config(string): JSON expiration of the values by kind, see key_ttl_config.
+                In write-behind mode values expire only once persisted to S3.
+            blob_expiration_days(int): with use_S3, expiration of the blobs by the lifecycle
+                rule of the bucket, see InOutS3. 0 if blobs do not expire
         """
         self.namespace = namespace
+        self.blob_expiration_days = blob_expiration_days
         self.cache_url = cache_url
         self.cache_password = cache_password
         self.subnamespace = subnamespace
+        self.compressor = compressor if compressor is not None else InOutCompressor()
+        self.stream_chunk_size = stream_chunk_size
+        self.key_ttls = key_ttl_config(ttl_config)
+        self.transfer_profile = (
+            transfer_profile if transfer_profile is not None else S3TransferProfile()
+        )
+        self.transfer_config = self.transfer_profile.transfer_config()
 
         if use_S3:
             if s3_custom_resource is None:
-                self.s3 = boto3.resource("s3", region_name=region)
+                self.s3 = boto3.resource(
+                    "s3",
+                    region_name=region,
+                    config=self.transfer_profile.client_config(),
+                )
             else:
                 self.s3 = s3_custom_resource
             self.bucket = self.s3.Bucket(self.namespace)
@@ -68,12 +135,23 @@ class InOutRedis:
             self.s3_kms_key_id = None
 
         if redis_custom_connection is None:
-            self.redis_cache = redis.StrictRedis(
-                host=cache_url, ssl=True, password=cache_password
+            self.redis_cache = redis_connection(
+                cache_url, cache_password, redis_pool_config
             )
         else:
             self.redis_cache = redis_custom_connection
 
+        if self.bucket and write_behind:
+            self.write_behind = S3WriteBehind(
+                self.redis_cache,
+                self.__persist,
+                read=self.__read_value,
+                give_up=self.__expire_by_kind,
+            )
+            self.write_behind.start()
+        else:
+            self.write_behind = None
+
     def put_input_from_file(self, task_id, file_name):
         self.__put_from_file(task_id, file_name, INPUT_POSTFIX)
 
@@ -113,19 +191,176 @@ class InOutRedis:
     def get_payload_to_bytes(self, task_id):
         return self.__get_to_bytes(task_id, PAYLOAD_POSTFIX)
 
+    def put_blob_from_bytes(self, blob_key, data):
+        self.__put_from_bytes(blob_key, data, BLOB_POSTFIX)
+
+    def get_blob_to_bytes(self, blob_key):
+        return self.__get_to_bytes(blob_key, BLOB_POSTFIX)
+
+    def has_blob(self, blob_key):
+        """Returns True if the blob is stored and does not expire soon. A blob found in Redis
+        has its expiration restarted, its S3 copy must be fresh (see blob_is_fresh)"""
+        key = self.__get_full_key(blob_key, BLOB_POSTFIX)
+        if self.bucket and self.blob_expiration_days:
+            try:
+                blob = self.bucket.Object(key)
+                blob.load()
+                stored = blob_is_fresh(blob.last_modified, self.blob_expiration_days)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                    raise e
+                stored = False
+        else:
+            stored = self.__exists(blob_key, BLOB_POSTFIX)
+
+        # Values queued for S3 by the write-behind mode have no expiration yet
+        if stored and self.key_ttls["blob"] and self.redis_cache.ttl(key) > 0:
+            self.__expire_value(key, self.key_ttls["blob"])
+        return stored
+
+    def flush(self, timeout_sec=30):
+        """Persists to S3 the values still queued by the write-behind mode
+
+        Returns:
+            bool: True if every queued value has been persisted
+        """
+        if self.write_behind is None:
+            return True
+        return self.write_behind.flush(timeout_sec)
+
+    def purge_session(self, session_id):
+        """Deletes the payload of a session and the inputs, outputs and errors of its tasks
+        from Redis and S3, shared blobs are kept
+
+        Returns:
+            int: the number of keys and objects deleted
+        """
+        prefix = str(self.subnamespace) + "/" if self.subnamespace is not None else ""
+        deleted = 0
+        batch = []
+        for pattern in session_key_patterns(session_id, prefix):
+            for key in self.redis_cache.scan_iter(match=pattern, count=1000):
+                batch.append(key)
+                if len(batch) == 1000:
+                    deleted += self.__delete_keys(batch)
+                    batch = []
+        if batch:
+            deleted += self.__delete_keys(batch)
+
+        if self.bucket:
+            for key_prefix in session_key_prefixes(session_id, prefix):
+                for response in self.bucket.objects.filter(Prefix=key_prefix).delete():
+                    deleted += len(response.get("Deleted", []))
+        return deleted
+
+    def memory_report(self, sample_size=1000):
+        """Estimates the Redis memory used by each session, see redis_memory_by_session"""
+        prefix = str(self.subnamespace) + "/" if self.subnamespace is not None else ""
+        return redis_memory_by_session(self.redis_cache, sample_size, prefix)
+
+    def open_input_stream(self, task_id):
+        return self.__open_stream(task_id, INPUT_POSTFIX)
+
+    def open_output_stream(self, task_id):
+        return self.__open_stream(task_id, OUTPUT_POSTFIX)
+
+    def open_input_writer(self, task_id):
+        return self.__open_writer(task_id, INPUT_POSTFIX)
+
+    def open_output_writer(self, task_id):
+        return self.__open_writer(task_id, OUTPUT_POSTFIX)
+
+    def __open_stream(self, task_id, postfix):
+        """Returns a file-like object reading the value incrementally, chunk by chunk for
+        chunked values and from S3 on a cache miss"""
+        key = self.__get_full_key(task_id, postfix)
+        content = self.redis_cache.get(key)
+        if content is None:
+            if not self.bucket:
+                raise Exception("Cache miss for {}".format(task_id))
+            return open_s3_object_stream(
+                self.s3.meta.client, self.namespace, key, self.compressor
+            )
+
+        manifest = parse_chunk_manifest(content)
+        if manifest is not None:
+            return io.BufferedReader(
+                RedisChunkReader(self.redis_cache, key, manifest[0], manifest[2]),
+                buffer_size=self.stream_chunk_size,
+            )
+        return io.BytesIO(self.compressor.decompress(content))
+
+    def __open_writer(self, task_id, postfix):
+        """Returns a file-like object writing the value in chunks (uncompressed), the value
+        is visible once the writer is closed"""
+        key = self.__get_full_key(task_id, postfix)
+        tee = None
+        if self.bucket and self.write_behind is None:
+            tee = S3ObjectWriter(
+                self.s3.meta.client,
+                self.namespace,
+                key,
+                extra_args={
+                    "ServerSideEncryption": "AES256",
+                    "SSEKMSKeyId": self.s3_kms_key_id,
+                },
+                part_size=self.transfer_profile.multipart_chunksize,
+            )
+        return RedisChunkWriter(
+            self.redis_cache,
+            key,
+            chunk_size=self.stream_chunk_size,
+            tee=tee,
+            on_commit=self.write_behind.enqueue if self.write_behind else None,
+            ttl=self.__write_ttl(postfix),
+        )
+
+    def __read_value(self, key):
+        """Returns the stored value of key, chunked values are reassembled"""
+        content = self.redis_cache.get(key)
+        if content is None:
+            return None
+
+        manifest = parse_chunk_manifest(content)
+        if manifest is None:
+            return content
+        try:
+            with RedisChunkReader(self.redis_cache, key, manifest[0], manifest[2]) as reader:
+                return reader.read()
+        except ChunkEvictedException:
+            return None
+
+    def __exists(self, task_id, postfix):
+        """The value is looked up in Redis first, then in S3 since Redis may have evicted it"""
+        key = self.__get_full_key(task_id, postfix)
+        try:
+            if self.redis_cache.exists(key):
+                return True
+
+            if self.bucket:
+                self.bucket.Object(key).load()
+                return True
+
+            return False
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            print(e)
+            raise e
+
     def __get_full_key(self, key, postfix):
         if self.subnamespace is not None:
             return str(self.subnamespace) + "/" + str(key) + str(postfix)
         else:
             return str(key) + str(postfix)
 
-    ##################################################################################
-    # MIGHT NEED TO QUIT THE CONNECTION? IE CREATE THE CONNECTION WHEN NEEDED ONLY?###
-    ##################################################################################
-
     def __put_from_file(self, task_id, file_name, postfix):
+        if self.compressor.enabled:
+            with open(file_name, "rb") as in_file:
+                return self.__put_from_bytes(task_id, in_file.read(), postfix)
+
         try:
-            if self.bucket:
+            if self.bucket and self.write_behind is None:
                 self.bucket.upload_file(
                     Filename=file_name,
                     Key=self.__get_full_key(task_id, postfix),
@@ -133,15 +368,18 @@ class InOutRedis:
                         "ServerSideEncryption": "AES256",
                         "SSEKMSKeyId": self.s3_kms_key_id,
                     },
+                    Config=self.transfer_config,
                 )
 
-            in_file = open(file_name, "rb")
-
-            file_content = in_file.read()
-
-            in_file.close()
-
-            self.redis_cache.set(self.__get_full_key(task_id, postfix), file_content)
+            # The file is copied to Redis chunk by chunk, without reading it in memory
+            with open(file_name, "rb") as in_file, RedisChunkWriter(
+                self.redis_cache,
+                self.__get_full_key(task_id, postfix),
+                chunk_size=self.stream_chunk_size,
+                on_commit=self.write_behind.enqueue if self.write_behind else None,
+                ttl=self.__write_ttl(postfix),
+            ) as writer:
+                shutil.copyfileobj(in_file, writer, self.stream_chunk_size)
 
         except Exception as e:
             print(e, file=sys.stderr)
@@ -149,75 +387,132 @@ class InOutRedis:
 
     def __put_from_bytes(self, task_id, data, postfix):
         try:
-            if self.bucket:
-                with io.BytesIO(data) as f_data:
-                    self.bucket.upload_fileobj(
-                        Fileobj=f_data,
-                        Key=self.__get_full_key(task_id, postfix),
-                        ExtraArgs={
-                            "ServerSideEncryption": "AES256",
-                            "SSEKMSKeyId": self.s3_kms_key_id,
-                        },
-                    )
+            data = self.compressor.compress(data)
+            if self.bucket and self.write_behind is None:
+                self.__upload_to_s3(self.__get_full_key(task_id, postfix), data)
 
-            self.redis_cache.set(self.__get_full_key(task_id, postfix), data)
+            self.__set(
+                self.__get_full_key(task_id, postfix), data, self.__write_ttl(postfix)
+            )
 
         except Exception as e:
             print(e)
             raise e
 
-    def __get_to_bytes(self, task_id, postfix):
-        try:
-            content = self.redis_cache.get(self.__get_full_key(task_id, postfix))
-            if content is None:
-                # cache miss
-                print("Cache miss for " + task_id)
-
-                if self.bucket:
-                    with io.BytesIO() as f_data:
-                        self.bucket.download_fileobj(
-                            Key=self.__get_full_key(task_id, postfix), Fileobj=f_data
-                        )
-                        data = f_data.getvalue()
+    def __set(self, key, data, ttl=None):
+        """Writes a value to Redis, and queues it for S3 in write-behind mode. The chunks of
+        a value written by RedisChunkWriter that it replaces are retired."""
+        previous = read_chunk_manifest(self.redis_cache, key)
 
-                    if not data:
-                        raise Exception("Can not retrieve from S3 {} ".format(task_id))
-
-                    self.redis_cache.set(self.__get_full_key(task_id, postfix), data)
-                    return data
-                else:
-                    raise Exception("Cache miss for {}".format(task_id))
-            else:
-                return content
-        except Exception as e:
-            print(e)
-            raise e
+        if self.write_behind is None:
+            self.redis_cache.set(key, data, ex=ttl)
+        else:
+            pipeline = self.redis_cache.pipeline(transaction=False)
+            pipeline.set(key, data)
+            self.write_behind.enqueue(key, pipeline)
+            pipeline.execute()
+
+        if previous is not None:
+            retire_chunks(self.redis_cache, key, previous, ttl)
+
+    def __ttl(self, postfix):
+        return self.key_ttls[_TTL_KINDS[postfix]] or None
+
+    def __write_ttl(self, postfix):
+        """Values queued for S3 expire once persisted, see __persist"""
+        if self.write_behind is not None:
+            return None
+        return self.__ttl(postfix)
+
+    def __persist(self, key, data):
+        """Write-behind upload, the value starts expiring once it is in S3"""
+        self.__upload_to_s3(key, data)
+        self.__expire_by_kind(key)
+
+    def __expire_by_kind(self, key):
+        """Applies the expiration of the kind of a value, once persisted to S3 or once its
+        upload has been given up"""
+        for postfix, kind in _TTL_KINDS.items():
+            if key.endswith(postfix) and self.key_ttls[kind]:
+                self.__expire_value(key, self.key_ttls[kind])
+
+    def __demote_consumed_output(self, key):
+        """Shortens the expiration of an output once read, S3 keeps it"""
+        ttl = self.key_ttls["consumed_output"]
+        if not ttl or not self.bucket:
+            return
+        if self.write_behind is not None and (
+            self.redis_cache.zscore(self.write_behind.queue_key, key) is not None
+        ):
+            # not in S3 yet
+            return
+        if 0 < self.redis_cache.ttl(key) <= ttl:
+            return
+        self.__expire_value(key, ttl)
+
+    def __expire_value(self, key, ttl):
+        """Sets the expiration of a value, and of its chunks for a chunked value"""
+        keys = [key]
+        manifest = read_chunk_manifest(self.redis_cache, key)
+        if manifest is not None:
+            keys += [chunk_key(key, manifest[2], i) for i in range(manifest[0])]
+
+        pipeline = self.redis_cache.pipeline(transaction=False)
+        for k in keys:
+            pipeline.expire(k, ttl)
+        pipeline.execute()
+
+    def __delete_keys(self, keys):
+        # One DEL per key, the keys of a session may belong to different cluster slots
+        pipeline = self.redis_cache.pipeline(transaction=False)
+        for key in keys:
+            pipeline.delete(key)
+        deleted = sum(pipeline.execute())
+        if self.write_behind is not None:
+            self.redis_cache.zrem(self.write_behind.queue_key, *keys)
+        return deleted
+
+    def __upload_to_s3(self, key, data):
+        extra_args = {
+            "ServerSideEncryption": "AES256",
+            "SSEKMSKeyId": self.s3_kms_key_id,
+        }
+        if key.endswith(BLOB_POSTFIX):
+            extra_args["Tagging"] = BLOB_TAGGING
+        with io.BytesIO(data) as f_data:
+            self.bucket.upload_fileobj(
+                Fileobj=f_data,
+                Key=key,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config,
+            )
 
-    def __get_to_utf8_string(self, task_id, postfix):
+    def __get_to_bytes(self, task_id, postfix):
+        key = self.__get_full_key(task_id, postfix)
         try:
-            content = self.redis_cache.get(self.__get_full_key(task_id, postfix))
+            content = self.__read_value(key)
             if content is None:
                 # cache miss
                 print("Cache miss for " + task_id)
 
                 if self.bucket:
-                    with io.BytesIO() as f_data:
-                        self.bucket.download_fileobj(
-                            Key=self.__get_full_key(task_id, postfix), Fileobj=f_data
-                        )
-                        data = f_data.getvalue()
+                    content = self.transfer_profile.download(
+                        self.s3.meta.client, self.namespace, key
+                    )
 
-                    if not data:
+                    if not content:
                         raise Exception("Can not retrieve from S3 {} ".format(task_id))
 
-                    self.redis_cache.set(self.__get_full_key(task_id, postfix), data)
-
-                    return data.decode("utf-8")
+                    self.redis_cache.set(key, content, ex=self.__ttl(postfix))
                 else:
                     raise Exception("Cache miss for {}".format(task_id))
 
-            else:
-                return content.decode("utf-8")
+            if postfix == OUTPUT_POSTFIX:
+                self.__demote_consumed_output(key)
+            return self.compressor.decompress(content)
         except Exception as e:
             print(e)
             raise e
+
+    def __get_to_utf8_string(self, task_id, postfix):
+        return self.__get_to_bytes(task_id, postfix).decode("utf-8")
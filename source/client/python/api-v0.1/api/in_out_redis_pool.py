@@ -0,0 +1,192 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import json
+import logging
+import threading
+import time
+
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+REDIS_PORT = 6379
+
+DEFAULT_REDIS_POOL_CONFIG = {
+    "max_connections": 32,
+    "pool_timeout_sec": 5,
+    "socket_timeout_sec": 5,
+    "socket_connect_timeout_sec": 5,
+    "socket_keepalive": True,
+    "health_check_interval_sec": 30,
+    "retry_attempts": 3,
+    "cluster": False,
+}
+
+
+class RedisPoolStats:
+    """Time spent waiting for a pooled connection and number of connections opened, for
+    every pool of the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = self.__new_stats()
+
+    def record_wait(self, wait_ms):
+        with self.lock:
+            self.stats["connection_requests"] += 1
+            self.stats["pool_wait_ms_total"] += wait_ms
+            self.stats["pool_wait_ms_max"] = max(self.stats["pool_wait_ms_max"], wait_ms)
+
+    def record_connection_created(self):
+        with self.lock:
+            self.stats["connections_created"] += 1
+
+    def get_and_reset_stats(self):
+        """Returns connection_requests, connections_created, pool_wait_ms (average) and
+        pool_wait_ms_max since the last call"""
+        with self.lock:
+            stats = self.stats
+            self.stats = self.__new_stats()
+
+        wait_ms = stats.pop("pool_wait_ms_total")
+        stats["pool_wait_ms"] = (
+            round(wait_ms / stats["connection_requests"], 3)
+            if stats["connection_requests"]
+            else 0
+        )
+        return stats
+
+    @staticmethod
+    def __new_stats():
+        return {
+            "connection_requests": 0,
+            "connections_created": 0,
+            "pool_wait_ms_total": 0.0,
+            "pool_wait_ms_max": 0.0,
+        }
+
+
+redis_pool_stats = RedisPoolStats()
+
+
+class _InstrumentedPoolMixin:
+    def get_connection(self, *args, **kwargs):
+        t_start = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        redis_pool_stats.record_wait((time.perf_counter() - t_start) * 1000)
+        return connection
+
+    def make_connection(self):
+        redis_pool_stats.record_connection_created()
+        return super().make_connection()
+
+
+class InstrumentedBlockingConnectionPool(
+    _InstrumentedPoolMixin, redis.BlockingConnectionPool
+):
+    """Connection pool waiting up to timeout for a free connection when max_connections
+    are in use"""
+
+
+class InstrumentedConnectionPool(_InstrumentedPoolMixin, redis.ConnectionPool):
+    """Connection pool of the nodes of a Redis cluster"""
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def redis_pool_config(pool_config=None):
+    """Returns the connection settings from the "redis_pool_config" configuration, a JSON
+    document (or dict) overriding DEFAULT_REDIS_POOL_CONFIG such as:
+
+    {"max_connections": 64, "socket_timeout_sec": 2, "cluster": true}
+    """
+    if not pool_config:
+        pool_config = {}
+    elif isinstance(pool_config, str):
+        pool_config = json.loads(pool_config)
+
+    unknown = set(pool_config) - set(DEFAULT_REDIS_POOL_CONFIG)
+    if unknown:
+        raise Exception(
+            "redis_pool_config: unknown settings {}, valid settings are {}".format(
+                sorted(unknown), list(DEFAULT_REDIS_POOL_CONFIG)
+            )
+        )
+
+    config = dict(DEFAULT_REDIS_POOL_CONFIG)
+    config.update(pool_config)
+    return config
+
+
+def redis_connection(cache_url, cache_password, pool_config=None):
+    """Returns a client of the redis cache, shared by every caller of the process using the
+    same cache and settings so that the connections (and their TLS sessions) are reused,
+    e.g. across the invocations of a warm Lambda.
+
+    Args:
+        cache_url(string): host of the redis cache (or of a node of the cluster)
+        cache_password(string): AUTH password of the redis cache
+        pool_config(string or dict): connection settings, see redis_pool_config
+
+    Returns:
+        object: a redis.Redis, or a redis.cluster.RedisCluster in cluster mode
+    """
+    config = redis_pool_config(pool_config)
+    client_key = (cache_url, cache_password, json.dumps(config, sort_keys=True))
+
+    with _clients_lock:
+        client = _clients.get(client_key)
+        if client is None:
+            client = _new_client(cache_url, cache_password, config)
+            _clients[client_key] = client
+        return client
+
+
+def _new_client(cache_url, cache_password, config):
+    connection_kwargs = {
+        "password": cache_password,
+        "socket_timeout": config["socket_timeout_sec"],
+        "socket_connect_timeout": config["socket_connect_timeout_sec"],
+        "socket_keepalive": config["socket_keepalive"],
+        "health_check_interval": config["health_check_interval_sec"],
+    }
+
+    if config["cluster"]:
+        from redis.cluster import RedisCluster
+
+        logger.info("Connecting to the redis cluster {}".format(cache_url))
+        return RedisCluster(
+            host=cache_url,
+            port=REDIS_PORT,
+            ssl=True,
+            max_connections=config["max_connections"],
+            connection_pool_class=InstrumentedConnectionPool,
+            cluster_error_retry_attempts=config["retry_attempts"],
+            **connection_kwargs
+        )
+
+    pool = InstrumentedBlockingConnectionPool(
+        connection_class=redis.SSLConnection,
+        host=cache_url,
+        port=REDIS_PORT,
+        max_connections=config["max_connections"],
+        timeout=config["pool_timeout_sec"],
+        retry=Retry(ExponentialBackoff(cap=1, base=0.05), config["retry_attempts"]),
+        **connection_kwargs
+    )
+    return redis.StrictRedis(connection_pool=pool)
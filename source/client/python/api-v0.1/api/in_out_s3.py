@@ -3,9 +3,16 @@
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
 import boto3
+import botocore
 import sys
 import io
 import logging
+import os
+
+from api.in_out_compression import InOutCompressor
+from api.in_out_lifecycle import BLOB_TAGGING, blob_is_fresh, session_key_prefixes
+from api.in_out_stream import S3ObjectWriter, open_s3_object_stream
+from api.in_out_transfer import S3TransferProfile
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
@@ -19,6 +26,7 @@ INPUT_POSTFIX = "-input"
 OUTPUT_POSTFIX = "-output"
 ERROR_POSTFIX = "-error"
 PAYLOAD_POSTFIX = "-payload"
+BLOB_POSTFIX = "-blob"
 
 
 class InOutS3:
@@ -40,6 +48,9 @@ class InOutS3:
         s3_kms_key_id,
         subnamespace=None,
         s3_custom_resource=None,
+        compressor=None,
+        transfer_profile=None,
+        blob_expiration_days=0,
     ):
         """Initialize a dataplane backed by an S3 bucket
 
@@ -48,13 +59,27 @@ class InOutS3:
             region(string): region where the s3 bucket has been created
             subnamespace(string): subnamespace of the S3 bucket
             s3_custom_resource(object): override default S3 resource
+            compressor(InOutCompressor): compression of the stored values, none by default
+            transfer_profile(S3TransferProfile): multipart and concurrency settings, boto3
+                defaults by default
+            blob_expiration_days(int): expiration of the blobs by the lifecycle rule of the
+                bucket, blobs are uploaded again once half of it has elapsed (see has_blob).
+                0 if blobs do not expire
         """
 
         self.namespace = namespace
+        self.blob_expiration_days = blob_expiration_days
         self.subnamespace = subnamespace
+        self.compressor = compressor if compressor is not None else InOutCompressor()
+        self.transfer_profile = (
+            transfer_profile if transfer_profile is not None else S3TransferProfile()
+        )
+        self.transfer_config = self.transfer_profile.transfer_config()
 
         if s3_custom_resource is None:
-            self.s3 = boto3.resource("s3", region_name=region)
+            self.s3 = boto3.resource(
+                "s3", region_name=region, config=self.transfer_profile.client_config()
+            )
             logger.warning("using s3 resource from AWS")
         else:
             self.s3 = s3_custom_resource
@@ -119,6 +144,54 @@ class InOutS3:
     def get_payload_to_bytes(self, task_id):
         return self.__get_to_bytes(task_id, PAYLOAD_POSTFIX)
 
+    def put_blob_from_bytes(self, blob_key, data):
+        self.__put_from_bytes(blob_key, data, BLOB_POSTFIX)
+
+    def get_blob_to_bytes(self, blob_key):
+        return self.__get_to_bytes(blob_key, BLOB_POSTFIX)
+
+    def has_blob(self, blob_key):
+        """Returns True if the blob is stored and does not expire soon, see blob_is_fresh"""
+        try:
+            blob = self.bucket.Object(self.__get_full_key(blob_key, BLOB_POSTFIX))
+            blob.load()
+            return blob_is_fresh(blob.last_modified, self.blob_expiration_days)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            print(e, file=sys.stderr)
+            raise e
+
+    def flush(self, timeout_sec=30):
+        """Writes to S3 are synchronous, nothing is pending"""
+        return True
+
+    def purge_session(self, session_id):
+        """Deletes the payload of a session and the inputs, outputs and errors of its tasks,
+        shared blobs are kept
+
+        Returns:
+            int: the number of objects deleted
+        """
+        prefix = str(self.subnamespace) + "/" if self.subnamespace is not None else ""
+        deleted = 0
+        for key_prefix in session_key_prefixes(session_id, prefix):
+            for response in self.bucket.objects.filter(Prefix=key_prefix).delete():
+                deleted += len(response.get("Deleted", []))
+        return deleted
+
+    def open_input_stream(self, task_id):
+        return self.__open_stream(task_id, INPUT_POSTFIX)
+
+    def open_output_stream(self, task_id):
+        return self.__open_stream(task_id, OUTPUT_POSTFIX)
+
+    def open_input_writer(self, task_id):
+        return self.__open_writer(task_id, INPUT_POSTFIX)
+
+    def open_output_writer(self, task_id):
+        return self.__open_writer(task_id, OUTPUT_POSTFIX)
+
     # Do we need to implement it for buffers?
     # def get_input_to_buffer(self, taskId):
     #     return self.__get_to_buffer(taskId, INPUT_POSTFIX)
@@ -126,7 +199,34 @@ class InOutS3:
     # def get_output_to_buffer(self, taskId):
     #     return self.__get_to_buffer(taskId, OUTPUT_POSTFIX)
 
+    def __open_stream(self, task_id, postfix):
+        """Returns a file-like object reading the value incrementally"""
+        return open_s3_object_stream(
+            self.s3.meta.client,
+            self.namespace,
+            self.__get_full_key(task_id, postfix),
+            self.compressor,
+        )
+
+    def __open_writer(self, task_id, postfix):
+        """Returns a file-like object writing the value with a multipart upload, the value is
+        stored (uncompressed) when the writer is closed"""
+        return S3ObjectWriter(
+            self.s3.meta.client,
+            self.namespace,
+            self.__get_full_key(task_id, postfix),
+            extra_args={
+                "ServerSideEncryption": "AES256",
+                "SSEKMSKeyId": self.s3_kms_key_id,
+            },
+            part_size=self.transfer_profile.multipart_chunksize,
+        )
+
     def __put_from_file(self, task_id, file_name, postfix):
+        if self.compressor.enabled:
+            with open(file_name, "rb") as in_file:
+                return self.__put_from_bytes(task_id, in_file.read(), postfix)
+
         try:
             self.bucket.upload_file(
                 Filename=file_name,
@@ -135,6 +235,7 @@ class InOutS3:
                     "ServerSideEncryption": "AES256",
                     "SSEKMSKeyId": self.s3_kms_key_id,
                 },
+                Config=self.transfer_config,
             )
         except Exception as e:
             print(e, file=sys.stderr)
@@ -142,23 +243,44 @@ class InOutS3:
 
     def __get_to_file(self, task_id, file_name, postfix):
         try:
-            self.bucket.download_file(
-                Key=self.__get_full_key(task_id, postfix), Filename=file_name
-            )
+            try:
+                with open(file_name, "wb") as f_data:
+                    self.transfer_profile.download(
+                        self.s3.meta.client,
+                        self.namespace,
+                        self.__get_full_key(task_id, postfix),
+                        fileobj=f_data,
+                    )
+            except Exception:
+                os.remove(file_name)
+                raise
+
+            with open(file_name, "r+b") as f_data:
+                if self.compressor.is_compressed(f_data.read(16)):
+                    f_data.seek(0)
+                    data = self.compressor.decompress(f_data.read())
+                    f_data.seek(0)
+                    f_data.write(data)
+                    f_data.truncate()
         except Exception as e:
             print(e, file=sys.stderr)
             raise e
 
     def __put_from_bytes(self, task_id, data, postfix):
         try:
+            data = self.compressor.compress(data)
+            extra_args = {
+                "ServerSideEncryption": "AES256",
+                "SSEKMSKeyId": self.s3_kms_key_id,
+            }
+            if postfix == BLOB_POSTFIX:
+                extra_args["Tagging"] = BLOB_TAGGING
             with io.BytesIO(data) as f_data:
                 self.bucket.upload_fileobj(
                     Fileobj=f_data,
                     Key=self.__get_full_key(task_id, postfix),
-                    ExtraArgs={
-                        "ServerSideEncryption": "AES256",
-                        "SSEKMSKeyId": self.s3_kms_key_id,
-                    },
+                    ExtraArgs=extra_args,
+                    Config=self.transfer_config,
                 )
         except Exception as e:
             print(e, file=sys.stderr)
@@ -173,11 +295,12 @@ class InOutS3:
 
     def __get_to_bytes(self, task_id, postfix):
         try:
-            with io.BytesIO() as f_data:
-                self.bucket.download_fileobj(
-                    Key=self.__get_full_key(task_id, postfix), Fileobj=f_data
-                )
-                return f_data.getvalue()
+            data = self.transfer_profile.download(
+                self.s3.meta.client,
+                self.namespace,
+                self.__get_full_key(task_id, postfix),
+            )
+            return self.compressor.decompress(data)
         except Exception as e:
             print(e, file=sys.stderr)
             raise e
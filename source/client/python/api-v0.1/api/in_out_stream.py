@@ -0,0 +1,392 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import io
+import os
+import struct
+
+# S3 rejects multipart parts smaller than 5 MB, but the last one
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_REDIS_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Values written in chunks to Redis are stored under <key>-chunk-<generation>-<i>, <key> holds
+# a manifest made of CHUNK_MAGIC, the number of chunks, the total size and the generation, a
+# random number drawn by each write so that a rewrite never overwrites the chunks being read.
+CHUNK_MAGIC = b"\xfeHC"
+_MANIFEST = struct.Struct("!3sIQQ")
+CHUNK_MANIFEST_SIZE = _MANIFEST.size
+# Chunks of the previous generation of a rewritten value expire after this delay, which lets
+# the readers that fetched the previous manifest finish
+CHUNK_GENERATION_GRACE_SEC = 60
+
+
+TMP_FILE_PREFIX = ".tmp-"
+
+
+def create_temporary_file(directory, file_mode=None):
+    """Creates an empty temporary file in directory, like tempfile.mkstemp but with the mode
+    open(2) gives new files (0o666 less the umask of the process, applied by the kernel) or
+    file_mode if provided. mkstemp creates files readable by their owner only.
+
+    Returns:
+        (int, string): the file descriptor opened for writing and the path of the file
+    """
+    while True:
+        tmp_name = os.path.join(directory, TMP_FILE_PREFIX + os.urandom(8).hex())
+        try:
+            fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        if file_mode is not None:
+            os.fchmod(fd, file_mode)
+        return fd, tmp_name
+
+
+class ChunkEvictedException(Exception):
+    pass
+
+
+def chunk_key(key, generation, index):
+    return "{}-chunk-{:016x}-{}".format(key, generation, index)
+
+
+def new_chunk_generation():
+    return struct.unpack("!Q", os.urandom(8))[0]
+
+
+def pack_chunk_manifest(chunk_count, size, generation):
+    return _MANIFEST.pack(CHUNK_MAGIC, chunk_count, size, generation)
+
+
+def parse_chunk_manifest(value):
+    """Returns (chunk_count, size, generation) if value is a chunk manifest, None otherwise"""
+    if len(value) != _MANIFEST.size or bytes(value[:3]) != CHUNK_MAGIC:
+        return None
+    _, chunk_count, size, generation = _MANIFEST.unpack(value)
+    return chunk_count, size, generation
+
+
+def read_chunk_manifest(redis_cache, key):
+    """Returns the manifest of the value of key, None if it is not chunked (or missing)"""
+    # A manifest is CHUNK_MANIFEST_SIZE bytes long, one more byte tells it from a longer
+    # value without reading the value itself
+    return parse_chunk_manifest(redis_cache.getrange(key, 0, CHUNK_MANIFEST_SIZE))
+
+
+def retire_chunks(redis_cache, key, manifest, ttl=None):
+    """Lets the chunks of a value replaced in Redis expire once the readers that fetched
+    its manifest had CHUNK_GENERATION_GRACE_SEC to finish (ttl, the expiration of the new
+    value, if shorter)"""
+    chunk_count, _, generation = manifest
+    grace_sec = CHUNK_GENERATION_GRACE_SEC
+    if ttl:
+        grace_sec = min(grace_sec, ttl)
+    pipeline = redis_cache.pipeline(transaction=False)
+    for i in range(chunk_count):
+        pipeline.expire(chunk_key(key, generation, i), grace_sec)
+    pipeline.execute()
+
+
+class _StreamWriter(io.RawIOBase):
+    """Base of the writers: data is buffered up to part_size and flushed part by part.
+    close() commits the value, leaving a `with` block on an exception aborts it."""
+
+    def __init__(self, part_size):
+        super().__init__()
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed stream")
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            part_size = self.part_size
+            part = bytes(self.buffer[:part_size])
+            del self.buffer[:part_size]
+            self._write_part(part)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._commit(bytes(self.buffer))
+            except Exception:
+                self._abort()
+                raise
+            finally:
+                self.buffer = bytearray()
+                super().close()
+
+    def abort(self):
+        """Discards the value being written"""
+        if not self.closed:
+            self._abort()
+            self.buffer = bytearray()
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self):
+        # A writer that was never closed is discarded rather than committed partially
+        try:
+            self.abort()
+        except Exception:
+            pass
+
+    def _write_part(self, part):
+        raise NotImplementedError
+
+    def _commit(self, last_part):
+        raise NotImplementedError
+
+    def _abort(self):
+        raise NotImplementedError
+
+
+class S3ObjectWriter(_StreamWriter):
+    """Writes an S3 object with a multipart upload, a value smaller than a part is written
+    with a single PutObject on close"""
+
+    def __init__(
+        self, s3_client, bucket, key, extra_args=None, part_size=S3_MIN_PART_SIZE
+    ):
+        super().__init__(max(part_size, S3_MIN_PART_SIZE))
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.extra_args = extra_args or {}
+        self.upload_id = None
+        self.parts = []
+
+    def _write_part(self, part):
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args
+            )["UploadId"]
+
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=part,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def _commit(self, last_part):
+        if self.upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=last_part, **self.extra_args
+            )
+            return
+
+        if last_part:
+            self._write_part(last_part)
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def _abort(self):
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+
+class RedisChunkWriter(_StreamWriter):
+    """Writes a value to Redis in chunks of chunk_size, the manifest is written on close so
+    readers never see a partial value. The chunks belong to a new generation: the chunks of
+    a value being rewritten stay readable, then expire CHUNK_GENERATION_GRACE_SEC after the
+    new manifest replaced theirs.
+
+    Args:
+        tee(_StreamWriter): optional writer receiving the same data (e.g. S3ObjectWriter)
+        on_commit(function): called with the key once the value is written
+        ttl(int): expiration in seconds of the value and its chunks, None for no expiration
+    """
+
+    def __init__(
+        self,
+        redis_cache,
+        key,
+        chunk_size=DEFAULT_REDIS_CHUNK_SIZE,
+        tee=None,
+        on_commit=None,
+        ttl=None,
+    ):
+        super().__init__(chunk_size)
+        self.redis_cache = redis_cache
+        self.key = key
+        self.tee = tee
+        self.on_commit = on_commit
+        self.ttl = ttl
+        self.generation = new_chunk_generation()
+        self.chunk_count = 0
+
+    def write(self, data):
+        if self.tee is not None:
+            self.tee.write(data)
+        return super().write(data)
+
+    def _write_part(self, part):
+        self.redis_cache.set(
+            chunk_key(self.key, self.generation, self.chunk_count), part, ex=self.ttl
+        )
+        self.chunk_count += 1
+
+    def _commit(self, last_part):
+        if self.tee is not None:
+            self.tee.close()
+
+        previous = read_chunk_manifest(self.redis_cache, self.key)
+
+        if self.chunk_count == 0:
+            # Values smaller than a chunk are stored as usual
+            self.redis_cache.set(self.key, last_part, ex=self.ttl)
+        else:
+            if last_part:
+                self._write_part(last_part)
+            self.redis_cache.set(
+                self.key,
+                pack_chunk_manifest(self.chunk_count, self.size, self.generation),
+                ex=self.ttl,
+            )
+
+        if previous is not None:
+            retire_chunks(self.redis_cache, self.key, previous, self.ttl)
+
+        if self.on_commit is not None:
+            self.on_commit(self.key)
+
+    def _abort(self):
+        if self.tee is not None:
+            self.tee.abort()
+        if self.chunk_count:
+            self.redis_cache.delete(
+                *[
+                    chunk_key(self.key, self.generation, i)
+                    for i in range(self.chunk_count)
+                ]
+            )
+
+
+class LocalFileWriter(_StreamWriter):
+    """Writes a file through a temporary file of the same directory, renamed over the
+    destination on close so readers never see a partial value"""
+
+    def __init__(self, file_name, part_size=1024 * 1024, file_mode=None):
+        super().__init__(part_size)
+        self.file_name = file_name
+        directory = os.path.dirname(file_name) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_name = create_temporary_file(directory, file_mode)
+        self.tmp_file = os.fdopen(fd, "wb")
+
+    def _write_part(self, part):
+        self.tmp_file.write(part)
+
+    def _commit(self, last_part):
+        self.tmp_file.write(last_part)
+        self.tmp_file.close()
+        os.replace(self.tmp_name, self.file_name)
+
+    def _abort(self):
+        self.tmp_file.close()
+        if os.path.exists(self.tmp_name):
+            os.remove(self.tmp_name)
+
+
+class _StreamReader(io.RawIOBase):
+    """Base of the readers: serves the value part by part from _read_part"""
+
+    def __init__(self):
+        super().__init__()
+        self.part = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.part:
+            part = self._read_part()
+            if part is None:
+                return 0
+            self.part = memoryview(part)
+
+        size = min(len(buffer), len(self.part))
+        buffer[:size] = self.part[:size]
+        self.part = self.part[size:]
+        return size
+
+    def _read_part(self):
+        """Returns the next part of the value, None at the end"""
+        raise NotImplementedError
+
+
+def open_s3_object_stream(s3_client, bucket, key, compressor):
+    """Returns a buffered reader of an S3 object. Compressed values are not streamed, they
+    are decompressed in memory."""
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    reader = io.BufferedReader(S3ObjectReader(response["Body"]))
+    if compressor.is_compressed(reader.peek(16)[:16]):
+        with reader:
+            return io.BytesIO(compressor.decompress(reader.read()))
+    return reader
+
+
+class S3ObjectReader(_StreamReader):
+    """Reads an S3 object from its GetObject body, read_size bytes at a time"""
+
+    def __init__(self, body, read_size=1024 * 1024):
+        super().__init__()
+        self.body = body
+        self.read_size = read_size
+
+    def _read_part(self):
+        return self.body.read(self.read_size) or None
+
+    def close(self):
+        if not self.closed:
+            self.body.close()
+        super().close()
+
+
+class RedisChunkReader(_StreamReader):
+    """Reads a value written by RedisChunkWriter, one chunk in memory at a time"""
+
+    def __init__(self, redis_cache, key, chunk_count, generation):
+        super().__init__()
+        self.redis_cache = redis_cache
+        self.key = key
+        self.chunk_count = chunk_count
+        self.generation = generation
+        self.next_chunk = 0
+
+    def _read_part(self):
+        if self.next_chunk == self.chunk_count:
+            return None
+
+        chunk = self.redis_cache.get(
+            chunk_key(self.key, self.generation, self.next_chunk)
+        )
+        if chunk is None:
+            raise ChunkEvictedException(
+                "Chunk {} of {} evicted from the cache".format(self.next_chunk, self.key)
+            )
+        self.next_chunk += 1
+        return chunk
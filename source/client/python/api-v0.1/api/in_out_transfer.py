@@ -0,0 +1,191 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Named transfer profiles, "default" matches the boto3 defaults
+S3_TRANSFER_PROFILES = {
+    "default": {
+        "multipart_threshold": 8 * MB,
+        "multipart_chunksize": 8 * MB,
+        "max_concurrency": 10,
+        "max_pool_connections": 10,
+    },
+    # Task inputs and small outputs: single request transfers
+    "small_payloads": {
+        "multipart_threshold": 64 * MB,
+        "multipart_chunksize": 16 * MB,
+        "max_concurrency": 4,
+        "max_pool_connections": 10,
+    },
+    # Outputs of hundreds of MB (e.g. Monte Carlo paths) fetched by clients
+    "large_results": {
+        "multipart_threshold": 16 * MB,
+        "multipart_chunksize": 16 * MB,
+        "max_concurrency": 32,
+        "max_pool_connections": 64,
+    },
+}
+DEFAULT_S3_TRANSFER_PROFILE = "default"
+
+
+def s3_transfer_profile(transfer_config=None):
+    """Creates the S3 transfer profile of the data plane from the "grid_storage_transfer"
+    configuration, a JSON document (or dict) such as:
+
+    {"profile": "large_results", "max_concurrency": 16}
+
+    "profile" is one of S3_TRANSFER_PROFILES (default "default"), the other keys override the
+    values of the profile: multipart_threshold, multipart_chunksize (bytes), max_concurrency
+    and max_pool_connections.
+
+    Args:
+        transfer_config(str or dict): the transfer configuration, None for the default profile
+
+    Returns:
+        S3TransferProfile: the transfer profile
+    """
+    if not transfer_config:
+        transfer_config = {}
+    elif isinstance(transfer_config, str):
+        transfer_config = json.loads(transfer_config)
+
+    transfer_config = dict(transfer_config)
+    profile = transfer_config.pop("profile", DEFAULT_S3_TRANSFER_PROFILE)
+    if profile not in S3_TRANSFER_PROFILES:
+        raise Exception(
+            "S3TransferProfile: unknown profile [{}], valid profiles are {}".format(
+                profile, list(S3_TRANSFER_PROFILES)
+            )
+        )
+
+    settings = dict(S3_TRANSFER_PROFILES[profile])
+    settings.update(transfer_config)
+    return S3TransferProfile(**settings)
+
+
+class S3TransferProfile:
+    """Transfer settings of InOutS3: multipart uploads, parallel ranged downloads and size
+    of the HTTP connection pool (which must allow max_concurrency parallel requests)."""
+
+    def __init__(
+        self,
+        multipart_threshold=8 * MB,
+        multipart_chunksize=8 * MB,
+        max_concurrency=10,
+        max_pool_connections=10,
+    ):
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_concurrency = max_concurrency
+        self.max_pool_connections = max_pool_connections
+
+    def transfer_config(self):
+        """Returns the boto3 TransferConfig of the uploads"""
+        return TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+        )
+
+    def client_config(self):
+        """Returns the botocore Config of the S3 client"""
+        return Config(max_pool_connections=self.max_pool_connections)
+
+    def download(self, s3_client, bucket, key, fileobj=None):
+        """Downloads an object with ranged GETs of multipart_chunksize bytes
+
+        The first GET returns the first part and the size of the object, objects smaller than
+        a part are downloaded with this single request (download_fileobj sends a HeadObject
+        first). The other parts are downloaded in parallel, up to max_concurrency, directly
+        into their place in the result.
+
+        Args:
+            s3_client(object): the S3 client
+            bucket(string): the bucket name
+            key(string): the object key
+            fileobj(object): seekable binary file receiving the object, None to return bytes
+
+        Returns:
+            bytes: the object if fileobj is None
+        """
+        part_size = self.multipart_chunksize
+        try:
+            response = s3_client.get_object(
+                Bucket=bucket, Key=key, Range="bytes=0-{}".format(part_size - 1)
+            )
+        except botocore.exceptions.ClientError as e:
+            # Ranges are not satisfiable on empty objects
+            if e.response["Error"]["Code"] != "InvalidRange":
+                raise e
+            return self.__result(bytearray(), fileobj)
+
+        first_part = response["Body"].read()
+        size = self.__object_size(response, len(first_part))
+        if size <= len(first_part):
+            return self.__result(first_part, fileobj)
+
+        if fileobj is None:
+            data = bytearray(size)
+            view = memoryview(data)
+
+            def write_part(start, part):
+                end = start + len(part)
+                view[start:end] = part
+
+        else:
+            file_lock = threading.Lock()
+
+            def write_part(start, part):
+                with file_lock:
+                    fileobj.seek(start)
+                    fileobj.write(part)
+
+        def download_part(start):
+            end = min(start + part_size, size)
+            part = s3_client.get_object(
+                Bucket=bucket, Key=key, Range="bytes={}-{}".format(start, end - 1)
+            )["Body"].read()
+            write_part(start, part)
+
+        write_part(0, first_part)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            # list() re-raises the first failed part
+            list(executor.map(download_part, range(part_size, size, part_size)))
+
+        if fileobj is None:
+            return bytes(data)
+        fileobj.seek(size)
+        return None
+
+    @staticmethod
+    def __object_size(response, default):
+        content_range = response.get("ContentRange")
+        if content_range:
+            # bytes <start>-<end>/<size>
+            return int(content_range.rpartition("/")[2])
+        return default
+
+    @staticmethod
+    def __result(data, fileobj):
+        if fileobj is None:
+            return bytes(data)
+        fileobj.write(data)
+        return None
@@ -0,0 +1,253 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import logging
+import threading
+import time
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITE_BEHIND_QUEUE_KEY = "htc-write-behind"
+DEFAULT_MAX_FAILED_KEYS = 10000
+DEFAULT_FAILED_RETENTION_SEC = 7 * 24 * 3600
+
+# Removes a key from the queue only if it still has the score it had when it was uploaded:
+# a key written again in the meantime was re-queued with a new score and must stay queued.
+_DEQUEUE_IF_UNCHANGED_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) == tonumber(ARGV[2]) then
+    return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+class S3WriteBehind:
+    """Persists to S3, in the background, values already written to Redis.
+
+    The keys waiting for S3 are kept in Redis in a sorted set scored by their enqueue time,
+    so the backlog survives the restart of the writer and is drained by any agent sharing the
+    cache. Before uploading a key a flusher claims it for claim_timeout_sec (SET NX EX), a key
+    claimed by a flusher that died is uploaded by another one once the claim expires. A failed
+    upload keeps its claim for retry_backoff_sec, then is retried up to max_attempts times
+    before the key is moved to the failed set. The value of a failed key is handed to
+    give_up, which applies its expiration, and the failed set only keeps the newest
+    max_failed_keys keys for failed_retention_sec after the last failure.
+    """
+
+    def __init__(
+        self,
+        redis_cache,
+        upload,
+        queue_key=DEFAULT_WRITE_BEHIND_QUEUE_KEY,
+        batch_size=32,
+        poll_interval_sec=0.5,
+        claim_timeout_sec=60,
+        retry_backoff_sec=5,
+        max_attempts=5,
+        read=None,
+        give_up=None,
+        max_failed_keys=DEFAULT_MAX_FAILED_KEYS,
+        failed_retention_sec=DEFAULT_FAILED_RETENTION_SEC,
+    ):
+        """
+        Args:
+            redis_cache(object): the redis connection holding the values and the queue
+            upload(function): upload(key, data) writes a value to S3
+            queue_key(string): redis key of the queue, the failed keys are in <queue_key>-failed
+            batch_size(int): number of keys uploaded per iteration
+            poll_interval_sec(float): wait of the background thread when the queue is empty
+            claim_timeout_sec(int): time after which a key claimed by a flusher can be re-claimed
+            retry_backoff_sec(int): time before a failed upload is retried
+            max_attempts(int): number of uploads attempted before a key is given up
+            read(function): read(key) returns the value to upload, redis GET by default
+            give_up(function): give_up(key) is called once the upload of a key is given up,
+                e.g. to let its value expire
+            max_failed_keys(int): number of keys kept in the failed set, the oldest are trimmed
+            failed_retention_sec(int): expiration of the failed set, renewed on each failure
+        """
+        self.redis_cache = redis_cache
+        self.upload = upload
+        self.read = read if read is not None else redis_cache.get
+        self.give_up = give_up
+        self.queue_key = queue_key
+        self.failed_key = queue_key + "-failed"
+        self.attempts_key = queue_key + "-attempts"
+        self.batch_size = batch_size
+        self.poll_interval_sec = poll_interval_sec
+        self.claim_timeout_sec = claim_timeout_sec
+        self.retry_backoff_sec = retry_backoff_sec
+        self.max_attempts = max_attempts
+        self.max_failed_keys = max_failed_keys
+        self.failed_retention_sec = failed_retention_sec
+
+        self.dequeue_if_unchanged = redis_cache.register_script(
+            _DEQUEUE_IF_UNCHANGED_SCRIPT
+        )
+
+        self.stats_lock = threading.Lock()
+        self.stats = self.__new_stats()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def enqueue(self, key, pipeline=None):
+        """Queues key for S3, on pipeline (sent with the write of the value) if provided"""
+        (pipeline or self.redis_cache).zadd(self.queue_key, {key: time.time() * 1000})
+
+    def start(self):
+        """Starts the background flusher thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.__run, name="s3-write-behind", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def flush(self, timeout_sec=30):
+        """Stops the background thread and uploads the queued keys synchronously
+
+        Returns:
+            bool: True if the queue is empty, keys claimed by other flushers may remain
+        """
+        self.stop()
+        deadline = time.monotonic() + timeout_sec
+        while self.backlog() > 0 and time.monotonic() < deadline:
+            if self.flush_once() == 0:
+                time.sleep(min(self.poll_interval_sec, timeout_sec))
+
+        backlog = self.backlog()
+        if backlog:
+            logger.warning(
+                "S3WriteBehind: {} keys not yet persisted to S3".format(backlog)
+            )
+        return backlog == 0
+
+    def backlog(self):
+        return self.redis_cache.zcard(self.queue_key)
+
+    def flush_once(self):
+        """Uploads a batch of the oldest queued keys
+
+        Returns:
+            int: the number of keys processed
+        """
+        processed = 0
+        entries = self.redis_cache.zrange(
+            self.queue_key, 0, self.batch_size - 1, withscores=True
+        )
+        for key, enqueued_ms in entries:
+            claim_key = self.queue_key + "-claim-" + key.decode("utf-8")
+            if not self.redis_cache.set(
+                claim_key, 1, nx=True, ex=self.claim_timeout_sec
+            ):
+                continue
+
+            self.__flush_key(key, enqueued_ms, claim_key)
+            processed += 1
+        return processed
+
+    def get_and_reset_stats(self):
+        """Returns the backlog, the number of keys flushed, retried and failed and the
+        average and max time between the write to Redis and the write to S3"""
+        with self.stats_lock:
+            stats = self.stats
+            self.stats = self.__new_stats()
+
+        latency_ms = stats.pop("flush_latency_ms_total")
+        stats["flush_latency_ms"] = (
+            round(latency_ms / stats["flushed"], 2) if stats["flushed"] else 0
+        )
+        stats["backlog"] = self.backlog()
+        return stats
+
+    @staticmethod
+    def __new_stats():
+        return {
+            "flushed": 0,
+            "retried": 0,
+            "failed": 0,
+            "flush_latency_ms_total": 0.0,
+            "flush_latency_ms_max": 0.0,
+        }
+
+    def __run(self):
+        while not self.stop_event.is_set():
+            try:
+                processed = self.flush_once()
+            except Exception as e:
+                logger.error("S3WriteBehind: cannot read the queue: [{}]".format(e))
+                processed = 0
+
+            if processed == 0:
+                self.stop_event.wait(self.poll_interval_sec)
+
+    def __flush_key(self, key, enqueued_ms, claim_key):
+        try:
+            data = self.read(key.decode("utf-8"))
+            if data is None:
+                raise Exception("value evicted from Redis before it was persisted")
+            self.upload(key.decode("utf-8"), data)
+
+        except Exception as e:
+            attempts = self.redis_cache.hincrby(self.attempts_key, key, 1)
+            if attempts < self.max_attempts:
+                logger.warning(
+                    "S3WriteBehind: upload of [{}] failed ({}/{}): [{}]".format(
+                        key, attempts, self.max_attempts, e
+                    )
+                )
+                # The claim is kept until the backoff expires
+                self.redis_cache.expire(claim_key, self.retry_backoff_sec)
+                with self.stats_lock:
+                    self.stats["retried"] += 1
+                return
+
+            logger.error(
+                "S3WriteBehind: giving up the upload of [{}]: [{}]".format(key, e)
+            )
+            self.__add_failed(key, enqueued_ms)
+            self.__dequeue(key, enqueued_ms, claim_key)
+            if self.give_up is not None:
+                try:
+                    self.give_up(key.decode("utf-8"))
+                except Exception as e:
+                    logger.error(
+                        "S3WriteBehind: cannot expire [{}]: [{}]".format(key, e)
+                    )
+            with self.stats_lock:
+                self.stats["failed"] += 1
+            return
+
+        # A key written again while it was uploaded has a new score and stays queued
+        self.__dequeue(key, enqueued_ms, claim_key)
+
+        latency_ms = time.time() * 1000 - enqueued_ms
+        with self.stats_lock:
+            self.stats["flushed"] += 1
+            self.stats["flush_latency_ms_total"] += latency_ms
+            self.stats["flush_latency_ms_max"] = max(
+                self.stats["flush_latency_ms_max"], latency_ms
+            )
+
+    def __add_failed(self, key, enqueued_ms):
+        pipeline = self.redis_cache.pipeline(transaction=False)
+        pipeline.zadd(self.failed_key, {key: enqueued_ms})
+        pipeline.zremrangebyrank(self.failed_key, 0, -self.max_failed_keys - 1)
+        pipeline.expire(self.failed_key, self.failed_retention_sec)
+        pipeline.execute()
+
+    def __dequeue(self, key, enqueued_ms, claim_key):
+        self.dequeue_if_unchanged(keys=[self.queue_key], args=[key, repr(enqueued_ms)])
+        self.redis_cache.hdel(self.attempts_key, key)
+        self.redis_cache.delete(claim_key)
@@ -0,0 +1,128 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import datetime
+import logging
+import time
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s  - %(lineno)d - %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.INFO,
+)
+
+DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC = 5
+
+QUEUE_DEPTH_COUNTERS = ["visible", "in_flight", "delayed"]
+
+
+class QueueDepthProvider:
+    """Cached view of the depth of a task queue (QueueSQS or QueuePrioritySQS).
+
+    A refresh sweeps every priority queue concurrently (see get_queue_depth_by_priority of the
+    task queue) and, when a CloudWatch client is supplied, reads the age of the oldest message of
+    every queue with a single GetMetricData call. The result is reused for cache_ttl_sec, so
+    callers that ask for the depth several times per tick pay for one sweep only.
+    """
+
+    def __init__(
+        self,
+        task_queue,
+        cache_ttl_sec=DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC,
+        cloudwatch_client=None,
+    ):
+        """
+        Args:
+            task_queue(object): the task queue returned by queue_manager
+            cache_ttl_sec(float): how long a sweep is reused, 0 disables caching
+            cloudwatch_client(object): optional boto3 CloudWatch client used to read
+                ApproximateAgeOfOldestMessage. Without it the age is reported as None.
+        """
+        self.task_queue = task_queue
+        self.cache_ttl_sec = cache_ttl_sec
+        self.cloudwatch_client = cloudwatch_client
+
+        self.cached_depth = None
+        self.cached_at = 0
+
+    def get_queue_depth(self):
+        """Returns the depth of the task queue, refreshed at most once per cache_ttl_sec.
+
+        Returns:
+            dict: {
+                "total": {"visible": int, "in_flight": int, "delayed": int, "oldest_message_age_sec": int},
+                "priorities": {priority: {"queue_name": str, "visible": int, ...}, ...},
+            }
+        """
+        if (
+            self.cached_depth is None
+            or time.monotonic() - self.cached_at >= self.cache_ttl_sec
+        ):
+            self.cached_depth = self.__read_queue_depth()
+            self.cached_at = time.monotonic()
+
+        return self.cached_depth
+
+    def get_queue_length(self):
+        """Returns the number of visible (i.e. pending) messages across all priorities."""
+        return self.get_queue_depth()["total"]["visible"]
+
+    def invalidate(self):
+        self.cached_depth = None
+
+    def __read_queue_depth(self):
+        priorities = self.task_queue.get_queue_depth_by_priority()
+
+        ages = self.__read_oldest_message_ages(
+            [depth["queue_name"] for depth in priorities.values()]
+        )
+        for depth in priorities.values():
+            depth["oldest_message_age_sec"] = ages.get(depth["queue_name"])
+
+        total = {c: sum(d[c] for d in priorities.values()) for c in QUEUE_DEPTH_COUNTERS}
+        known_ages = [a for a in ages.values() if a is not None]
+        total["oldest_message_age_sec"] = max(known_ages) if known_ages else None
+
+        return {"total": total, "priorities": priorities}
+
+    def __read_oldest_message_ages(self, queue_names):
+        """Reads ApproximateAgeOfOldestMessage of every queue in one GetMetricData call.
+        SQS publishes this metric once per minute, hence the 5 minutes look-back."""
+        if self.cloudwatch_client is None:
+            return {}
+
+        now = datetime.datetime.utcnow()
+        queries = [
+            {
+                "Id": f"age{i}",
+                "Label": queue_name,
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": "AWS/SQS",
+                        "MetricName": "ApproximateAgeOfOldestMessage",
+                        "Dimensions": [{"Name": "QueueName", "Value": queue_name}],
+                    },
+                    "Period": 60,
+                    "Stat": "Maximum",
+                },
+            }
+            for i, queue_name in enumerate(queue_names)
+        ]
+
+        try:
+            response = self.cloudwatch_client.get_metric_data(
+                MetricDataQueries=queries,
+                StartTime=now - datetime.timedelta(minutes=5),
+                EndTime=now,
+                ScanBy="TimestampDescending",
+            )
+        except Exception as e:
+            logging.warning(f"QueueDepthProvider: cannot read oldest message age: [{e}]")
+            return {}
+
+        ages = {}
+        for result in response.get("MetricDataResults", []):
+            if result.get("Values"):
+                ages[result["Label"]] = int(result["Values"][0])
+        return ages
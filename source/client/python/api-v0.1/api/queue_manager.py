@@ -15,7 +15,13 @@ logging.basicConfig(
 )
 
 
-def queue_manager(task_queue_service, task_queue_config, tasks_queue_name, region):
+def queue_manager(
+    task_queue_service,
+    task_queue_config,
+    tasks_queue_name,
+    region,
+    visibility_timeout_sec=None,
+):
     # TODO due to the way variables are propagated from terraform to AWS Lambda and to Agent file
     # double quotes can not be escaped during the deployment. As a way around, task queue configuration is
     # passed with the single quotes and then converted into double quotes here.
@@ -30,7 +36,11 @@ def queue_manager(task_queue_service, task_queue_config, tasks_queue_name, regio
         logging.debug("Initializing Tasks Tasks Queue using SQS Priority")
         endpoint_url = f"https://sqs.{region}.amazonaws.com"
         return QueuePrioritySQS(
-            endpoint_url, task_queue_config, tasks_queue_name, region
+            endpoint_url,
+            task_queue_config,
+            tasks_queue_name,
+            region,
+            visibility_timeout_sec=visibility_timeout_sec,
         )
     else:
         raise NotImplementedError()
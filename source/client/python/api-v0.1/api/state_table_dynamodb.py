@@ -30,6 +30,7 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
     level=logging.INFO,
 )
+logger = logging.getLogger(__name__)
 
 
 class StateTableDDB:
@@ -92,17 +93,17 @@ class StateTableDDB:
                     "ProvisionedThroughputExceededException",
                 ]:
                     msg = f"DynamoDB Batch Write Failed from DynamoDB, Throttling Exception [{e}] [{traceback.format_exc()}]"
-                    logging.warning(msg)
+                    logger.warning(msg)
                     raise StateTableException(e, msg, caused_by_throttling=True)
 
                 else:
                     msg = f"DynamoDB Batch Write Failed from DynamoDB Exception [{e}] [{traceback.format_exc()}]"
-                    logging.error(msg)
+                    logger.error(msg)
                     raise Exception(e)
 
             except Exception as e:
                 msg = f"DynamoDB Batch Write Failed from DynamoDB Exception [{e}] [{traceback.format_exc()}]"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
     def get_task_by_id(self, task_id, consistent_read=False):
@@ -131,19 +132,19 @@ class StateTableDDB:
                 "ThrottlingException",
                 "ProvisionedThroughputExceededException",
             ]:
-                logging.warning(
+                logger.warning(
                     f"Could not read row for task [{task_id}] from Status Table. Exception: {e} [{traceback.format_exc()}]"
                 )
                 return None
 
             else:
-                logging.error(
+                logger.error(
                     f"Could not read row for task [{task_id}] from Status Table. Exception: {e} [{traceback.format_exc()}]"
                 )
                 raise Exception(e)
 
         except Exception as e:
-            logging.error(
+            logger.error(
                 f"Could not read row for task [{task_id}] from Status Table. Exception: {e} [{traceback.format_exc()}]"
             )
             raise e
@@ -194,12 +195,12 @@ class StateTableDDB:
                 # By design we only take one page per tick (expired tasks drain across ticks),
                 # but surface when we hit the cap so a TTL-checker-can't-keep-up backlog is
                 # visible in CloudWatch instead of silently truncated.
-                logging.warning(
+                logger.warning(
                     "Partition %s hit the %d expired-task cap; remaining deferred to a later tick",
                     state_partition,
                     self.RETRIEVE_EXPIRED_TASKS_LIMIT,
                 )
-            logging.debug("Partition: %s expired tasks: %d", state_partition, n)
+            logger.debug("Partition: %s expired tasks: %d", state_partition, n)
 
             return response["Items"]
 
@@ -209,17 +210,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"{__name__} Failed. Throttling."
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"{__name__} Failed. Exception: [{e.response['Error']}]"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"{__name__} Failed. Exception: [{e}] {traceback.format_exc()}"
-            logging.error(msg)
+            logger.error(msg)
             raise
 
     def query_live_tasks(self):
@@ -281,17 +282,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"{__name__} Failed. Throttling."
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"{__name__} Failed. Exception: [{e.response['Error']}]"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"{__name__} Failed. Exception: [{e}] {traceback.format_exc()}"
-            logging.error(msg)
+            logger.error(msg)
             raise
 
     def retry_task(self, task_id, new_retry_count):
@@ -333,7 +334,7 @@ class StateTableDDB:
                 msg = f"{__name__} Failed ConditionalCheckFailedException.\
                     task_id [{task_id}] is no longer in State: task_status [{self.__make_task_state_from_task_id(TASK_STATE_PROCESSING, task_id)}]\
                     [{e.response['Error']}]"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_condition=True)
 
             if e.response["Error"]["Code"] in [
@@ -341,17 +342,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"{__name__} Failed. Throttling."
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"{__name__} Failed. Exception: [{e.response['Error']}]"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"{__name__} Failed. Exception: [{e}] {traceback.format_exc()}"
-            logging.error(msg)
+            logger.error(msg)
             raise
 
     # ---------------------------------------------------------------------------------------------
@@ -417,7 +418,7 @@ class StateTableDDB:
         except ClientError as e:
             if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
                 msg = f"Could not acquire task [{task_id}] for status [{self.__make_task_state_from_session_id(TASK_STATE_PENDING, session_id)}] from DynamoDB, someone else already locked it? [{e}]"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_condition=True)
 
             elif e.response["Error"]["Code"] in [
@@ -425,17 +426,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"Could not acquire task [{task_id}] from DynamoDB, Throttling Exception {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"ClientError while acquire task [{task_id}] from DynamoDB: {e}"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"Failed to acquire task [{task_id}] for agent [{agent_id}]: from DynamoDB: {e}"
-            logging.error(msg)
+            logger.error(msg)
             raise e
 
         return claim_is_successful
@@ -488,7 +489,7 @@ class StateTableDDB:
             if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
                 task_row = self.get_task_by_id(task_id, consistent_read=True)
                 msg = f"Could not update TTL on the own task [{task_id}] agent: [{agent_id}] state: [{self.__make_task_state_from_session_id(TASK_STATE_PROCESSING, session_id)}], did TTL Lambda re-assigned it? TaskRow: [{task_row}] {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_condition=True)
 
             elif e.response["Error"]["Code"] in [
@@ -496,17 +497,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"Could not update TTL on the own task [{task_id}] agent: [{agent_id}], Throttling Exception {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"Could not update TTL on the own task [{task_id}] agent: [{agent_id}]: {e}"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"Could not update TTL on the own task [{task_id}]: {e}"
-            logging.error(msg)
+            logger.error(msg)
             raise e
 
         return refresh_is_successful
@@ -563,7 +564,7 @@ class StateTableDDB:
                     on task:  [{task_id}] owner [{agent_id}] for status [{self.__make_task_state_from_session_id(TASK_STATE_PENDING, session_id)}] from DynamoDB,\
                     someone else already locked it? [{e}]. Check State Table read: [{check_read}]"
 
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_condition=True)
 
             elif e.response["Error"]["Code"] in [
@@ -571,17 +572,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"Could not set completion state to Finish on task:  [{task_id}] from DynamoDB, Throttling Exception {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"Could not set completion state to Finish on task: [{task_id}] from DynamoDB: {e}"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"Could not set completion state to Finish on task: [{task_id}] for agent [{agent_id}]: from DynamoDB: {e}"
-            logging.error(msg)
+            logger.error(msg)
             raise e
 
         return update_succesfull
@@ -647,16 +648,16 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"Could not read tasks for session status [{session_id}] by key expression from Status Table. Exception: {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"Could not read tasks for session status [{session_id}] by key expression from Status Table. Exception: {e}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise Exception(e)
 
         except Exception as e:
-            logging.error(
+            logger.error(
                 "Could not read tasks for session status [{}] by key expression from Status Table. Exception: {}".format(
                     session_id, e
                 )
@@ -698,7 +699,7 @@ class StateTableDDB:
 
     def __make_task_state_from_state_and_partition(self, task_state, partition_id):
         res = "{}{}".format(task_state, partition_id)
-        logging.info("PARTITION: {}".format(res))
+        logger.debug("PARTITION: %s", res)
 
         return res
 
@@ -719,7 +720,7 @@ class StateTableDDB:
             Exception for all other errors
         """
         if new_task_state not in [TASK_STATE_FAILED, TASK_STATE_CANCELLED]:
-            logging.error(
+            logger.error(
                 "__finalize_tasks_state called with incorrect input: {}".format(
                     new_task_state
                 )
@@ -747,17 +748,17 @@ class StateTableDDB:
                 "ProvisionedThroughputExceededException",
             ]:
                 msg = f"{__name__} Failed. Throttling. task_id [{task_id}] new state [{new_task_state}] {traceback.format_exc()}"
-                logging.warning(msg)
+                logger.warning(msg)
                 raise StateTableException(e, msg, caused_by_throttling=True)
 
             else:
                 msg = f"{__name__} Failed. task_id [{task_id}] new state [{new_task_state}]\
                     Exception: [{e.response['Error']}] {traceback.format_exc()}"
-                logging.error(msg)
+                logger.error(msg)
                 raise Exception(e)
 
         except Exception as e:
             msg = f"{__name__} Failed. task_id [{task_id}] new state [{new_task_state}]\
                 Exception: [{e}] {traceback.format_exc()}"
-            logging.error(msg)
+            logger.error(msg)
             raise e
@@ -0,0 +1,113 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+from utils.task_queue_common import TaskQueueException
+
+SCHEDULING_POLICY_STRICT = "strict"
+SCHEDULING_POLICY_WEIGHTED = "weighted"
+
+
+def priority_scheduler(task_queue_config, priorities):
+    """Creates the scheduling policy used by QueuePrioritySQS to choose which priority to serve.
+
+    Valid "scheduling_policy" values in task_queue_config:
+
+    "scheduling_policy" : "strict"   (default) higher priorities are always drained first
+    "scheduling_policy" : "weighted" smooth weighted round-robin using "priority_weights"
+
+    Args:
+        task_queue_config(dict): parsed task queue configuration
+        priorities(list): list of priorities, lowest first
+
+    Returns:
+        object: a scheduler implementing order() and served()
+    """
+    policy = task_queue_config.get("scheduling_policy", SCHEDULING_POLICY_STRICT)
+
+    if policy == SCHEDULING_POLICY_STRICT:
+        return StrictPriorityScheduler(priorities)
+
+    elif policy == SCHEDULING_POLICY_WEIGHTED:
+        return WeightedPriorityScheduler(
+            priorities, task_queue_config.get("priority_weights")
+        )
+
+    else:
+        raise TaskQueueException(
+            None, f"PrioritySQS: unknown scheduling_policy [{policy}]", ""
+        )
+
+
+class StrictPriorityScheduler:
+    """Always prefers the highest non-empty priority. Lower priorities can starve under load."""
+
+    def __init__(self, priorities):
+        self.priorities = priorities
+
+    def order(self):
+        """Returns priorities in the order they should be served, most preferred first."""
+        return list(reversed(self.priorities))
+
+    def served(self, priority, empty_priorities=()):
+        """Records the outcome of a receive attempt.
+
+        Args:
+            priority(int): priority of the message that was served, None if nothing was received
+            empty_priorities(iterable): priorities that were polled and returned nothing
+        """
+        pass
+
+
+class WeightedPriorityScheduler:
+    """Smooth weighted round-robin across priorities (the algorithm used by nginx upstreams).
+
+    Under sustained load on every queue, priority p receives weight[p] / sum(weights) of the
+    dequeues, interleaved rather than in bursts. The policy stays work conserving: when the
+    preferred queue is empty the next one in order is served. As in deficit round-robin, a
+    queue that was found empty loses its accumulated credit, so it cannot burst after idling,
+    and does not take part in the round, so the queues that were served do not build a debt.
+    """
+
+    def __init__(self, priorities, weights=None):
+        self.priorities = priorities
+
+        if weights is None:
+            weights = {p: p + 1 for p in priorities}
+        elif isinstance(weights, list):
+            weights = dict(enumerate(weights))
+        else:
+            weights = {int(p): w for p, w in weights.items()}
+
+        missing = [p for p in priorities if p not in weights]
+        if missing or any(weights[p] <= 0 for p in priorities):
+            raise TaskQueueException(
+                None,
+                f"PrioritySQS: priority_weights [{weights}] must hold a positive weight for every priority {priorities}",
+                "",
+            )
+
+        self.weights = {p: weights[p] for p in priorities}
+        self.total_weight = sum(self.weights.values())
+        self.current = {p: 0 for p in priorities}
+
+    def order(self):
+        # Ties go to the higher priority.
+        return sorted(
+            self.priorities,
+            key=lambda p: (self.current[p] + self.weights[p], p),
+            reverse=True,
+        )
+
+    def served(self, priority, empty_priorities=()):
+        if priority is None:
+            return
+
+        # Queues found empty sit this round out and drop their credit, the others share it.
+        active = [p for p in self.priorities if p not in empty_priorities]
+        for p in active:
+            self.current[p] += self.weights[p]
+        self.current[priority] -= sum(self.weights[p] for p in active)
+
+        for p in empty_priorities:
+            self.current[p] = 0
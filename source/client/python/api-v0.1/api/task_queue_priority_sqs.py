@@ -5,9 +5,15 @@
 
 import logging
 import json
+import threading
+import time
 import traceback
 
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
 from api.task_queue_sqs import QueueSQS
+from api.task_queue_priority_scheduler import priority_scheduler
 from utils.task_queue_common import TaskQueueException
 from utils import grid_error_logger as errlog
 
@@ -17,24 +23,153 @@ logging.basicConfig(
     level=logging.INFO,
 )
 
+RECEIVE_STRATEGY_SEQUENTIAL = "sequential"
+RECEIVE_STRATEGY_CONCURRENT = "concurrent"
+
+# How long (after the first message arrives) we keep waiting for a higher priority queue
+# to return a message before committing to the best message received so far.
+DEFAULT_RECEIVE_ARBITRATION_WINDOW_SEC = 0.1
+
+# Bounds of the message handle -> queue lookup. Entries older than the TTL belong to messages
+# whose visibility timeout expired, i.e. handles that are no longer usable. The TTL is the
+# visibility timeout the agent sets on the messages it receives plus a margin, or the SQS
+# maximum visibility timeout (12 hours) when the visibility timeout is not known.
+DEFAULT_MSG_HANDLE_LOOKUP_MAX_SIZE = 10000
+DEFAULT_MSG_HANDLE_LOOKUP_TTL_SEC = 12 * 3600
+MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC = 60
+
+
+class MessageHandleLookup:
+    """Bounded mapping from message handle id to the QueueSQS the message was received from.
+
+    Entries are removed when their message is deleted or released, expire after their
+    visibility timeout, and the least recently used entry is evicted once max_size is reached.
+    Expired entries are dropped lazily, on lookup or when they reach the front of the LRU order.
+    """
+
+    def __init__(self, max_size, ttl_sec):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.entries = OrderedDict()  # handle -> (queue, expiration monotonic timestamp)
+
+    def put(self, message_handle_id, queue, ttl_sec=None):
+        if ttl_sec is None:
+            ttl_sec = self.ttl_sec
+        self.entries[message_handle_id] = (queue, time.monotonic() + ttl_sec)
+        self.entries.move_to_end(message_handle_id)
+        self.__evict()
+
+    def get(self, message_handle_id):
+        """Returns the queue of a message handle or None if unknown or expired."""
+        entry = self.entries.get(message_handle_id)
+        if entry is None:
+            return None
+
+        if entry[1] <= time.monotonic():
+            del self.entries[message_handle_id]
+            return None
+
+        return entry[0]
+
+    def touch(self, message_handle_id, ttl_sec):
+        """Extends the expiration of a handle, e.g. after its visibility timeout changed."""
+        queue = self.get(message_handle_id)
+        if queue is not None:
+            self.put(message_handle_id, queue, ttl_sec)
+
+    def discard(self, message_handle_id):
+        self.entries.pop(message_handle_id, None)
+
+    def __contains__(self, message_handle_id):
+        return self.get(message_handle_id) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __evict(self):
+        now = time.monotonic()
+        while self.entries:
+            handle, (_, expiration) = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_size and expiration > now:
+                break
+            del self.entries[handle]
+
 
 class QueuePrioritySQS:
-    def __init__(self, endpoint_url, task_queue_config, first_queue_name, region):
+    def __init__(
+        self,
+        endpoint_url,
+        task_queue_config,
+        first_queue_name,
+        region,
+        visibility_timeout_sec=None,
+    ):
         """
         QueuePrioritySQS implemented using multiple SQS queues. This class is a wrapper
         around a list of QueueSQS with an additional logic to keep mapping between
         message handle id and a queue from which this message was received.
+
+        visibility_timeout_sec is the visibility timeout the caller sets on the messages it
+        receives (agent_task_visibility_timeout_sec for the agents), it bounds how long
+        their handles are kept in the lookup.
         """
 
         self.endpoint_url = endpoint_url
         self.config = json.loads(task_queue_config)
         self.priorities_count = self.config["priorities"]
 
-        self.msg_handle_to_queue_lookup = {}
+        self.msg_handle_to_queue_lookup = MessageHandleLookup(
+            int(
+                self.config.get(
+                    "msg_handle_lookup_max_size", DEFAULT_MSG_HANDLE_LOOKUP_MAX_SIZE
+                )
+            ),
+            float(
+                self.config.get(
+                    "msg_handle_lookup_ttl_sec",
+                    DEFAULT_MSG_HANDLE_LOOKUP_TTL_SEC
+                    if visibility_timeout_sec is None
+                    else visibility_timeout_sec + MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC,
+                )
+            ),
+        )
         self.priority_to_queue_lookup = {}
 
         self.priorities = [x for x in range(0, self.priorities_count)]
 
+        self.receive_strategy = self.config.get(
+            "receive_strategy", RECEIVE_STRATEGY_SEQUENTIAL
+        )
+        if self.receive_strategy not in (
+            RECEIVE_STRATEGY_SEQUENTIAL,
+            RECEIVE_STRATEGY_CONCURRENT,
+        ):
+            raise TaskQueueException(
+                None,
+                f"PrioritySQS: unknown receive_strategy [{self.receive_strategy}]",
+                "",
+            )
+        self.receive_arbitration_window_sec = float(
+            self.config.get(
+                "receive_arbitration_window_sec", DEFAULT_RECEIVE_ARBITRATION_WINDOW_SEC
+            )
+        )
+
+        self.scheduler = priority_scheduler(self.config, self.priorities)
+        self.dequeue_counts = {p: 0 for p in self.priorities}
+
+        # Concurrent receive state: long polls in flight and the messages received during the
+        # receive call in progress, keyed by priority. Protected by the condition because the
+        # completion callbacks of the polls run on the executor threads.
+        self.receive_executor = None
+        self.receiving = False
+        self.closed = False
+        self.pending_receives = {}
+        self.receive_buffer = {p: deque() for p in self.priorities}
+        self.empty_priorities = set()
+        self.receive_errors = []
+        self.receive_condition = threading.Condition()
+
         for priority in self.priorities:
             # Expected format htc_task_queue-<TAG>__<QUEUE PRIORITY>
             # e.g., htc_task_queue-kbgcncl__1
@@ -74,14 +209,22 @@ class QueuePrioritySQS:
 
     def receive_message(self, wait_time_sec=0) -> dict:
         """
-        # Receives a message from the front of the task queue based on p
-        Iterates over list of QueueSQS based on priorities and attempts to receive a message
-        from the from of each. The first successfully received message is returned.
+        Receives a message from the front of the non-empty queue preferred by the scheduling policy
+        ("scheduling_policy" in task_queue_config, strict priority by default). The priority the
+        message was received from is returned in properties["task_priority"].
+
+        Two strategies are available, selected by "receive_strategy" in task_queue_config:
+
+        - "sequential" (default): iterates over list of QueueSQS in scheduling order and attempts
+          to receive a message from the front of each. The first successfully received message is returned.
+        - "concurrent": short polls the queues in scheduling order, then long polls all of them
+          at once when they are all empty, see __receive_message_concurrent.
 
         Args:
-            wait_time_sec - pulling time out. NOTE: By default priority queue emulation
-            with multi SQS does not perform long polling as it need to iterate over several queues.
+            wait_time_sec - pulling time out. NOTE: With the sequential strategy priority queue emulation
+            does not perform long polling as it need to iterate over several queues.
             Performing long polling on each queue would significantly increase latency.
+            The concurrent strategy long polls every queue for up to wait_time_sec once they are all empty.
 
 
         Returns:
@@ -89,22 +232,211 @@ class QueuePrioritySQS:
             a dictionary containing the body of the message + associated properties
 
         """
+        if self.receive_strategy == RECEIVE_STRATEGY_CONCURRENT:
+            return self.__receive_message_concurrent(wait_time_sec)
+
         wait_time_sec = 0
+        empty_priorities = []
 
-        for priority in reversed(self.priorities):
+        for priority in self.scheduler.order():
             queue = self.priority_to_queue_lookup[priority]
 
             queue_sqs_response = queue.receive_message(wait_time_sec)
 
             if "body" in queue_sqs_response:
-                self.msg_handle_to_queue_lookup[
-                    queue_sqs_response["properties"]["message_handle_id"]
-                ] = queue
+                self.scheduler.served(priority, empty_priorities)
+                self.__register_received_message(queue_sqs_response, priority)
 
                 return queue_sqs_response
 
+            empty_priorities.append(priority)
+
         return {}
 
+    def __receive_message_concurrent(self, wait_time_sec):
+        """Short polls the queues in scheduling order, then long polls all of them at once.
+
+        A call first short polls every queue in scheduling order, like the sequential strategy,
+        and returns the first message received: under load no long poll is started and exactly
+        one message is received per call. Only when every queue is empty does it long poll each
+        queue that has no poll in flight and, once the first message arrives, wait at most
+        receive_arbitration_window_sec for the queues the scheduler prefers over it.
+
+        Messages are buffered only while a call is in progress; those not returned (a message
+        delivered by another poll during the arbitration window) are handed back with a zero
+        visibility timeout before the call returns. Polls cannot be cancelled: a poll still in
+        flight after the call returned hands back whatever it receives right away, so that the
+        message is visible to idle agents instead of waiting for this one. Each hand back counts
+        towards the maxReceiveCount of the redrive policy of the queue, but only happens for
+        messages sent while the queues were idle.
+
+        Args:
+            wait_time_sec - long polling time out applied to every queue
+
+        Returns:
+            empty dictionary if no mesage was read from the queues, otherwise
+            a dictionary containing the body of the message + associated properties
+
+        """
+        with self.receive_condition:
+            if self.receive_executor is None and not self.closed:
+                self.receive_executor = ThreadPoolExecutor(
+                    max_workers=self.priorities_count,
+                    thread_name_prefix="priority-sqs-receive",
+                )
+
+        order = self.scheduler.order()
+
+        with self.receive_condition:
+            self.receiving = True
+            self.empty_priorities = set()
+            self.receive_errors = []
+
+        try:
+            # <1.> Short poll the queues in scheduling order, stop at the first message.
+            for priority in order:
+                response = self.priority_to_queue_lookup[priority].receive_message(0)
+                with self.receive_condition:
+                    if "body" in response:
+                        self.receive_buffer[priority].append(response)
+                        break
+                    if not self.receive_buffer[priority]:
+                        self.empty_priorities.add(priority)
+
+            with self.receive_condition:
+                # <2.> Every queue was empty: long poll them all until any delivers a message.
+                if (
+                    not self.__has_buffered_message()
+                    and wait_time_sec > 0
+                    and not self.closed
+                ):
+                    for priority in self.priorities:
+                        if priority not in self.pending_receives:
+                            self.__start_receive(priority, wait_time_sec)
+
+                    deadline = time.monotonic() + wait_time_sec + 1
+                    while not self.__has_buffered_message() and self.pending_receives:
+                        remaining_sec = deadline - time.monotonic()
+                        if remaining_sec <= 0:
+                            break
+                        self.receive_condition.wait(remaining_sec)
+
+                best_priority = self.__best_buffered(order)
+                if best_priority is None:
+                    if self.receive_errors:
+                        raise self.receive_errors[0]
+                    return {}
+
+                # <3.> Arbitration window: give the long polls of queues preferred over the
+                # best message received so far a short chance to deliver.
+                window_deadline = time.monotonic() + self.receive_arbitration_window_sec
+                while any(
+                    p in self.pending_receives
+                    for p in order[: order.index(best_priority)]
+                ):
+                    remaining_sec = window_deadline - time.monotonic()
+                    if remaining_sec <= 0:
+                        break
+                    self.receive_condition.wait(remaining_sec)
+                    best_priority = self.__best_buffered(order)
+
+                response = self.receive_buffer[best_priority].popleft()
+                surplus = []
+                for priority in self.priorities:
+                    while self.receive_buffer[priority]:
+                        surplus.append((priority, self.receive_buffer[priority].popleft()))
+                empty_priorities = [
+                    p for p in self.empty_priorities if p not in self.pending_receives
+                ]
+        finally:
+            with self.receive_condition:
+                self.receiving = False
+
+        for priority, surplus_response in surplus:
+            self.__release_received_message(priority, surplus_response)
+
+        self.scheduler.served(best_priority, empty_priorities)
+        self.__register_received_message(response, best_priority)
+        return response
+
+    def __start_receive(self, priority, wait_time_sec):
+        """Starts a long poll of a queue, its result is handled by __on_receive."""
+        future = self.receive_executor.submit(
+            self.priority_to_queue_lookup[priority].receive_message, wait_time_sec
+        )
+        self.pending_receives[priority] = future
+        future.add_done_callback(lambda f, p=priority: self.__on_receive(p, f))
+
+    def __on_receive(self, priority, future):
+        """Done callback of every long poll, runs on the executor threads. The message is
+        buffered for the receive call in progress, or handed back if there is none."""
+        late_response = None
+        with self.receive_condition:
+            if self.pending_receives.get(priority) is future:
+                del self.pending_receives[priority]
+
+            if future.exception() is not None:
+                if self.receiving:
+                    self.receive_errors.append(future.exception())
+            elif "body" not in future.result():
+                if not self.receive_buffer[priority]:
+                    self.empty_priorities.add(priority)
+            elif self.receiving:
+                self.receive_buffer[priority].append(future.result())
+                self.empty_priorities.discard(priority)
+            else:
+                late_response = future.result()
+
+            self.receive_condition.notify_all()
+
+        if late_response is not None:
+            self.__release_received_message(priority, late_response)
+
+    def __release_received_message(self, priority, response):
+        """Makes a message received but not processed visible to the other agents again."""
+        message_handle_id = response["properties"]["message_handle_id"]
+        try:
+            self.priority_to_queue_lookup[priority].change_visibility(
+                message_handle_id, 0
+            )
+        except Exception as e:
+            # The message re-appears on its own once its visibility timeout expires.
+            logging.warning(
+                "PrioritySQS: failed to release message [%s] priority [%s]: [%s]",
+                message_handle_id,
+                priority,
+                e,
+            )
+
+    def __has_buffered_message(self):
+        return any(self.receive_buffer.values())
+
+    def __best_buffered(self, order):
+        """Returns the first priority in scheduling order with a buffered message."""
+        for priority in order:
+            if self.receive_buffer[priority]:
+                return priority
+        return None
+
+    def __register_received_message(self, queue_sqs_response, priority):
+        self.dequeue_counts[priority] += 1
+        queue_sqs_response["properties"]["task_priority"] = priority
+        self.msg_handle_to_queue_lookup.put(
+            queue_sqs_response["properties"]["message_handle_id"],
+            self.priority_to_queue_lookup[priority],
+        )
+
+    def __forget_handles(self, message_handle_ids, visibility_timeout_sec=0):
+        """Updates the handle lookup after messages were deleted (or their visibility changed)."""
+        for message_handle_id in message_handle_ids:
+            if visibility_timeout_sec > 0:
+                self.msg_handle_to_queue_lookup.touch(
+                    message_handle_id,
+                    visibility_timeout_sec + MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC,
+                )
+            else:
+                self.msg_handle_to_queue_lookup.discard(message_handle_id)
+
     def delete_message(self, message_handle_id, task_priority=None):
         """Deletes message from the queue by the message_handle_id or task_priority
         Often this function is called when message is successfully consumed.
@@ -121,6 +453,8 @@ class QueuePrioritySQS:
 
             res = queue.delete_message(message_handle_id)
 
+            self.__forget_handles([message_handle_id])
+
             return res
 
         except Exception as e:
@@ -146,6 +480,8 @@ class QueuePrioritySQS:
 
             res = queue.change_visibility(message_handle_id, visibility_timeout_sec)
 
+            self.__forget_handles([message_handle_id], visibility_timeout_sec)
+
             return res
 
         except Exception as e:
@@ -153,17 +489,142 @@ class QueuePrioritySQS:
             errlog.log(msg)
             raise TaskQueueException(e, msg, traceback.format_exc())
 
+    def delete_messages(self, message_handle_ids, task_priorities=None):
+        """Deletes a list of messages, grouped by the queue that owns each of them, using one
+        SQS call per 10 messages of the same queue.
+
+        Args:
+            message_handle_ids(list): the sqs handlers of the messages to be deleted
+            task_priorities(list): priority of each message, same length as message_handle_ids.
+                Required for handles that were not received through this object.
+
+        Returns:
+            dict: {"Successful": [message_handle_id, ...],
+                   "Failed": [{"message_handle_id": ..., "code": ..., "message": ...}, ...]}
+        """
+
+        result = self.__run_grouped_by_queue(
+            message_handle_ids,
+            task_priorities,
+            lambda queue, handles: queue.delete_messages(handles),
+        )
+        self.__forget_handles(result["Successful"])
+
+        return result
+
+    def change_visibility_batch(
+        self, message_handle_ids, visibility_timeout_sec, task_priorities=None
+    ):
+        """Changes visibility timeout of a list of messages, grouped by the queue that owns each
+        of them, using one SQS call per 10 messages of the same queue.
+
+        Args:
+            message_handle_ids(list): the sqs handlers of the messages to be updated
+            visibility_timeout_sec(int): new visibility timeout applied to every message
+            task_priorities(list): priority of each message, same length as message_handle_ids.
+                Required for handles that were not received through this object.
+
+        Returns:
+            dict: {"Successful": [message_handle_id, ...],
+                   "Failed": [{"message_handle_id": ..., "code": ..., "message": ...}, ...]}
+        """
+
+        result = self.__run_grouped_by_queue(
+            message_handle_ids,
+            task_priorities,
+            lambda queue, handles: queue.change_visibility_batch(
+                handles, visibility_timeout_sec
+            ),
+        )
+        self.__forget_handles(result["Successful"], visibility_timeout_sec)
+
+        return result
+
+    def __run_grouped_by_queue(self, message_handle_ids, task_priorities, batch_call):
+        """Groups handles by owning queue and merges the per-queue batch results. Handles whose
+        queue cannot be determined, and every handle of a queue whose batch call raised, are
+        reported as failed instead of aborting the other groups."""
+        if task_priorities is None:
+            task_priorities = [None] * len(message_handle_ids)
+
+        result = {"Successful": [], "Failed": []}
+        handles_by_queue = {}
+
+        for message_handle_id, task_priority in zip(message_handle_ids, task_priorities):
+            queue = self.__find_queue_object(message_handle_id, task_priority)
+            if queue is None:
+                result["Failed"].append(
+                    {
+                        "message_handle_id": message_handle_id,
+                        "code": "UnknownQueue",
+                        "message": "PrioritySQS: Can not find QueueSQS by message_handle_id and priority",
+                    }
+                )
+            else:
+                handles_by_queue.setdefault(queue, []).append(message_handle_id)
+
+        for queue, handles in handles_by_queue.items():
+            try:
+                response = batch_call(queue, handles)
+                result["Successful"] += response["Successful"]
+                result["Failed"] += response["Failed"]
+
+            except Exception as e:
+                result["Failed"] += [
+                    {"message_handle_id": h, "code": type(e).__name__, "message": str(e)}
+                    for h in handles
+                ]
+
+        return result
+
+    def close(self):
+        """Stops the concurrent receive strategy: no long poll is started anymore and the
+        executor of the polls is shut down. Polls already in flight cannot be cancelled, they
+        hand back the message they receive, if any, as once a receive call has returned.
+        """
+        with self.receive_condition:
+            self.closed = True
+            executor, self.receive_executor = self.receive_executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
     def get_queue_length(self):
         """
         Returns total number of queued tasks across all queues under all priorities.
 
         """
 
-        all_queued_tasks = sum(
-            self.priority_to_queue_lookup[p].get_queue_length() for p in self.priorities
+        return sum(
+            depth["visible"] for depth in self.get_queue_depth_by_priority().values()
         )
 
-        return all_queued_tasks
+    def get_queue_depth_by_priority(self):
+        """Reads the message counters of every priority queue concurrently, so a sweep costs
+        one get_queue_attributes round trip instead of one per priority.
+
+        Returns:
+            dict: {priority: {"queue_name": ..., "visible": int, "in_flight": int, "delayed": int}}
+        """
+
+        with ThreadPoolExecutor(max_workers=self.priorities_count) as executor:
+            futures = {
+                p: executor.submit(self.priority_to_queue_lookup[p].get_queue_depth)
+                for p in self.priorities
+            }
+
+        return {p: f.result() for p, f in futures.items()}
+
+    def __find_queue_object(self, message_handle_id, task_priority=None):
+        """Same lookup as __get_queue_object, returns None instead of raising."""
+        queue = self.msg_handle_to_queue_lookup.get(message_handle_id)
+        if queue is not None:
+            return queue
+
+        elif task_priority is not None:
+            return self.priority_to_queue_lookup.get(task_priority)
+
+        return None
 
     def __get_queue_object(self, message_handle_id, task_priority=None) -> QueueSQS:
         """This function finds a corresponding queue by message_handle_id or task_priority
@@ -176,12 +637,13 @@ class QueuePrioritySQS:
             QueueSQS
 
         """
-        queue = None
+        # <1.> If this object was used to receive the message then we should have
+        # a mapping from the handle to the queue object that was used to in-queue this message
+        # (unless the entry has expired or was evicted from the bounded lookup).
+        queue = self.msg_handle_to_queue_lookup.get(message_handle_id)
 
-        if message_handle_id in self.msg_handle_to_queue_lookup:
-            # <1.> If this object was used to submit the message then we should have
-            # a mapping from the handle to the queue object that was used to in-queue this message
-            queue = self.msg_handle_to_queue_lookup[message_handle_id]
+        if queue is not None:
+            return queue
 
         elif task_priority is not None:
             # <2.> The message was in-queued by some external object, (this can happen if submit_tasks lambda
@@ -16,6 +16,9 @@ logging.basicConfig(
     level=logging.INFO,
 )
 
+# Maximum number of entries accepted by SQS batch APIs.
+SQS_MAX_BATCH_SIZE = 10
+
 
 class QueueSQS:
     def __init__(self, endpoint_url, queue_name, region):
@@ -144,6 +147,117 @@ class QueueSQS:
 
         return None
 
+    def delete_messages(self, message_handle_ids, task_priorities=None) -> dict:
+        """Deletes a list of messages from the queue, using one SQS call per 10 messages.
+
+        Args:
+            message_handle_ids(list): the sqs handlers of the messages to be deleted
+            task_priorities(list): <Interface argument, not used in this class>
+
+        Returns:
+            dict: {"Successful": [message_handle_id, ...],
+                   "Failed": [{"message_handle_id": ..., "code": ..., "message": ...}, ...]}
+        """
+
+        try:
+            return self.__run_batches(
+                self.sqs_client.delete_message_batch,
+                [{"ReceiptHandle": h} for h in message_handle_ids],
+            )
+
+        except Exception as e:
+            msg = f"QueueSQS: Cannot delete {len(message_handle_ids)} messages, Exception: [{e}] [{traceback.format_exc()}]"
+            errlog.log(msg)
+            raise TaskQueueException(e, msg, traceback.format_exc())
+
+    def change_visibility_batch(
+        self, message_handle_ids, visibility_timeout_sec, task_priorities=None
+    ) -> dict:
+        """Changes visibility timeout of a list of messages, using one SQS call per 10 messages.
+
+        Args:
+            message_handle_ids(list): the sqs handlers of the messages to be updated
+            visibility_timeout_sec(int): new visibility timeout applied to every message
+            task_priorities(list): <Interface argument, not used in this class>
+
+        Returns:
+            dict: {"Successful": [message_handle_id, ...],
+                   "Failed": [{"message_handle_id": ..., "code": ..., "message": ...}, ...]}
+        """
+
+        try:
+            return self.__run_batches(
+                self.sqs_client.change_message_visibility_batch,
+                [
+                    {"ReceiptHandle": h, "VisibilityTimeout": visibility_timeout_sec}
+                    for h in message_handle_ids
+                ],
+            )
+
+        except Exception as e:
+            msg = f"QueueSQS: Cannot reset VTO for {len(message_handle_ids)} messages, Exception: [{e}] [{traceback.format_exc()}]"
+            errlog.log(msg)
+            raise TaskQueueException(e, msg, traceback.format_exc())
+
+    def __run_batches(self, batch_api, entries) -> dict:
+        """Sends entries to an SQS batch API in chunks of SQS_MAX_BATCH_SIZE and maps the
+        per-entry results back to receipt handles."""
+        result = {"Successful": [], "Failed": []}
+
+        for x in range(0, len(entries), SQS_MAX_BATCH_SIZE):
+            chunk = entries[x: x + SQS_MAX_BATCH_SIZE]
+            # Batch entry ids only need to be unique within a request.
+            for i, entry in enumerate(chunk):
+                entry["Id"] = str(i)
+
+            response = batch_api(QueueUrl=self.sqs_queue.url, Entries=chunk)
+
+            for ok in response.get("Successful", []):
+                result["Successful"].append(chunk[int(ok["Id"])]["ReceiptHandle"])
+            for failed in response.get("Failed", []):
+                result["Failed"].append(
+                    {
+                        "message_handle_id": chunk[int(failed["Id"])]["ReceiptHandle"],
+                        "code": failed.get("Code"),
+                        "message": failed.get("Message"),
+                    }
+                )
+
+        return result
+
+    def get_queue_depth(self) -> dict:
+        """Reads the message counters of the queue with a single get_queue_attributes call.
+
+        Returns:
+            dict: {"queue_name": ..., "visible": int, "in_flight": int, "delayed": int}
+        """
+        try:
+            response = self.sqs_client.get_queue_attributes(
+                QueueUrl=self.sqs_queue.url,
+                AttributeNames=[
+                    "ApproximateNumberOfMessages",
+                    "ApproximateNumberOfMessagesNotVisible",
+                    "ApproximateNumberOfMessagesDelayed",
+                ],
+            )
+
+        except Exception as e:
+            msg = f"QueueSQS: Cannot read attributes of queue [{self.queue_name}], Exception: [{e}] [{traceback.format_exc()}]"
+            errlog.log(msg)
+            raise TaskQueueException(e, msg, traceback.format_exc())
+
+        attributes = response["Attributes"]
+        return {
+            "queue_name": self.queue_name,
+            "visible": int(attributes.get("ApproximateNumberOfMessages", 0)),
+            "in_flight": int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0)),
+            "delayed": int(attributes.get("ApproximateNumberOfMessagesDelayed", 0)),
+        }
+
+    def get_queue_depth_by_priority(self) -> dict:
+        """Same interface as QueuePrioritySQS, a single queue is reported as priority 0."""
+        return {0: self.get_queue_depth()}
+
     def get_queue_length(self) -> int:
         # boto3's Queue resource lazy-loads .attributes once and caches them for the life of the
         # object. A long-lived caller (e.g. the capacity_controller's module-level queue in a warm
@@ -153,3 +267,7 @@ class QueueSQS:
         self.sqs_queue.reload()
         queue_length = int(self.sqs_queue.attributes.get("ApproximateNumberOfMessages"))
         return queue_length
+
+    def close(self):
+        """Same interface as QueuePrioritySQS, a single queue has nothing to release."""
+        pass
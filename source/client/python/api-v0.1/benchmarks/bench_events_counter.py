@@ -0,0 +1,131 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Cost of an EventsCounter increment under contention.
+
+Measures the nanoseconds per increment() with 1 to N threads incrementing the same counter
+while another thread collects a sample every --collect-ms, for the sharded EventsCounter
+and for a single dict behind a global lock. The unsynchronized dict the EventsCounter used
+before is measured as well, with the number of increments it lost.
+
+    python3 benchmarks/bench_events_counter.py --threads 1 2 4 8 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.events_counter import EventsCounter  # noqa: E402
+
+
+class UnsynchronizedCounter:
+    """The previous EventsCounter: increments and resets race"""
+
+    def __init__(self):
+        self.evcounter = {}
+
+    def increment(self, event_name, value=1):
+        if event_name in self.evcounter:
+            self.evcounter[event_name] += value
+        else:
+            self.evcounter[event_name] = value
+
+    def collect(self):
+        events, self.evcounter = self.evcounter, {}
+        return events.get("tasks", 0)
+
+
+class GlobalLockCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.evcounter = {}
+
+    def increment(self, event_name, value=1):
+        with self.lock:
+            self.evcounter[event_name] = self.evcounter.get(event_name, 0) + value
+
+    def collect(self):
+        with self.lock:
+            events, self.evcounter = self.evcounter, {}
+        return events.get("tasks", 0)
+
+
+class ShardedCounter(EventsCounter):
+    def collect(self):
+        return super().collect().counters.get("tasks", 0)
+
+
+COUNTERS = {
+    "unsynchronized": UnsynchronizedCounter,
+    "global_lock": GlobalLockCounter,
+    "sharded": ShardedCounter,
+}
+
+
+def run(counter, n_threads, n_increments, collect_ms):
+    """Returns the ns per increment (wall time of all threads / increments) and the number
+    of increments lost"""
+    start = threading.Barrier(n_threads + 1)
+    done = threading.Event()
+    collected = []
+
+    def increment():
+        start.wait()
+        for _ in range(n_increments):
+            counter.increment("tasks")
+
+    def collect():
+        while not done.wait(collect_ms / 1000):
+            collected.append(counter.collect())
+
+    threads = [threading.Thread(target=increment) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    collector = threading.Thread(target=collect)
+    collector.start()
+
+    start.wait()
+    t_start = time.perf_counter_ns()
+    for t in threads:
+        t.join()
+    elapsed_ns = time.perf_counter_ns() - t_start
+    done.set()
+    collector.join()
+    collected.append(counter.collect())
+
+    total = n_threads * n_increments
+    return elapsed_ns / total, total - sum(collected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--increments", type=int, default=200000)
+    parser.add_argument("--collect-ms", type=float, default=1)
+    args = parser.parse_args()
+
+    print(
+        "{:<16} {:>8} {:>14} {:>10}".format("counter", "threads", "ns_per_inc", "lost")
+    )
+    for name, counter_class in COUNTERS.items():
+        for n_threads in args.threads:
+            ns_per_increment, lost = run(
+                counter_class(), n_threads, args.increments, args.collect_ms
+            )
+            print(
+                "{:<16} {:>8} {:>14.1f} {:>10}".format(
+                    name, n_threads, ns_per_increment, lost
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
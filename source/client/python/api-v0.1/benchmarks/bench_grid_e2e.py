@@ -0,0 +1,664 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""End-to-end throughput of the grid, offline.
+
+Runs in one process the client API (AWSConnector), the submit_tasks, get_results and
+ttl_checker lambdas and N agent event loops, against moto's DynamoDB and SQS for the state
+table and the task queue, the LOCAL data plane, and a stand-in of the worker lambda which
+returns its input after --task-ms. For each task size and number of agents, sessions of
+--tasks tasks are submitted and their results retrieved, and the run reports:
+
+- tasks per second, from the submission of the sessions to the retrieval of their results
+- latency percentiles of each stage of the tasks, from their stats (see utils.stage_clock)
+- AWS API calls per task of each component, by service and operation, plus the lambda
+  invocations and the data plane operations
+
+Results are written to --output as JSON, to track regressions between commits. The agents
+are threads sharing the GIL and moto is much slower than DynamoDB and SQS: the numbers
+measure the cost of the grid code, not the capacity of a deployment.
+
+The grid runs with the default configuration generated by agent-config.tf, except for the
+agent and client polling intervals (0.5 s by default, which bounds an agent to about 2
+tasks per second), set by --poll-interval-sec. --config overrides any other setting, e.g.
+'{"payload_codec": "msgpack", "task_queue_service": "PrioritySQS",
+"task_queue_config": "{\\"priorities\\": 3}"}'.
+
+Requires moto and the dependencies of the agent and of the client API, including the
+generated API client (publicapi, see source/control_plane/openapi).
+
+    python3 benchmarks/bench_grid_e2e.py --task-kb 1 64 --agents 1 4 --tasks 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+
+import boto3
+import botocore.client
+
+_HERE = os.path.dirname(__file__)
+_SOURCE = os.path.abspath(os.path.join(_HERE, "..", "..", "..", ".."))
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+LAMBDA_DIR = os.path.join(_SOURCE, "control_plane", "python", "lambda")
+AGENT_FILE = os.path.join(_SOURCE, "compute_plane", "python", "agent", "agent.py")
+
+REGION = "eu-west-1"
+PERCENTILES = (50, 90, 99)
+
+# Data plane operations counted per task, in addition to the AWS API calls
+DATA_PLANE_OPERATIONS = ("put_", "get_", "has_", "delete_", "purge_")
+
+
+def grid_config(work_dir, poll_interval_sec, overrides):
+    """Configuration of the agents and of the client API, as generated by agent-config.tf
+    with the default values of the terraform variables"""
+    suffix = uuid.uuid4().hex[:8]
+    config = {
+        "region": REGION,
+        "sqs_endpoint": "https://sqs.{}.amazonaws.com".format(REGION),
+        "redis_url": "",
+        "redis_password": "",
+        "ddb_state_table": "htc_tasks_state_table-" + suffix,
+        "empty_task_queue_backoff_timeout_sec": poll_interval_sec,
+        "work_proc_status_pull_interval_sec": poll_interval_sec,
+        "task_ttl_expiration_offset_sec": 30,
+        "task_ttl_refresh_interval_sec": 5,
+        "dynamodb_results_pull_interval_sec": poll_interval_sec,
+        "agent_task_visibility_timeout_sec": 3600,
+        "task_input_passed_via_external_storage": 1,
+        "payload_codec": "base64",
+        "task_input_deduplication": 0,
+        "s3_bucket": "htc-grid-benchmark-" + suffix,
+        "s3_kms_key_id": "",
+        "grid_storage_service": "LOCAL",
+        "task_queue_service": "SQS",
+        "task_queue_config": "{}",
+        "tasks_queue_name": "htc_task_queue-{}__0".format(suffix),
+        "tasks_queue_dlq_name": "htc_task_queue_dlq-" + suffix,
+        "state_table_service": "DynamoDB",
+        "state_table_config": "{'retries':{'max_attempts':10, 'mode':'adaptive'}}",
+        "error_log_group": "htc-grid-benchmark",
+        "error_logging_stream": "htc-grid-benchmark",
+        "error_log_file": os.path.join(work_dir, "errors.log"),
+        "metrics_are_enabled": "0",
+        "metrics_grafana_private_ip": "",
+        "metrics_pre_agent_connection_string": "",
+        "metrics_post_agent_connection_string": "",
+        "metrics_submit_tasks_lambda_connection_string": "",
+        "metrics_get_results_lambda_connection_string": "",
+        "metrics_ttl_checker_lambda_connection_string": "",
+        # The records of every task are formatted at INFO, see bench_logging.py
+        "logging": {"level": "WARNING"},
+        "agent_use_congestion_control": "0",
+        "enable_xray": "0",
+        "user_pool_id": "",
+        "cognito_userpool_client_id": "",
+        "public_api_gateway_url": "http://localhost",
+        "private_api_gateway_url": "http://localhost",
+        "api_gateway_key": "",
+    }
+    config.update(overrides)
+    return config
+
+
+def lambda_environment(config, config_file):
+    """Environment of the lambdas (see the control_plane lambda_*.tf) and of the agents"""
+    environment = {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": config["region"],
+        "REGION": config["region"],
+        "AGENT_CONFIG_FILE": config_file,
+        "LAMBDA_ENDPOINT_URL": "http://localhost:9001",
+        "LAMBDA_FONCTION_NAME": "htc-grid-benchmark-worker",
+        "ERROR_LOG_GROUP": config["error_log_group"],
+        "ERROR_LOGGING_STREAM": config["error_logging_stream"],
+        "STATE_TABLE_SERVICE": config["state_table_service"],
+        "STATE_TABLE_CONFIG": config["state_table_config"],
+        "STATE_TABLE_NAME": config["ddb_state_table"],
+        "TASK_QUEUE_SERVICE": config["task_queue_service"],
+        "TASK_QUEUE_CONFIG": config["task_queue_config"],
+        "TASKS_QUEUE_NAME": config["tasks_queue_name"],
+        "TASKS_QUEUE_DLQ_NAME": config["tasks_queue_dlq_name"],
+        "GRID_STORAGE_SERVICE": config["grid_storage_service"],
+        "S3_BUCKET": config["s3_bucket"],
+        "REDIS_URL": config["redis_url"],
+        "REDIS_PASSWORD": config["redis_password"],
+        "TASK_INPUT_PASSED_VIA_EXTERNAL_STORAGE": str(
+            config["task_input_passed_via_external_storage"]
+        ),
+        "METRICS_ARE_ENABLED": config["metrics_are_enabled"],
+        "METRICS_GRAFANA_PRIVATE_IP": config["metrics_grafana_private_ip"],
+        "METRICS_SUBMIT_TASKS_LAMBDA_CONNECTION_STRING": config[
+            "metrics_submit_tasks_lambda_connection_string"
+        ],
+        "METRICS_GET_RESULTS_LAMBDA_CONNECTION_STRING": config[
+            "metrics_get_results_lambda_connection_string"
+        ],
+        "METRICS_TTL_CHECKER_LAMBDA_CONNECTION_STRING": config[
+            "metrics_ttl_checker_lambda_connection_string"
+        ],
+    }
+    for variable, key in (
+        ("GRID_STORAGE_COMPRESSION", "grid_storage_compression"),
+        ("TRACING_CONFIG", "tracing"),
+    ):
+        if config.get(key):
+            value = config[key]
+            environment[variable] = value if isinstance(value, str) else json.dumps(value)
+    return environment
+
+
+def create_state_table(config):
+    """State table and indexes of deployment/grid/terraform/control_plane/dynamodb.tf"""
+    attributes = [
+        ("task_id", "S"),
+        ("session_id", "S"),
+        ("task_status", "S"),
+        ("heartbeat_expiration_timestamp", "N"),
+    ]
+
+    def index(name, hash_key, range_key, non_key_attributes):
+        return {
+            "IndexName": name,
+            "KeySchema": [
+                {"AttributeName": hash_key, "KeyType": "HASH"},
+                {"AttributeName": range_key, "KeyType": "RANGE"},
+            ],
+            "Projection": {
+                "ProjectionType": "INCLUDE",
+                "NonKeyAttributes": non_key_attributes,
+            },
+        }
+
+    boto3.client("dynamodb", region_name=config["region"]).create_table(
+        TableName=config["ddb_state_table"],
+        KeySchema=[{"AttributeName": "task_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": name, "AttributeType": kind} for name, kind in attributes
+        ],
+        GlobalSecondaryIndexes=[
+            index(
+                "gsi_ttl_index",
+                "task_status",
+                "heartbeat_expiration_timestamp",
+                ["task_id", "task_owner", "task_priority"],
+            ),
+            index("gsi_session_index", "session_id", "task_status", ["task_id"]),
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def create_queues(config):
+    """Task queue (one queue per priority with PrioritySQS) and dead letter queue"""
+    sqs = boto3.client("sqs", region_name=config["region"])
+    priorities = 1
+    if config["task_queue_service"] == "PrioritySQS":
+        task_queue_config = json.loads(config["task_queue_config"].replace("'", '"'))
+        priorities = task_queue_config["priorities"]
+    prefix = config["tasks_queue_name"].split("__")[0]
+    for priority in range(priorities):
+        sqs.create_queue(QueueName="{}__{}".format(prefix, priority))
+    sqs.create_queue(QueueName=config["tasks_queue_dlq_name"])
+
+
+def load_module(name, file_name):
+    spec = importlib.util.spec_from_file_location(name, file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_lambda(name):
+    return load_module(name, os.path.join(LAMBDA_DIR, name, name + ".py"))
+
+
+def load_agent(index):
+    """Imports a new instance of the agent module, whose globals are the state of one
+    agent (its clients, counters and task in progress)"""
+    os.environ["MY_POD_NAME"] = "htc-agent-benchmark-{}".format(index)
+    # The agent waits 5 to 15 s before starting
+    with mock.patch("time.sleep"):
+        return load_module("agent_{}".format(index), AGENT_FILE)
+
+
+class ApiCalls:
+    """Counts the AWS API calls of each component of the grid, by service and operation.
+    The component making the calls is set per thread, see component()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def component(self, name):
+        previous = getattr(self.local, "component", None)
+        self.local.component = name
+        try:
+            yield
+        finally:
+            self.local.component = previous
+
+    def count(self, operation, component=None):
+        if component is None:
+            component = getattr(self.local, "component", None) or "other"
+        with self.lock:
+            self.counts[(component, operation)] += 1
+
+    def get_and_reset(self):
+        with self.lock:
+            counts, self.counts = self.counts, collections.Counter()
+        return counts
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Counts the calls of every botocore client and every data plane operation"""
+        from api.in_out_local import InOutLocal
+
+        make_api_call = botocore.client.BaseClient._make_api_call
+
+        def counted_api_call(client, operation_name, api_params):
+            self.count(
+                "{}.{}".format(client.meta.service_model.service_name, operation_name)
+            )
+            return make_api_call(client, operation_name, api_params)
+
+        def counted_operation(name, operation):
+            def counted(*args, **kwargs):
+                self.count("data_plane." + name)
+                return operation(*args, **kwargs)
+
+            return counted
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(
+                mock.patch.object(
+                    botocore.client.BaseClient, "_make_api_call", counted_api_call
+                )
+            )
+            for name, operation in list(vars(InOutLocal).items()):
+                if name.startswith(DATA_PLANE_OPERATIONS) and callable(operation):
+                    stack.enter_context(
+                        mock.patch.object(
+                            InOutLocal, name, counted_operation(name, operation)
+                        )
+                    )
+            yield
+
+
+class LocalWorker:
+    """Stand-in of the worker lambda invoked by the agents: returns its input as output
+    after task_ms, without using the CPU of the agent (the lambda runs in its own
+    container)"""
+
+    def __init__(self, api_calls, task_ms):
+        self.api_calls = api_calls
+        self.task_ms = task_ms
+
+    def invoke(self, FunctionName, InvocationType, Payload, LogType=None):
+        self.api_calls.count("lambda.Invoke", "agent")
+        if self.task_ms:
+            time.sleep(self.task_ms / 1000)
+        return {"StatusCode": 200, "Payload": io.BytesIO(Payload)}
+
+
+class LocalApiGateway:
+    """Stand-in of API Gateway for the generated API client used by AWSConnector: /submit
+    and /result invoke the submit_tasks and get_results lambda handlers in the thread of
+    the client"""
+
+    def __init__(self, submit_tasks, get_results, api_calls):
+        self.submit_tasks = submit_tasks
+        self.get_results = get_results
+        self.api_calls = api_calls
+
+    def submit_post(self, submission_content):
+        return self.__invoke(self.submit_tasks, "submit_tasks", submission_content)
+
+    def result_get(self, submission_content):
+        return self.__invoke(self.get_results, "get_results", submission_content)
+
+    def __invoke(self, lambda_module, name, submission_content):
+        self.api_calls.count("apigateway." + name)
+        event = {"queryStringParameters": {"submission_content": submission_content}}
+        with self.api_calls.component(name):
+            response = lambda_module.lambda_handler(event, None)
+        if response["statusCode"] != 200:
+            raise Exception("{} failed: {}".format(name, response["body"]))
+        return json.loads(response["body"])
+
+
+class TaskStatsRecorder:
+    """Performance tracker of an agent keeping the stats of the tasks it completes, passed
+    to the tracker once the output of a task is stored"""
+
+    def __init__(self, perf_tracker, task_stats, lock):
+        self.perf_tracker = perf_tracker
+        self.task_stats = task_stats
+        self.lock = lock
+
+    def add_metric_sample(self, stats_dic, *args, **kwargs):
+        with self.lock:
+            self.task_stats.append(dict(stats_dic))
+        return self.perf_tracker.add_metric_sample(stats_dic, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.perf_tracker, name)
+
+
+class AgentLoop(threading.Thread):
+    """Event loop of an agent (see event_loop in agent.py), run once activated"""
+
+    def __init__(self, agent, api_calls):
+        super().__init__(name=agent.SELF_ID, daemon=True)
+        self.agent = agent
+        self.api_calls = api_calls
+        self.active = threading.Event()
+        self.errors = 0
+
+    def run(self):
+        with self.api_calls.component("agent"):
+            while True:
+                self.active.wait()
+                try:
+                    if not self.agent.process_next_task():
+                        time.sleep(self.agent.empty_task_queue_backoff_timeout_sec)
+                except Exception:
+                    # The pod of the agent would restart
+                    logging.exception("Agent %s failed", self.agent.SELF_ID)
+                    self.errors += 1
+
+
+class Grid:
+    """The components of the grid, wired together in the benchmark process"""
+
+    def __init__(self, config, n_agents, task_ms, ttl_checker_interval_sec):
+        from api import connector as api_connector
+        from aws_xray_sdk import global_sdk_config
+
+        global_sdk_config.set_sdk_enabled(False)
+        self.config = config
+        self.api_calls = ApiCalls()
+        self.task_stats = []
+        self.task_stats_lock = threading.Lock()
+
+        self.submit_tasks = load_lambda("submit_tasks")
+        self.get_results = load_lambda("get_results")
+        self.ttl_checker = load_lambda("ttl_checker")
+        # moto has no DynamoDB metrics to report, and its CloudWatch cannot parse the
+        # requests of recent botocore versions
+        self.ttl_checker.is_state_table_under_throttling = lambda: False
+        self.gateway = LocalApiGateway(
+            self.submit_tasks, self.get_results, self.api_calls
+        )
+        self.api_connector = api_connector
+
+        worker = LocalWorker(self.api_calls, task_ms)
+        self.agent_loops = []
+        for index in range(n_agents):
+            agent = load_agent(index)
+            agent.lambda_client = worker
+            agent.perf_tracker_post = TaskStatsRecorder(
+                agent.perf_tracker_post, self.task_stats, self.task_stats_lock
+            )
+            self.agent_loops.append(AgentLoop(agent, self.api_calls))
+        for agent_loop in self.agent_loops:
+            agent_loop.start()
+
+        self.ttl_checker_interval_sec = ttl_checker_interval_sec
+        threading.Thread(target=self.__run_ttl_checker, daemon=True).start()
+
+    def connector(self):
+        client = self.api_connector.AWSConnector()
+        client.init(self.config)
+        return client
+
+    def run_session(self, task, n_tasks, timeout_sec):
+        """Submits a session and waits for its results, from a client thread"""
+        with self.api_calls.component("client"):
+            client = self.connector()
+            submission = client.send([task] * n_tasks)
+            results = client.get_results(submission, timeout_sec=timeout_sec)
+        return len(results.get("finished", []))
+
+    def set_agents(self, n_agents):
+        for index, agent_loop in enumerate(self.agent_loops):
+            if index < n_agents:
+                agent_loop.active.set()
+            else:
+                agent_loop.active.clear()
+
+    def wait_for_task_stats(self, n_tasks, timeout_sec=10):
+        """The stats of a task are recorded by its agent after the task is marked finished
+        and thus after get_results may have returned"""
+        deadline = time.monotonic() + timeout_sec
+        while time.monotonic() < deadline:
+            with self.task_stats_lock:
+                if len(self.task_stats) >= n_tasks:
+                    break
+            time.sleep(0.01)
+        with self.task_stats_lock:
+            task_stats, self.task_stats[:] = list(self.task_stats), []
+        return task_stats
+
+    def __run_ttl_checker(self):
+        with self.api_calls.component("ttl_checker"):
+            while True:
+                time.sleep(self.ttl_checker_interval_sec)
+                try:
+                    self.ttl_checker.lambda_handler({}, None)
+                except Exception:
+                    logging.exception("ttl_checker failed")
+
+
+def summarize(values, ndigits=3):
+    values = sorted(values)
+    if not values:
+        return {}
+    summary = {
+        "p{}".format(p): round(values[min(len(values) - 1, len(values) * p // 100)], ndigits)
+        for p in PERCENTILES
+    }
+    summary["max"] = round(values[-1], ndigits)
+    return summary
+
+
+def stage_latency_ms(task_stats):
+    """Percentiles of the latency of each stage of the tasks and of the tasks, in ms"""
+    from utils.stage_clock import NS_PER_MS, TASK_STAGES, stage_latencies
+
+    latencies = collections.defaultdict(list)
+    for stats in task_stats:
+        for label, value in stage_latencies(
+            stats, TASK_STAGES[0], TASK_STAGES[-1]
+        ).items():
+            if label.endswith("_us"):
+                latencies[label[: -len("_us")]].append(value / 1000)
+        latencies["task"].append(
+            (stats[TASK_STAGES[-1]] - stats[TASK_STAGES[0]]) / NS_PER_MS
+        )
+    return {label: summarize(values) for label, values in latencies.items()}
+
+
+def api_calls_per_task(counts, n_tasks):
+    per_task = collections.defaultdict(dict)
+    for (component, operation), calls in sorted(counts.items()):
+        per_task[component][operation] = round(calls / max(n_tasks, 1), 3)
+    return dict(per_task)
+
+
+def run(grid, task_kb, n_agents, n_clients, n_tasks, timeout_sec):
+    grid.set_agents(n_agents)
+    grid.api_calls.get_and_reset()
+    task = {"worker_arguments": ["1000", "1", "1"], "data": "x" * (task_kb * 1024)}
+
+    finished = []
+    t_start = time.perf_counter()
+    clients = [
+        threading.Thread(
+            target=lambda: finished.append(grid.run_session(task, n_tasks, timeout_sec))
+        )
+        for _ in range(n_clients)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    wall_time_sec = time.perf_counter() - t_start
+
+    total_tasks = n_clients * n_tasks
+    task_stats = grid.wait_for_task_stats(total_tasks)
+    return {
+        "task_kb": task_kb,
+        "agents": n_agents,
+        "clients": n_clients,
+        "tasks": total_tasks,
+        "finished": sum(finished),
+        "wall_time_sec": round(wall_time_sec, 3),
+        "tasks_per_sec": round(sum(finished) / wall_time_sec, 2),
+        "stage_latency_ms": stage_latency_ms(task_stats),
+        "api_calls_per_task": api_calls_per_task(
+            grid.api_calls.get_and_reset(), total_tasks
+        ),
+        "agent_errors": sum(agent_loop.errors for agent_loop in grid.agent_loops),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(  # nosec B603 B607
+            ["git", "rev-parse", "HEAD"],
+            cwd=_HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task-kb", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--agents", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--tasks", type=int, default=100, help="tasks per session")
+    parser.add_argument("--clients", type=int, default=1, help="concurrent sessions")
+    parser.add_argument("--task-ms", type=float, default=0)
+    parser.add_argument("--poll-interval-sec", type=float, default=0.01)
+    parser.add_argument("--ttl-checker-interval-sec", type=float, default=10)
+    parser.add_argument("--timeout-sec", type=float, default=600)
+    parser.add_argument("--config", default="{}", help="JSON grid settings")
+    parser.add_argument("--output", default="bench_grid_e2e.json")
+    args = parser.parse_args()
+
+    from moto import mock_cloudwatch, mock_dynamodb, mock_logs, mock_sqs
+
+    with contextlib.ExitStack() as stack:
+        work_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        config = grid_config(work_dir, args.poll_interval_sec, json.loads(args.config))
+        config_file = os.path.join(work_dir, "Agent_config.tfvars.json")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        stack.enter_context(
+            mock.patch.dict(os.environ, lambda_environment(config, config_file))
+        )
+        for aws_mock in (mock_dynamodb, mock_sqs, mock_cloudwatch, mock_logs):
+            stack.enter_context(aws_mock())
+        create_state_table(config)
+        create_queues(config)
+
+        from api.in_out_local import DEFAULT_LOCAL_DIR
+
+        stack.callback(
+            shutil.rmtree,
+            os.path.join(DEFAULT_LOCAL_DIR, config["s3_bucket"]),
+            ignore_errors=True,
+        )
+        grid = Grid(config, max(args.agents), args.task_ms, args.ttl_checker_interval_sec)
+        stack.enter_context(grid.api_calls.recording())
+        stack.enter_context(
+            mock.patch.object(
+                grid.api_connector.default_api,
+                "DefaultApi",
+                lambda api_client: grid.gateway,
+            )
+        )
+
+        print(
+            "{:>8} {:>7} {:>7} {:>10} {:>14} {:>14} {:>14}".format(
+                "task_kb",
+                "agents",
+                "tasks",
+                "tasks/s",
+                "task_p50_ms",
+                "task_p99_ms",
+                "api_calls/task",
+            )
+        )
+        runs = []
+        # Agents are only added from one run to the next, an agent never stops in the
+        # middle of a long poll of the task queue
+        for n_agents in sorted(args.agents):
+            for task_kb in args.task_kb:
+                result = run(
+                    grid, task_kb, n_agents, args.clients, args.tasks, args.timeout_sec
+                )
+                runs.append(result)
+                task_latency = result["stage_latency_ms"].get("task", {})
+                print(
+                    "{:>8} {:>7} {:>7} {:>10.1f} {:>14} {:>14} {:>14.1f}".format(
+                        task_kb,
+                        n_agents,
+                        result["finished"],
+                        result["tasks_per_sec"],
+                        task_latency.get("p50", "-"),
+                        task_latency.get("p99", "-"),
+                        sum(
+                            calls
+                            for operations in result["api_calls_per_task"].values()
+                            for calls in operations.values()
+                        ),
+                    )
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "benchmark": "bench_grid_e2e",
+                "time": datetime.datetime.now().isoformat(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "arguments": vars(args),
+                "runs": runs,
+            },
+            f,
+            indent=2,
+        )
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
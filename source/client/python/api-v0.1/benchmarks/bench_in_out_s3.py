@@ -0,0 +1,141 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Throughput of the InOutS3 transfers per S3 transfer profile.
+
+Measures, for each profile and object size, the upload throughput of put_output_from_bytes
+and the download throughput of get_output_to_bytes (ranged parallel GETs) against the single
+download_fileobj call used before transfer profiles.
+
+Runs against any S3-compatible endpoint (e.g. MinIO: `--endpoint-url http://localhost:9000`).
+Without --endpoint-url a local moto server is started (requires moto[server]), or moto's
+in-process mock is used, which only measures the client side.
+
+    python3 benchmarks/bench_in_out_s3.py --sizes-mb 1 64 256 --profiles default large_results
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import boto3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_s3 import InOutS3  # noqa: E402
+from api.in_out_transfer import S3_TRANSFER_PROFILES, s3_transfer_profile  # noqa: E402
+
+BUCKET = "htc-grid-benchmark"
+REGION = "eu-west-1"
+MB = 1024 * 1024
+
+
+@contextlib.contextmanager
+def s3_endpoint(endpoint_url):
+    """Yields the endpoint URL to use, None for moto's in-process mock"""
+    if endpoint_url:
+        yield endpoint_url
+        return
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    try:
+        from moto.server import ThreadedMotoServer
+
+        server = ThreadedMotoServer(port=0)
+        server.start()
+        host, port = server.get_host_and_port()
+        try:
+            yield "http://{}:{}".format(host, port)
+        finally:
+            server.stop()
+    except ImportError:
+        from moto import mock_s3
+
+        print("moto[server] is not installed, using moto in-process (no network)")
+        with mock_s3():
+            yield None
+
+
+def throughput_mb_s(size, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t_start)
+    return size / MB / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint-url", default=None)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 64, 256])
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(S3_TRANSFER_PROFILES),
+        choices=list(S3_TRANSFER_PROFILES),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with s3_endpoint(args.endpoint_url) as endpoint_url:
+        print(
+            "{:<16} {:>9} {:>12} {:>18} {:>16}".format(
+                "profile", "size_mb", "upload_mb_s", "download_fileobj", "ranged_download"
+            )
+        )
+        for profile_name in args.profiles:
+            profile = s3_transfer_profile({"profile": profile_name})
+            s3 = boto3.resource(
+                "s3",
+                region_name=REGION,
+                endpoint_url=endpoint_url,
+                config=profile.client_config(),
+            )
+            with contextlib.suppress(s3.meta.client.exceptions.BucketAlreadyOwnedByYou):
+                s3.create_bucket(
+                    Bucket=BUCKET,
+                    CreateBucketConfiguration={"LocationConstraint": REGION},
+                )
+            iom = InOutS3(
+                BUCKET,
+                REGION,
+                "kms-key-id",
+                s3_custom_resource=s3,
+                transfer_profile=profile,
+            )
+
+            for size_mb in args.sizes_mb:
+                size = size_mb * MB
+                data = os.urandom(size)
+                key = "bench-{}".format(size_mb)
+
+                upload = throughput_mb_s(
+                    size, lambda: iom.put_output_from_bytes(key, data), args.repeat
+                )
+
+                def download_fileobj():
+                    with io.BytesIO() as f_data:
+                        iom.bucket.download_fileobj(Key=key + "-output", Fileobj=f_data)
+
+                single = throughput_mb_s(size, download_fileobj, args.repeat)
+                ranged = throughput_mb_s(
+                    size, lambda: iom.get_output_to_bytes(key), args.repeat
+                )
+                print(
+                    "{:<16} {:>9} {:>12.1f} {:>18.1f} {:>16.1f}".format(
+                        profile_name, size_mb, upload, single, ranged
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
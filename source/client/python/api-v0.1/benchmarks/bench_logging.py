@@ -0,0 +1,96 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""CPU time of the per-task log records of the agent.
+
+Logs the records the agent writes for each task ("Running Task", the SQS message, the
+Lambda response...) with a task of --task-kb KB, formatted eagerly as before
+(str.format / f-strings) and lazily with utils.grid_logging.truncated, with the agent
+logger at INFO and at WARNING. Records go through a real handler and formatter writing to
+/dev/null, so the formatting and I/O costs are included.
+
+    python3 benchmarks/bench_logging.py --task-kb 1 8 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.grid_logging import truncated  # noqa: E402
+
+
+def make_task(task_kb):
+    return {
+        "task_id": "bd88ea18-6564-11eb-b5fb-060372291b89_0",
+        "session_id": "bd88ea18-6564-11eb-b5fb-060372291b89",
+        "task_definition": "x" * (task_kb * 1024),
+        "stats": {"stage{}_tstmp".format(i): 1612276891690123456 + i for i in range(8)},
+    }
+
+
+def eager(logger, task, message, response):
+    logger.info(f"try_to_acquire_a_task, message: {message}")
+    logger.info("Running Task: {}".format(task))
+    logger.info("TASK FINISHED!!!\nRESPONSE: [{}]".format(response))
+    logger.info("retValue : {}".format(response["Payload"]))
+    logger.info("Finished Task: {}".format(task))
+
+
+def lazy(logger, task, message, response):
+    logger.info("try_to_acquire_a_task, message: %s", truncated(message))
+    logger.info("Running Task: %s", truncated(task))
+    logger.info("TASK FINISHED!!!\nRESPONSE: [%s]", truncated(response))
+    logger.info("retValue : %s", truncated(response["Payload"]))
+    logger.info("Finished Task: %s", task["task_id"])
+
+
+def us_per_task(log_task, logger, task, n_tasks):
+    message = {"body": str(task), "properties": {"message_handle_id": "AQEB" * 100}}
+    response = {"StatusCode": 200, "Payload": "y" * len(task["task_definition"])}
+    t_start = time.process_time()
+    for _ in range(n_tasks):
+        log_task(logger, task, message, response)
+    return (time.process_time() - t_start) * 1e6 / n_tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task-kb", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--tasks", type=int, default=2000)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench_agent")
+    logger.propagate = False
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(funcName)s - %(message)s")
+    )
+    logger.addHandler(handler)
+
+    print(
+        "{:>8} {:>8} {:>16} {:>16}".format("task_kb", "level", "eager_us_task", "lazy_us_task")
+    )
+    for task_kb in args.task_kb:
+        task = make_task(task_kb)
+        for level in (logging.INFO, logging.WARNING):
+            logger.setLevel(level)
+            print(
+                "{:>8} {:>8} {:>16.1f} {:>16.1f}".format(
+                    task_kb,
+                    logging.getLevelName(level),
+                    us_per_task(eager, logger, task, args.tasks),
+                    us_per_task(lazy, logger, task, args.tasks),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
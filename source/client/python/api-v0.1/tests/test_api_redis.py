@@ -234,18 +234,18 @@ def test_send(test_init_connector, test_generate_one_task, mocked_responses_subm
         test_generate_one_task["scheduler_data"]
     )
     submitted_content.should.have.key("stats")
+    # Stage timestamps are flat integers in ns, see utils.stage_clock
     submitted_content["stats"].should.have.key(
         "stage1_grid_api_01_task_creation_tstmp"
-    ).which.should.have.key("label").which.should.equal(" ")
-    submitted_content["stats"].should.have.key(
-        "stage1_grid_api_01_task_creation_tstmp"
-    ).which.should.have.key("tstmp")
+    ).which.should.be.an(int)
     submitted_content["stats"].should.have.key(
         "stage1_grid_api_02_task_submission_tstmp"
-    ).which.should.have.key("label").which.should.equal("upload_data_to_storage")
-    submitted_content["stats"].should.have.key(
+    ).which.should.be.an(int)
+    submitted_content["stats"][
         "stage1_grid_api_02_task_submission_tstmp"
-    ).which.should.have.key("tstmp")
+    ].should.be.greater_than_or_equal_to(
+        submitted_content["stats"]["stage1_grid_api_01_task_creation_tstmp"]
+    )
     submitted_content["stats"].should.have.key(
         "stage2_sbmtlmba_01_invocation_tstmp"
     ).should.equal(
@@ -0,0 +1,123 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.events_counter.
+
+Runnable with plain stdlib: `python3 -m unittest test_events_counter`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.events_counter import EventsCounter  # noqa: E402
+
+
+class EventsCounterTest(unittest.TestCase):
+    def test_increment_of_a_new_event_adds_the_value(self):
+        counter = EventsCounter()
+        counter.increment("expired_tasks", 5)
+        counter.increment("expired_tasks", 2)
+
+        self.assertEqual(counter.get_counter("expired_tasks"), 7)
+
+    def test_expected_events_are_always_in_the_samples(self):
+        counter = EventsCounter(
+            ["counter_tasks", "str_pod_id"], expected_histograms=["lease_ms"]
+        )
+        counter.increment("counter_tasks")
+        counter.collect()
+
+        fields = counter.collect().to_fields()
+
+        self.assertEqual(fields["counter_tasks"], 0)
+        self.assertEqual(fields["str_pod_id"], "")
+        self.assertEqual(fields["lease_ms_count"], 0)
+        self.assertEqual(fields["lease_ms_p99"], 0)
+
+    def test_collect_types_and_resets_the_events(self):
+        counter = EventsCounter()
+        counter.increment("tasks", 3)
+        counter.set("tasks_in_flight", 2)
+        for value in [10, 20, 30]:
+            counter.observe("lease_ms", value)
+
+        events = counter.collect()
+
+        self.assertEqual(events.counters, {"tasks": 3})
+        self.assertEqual(events.gauges, {"tasks_in_flight": 2})
+        fields = events.to_fields()
+        self.assertEqual(fields["lease_ms_count"], 3)
+        self.assertEqual(fields["lease_ms_max"], 30)
+        # Counters seen once stay in the samples
+        self.assertEqual(counter.collect().to_fields(), {"tasks": 0})
+
+    def test_peek_does_not_reset(self):
+        counter = EventsCounter()
+        counter.increment("tasks")
+        counter.observe("lease_ms", 5)
+
+        self.assertEqual(counter.peek().counters, {"tasks": 1})
+        events = counter.collect()
+        self.assertEqual(events.counters, {"tasks": 1})
+        self.assertEqual(events.histograms["lease_ms"].count, 1)
+
+    def test_concurrent_increments_are_not_lost(self):
+        counter = EventsCounter()
+        collected = []
+        n_threads, n_increments = 8, 5000
+
+        def increment():
+            for _ in range(n_increments):
+                counter.increment("tasks")
+
+        threads = [threading.Thread(target=increment) for _ in range(n_threads)]
+        for t in threads:
+            t.start()
+        # Collections racing with the increments
+        while any(t.is_alive() for t in threads):
+            collected.append(counter.collect().counters.get("tasks", 0))
+        for t in threads:
+            t.join()
+        collected.append(counter.collect().counters.get("tasks", 0))
+
+        self.assertEqual(sum(collected), n_threads * n_increments)
+        # Shards of the exited threads are dropped once drained
+        self.assertEqual(counter.shards, [])
+
+    def test_last_set_wins_across_threads(self):
+        counter = EventsCounter()
+        counter.set("tasks_in_flight", 1)
+        thread = threading.Thread(target=counter.set, args=("tasks_in_flight", 4))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(counter.collect().gauges, {"tasks_in_flight": 4})
+
+    def test_set_stored_after_a_collect_of_a_later_set_is_reported(self):
+        counter = EventsCounter()
+        counter.set("tasks_in_flight", 0)
+        counter.collect()
+
+        # This thread draws the sequence number of its set() ...
+        sequence = next(counter.sequence)
+        # ... another thread sets a gauge and a sample is collected ...
+        thread = threading.Thread(target=counter.set, args=("queue_size", 5))
+        thread.start()
+        thread.join()
+        self.assertEqual(counter.collect().gauges, {"queue_size": 5})
+        # ... before this thread stores its value.
+        counter.local.shard.gauges["tasks_in_flight"] = (sequence, 2)
+
+        self.assertEqual(counter.collect().gauges, {"tasks_in_flight": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
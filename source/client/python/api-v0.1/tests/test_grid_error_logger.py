@@ -0,0 +1,147 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the buffered error logger of utils.grid_error_logger.
+
+Runnable with plain stdlib: `python3 -m unittest test_grid_error_logger`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+# grid_error_logger reads these at import; supply harmless values so the import doesn't KeyError.
+os.environ.setdefault("ERROR_LOG_GROUP", "test")
+os.environ.setdefault("ERROR_LOGGING_STREAM", "test")
+os.environ.setdefault("REGION", "eu-west-1")
+
+from utils.grid_error_logger import (  # noqa: E402
+    BufferedErrorLogger,
+    CloudWatchLogsSink,
+    LocalFileSink,
+)
+
+
+class FakeLogsClient:
+    """put_log_events recording its calls and returning increasing sequence tokens"""
+
+    class exceptions:
+        class InvalidSequenceTokenException(Exception):
+            pass
+
+        class DataAlreadyAcceptedException(Exception):
+            pass
+
+    def __init__(self):
+        self.calls = []
+
+    def put_log_events(self, **kwargs):
+        self.calls.append(kwargs)
+        return {"nextSequenceToken": str(len(self.calls))}
+
+
+class BufferedErrorLoggerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.file_name = os.path.join(directory, "errors.log")
+
+    def events(self):
+        if not os.path.exists(self.file_name):
+            return []
+        with open(self.file_name) as f:
+            return [json.loads(line) for line in f]
+
+    def test_log_does_not_write_until_flushed(self):
+        logger = BufferedErrorLogger(
+            LocalFileSink(self.file_name), max_batching_delay_ms=60000
+        )
+        logger.log("error 1", "group", "stream")
+        logger.log("error 2", "group", "other_stream")
+
+        self.assertEqual(self.events(), [])
+        logger.flush()
+
+        self.assertEqual(
+            [(e["logStreamName"], e["message"]) for e in self.events()],
+            [("stream", "error 1"), ("other_stream", "error 2")],
+        )
+
+    def test_repeated_messages_are_counted(self):
+        logger = BufferedErrorLogger(
+            LocalFileSink(self.file_name), max_batching_delay_ms=60000
+        )
+        for _ in range(3):
+            logger.log("throttled", "group", "stream")
+        logger.log("other", "group", "stream")
+        logger.flush()
+
+        self.assertEqual(
+            [e["message"] for e in self.events()],
+            ["throttled [repeated 3 times]", "other"],
+        )
+        self.assertEqual(logger.get_stats()["messages_deduplicated"], 2)
+
+    def test_rate_limit(self):
+        logger = BufferedErrorLogger(
+            LocalFileSink(self.file_name),
+            max_batching_delay_ms=60000,
+            max_messages_per_sec=2,
+        )
+        for i in range(5):
+            logger.log("error {}".format(i), "group", "stream")
+        logger.flush()
+
+        messages = [e["message"] for e in self.events()]
+        self.assertEqual(messages[:2], ["error 0", "error 1"])
+        self.assertEqual(messages[2:], ["3 error messages suppressed by rate limiting"])
+
+    def test_background_flush_by_size(self):
+        logger = BufferedErrorLogger(
+            LocalFileSink(self.file_name), max_batch_size=2, max_batching_delay_ms=60000
+        )
+        logger.log("error 1", "group", "stream")
+        logger.log("error 2", "group", "stream")
+
+        deadline = time.monotonic() + 2
+        while len(self.events()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.events()), 2)
+
+    def test_failed_write_is_counted(self):
+        logger = BufferedErrorLogger(
+            LocalFileSink(os.path.join(self.file_name, "missing", "errors.log")),
+            max_batching_delay_ms=60000,
+        )
+        logger.log("error", "group", "stream")
+        logger.flush()
+
+        self.assertEqual(logger.get_stats()["write_failures"], 1)
+
+
+class CloudWatchLogsSinkTest(unittest.TestCase):
+    def test_sequence_token_is_kept_locally(self):
+        client = FakeLogsClient()
+        sink = CloudWatchLogsSink(client)
+        events = [{"timestamp": 1, "message": "error"}]
+
+        sink.write("group", "stream", events)
+        sink.write("group", "stream", events)
+        sink.write("group", "other_stream", events)
+
+        self.assertNotIn("sequenceToken", client.calls[0])
+        self.assertEqual(client.calls[1]["sequenceToken"], "1")
+        self.assertNotIn("sequenceToken", client.calls[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.grid_logging.
+
+Runnable with plain stdlib: `python3 -m unittest test_grid_logging`.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+import os
+import sys
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.grid_logging import (  # noqa: E402
+    JsonFormatter,
+    configure_logging,
+    log_fields,
+    logging_config,
+    truncated,
+)
+
+
+class Payload:
+    def __init__(self):
+        self.renders = 0
+
+    def __repr__(self):
+        self.renders += 1
+        return "Payload"
+
+
+class TruncatedTest(unittest.TestCase):
+    def test_large_task_is_truncated(self):
+        task = {"task_id": "t-1", "task_definition": "x" * 100000}
+
+        text = str(truncated(task, max_chars=64))
+
+        self.assertTrue(text.startswith("{'task_id': 't-1', 'task_definition': 'xxx"))
+        self.assertLess(len(text), 100)
+        self.assertTrue(text.endswith(" chars]"))
+
+    def test_large_bytes_are_truncated(self):
+        text = str(truncated({"payload": b"x" * 2000}))
+
+        self.assertTrue(text.startswith("{'payload': b'xxx"))
+        self.assertLess(len(text), 600)
+
+    def test_small_payload_is_unchanged(self):
+        message = {"body": '{"task_id": "t-1"}', "properties": (1, None)}
+
+        self.assertEqual(str(truncated(message)), repr(message))
+        self.assertEqual(str(truncated("Task t-1")), "Task t-1")
+
+    def test_rendered_only_when_the_record_is_emitted(self):
+        logger = logging.getLogger("test_grid_logging.lazy")
+        logger.propagate = False
+        stream = io.StringIO()
+        logger.addHandler(logging.StreamHandler(stream))
+        self.addCleanup(logger.handlers.clear)
+        payload = Payload()
+
+        logger.setLevel(logging.WARNING)
+        logger.info("Running Task: %s", truncated([payload]))
+        self.assertEqual(payload.renders, 0)
+
+        logger.setLevel(logging.INFO)
+        logger.info("Running Task: %s", truncated([payload]))
+        self.assertEqual(payload.renders, 1)
+        self.assertEqual(stream.getvalue(), "Running Task: [Payload]\n")
+
+
+class JsonFormatterTest(unittest.TestCase):
+    def test_structured_fields(self):
+        logger = logging.getLogger("test_grid_logging.json")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        self.addCleanup(logger.handlers.clear)
+
+        logger.info(
+            "Finished Task: %s", "t-1", extra=log_fields(task_id="t-1", session_id="s-1")
+        )
+
+        document = json.loads(stream.getvalue())
+        self.assertEqual(document["message"], "Finished Task: t-1")
+        self.assertEqual(document["level"], "INFO")
+        self.assertEqual(document["logger"], "test_grid_logging.json")
+        self.assertEqual(document["task_id"], "t-1")
+        self.assertEqual(document["session_id"], "s-1")
+
+
+class ConfigureLoggingTest(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        level = root.level
+        self.addCleanup(root.setLevel, level)
+        self.addCleanup(configure_logging, None)
+
+    def test_levels(self):
+        configure_logging('{"level": "WARNING", "loggers": {"agent": "DEBUG"}}')
+
+        self.assertEqual(logging.getLogger().level, logging.WARNING)
+        self.assertEqual(logging.getLogger("agent").level, logging.DEBUG)
+        logging.getLogger("agent").setLevel(logging.NOTSET)
+
+    def test_max_payload_chars(self):
+        configure_logging({"max_payload_chars": 8})
+
+        self.assertEqual(str(truncated("x" * 20)), "xxxxxxxx... [20 chars]")
+
+    def test_invalid_settings_are_rejected(self):
+        with self.assertRaises(Exception):
+            logging_config('{"max_chars": 10}')
+        with self.assertRaises(Exception):
+            logging_config({"format": "xml"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.grid_tracing.
+
+Runnable with plain stdlib: `python3 -m unittest test_grid_tracing`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.grid_tracing import (  # noqa: E402
+    SpanContext,
+    is_session_sampled,
+    tracer_from_config,
+    tracing_config,
+)
+
+
+class GridTracingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.file_name = os.path.join(directory, "spans.jsonl")
+
+    def tracer(self, sample_rate=1.0, background=False):
+        tracer = tracer_from_config(
+            {"sample_rate": sample_rate, "file": self.file_name}, background
+        )
+        self.addCleanup(tracer.flush)
+        return tracer
+
+    def spans(self):
+        spans = []
+        with open(self.file_name) as f:
+            for line in f:
+                for resource_spans in json.loads(line)["resourceSpans"]:
+                    for scope_spans in resource_spans["scopeSpans"]:
+                        spans.extend(scope_spans["spans"])
+        return {span["name"]: span for span in spans}
+
+    def test_trace_propagated_through_traceparent(self):
+        client = self.tracer()
+        lambda_tracer = self.tracer(sample_rate=0)
+
+        root = client.start_trace("client", session_id="s", attributes={"tasks": 2})
+        root.end()
+        # The lambda only follows the sampling decision of the client
+        with lambda_tracer.start_span("submit_tasks", root.traceparent()) as submit:
+            lambda_tracer.record_span(
+                "sqs.queued", submit.traceparent(), 1000, 1500, {"task_id": "s_0"}
+            )
+        client.flush()
+        lambda_tracer.flush()
+
+        spans = self.spans()
+        trace_id = spans["client"]["traceId"]
+        self.assertEqual(spans["submit_tasks"]["traceId"], trace_id)
+        self.assertEqual(
+            spans["submit_tasks"]["parentSpanId"], spans["client"]["spanId"]
+        )
+        self.assertEqual(
+            spans["sqs.queued"]["parentSpanId"], spans["submit_tasks"]["spanId"]
+        )
+        self.assertEqual(spans["sqs.queued"]["startTimeUnixNano"], "1000000000")
+        self.assertEqual(spans["sqs.queued"]["endTimeUnixNano"], "1500000000")
+        self.assertNotIn("parentSpanId", spans["client"])
+        self.assertIn(
+            {"key": "tasks", "value": {"intValue": "2"}}, spans["client"]["attributes"]
+        )
+
+    def test_sessions_not_sampled_are_not_recorded(self):
+        tracer = self.tracer(sample_rate=0)
+
+        root = tracer.start_trace("client", session_id="s")
+        child = tracer.start_span("child", root)
+        orphan = tracer.start_span("orphan", None)
+        for span in (root, child, orphan):
+            span.end()
+        tracer.flush()
+
+        self.assertIsNone(root.traceparent())
+        self.assertFalse(child.recording or orphan.recording)
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_error_status(self):
+        tracer = self.tracer()
+        root = tracer.start_trace("client")
+
+        with self.assertRaises(ValueError):
+            with tracer.start_span("failing", root):
+                raise ValueError("boom")
+        tracer.flush()
+
+        self.assertEqual(
+            self.spans()["failing"]["status"], {"code": 2, "message": "boom"}
+        )
+
+    def test_background_export(self):
+        tracer = self.tracer(background=True)
+        tracer.start_trace("client").end()
+
+        self.assertTrue(tracer.flush(1))
+        self.assertIn("client", self.spans())
+
+    def test_context_propagated_without_exporter(self):
+        tracer = tracer_from_config({"sample_rate": 1.0})
+
+        root = tracer.start_trace("client")
+        child = tracer.start_span("child", root)
+
+        self.assertEqual(
+            SpanContext.from_traceparent(child.traceparent()).trace_id,
+            root.context.trace_id,
+        )
+
+    def test_traceparent(self):
+        context = SpanContext.from_traceparent(
+            "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        )
+        self.assertEqual(context.trace_id, "0af7651916cd43dd8448eb211c80319c")
+        self.assertTrue(context.sampled)
+        self.assertEqual(
+            context.to_traceparent(),
+            "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01",
+        )
+        self.assertIsNone(SpanContext.from_traceparent("garbage"))
+        self.assertIsNone(SpanContext.from_traceparent(None))
+
+    def test_session_sampling_is_deterministic(self):
+        sessions = ["session-{}".format(i) for i in range(200)]
+        sampled = [is_session_sampled(session, 0.5) for session in sessions]
+
+        self.assertEqual(sampled, [is_session_sampled(s, 0.5) for s in sessions])
+        self.assertTrue(60 < sampled.count(True) < 140)
+
+    def test_config(self):
+        self.assertEqual(tracing_config("{}")["sample_rate"], 0.0)
+        with self.assertRaises(Exception):
+            tracing_config('{"rate": 1}')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the content-addressed (deduplicated) task inputs of the data plane.
+
+Runnable with plain stdlib plus fakeredis and moto: `python3 -m unittest test_in_out_blobs`.
+"""
+
+from __future__ import annotations
+
+import datetime
+import os
+import sys
+import unittest
+from unittest import mock
+
+import boto3
+import fakeredis
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_manager import (  # noqa: E402
+    content_key,
+    parse_task_input_blob_ref,
+    task_input_blob_ref,
+)
+from api.in_out_redis import InOutRedis  # noqa: E402
+from api.in_out_s3 import InOutS3  # noqa: E402
+
+INPUT = b'{"worker_arguments": ["1000", "1", "1"]}'
+
+
+class BlobRefTest(unittest.TestCase):
+    def test_content_key_depends_on_content_only(self):
+        self.assertEqual(content_key(INPUT), content_key(bytes(INPUT)))
+        self.assertNotEqual(content_key(INPUT), content_key(INPUT + b" "))
+
+    def test_ref_round_trip(self):
+        key = content_key(INPUT)
+
+        self.assertEqual(parse_task_input_blob_ref(task_input_blob_ref(key)), key)
+        self.assertIsNone(parse_task_input_blob_ref("none"))
+        self.assertIsNone(parse_task_input_blob_ref(None))
+
+
+def _create_bucket(s3):
+    s3.create_bucket(
+        Bucket="bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-1"}
+    )
+
+
+class InOutRedisBlobTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        self.iom = InOutRedis(
+            "bucket", "cache_url", "cache_password", redis_custom_connection=self.redis
+        )
+
+    def test_put_has_get(self):
+        key = content_key(INPUT)
+        self.assertFalse(self.iom.has_blob(key))
+
+        self.iom.put_blob_from_bytes(key, INPUT)
+
+        self.assertTrue(self.iom.has_blob(key))
+        self.assertEqual(self.iom.get_blob_to_bytes(key), INPUT)
+
+    @mock_s3
+    def test_blob_evicted_from_redis_is_found_in_s3(self):
+        s3 = boto3.resource("s3", region_name="eu-west-1")
+        _create_bucket(s3)
+        iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            use_S3=True,
+            s3_kms_key_id="kms-key-id",
+            s3_custom_resource=s3,
+            redis_custom_connection=self.redis,
+        )
+        key = content_key(INPUT)
+        iom.put_blob_from_bytes(key, INPUT)
+
+        self.redis.flushall()
+
+        self.assertTrue(iom.has_blob(key))
+        self.assertEqual(iom.get_blob_to_bytes(key), INPUT)
+
+    def test_reused_blob_expiration_is_restarted(self):
+        iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            redis_custom_connection=self.redis,
+            ttl_config={"blob": 3600},
+        )
+        key = content_key(INPUT)
+        iom.put_blob_from_bytes(key, INPUT)
+        self.redis.expire(key + "-blob", 10)
+
+        self.assertTrue(iom.has_blob(key))
+        self.assertGreater(self.redis.ttl(key + "-blob"), 3000)
+
+
+def _days_from_now(days):
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=days)
+
+
+@mock_s3
+class InOutS3BlobTest(unittest.TestCase):
+    def test_put_has_get(self):
+        s3 = boto3.resource("s3", region_name="eu-west-1")
+        _create_bucket(s3)
+        iom = InOutS3("bucket", "eu-west-1", "kms-key-id", s3_custom_resource=s3)
+        key = content_key(INPUT)
+
+        self.assertFalse(iom.has_blob(key))
+        iom.put_blob_from_bytes(key, INPUT)
+
+        self.assertTrue(iom.has_blob(key))
+        self.assertEqual(iom.get_blob_to_bytes(key), INPUT)
+
+    def test_blobs_are_tagged_and_uploaded_again_before_they_expire(self):
+        s3 = boto3.resource("s3", region_name="eu-west-1")
+        _create_bucket(s3)
+        iom = InOutS3(
+            "bucket",
+            "eu-west-1",
+            "kms-key-id",
+            s3_custom_resource=s3,
+            blob_expiration_days=30,
+        )
+        key = content_key(INPUT)
+        iom.put_blob_from_bytes(key, INPUT)
+
+        tags = s3.meta.client.get_object_tagging(Bucket="bucket", Key=key + "-blob")
+        self.assertEqual(tags["TagSet"], [{"Key": "htc_grid_value", "Value": "blob"}])
+
+        with mock.patch("api.in_out_lifecycle._utc_now", return_value=_days_from_now(14)):
+            self.assertTrue(iom.has_blob(key))
+        with mock.patch("api.in_out_lifecycle._utc_now", return_value=_days_from_now(16)):
+            self.assertFalse(iom.has_blob(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
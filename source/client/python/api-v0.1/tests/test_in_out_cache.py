@@ -0,0 +1,191 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the agent cache of blobs and the shared data references.
+
+Runnable with plain stdlib (no pytest/moto): `python3 -m unittest test_in_out_cache`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_cache import (  # noqa: E402
+    STALE_TMP_FILE_AGE_SEC,
+    TMP_FILE_PREFIX,
+    TieredCache,
+)
+from api.in_out_manager import (  # noqa: E402
+    content_key,
+    resolve_shared_data_refs,
+    shared_data_ref,
+)
+
+
+class Loader:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.data
+
+
+class TieredCacheMemoryTest(unittest.TestCase):
+    def test_loads_once(self):
+        cache = TieredCache(memory_max_bytes=1024)
+        loader = Loader(b"curve")
+
+        self.assertEqual(cache.get_or_load("k", loader), b"curve")
+        self.assertEqual(cache.get_or_load("k", loader), b"curve")
+
+        self.assertEqual(loader.calls, 1)
+        stats = cache.get_and_reset_stats()
+        self.assertEqual((stats["misses"], stats["hits_memory"]), (1, 1))
+        self.assertEqual(cache.get_and_reset_stats()["hits_memory"], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TieredCache(memory_max_bytes=20)
+        cache.put("a", b"a" * 10)
+        cache.put("b", b"b" * 10)
+        cache.get("a")
+
+        cache.put("c", b"c" * 10)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_and_reset_stats()["evictions_memory"], 1)
+
+    def test_values_larger_than_the_cache_are_not_kept(self):
+        cache = TieredCache(memory_max_bytes=4)
+        cache.put("k", b"too large")
+
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(len(cache), 0)
+
+
+class TieredCacheDiskTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.disk_dir = tmp.name
+
+    def test_disk_is_shared_by_the_agents_of_a_node(self):
+        agent1 = TieredCache(memory_max_bytes=1024, disk_dir=self.disk_dir)
+        agent2 = TieredCache(memory_max_bytes=1024, disk_dir=self.disk_dir)
+        loader = Loader(b"market data")
+
+        agent1.get_or_load("k", loader)
+        self.assertEqual(agent2.get_or_load("k", loader), b"market data")
+
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(agent2.get_and_reset_stats()["hits_disk"], 1)
+
+    def test_disk_hit_is_promoted_to_memory(self):
+        cache = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir)
+        cache.put("k", b"value")
+
+        self.assertEqual(cache.get("k"), b"value")
+        self.assertEqual(cache.get_and_reset_stats()["hits_disk"], 1)
+
+    def test_disk_is_bounded(self):
+        cache = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=20)
+        for key in "abc":
+            cache.put(key, key.encode("utf-8") * 10)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), b"c" * 10)
+        self.assertEqual(len(self._files()), 2)
+        self.assertEqual(cache.get_and_reset_stats()["evictions_disk"], 1)
+
+    def test_disk_budget_is_shared_by_the_agents_of_a_node(self):
+        agent1 = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=20)
+        agent2 = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=20)
+        agent1.put("a", b"a" * 10)
+        agent1.put("b", b"b" * 10)
+
+        agent2.put("c", b"c" * 10)
+
+        self.assertEqual(len(self._files()), 2)
+        self.assertIsNone(agent1.get("a"))
+        self.assertEqual(agent2.get_and_reset_stats()["evictions_disk"], 1)
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        cache = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir)
+        with mock.patch("api.in_out_cache.os.replace", side_effect=OSError(28, "No space")):
+            cache.put("k", b"value")
+
+        self.assertEqual(os.listdir(self.disk_dir), [])
+        self.assertIsNone(cache.get("k"))
+
+    def test_stale_temporary_files_are_counted_and_removed(self):
+        fresh = os.path.join(self.disk_dir, TMP_FILE_PREFIX + "fresh")
+        stale = os.path.join(self.disk_dir, TMP_FILE_PREFIX + "stale")
+        for path in (fresh, stale):
+            with open(path, "wb") as f:
+                f.write(b"t" * 10)
+        old = time.time() - STALE_TMP_FILE_AGE_SEC - 1
+        os.utime(stale, (old, old))
+
+        cache = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=20)
+        cache.put("a", b"a" * 10)
+        cache.put("b", b"b" * 10)
+
+        # The write in progress keeps its 10 bytes of the budget, the stale one is removed.
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"b" * 10)
+
+    def _files(self):
+        return [name for name in os.listdir(self.disk_dir) if not name.startswith(".")]
+
+    def test_existing_files_are_indexed_at_startup(self):
+        TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir).put("a", b"a" * 10)
+
+        cache = TieredCache(memory_max_bytes=0, disk_dir=self.disk_dir, disk_max_bytes=10)
+        cache.put("b", b"b" * 10)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"b" * 10)
+
+
+class SharedDataRefTest(unittest.TestCase):
+    def setUp(self):
+        self.market_data = json.dumps({"curves": [1.0, 1.5]}).encode("utf-8")
+        self.key = content_key(self.market_data)
+
+    def test_refs_are_replaced_by_the_data(self):
+        task = {"trade": 1, "market_data": shared_data_ref(self.key)}
+        shared = {self.key: self.market_data}
+
+        for separators in [(", ", ": "), (",", ":")]:
+            with self.subTest(separators=separators):
+                payload = json.dumps(task, separators=separators).encode("utf-8")
+
+                resolved = resolve_shared_data_refs(payload, shared.__getitem__)
+
+                self.assertEqual(
+                    json.loads(resolved),
+                    {"trade": 1, "market_data": {"curves": [1.0, 1.5]}},
+                )
+
+    def test_payload_without_refs_is_unchanged(self):
+        payload = b'{"trade": 1}'
+
+        self.assertIs(resolve_shared_data_refs(payload, None), payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the compression of the values stored by InOutS3 and InOutRedis.
+
+Runnable with plain stdlib plus fakeredis and moto: `python3 -m unittest test_in_out_compression`.
+The zstd and lz4 tests are skipped when zstandard or lz4 are not installed.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import boto3
+import fakeredis
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api import in_out_compression  # noqa: E402
+from api.in_out_compression import InOutCompressor, in_out_compressor  # noqa: E402
+from api.in_out_redis import InOutRedis  # noqa: E402
+from api.in_out_s3 import InOutS3  # noqa: E402
+
+PORTFOLIO = json.dumps(
+    [{"trade_id": i, "notional": 1000000, "currency": "EUR"} for i in range(200)]
+).encode("utf-8")
+
+ALGORITHMS = ["zlib"]
+if in_out_compression.zstandard is not None:
+    ALGORITHMS.append("zstd")
+if in_out_compression.lz4 is not None:
+    ALGORITHMS.append("lz4")
+
+
+class InOutCompressorTest(unittest.TestCase):
+    def test_round_trip(self):
+        for algorithm in ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                compressor = InOutCompressor(algorithm)
+
+                stored = compressor.compress(PORTFOLIO)
+
+                self.assertTrue(InOutCompressor.is_compressed(stored))
+                self.assertLess(len(stored), len(PORTFOLIO) / 4)
+                # Readers decompress whatever algorithm wrote the value.
+                self.assertEqual(InOutCompressor().decompress(stored), PORTFOLIO)
+
+    def test_round_trip_with_dictionary(self):
+        dictionary = PORTFOLIO[:2048]
+        for algorithm in ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                compressor = InOutCompressor(algorithm, dictionary=dictionary)
+
+                stored = compressor.compress(PORTFOLIO)
+
+                self.assertEqual(compressor.decompress(stored), PORTFOLIO)
+                with self.assertRaises(Exception):
+                    InOutCompressor().decompress(stored)
+
+    def test_small_and_incompressible_values_are_stored_raw(self):
+        compressor = InOutCompressor("zlib", threshold_bytes=1024)
+        random_bytes = os.urandom(4096)
+
+        self.assertIs(compressor.compress(b"small"), b"small")
+        self.assertIs(compressor.compress(random_bytes), random_bytes)
+        self.assertEqual(compressor.decompress(random_bytes), random_bytes)
+
+    def test_disabled_by_default(self):
+        compressor = in_out_compressor(None)
+
+        self.assertFalse(compressor.enabled)
+        self.assertIs(compressor.compress(PORTFOLIO), PORTFOLIO)
+
+    def test_config_from_json(self):
+        compressor = in_out_compressor('{"algorithm": "zlib", "level": 9, "threshold_bytes": 10}')
+
+        self.assertEqual((compressor.algorithm, compressor.level, compressor.threshold_bytes), ("zlib", 9, 10))
+        with self.assertRaises(Exception):
+            in_out_compressor('{"algorithm": "brotli"}')
+
+    def test_stats(self):
+        compressor = InOutCompressor("zlib")
+        compressor.decompress(compressor.compress(PORTFOLIO))
+
+        stats = compressor.get_and_reset_stats()
+
+        self.assertEqual(stats["bytes_in"], len(PORTFOLIO))
+        self.assertGreater(stats["compression_ratio"], 4)
+        self.assertEqual(compressor.get_and_reset_stats()["bytes_in"], 0)
+
+
+class InOutRedisCompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        self.iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            redis_custom_connection=self.redis,
+            compressor=InOutCompressor("zlib"),
+        )
+
+    def test_values_are_stored_compressed(self):
+        self.iom.put_input_from_bytes("task1", PORTFOLIO)
+
+        self.assertLess(len(self.redis.get("task1-input")), len(PORTFOLIO))
+        self.assertEqual(self.iom.get_input_to_bytes("task1"), PORTFOLIO)
+        self.assertEqual(self.iom.get_input_to_utf8_string("task1"), PORTFOLIO.decode("utf-8"))
+
+    def test_uncompressed_values_are_still_readable(self):
+        self.redis.set("task1-output", b"legacy output")
+
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), b"legacy output")
+
+    def test_put_from_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(PORTFOLIO)
+        self.addCleanup(os.remove, f.name)
+
+        self.iom.put_output_from_file("task1", f.name)
+
+        self.assertTrue(InOutCompressor.is_compressed(self.redis.get("task1-output")))
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), PORTFOLIO)
+
+
+@mock_s3
+class InOutS3CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.resource("s3", region_name="eu-west-1")
+        self.s3.create_bucket(
+            Bucket="bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+        )
+        self.iom = InOutS3(
+            "bucket",
+            "eu-west-1",
+            "kms-key-id",
+            s3_custom_resource=self.s3,
+            compressor=InOutCompressor("zlib"),
+        )
+
+    def test_bytes_round_trip(self):
+        self.iom.put_input_from_bytes("task1", PORTFOLIO)
+
+        stored = self.s3.Object("bucket", "task1-input").get()["Body"].read()
+        self.assertTrue(InOutCompressor.is_compressed(stored))
+        self.assertEqual(self.iom.get_input_to_bytes("task1"), PORTFOLIO)
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in")
+            target = os.path.join(tmp, "out")
+            with open(source, "wb") as f:
+                f.write(PORTFOLIO)
+
+            self.iom.put_output_from_file("task1", source)
+            self.iom.get_output_to_file("task1", target)
+
+            with open(target, "rb") as f:
+                self.assertEqual(f.read(), PORTFOLIO)
+
+
+if __name__ == "__main__":
+    unittest.main()
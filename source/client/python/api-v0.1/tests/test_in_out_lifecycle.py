@@ -0,0 +1,229 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the expiration, purge and memory report of the data plane values.
+
+Runnable with plain stdlib plus fakeredis and moto: `python3 -m unittest test_in_out_lifecycle`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import boto3
+import fakeredis
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_lifecycle import (  # noqa: E402
+    OTHER_KEYS,
+    SHARED_BLOBS,
+    key_ttl_config,
+    redis_memory_by_session,
+    session_key_patterns,
+    session_of_key,
+)
+from api.in_out_redis import InOutRedis  # noqa: E402
+from api.in_out_s3 import InOutS3  # noqa: E402
+
+KB = 1024
+SESSION = "62d2beea-6911-11eb-b5fb-060372291b89"
+
+
+class LifecycleHelpersTest(unittest.TestCase):
+    def test_ttl_config(self):
+        ttls = key_ttl_config('{"input": 60, "consumed_output": 5}')
+
+        self.assertEqual(ttls["input"], 60)
+        self.assertEqual(ttls["consumed_output"], 5)
+        self.assertEqual(ttls["output"], 0)
+        with self.assertRaises(Exception):
+            key_ttl_config({"inputs": 60})
+
+    def test_session_of_key(self):
+        self.assertEqual(session_of_key(SESSION + "_12-output"), SESSION)
+        self.assertEqual(session_of_key(SESSION + "_3-input-chunk-00c0ffee00c0ffee-2"), SESSION)
+        self.assertEqual(session_of_key(SESSION + "-payload"), SESSION)
+        self.assertEqual(session_of_key("ns/" + SESSION + "_1-error", "ns/"), SESSION)
+        self.assertEqual(session_of_key("0a1b-blob"), SHARED_BLOBS)
+        self.assertEqual(session_of_key("htc-write-behind"), OTHER_KEYS)
+
+    def test_session_patterns_escape_glob_characters(self):
+        self.assertEqual(
+            session_key_patterns("s[1]*", "ns/"),
+            ["ns/s\\[1\\]\\*_*", "ns/s\\[1\\]\\*-payload*"],
+        )
+
+    def test_memory_by_session(self):
+        redis = fakeredis.FakeStrictRedis()
+        for i in range(30):
+            redis.set("big_{}-output".format(i), b"x" * KB)
+        redis.set("small_0-output", b"x")
+        redis.set("abcd-blob", b"x" * 10)
+
+        report = redis_memory_by_session(redis, sample_size=100)
+
+        self.assertEqual(report["total_keys"], 32)
+        self.assertEqual(report["sampled_keys"], 32)
+        self.assertEqual(list(report["sessions"])[0], "big")
+        self.assertGreater(report["sessions"]["big"], 0)
+
+
+class InOutRedisTTLTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+
+    def iom(self, ttl_config):
+        return InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            redis_custom_connection=self.redis,
+            stream_chunk_size=64 * KB,
+            ttl_config=ttl_config,
+        )
+
+    def test_values_expire_by_kind(self):
+        iom = self.iom({"input": 60, "blob": 600})
+
+        iom.put_input_from_bytes("s_1", b"input")
+        iom.put_output_from_bytes("s_1", b"output")
+        iom.put_blob_from_bytes("abcd", b"blob")
+
+        self.assertTrue(0 < self.redis.ttl("s_1-input") <= 60)
+        self.assertEqual(self.redis.ttl("s_1-output"), -1)
+        self.assertTrue(60 < self.redis.ttl("abcd-blob") <= 600)
+
+    def test_chunks_expire_with_their_value(self):
+        iom = self.iom({"output": 60})
+
+        with iom.open_output_writer("s_1") as writer:
+            writer.write(os.urandom(64 * KB * 2 + 1))
+
+        keys = self.redis.keys("s_1-output*")
+        self.assertEqual(len(keys), 4)
+        for key in keys:
+            self.assertTrue(0 < self.redis.ttl(key) <= 60)
+
+    def test_expiration_reads_only_the_manifest_header(self):
+        iom = self.iom(None)
+        iom.put_output_from_bytes("s_1", b"x" * 32 * KB)
+        with iom.open_output_writer("s_2") as writer:
+            writer.write(os.urandom(64 * KB + 1))
+
+        with mock.patch.object(self.redis, "get", wraps=self.redis.get) as get:
+            iom._InOutRedis__expire_value("s_1-output", 60)
+            iom._InOutRedis__expire_value("s_2-output", 60)
+
+        get.assert_not_called()
+        self.assertTrue(0 < self.redis.ttl("s_1-output") <= 60)
+        for key in self.redis.keys("s_2-output*"):
+            self.assertTrue(0 < self.redis.ttl(key) <= 60)
+
+    def test_consumed_output_is_kept_without_s3(self):
+        iom = self.iom({"consumed_output": 5})
+        iom.put_output_from_bytes("s_1", b"output")
+
+        iom.get_output_to_bytes("s_1")
+
+        self.assertEqual(self.redis.ttl("s_1-output"), -1)
+
+    def test_purge_session(self):
+        iom = self.iom(None)
+        iom.put_payload_from_bytes("s", b"payload")
+        iom.put_input_from_bytes("s_1", b"input")
+        with iom.open_output_writer("s_1") as writer:
+            writer.write(os.urandom(64 * KB + 1))
+        iom.put_input_from_bytes("other_1", b"input")
+        iom.put_blob_from_bytes("abcd", b"blob")
+
+        self.assertEqual(iom.purge_session("s"), 5)
+
+        self.assertEqual(sorted(self.redis.keys()), [b"abcd-blob", b"other_1-input"])
+
+
+@mock_s3
+class InOutRedisS3LifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.resource("s3", region_name="eu-west-1")
+        self.s3.create_bucket(
+            Bucket="bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+        )
+        self.redis = fakeredis.FakeStrictRedis()
+
+    def iom(self, ttl_config, write_behind=False):
+        iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            use_S3=True,
+            s3_kms_key_id="kms-key-id",
+            s3_custom_resource=self.s3,
+            redis_custom_connection=self.redis,
+            write_behind=write_behind,
+            ttl_config=ttl_config,
+        )
+        if iom.write_behind is not None:
+            iom.write_behind.stop()
+        return iom
+
+    def test_consumed_output_is_demoted(self):
+        iom = self.iom({"consumed_output": 5})
+        iom.put_output_from_bytes("s_1", b"output")
+
+        self.assertEqual(iom.get_output_to_bytes("s_1"), b"output")
+
+        self.assertTrue(0 < self.redis.ttl("s_1-output") <= 5)
+        # Reads after the expiration fall back to S3
+        self.redis.delete("s_1-output")
+        self.assertEqual(iom.get_output_to_utf8_string("s_1"), "output")
+        self.assertTrue(0 < self.redis.ttl("s_1-output") <= 5)
+
+    def test_write_behind_values_expire_once_persisted(self):
+        iom = self.iom({"output": 60, "consumed_output": 5}, write_behind=True)
+        iom.put_output_from_bytes("s_1", b"output")
+
+        # Not in S3 yet: neither expiring nor demoted
+        iom.get_output_to_bytes("s_1")
+        self.assertEqual(self.redis.ttl("s_1-output"), -1)
+
+        self.assertTrue(iom.flush(timeout_sec=1))
+        self.assertTrue(0 < self.redis.ttl("s_1-output") <= 60)
+
+    def test_purge_session(self):
+        iom = self.iom(None, write_behind=True)
+        iom.put_input_from_bytes("s_1", b"input")
+        iom.put_output_from_bytes("s_1", b"output")
+        iom.flush(timeout_sec=1)
+        iom.put_output_from_bytes("s_2", b"output")
+        iom.put_blob_from_bytes("abcd", b"blob")
+
+        # 3 redis keys and 2 S3 objects, s_2 is dequeued before it reaches S3
+        self.assertEqual(iom.purge_session("s"), 5)
+
+        self.assertEqual(iom.write_behind.backlog(), 1)
+        self.assertTrue(iom.flush(timeout_sec=1))
+        keys = [o.key for o in self.s3.Bucket("bucket").objects.all()]
+        self.assertEqual(keys, ["abcd-blob"])
+
+    def test_purge_session_s3(self):
+        iom = InOutS3("bucket", "eu-west-1", "kms-key-id", s3_custom_resource=self.s3)
+        iom.put_payload_from_bytes("s", b"payload")
+        iom.put_output_from_bytes("s_1", b"output")
+        iom.put_output_from_bytes("other_1", b"output")
+
+        self.assertEqual(iom.purge_session("s"), 2)
+
+        keys = [o.key for o in self.s3.Bucket("bucket").objects.all()]
+        self.assertEqual(keys, ["other_1-output"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the local filesystem data plane (InOutLocal).
+
+Runnable with plain stdlib: `python3 -m unittest test_in_out_local`.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_compression import InOutCompressor  # noqa: E402
+from api.in_out_local import InOutLocal  # noqa: E402
+from api.in_out_manager import in_out_manager  # noqa: E402
+
+KB = 1024
+
+
+class InOutLocalTest(unittest.TestCase):
+    def setUp(self):
+        self.local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_dir)
+        self.iom = InOutLocal("bucket", local_dir=self.local_dir)
+
+    def files(self, directory="bucket"):
+        return sorted(os.listdir(os.path.join(self.local_dir, directory)))
+
+    def test_bytes_round_trip(self):
+        self.iom.put_input_from_bytes("s_1", b"input")
+        self.iom.put_output_from_bytes("s_1", b"")
+        self.iom.put_payload_from_bytes("s", "payload".encode("utf-8"))
+
+        self.assertEqual(self.iom.get_input_to_bytes("s_1"), b"input")
+        self.assertEqual(self.iom.get_output_to_bytes("s_1"), b"")
+        self.assertEqual(self.iom.get_payload_to_utf8_string("s"), "payload")
+        self.assertEqual(self.files(), ["s-payload", "s_1-input", "s_1-output"])
+
+    def test_missing_value_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.iom.get_output_to_bytes("s_1")
+        self.assertFalse(self.iom.has_blob("abcd"))
+
+    def test_compressed_values(self):
+        iom = InOutLocal(
+            "bucket", local_dir=self.local_dir, compressor=InOutCompressor("zlib")
+        )
+        data = b"x" * 10 * KB
+        iom.put_output_from_bytes("s_1", data)
+
+        stored = os.path.join(self.local_dir, "bucket", "s_1-output")
+        self.assertLess(os.path.getsize(stored), KB)
+        self.assertEqual(iom.get_output_to_bytes("s_1"), data)
+        with iom.open_output_stream("s_1") as reader:
+            self.assertEqual(reader.read(), data)
+
+        out_file = os.path.join(self.local_dir, "out")
+        iom.get_output_to_file("s_1", out_file)
+        with open(out_file, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_files_are_copied(self):
+        in_file = os.path.join(self.local_dir, "in")
+        with open(in_file, "wb") as f:
+            f.write(b"input")
+
+        self.iom.put_input_from_file("s_1", in_file)
+        out_file = os.path.join(self.local_dir, "out")
+        self.iom.get_input_to_file("s_1", out_file)
+
+        with open(out_file, "rb") as f:
+            self.assertEqual(f.read(), b"input")
+        self.assertEqual(os.stat(out_file).st_nlink, 1)
+
+    def test_files_are_hard_linked(self):
+        iom = InOutLocal("bucket", local_dir=self.local_dir, hard_links=True)
+        in_file = os.path.join(self.local_dir, "in")
+        with open(in_file, "wb") as f:
+            f.write(b"input")
+
+        iom.put_input_from_file("s_1", in_file)
+        out_file = os.path.join(self.local_dir, "out")
+        iom.get_input_to_file("s_1", out_file)
+
+        self.assertEqual(os.stat(out_file).st_ino, os.stat(in_file).st_ino)
+        self.assertEqual(os.stat(out_file).st_nlink, 3)
+
+    def test_writer_is_atomic(self):
+        with self.iom.open_output_writer("s_1") as writer:
+            writer.write(b"x" * KB)
+            self.assertNotIn("s_1-output", self.files())
+
+        with self.iom.open_output_stream("s_1") as reader:
+            self.assertEqual(reader.read(10), b"x" * 10)
+            self.assertEqual(len(reader.read()), KB - 10)
+
+        with self.assertRaises(ValueError):
+            with self.iom.open_output_writer("s_2") as writer:
+                writer.write(b"x")
+                raise ValueError()
+        self.assertEqual(self.files(), ["s_1-output"])
+
+    def test_file_mode(self):
+        in_file = os.path.join(self.local_dir, "in")
+        with open(in_file, "wb") as f:
+            f.write(b"input")
+        os.chmod(in_file, 0o600)
+
+        self.iom.put_input_from_file("s_1", in_file)
+        self.iom.put_output_from_bytes("s_1", b"output")
+        with self.iom.open_output_writer("s_2") as writer:
+            writer.write(b"output")
+        iom = InOutLocal("bucket", local_dir=self.local_dir, file_mode=0o640)
+        iom.put_output_from_bytes("s_3", b"output")
+
+        for name in ["s_1-input", "s_1-output", "s_2-output"]:
+            path = os.path.join(self.local_dir, "bucket", name)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o666 & ~self.umask())
+        path = os.path.join(self.local_dir, "bucket", "s_3-output")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+    def umask(self):
+        umask = os.umask(0o022)
+        os.umask(umask)
+        return umask
+
+    def test_subnamespace_and_keys_outside_the_namespace(self):
+        iom = InOutLocal("bucket", local_dir=self.local_dir, subnamespace="session")
+        iom.put_blob_from_bytes("abcd", b"blob")
+
+        self.assertTrue(iom.has_blob("abcd"))
+        self.assertEqual(self.files("bucket/session"), ["abcd-blob"])
+        with self.assertRaises(Exception):
+            iom.put_input_from_bytes("../../escape", b"input")
+
+    def test_purge_session(self):
+        self.iom.put_payload_from_bytes("s", b"payload")
+        self.iom.put_input_from_bytes("s_1", b"input")
+        self.iom.put_output_from_bytes("s_1", b"output")
+        self.iom.put_input_from_bytes("other_1", b"input")
+        self.iom.put_blob_from_bytes("abcd", b"blob")
+
+        self.assertEqual(self.iom.purge_session("s"), 3)
+        self.assertEqual(self.files(), ["abcd-blob", "other_1-input"])
+
+    def test_in_out_manager(self):
+        iom = in_out_manager("LOCAL", "bucket", None, None, local_dir=self.local_dir)
+
+        self.assertIsInstance(iom, InOutLocal)
+        self.assertFalse(iom.hard_links)
+        self.assertEqual(
+            iom.directory, os.path.join(os.path.realpath(self.local_dir), "bucket")
+        )
+        iom = in_out_manager(
+            "LOCAL",
+            "bucket",
+            None,
+            None,
+            local_dir=self.local_dir,
+            local_hard_links=True,
+        )
+        self.assertTrue(iom.hard_links)
+
+
+if __name__ == "__main__":
+    unittest.main()
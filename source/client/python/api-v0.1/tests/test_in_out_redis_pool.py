@@ -0,0 +1,102 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the shared Redis connection pool of the data plane.
+
+Runnable with plain stdlib plus fakeredis: `python3 -m unittest test_in_out_redis_pool`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import unittest
+
+import fakeredis
+import redis
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_redis_pool import (  # noqa: E402
+    InstrumentedBlockingConnectionPool,
+    redis_connection,
+    redis_pool_config,
+    redis_pool_stats,
+)
+
+
+class RedisPoolConfigTest(unittest.TestCase):
+    def test_defaults_are_overridden(self):
+        config = redis_pool_config('{"max_connections": 4, "cluster": true}')
+
+        self.assertEqual(config["max_connections"], 4)
+        self.assertTrue(config["cluster"])
+        self.assertEqual(config["socket_timeout_sec"], 5)
+
+    def test_unknown_setting_is_rejected(self):
+        with self.assertRaises(Exception):
+            redis_pool_config({"max_conections": 4})
+
+
+class RedisConnectionTest(unittest.TestCase):
+    def test_connection_is_shared(self):
+        # No connection is opened before the first command
+        first = redis_connection("shared-host", "password", '{"max_connections": 4}')
+        second = redis_connection("shared-host", "password", {"max_connections": 4})
+        other = redis_connection("shared-host", "password", None)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        pool = first.connection_pool
+        self.assertIsInstance(pool, InstrumentedBlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 4)
+        self.assertIs(pool.connection_class, redis.SSLConnection)
+        self.assertTrue(pool.connection_kwargs["socket_keepalive"])
+
+
+class InstrumentedPoolTest(unittest.TestCase):
+    def setUp(self):
+        redis_pool_stats.reset()
+        self.pool = InstrumentedBlockingConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=fakeredis.FakeServer(),
+            max_connections=2,
+            timeout=1,
+        )
+        self.redis = redis.StrictRedis(connection_pool=self.pool)
+
+    def test_connections_are_reused(self):
+        for i in range(10):
+            self.redis.set("key", i)
+
+        stats = redis_pool_stats.get_and_reset_stats()
+        self.assertEqual(stats["connection_requests"], 10)
+        self.assertEqual(stats["connections_created"], 1)
+        self.assertEqual(redis_pool_stats.get_and_reset_stats()["connection_requests"], 0)
+
+    def test_wait_for_a_free_connection(self):
+        busy = [self.pool.get_connection("GET") for _ in range(2)]
+        releaser = threading.Timer(0.1, self.pool.release, [busy[0]])
+        releaser.start()
+
+        self.redis.set("key", 1)
+
+        releaser.join()
+        stats = redis_pool_stats.get_and_reset_stats()
+        self.assertEqual(stats["connections_created"], 2)
+        self.assertGreaterEqual(stats["pool_wait_ms_max"], 50)
+
+    def test_exhausted_pool_raises(self):
+        self.pool.timeout = 0.05
+        for _ in range(2):
+            self.pool.get_connection("GET")
+
+        with self.assertRaises(redis.ConnectionError):
+            self.redis.get("key")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the streaming (chunked) API of InOutS3 and InOutRedis.
+
+Runnable with plain stdlib plus fakeredis and moto: `python3 -m unittest test_in_out_stream`.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import boto3
+import fakeredis
+from botocore.config import Config
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_compression import InOutCompressor  # noqa: E402
+from api.in_out_redis import InOutRedis  # noqa: E402
+from api.in_out_s3 import InOutS3  # noqa: E402
+from api.in_out_stream import (  # noqa: E402
+    CHUNK_GENERATION_GRACE_SEC,
+    S3_MIN_PART_SIZE,
+    parse_chunk_manifest,
+)
+
+KB = 1024
+
+
+def _write_in_pieces(writer, data, piece_size=10 * KB):
+    for start in range(0, len(data), piece_size):
+        end = start + piece_size
+        writer.write(data[start:end])
+
+
+def _create_bucket(s3):
+    s3.create_bucket(
+        Bucket="bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-1"}
+    )
+
+
+class InOutRedisStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        self.iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            redis_custom_connection=self.redis,
+            stream_chunk_size=64 * KB,
+        )
+
+    def test_large_value_is_chunked(self):
+        data = os.urandom(64 * KB * 3 + 5)
+
+        with self.iom.open_output_writer("task1") as writer:
+            _write_in_pieces(writer, data)
+
+        self.assertEqual(parse_chunk_manifest(self.redis.get("task1-output"))[:2], (4, len(data)))
+        with self.iom.open_output_stream("task1") as reader:
+            self.assertEqual(reader.read(100), data[:100])
+            self.assertEqual(reader.read(), data[100:])
+        # Chunked values are readable by the other get methods
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), data)
+
+    def test_rewrite_does_not_disturb_readers_of_the_previous_value(self):
+        old_data = os.urandom(64 * KB * 3)
+        new_data = os.urandom(64 * KB * 2)
+        with self.iom.open_output_writer("task1") as writer:
+            _write_in_pieces(writer, old_data)
+
+        with self.iom.open_output_stream("task1") as reader:
+            first = reader.read(64 * KB)
+            with self.iom.open_output_writer("task1") as writer:
+                _write_in_pieces(writer, new_data)
+            self.assertEqual(first + reader.read(), old_data)
+
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), new_data)
+        # The chunks of the previous value expire, those of the new one are kept
+        ttls = sorted(self.redis.ttl(k) for k in self.redis.keys("task1-output-chunk-*"))
+        self.assertEqual(len(ttls), 5)
+        self.assertEqual(ttls[:2], [-1, -1])
+        self.assertTrue(all(0 < ttl <= CHUNK_GENERATION_GRACE_SEC for ttl in ttls[2:]))
+
+    def test_put_from_bytes_retires_the_chunks_it_replaces(self):
+        with self.iom.open_output_writer("task1") as writer:
+            _write_in_pieces(writer, os.urandom(64 * KB * 4))
+
+        self.iom.put_output_from_bytes("task1", b"small")
+
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), b"small")
+        chunk_keys = self.redis.keys("task1-output-chunk-*")
+        self.assertEqual(len(chunk_keys), 4)
+        for key in chunk_keys:
+            self.assertTrue(0 < self.redis.ttl(key) <= CHUNK_GENERATION_GRACE_SEC)
+
+    def test_small_value_is_stored_as_usual(self):
+        with self.iom.open_input_writer("task1") as writer:
+            writer.write(b"small")
+
+        self.assertEqual(self.redis.get("task1-input"), b"small")
+        with self.iom.open_input_stream("task1") as reader:
+            self.assertEqual(reader.read(), b"small")
+
+    def test_value_is_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.iom.open_output_writer("task1") as writer:
+                writer.write(os.urandom(64 * KB * 2))
+                raise ValueError()
+
+        self.assertEqual(self.redis.keys(), [])
+
+    def test_put_from_file_is_chunked(self):
+        data = os.urandom(64 * KB * 2 + 1)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.remove, f.name)
+
+        self.iom.put_output_from_file("task1", f.name)
+
+        self.assertIsNotNone(parse_chunk_manifest(self.redis.get("task1-output")))
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), data)
+
+    def test_compressed_value_is_streamed(self):
+        iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            redis_custom_connection=self.redis,
+            compressor=InOutCompressor("zlib"),
+        )
+        iom.put_output_from_bytes("task1", b"x" * 10 * KB)
+
+        with iom.open_output_stream("task1") as reader:
+            self.assertEqual(reader.read(), b"x" * 10 * KB)
+
+
+@mock_s3
+class InOutRedisS3StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.resource("s3", region_name="eu-west-1")
+        _create_bucket(self.s3)
+        self.redis = fakeredis.FakeStrictRedis()
+
+    def iom(self, write_behind=False):
+        iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            use_S3=True,
+            s3_kms_key_id="kms-key-id",
+            s3_custom_resource=self.s3,
+            redis_custom_connection=self.redis,
+            write_behind=write_behind,
+            stream_chunk_size=64 * KB,
+        )
+        if iom.write_behind is not None:
+            iom.write_behind.stop()
+        return iom
+
+    def test_writer_tees_to_s3_and_reads_fall_back_to_s3(self):
+        iom = self.iom()
+        data = os.urandom(64 * KB * 2 + 1)
+
+        with iom.open_output_writer("task1") as writer:
+            _write_in_pieces(writer, data)
+        self.redis.flushall()
+
+        with iom.open_output_stream("task1") as reader:
+            self.assertEqual(reader.read(), data)
+
+    def test_write_behind_uploads_the_reassembled_value(self):
+        iom = self.iom(write_behind=True)
+        data = os.urandom(64 * KB * 2 + 1)
+
+        with iom.open_output_writer("task1") as writer:
+            writer.write(data)
+        self.assertTrue(iom.flush(timeout_sec=1))
+
+        stored = self.s3.Object("bucket", "task1-output").get()["Body"].read()
+        self.assertEqual(stored, data)
+
+
+@mock_s3
+class InOutS3StreamTest(unittest.TestCase):
+    def setUp(self):
+        # moto 4 stores the aws-chunked encoding of the parts sent with checksums
+        self.s3 = boto3.resource(
+            "s3",
+            region_name="eu-west-1",
+            config=Config(request_checksum_calculation="when_required"),
+        )
+        _create_bucket(self.s3)
+        self.iom = InOutS3("bucket", "eu-west-1", "kms-key-id", s3_custom_resource=self.s3)
+
+    def test_multipart_round_trip(self):
+        data = os.urandom(S3_MIN_PART_SIZE * 2 + 1)
+
+        with self.iom.open_output_writer("task1") as writer:
+            _write_in_pieces(writer, data, piece_size=1024 * KB)
+
+        with self.iom.open_output_stream("task1") as reader, tempfile.TemporaryFile() as f:
+            shutil.copyfileobj(reader, f)
+            f.seek(0)
+            self.assertEqual(f.read(), data)
+
+    def test_small_value(self):
+        with self.iom.open_input_writer("task1") as writer:
+            writer.write(b"small")
+
+        self.assertEqual(self.iom.get_input_to_bytes("task1"), b"small")
+
+    def test_multipart_upload_is_aborted_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.iom.open_output_writer("task1") as writer:
+                writer.write(os.urandom(S3_MIN_PART_SIZE + 1))
+                raise ValueError()
+
+        client = self.s3.meta.client
+        self.assertEqual(client.list_multipart_uploads(Bucket="bucket").get("Uploads", []), [])
+        self.assertEqual(list(self.s3.Bucket("bucket").objects.all()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the S3 transfer profiles and the ranged parallel downloads of InOutS3.
+
+Runnable with plain stdlib plus moto: `python3 -m unittest test_in_out_transfer`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+
+import boto3
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_s3 import InOutS3  # noqa: E402
+from api.in_out_transfer import S3TransferProfile, s3_transfer_profile  # noqa: E402
+
+KB = 1024
+
+
+class S3TransferProfileTest(unittest.TestCase):
+    def test_default_profile(self):
+        profile = s3_transfer_profile(None)
+
+        self.assertEqual(profile.max_concurrency, 10)
+        self.assertEqual(profile.client_config().max_pool_connections, 10)
+
+    def test_profile_with_overrides(self):
+        profile = s3_transfer_profile('{"profile": "large_results", "max_concurrency": 16}')
+
+        self.assertEqual(profile.max_concurrency, 16)
+        self.assertEqual(profile.transfer_config().multipart_chunksize, 16 * KB * KB)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(Exception):
+            s3_transfer_profile({"profile": "fastest"})
+
+
+@mock_s3
+class RangedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.resource("s3", region_name="eu-west-1")
+        self.s3.create_bucket(
+            Bucket="bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+        )
+        self.client = self.s3.meta.client
+        self.profile = S3TransferProfile(multipart_chunksize=64 * KB, max_concurrency=4)
+
+    def put(self, data):
+        self.client.put_object(Bucket="bucket", Key="key", Body=data)
+
+    def test_object_of_several_parts(self):
+        data = os.urandom(64 * KB * 5 + 123)
+        self.put(data)
+
+        self.assertEqual(self.profile.download(self.client, "bucket", "key"), data)
+
+    def test_object_of_one_part(self):
+        self.put(b"small")
+
+        self.assertEqual(self.profile.download(self.client, "bucket", "key"), b"small")
+
+    def test_empty_object(self):
+        self.put(b"")
+
+        self.assertEqual(self.profile.download(self.client, "bucket", "key"), b"")
+
+    def test_download_to_file(self):
+        data = os.urandom(64 * KB * 3)
+        self.put(data)
+
+        with tempfile.TemporaryFile() as f:
+            self.profile.download(self.client, "bucket", "key", fileobj=f)
+            f.seek(0)
+            self.assertEqual(f.read(), data)
+
+    def test_missing_object(self):
+        with self.assertRaises(Exception):
+            self.profile.download(self.client, "bucket", "missing")
+
+    def test_in_out_s3_round_trip(self):
+        iom = InOutS3(
+            "bucket",
+            "eu-west-1",
+            "kms-key-id",
+            s3_custom_resource=self.s3,
+            transfer_profile=self.profile,
+        )
+        data = os.urandom(64 * KB * 3 + 1)
+
+        iom.put_output_from_bytes("task1", data)
+
+        self.assertEqual(iom.get_output_to_bytes("task1"), data)
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, "out")
+            iom.get_output_to_file("task1", target)
+            with open(target, "rb") as f:
+                self.assertEqual(f.read(), data)
+
+            with self.assertRaises(Exception):
+                iom.get_output_to_file("task2", target)
+            self.assertFalse(os.path.exists(target))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the write-behind S3 persistence of the S3+REDIS data plane.
+
+Runnable with plain stdlib plus fakeredis and moto: `python3 -m unittest test_in_out_write_behind`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import unittest
+
+import boto3
+import fakeredis
+from moto import mock_s3
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+
+from api.in_out_redis import InOutRedis  # noqa: E402
+from api.in_out_write_behind import S3WriteBehind  # noqa: E402
+
+
+class FlakyUpload:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.uploaded = {}
+
+    def __call__(self, key, data):
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("S3 unavailable")
+        self.uploaded[key] = data
+
+
+class S3WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+
+    def queue(self, upload, **kwargs):
+        return S3WriteBehind(self.redis, upload, poll_interval_sec=0.01, **kwargs)
+
+    def test_queued_values_are_uploaded(self):
+        upload = FlakyUpload()
+        queue = self.queue(upload)
+        self.redis.set("task1-output", b"output")
+        queue.enqueue("task1-output")
+
+        self.assertEqual(queue.backlog(), 1)
+        self.assertTrue(queue.flush(timeout_sec=1))
+
+        self.assertEqual(upload.uploaded, {"task1-output": b"output"})
+        stats = queue.get_and_reset_stats()
+        self.assertEqual((stats["flushed"], stats["backlog"]), (1, 0))
+
+    def test_backlog_is_drained_by_another_writer(self):
+        self.redis.set("task1-output", b"output")
+        self.queue(FlakyUpload()).enqueue("task1-output")
+        upload = FlakyUpload()
+
+        self.queue(upload).flush(timeout_sec=1)
+
+        self.assertIn("task1-output", upload.uploaded)
+
+    def test_key_rewritten_during_the_upload_stays_queued(self):
+        def upload(key, data):
+            # The writer rewrites the value after it was read, before it is dequeued
+            time.sleep(0.01)
+            self.redis.set(key, b"new output")
+            queue.enqueue(key)
+
+        queue = self.queue(upload)
+        self.redis.set("task1-output", b"output")
+        queue.enqueue("task1-output")
+
+        self.assertEqual(queue.flush_once(), 1)
+
+        self.assertEqual(queue.backlog(), 1)
+        queue.upload = FlakyUpload()
+        queue.flush_once()
+        self.assertEqual(queue.upload.uploaded, {"task1-output": b"new output"})
+        self.assertEqual(queue.backlog(), 0)
+
+    def test_claimed_keys_are_skipped(self):
+        upload = FlakyUpload()
+        queue = self.queue(upload)
+        self.redis.set("task1-output", b"output")
+        queue.enqueue("task1-output")
+        self.redis.set(queue.queue_key + "-claim-task1-output", 1)
+
+        self.assertEqual(queue.flush_once(), 0)
+        self.assertEqual(upload.uploaded, {})
+
+    def test_failed_uploads_are_retried_after_backoff(self):
+        upload = FlakyUpload(failures=1)
+        queue = self.queue(upload, retry_backoff_sec=1)
+        self.redis.set("task1-output", b"output")
+        queue.enqueue("task1-output")
+
+        self.assertEqual(queue.flush_once(), 1)
+        self.assertEqual(queue.flush_once(), 0)
+        self.assertEqual(queue.get_and_reset_stats()["retried"], 1)
+
+        self.redis.delete(queue.queue_key + "-claim-task1-output")
+        queue.flush_once()
+
+        self.assertEqual(upload.uploaded, {"task1-output": b"output"})
+        self.assertEqual(queue.backlog(), 0)
+
+    def test_keys_are_given_up_after_max_attempts(self):
+        queue = self.queue(FlakyUpload(failures=2), max_attempts=2, retry_backoff_sec=1)
+        self.redis.set("task1-output", b"output")
+        queue.enqueue("task1-output")
+
+        queue.flush_once()
+        self.redis.delete(queue.queue_key + "-claim-task1-output")
+        queue.flush_once()
+
+        self.assertEqual(queue.backlog(), 0)
+        self.assertEqual(self.redis.zcard(queue.failed_key), 1)
+        self.assertEqual(queue.get_and_reset_stats()["failed"], 1)
+
+    def test_failed_set_is_bounded_and_given_up_values_are_handed_over(self):
+        given_up = []
+        queue = self.queue(
+            FlakyUpload(failures=3),
+            max_attempts=1,
+            give_up=given_up.append,
+            max_failed_keys=2,
+            failed_retention_sec=60,
+        )
+        for i in range(3):
+            self.redis.set(f"task{i}-output", b"output")
+            queue.enqueue(f"task{i}-output")
+            queue.flush_once()
+
+        self.assertEqual(given_up, ["task0-output", "task1-output", "task2-output"])
+        self.assertEqual(
+            self.redis.zrange(queue.failed_key, 0, -1), [b"task1-output", b"task2-output"]
+        )
+        self.assertTrue(0 < self.redis.ttl(queue.failed_key) <= 60)
+
+
+@mock_s3
+class InOutRedisWriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.resource("s3", region_name="eu-west-1")
+        self.s3.create_bucket(
+            Bucket="bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+        )
+        self.redis = fakeredis.FakeStrictRedis()
+        self.iom = InOutRedis(
+            "bucket",
+            "cache_url",
+            "cache_password",
+            use_S3=True,
+            s3_kms_key_id="kms-key-id",
+            s3_custom_resource=self.s3,
+            redis_custom_connection=self.redis,
+            write_behind=True,
+        )
+        # Uploads are driven by the test
+        self.iom.write_behind.stop()
+
+    def test_write_is_acknowledged_before_s3(self):
+        self.iom.put_output_from_bytes("task1", b"output")
+
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), b"output")
+        self.assertEqual(list(self.s3.Bucket("bucket").objects.all()), [])
+
+        self.assertTrue(self.iom.flush(timeout_sec=1))
+
+        stored = self.s3.Object("bucket", "task1-output").get()["Body"].read()
+        self.assertEqual(stored, b"output")
+
+    def test_reads_fall_back_to_s3(self):
+        self.iom.put_output_from_bytes("task1", b"output")
+        self.iom.flush(timeout_sec=1)
+
+        self.redis.delete("task1-output")
+
+        self.assertEqual(self.iom.get_output_to_bytes("task1"), b"output")
+
+    def test_value_given_up_expires(self):
+        self.iom.key_ttls["output"] = 300
+        self.iom.write_behind.upload = FlakyUpload(failures=1)
+        self.iom.write_behind.max_attempts = 1
+        self.iom.put_output_from_bytes("task1", b"output")
+        self.assertEqual(self.redis.ttl("task1-output"), -1)
+
+        self.iom.write_behind.flush_once()
+
+        self.assertEqual(self.redis.zcard(self.iom.write_behind.failed_key), 1)
+        self.assertTrue(0 < self.redis.ttl("task1-output") <= 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
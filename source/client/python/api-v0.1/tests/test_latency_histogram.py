@@ -0,0 +1,124 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.latency_histogram.
+
+Runnable with plain stdlib: `python3 -m unittest test_latency_histogram`.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.latency_histogram import (  # noqa: E402
+    HistogramSummaries,
+    LatencyHistogram,
+    metrics_summary_config,
+    percentile_name,
+)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles_within_relative_error(self):
+        rng = random.Random(42)
+        values = sorted(rng.lognormvariate(3, 1.5) for _ in range(10000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+
+        for percentile in (50, 90, 99, 99.9):
+            exact = values[int(len(values) * percentile / 100) - 1]
+            self.assertAlmostEqual(
+                histogram.percentile(percentile), exact, delta=exact / 64
+            )
+        self.assertEqual(histogram.percentile(100), values[-1])
+        self.assertEqual(histogram.percentile(0), values[0])
+
+    def test_zero_and_negative_values(self):
+        histogram = LatencyHistogram()
+        for value in (-5, 0, 0, 10):
+            histogram.record(value)
+
+        self.assertEqual(histogram.percentile(25), 0)
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertAlmostEqual(histogram.percentile(100), 10)
+
+    def test_merge_equals_recording_everything(self):
+        left, right, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for value in range(1, 1000):
+            (left if value % 3 else right).record(value)
+            both.record(value)
+
+        left.merge(right)
+
+        self.assertEqual(left.counts, both.counts)
+        self.assertEqual(left.summary(), both.summary())
+        with self.assertRaises(Exception):
+            left.merge(LatencyHistogram(sub_buckets=8))
+
+    def test_json_round_trip(self):
+        histogram = LatencyHistogram()
+        for value in (1, 2, 2, 300, 4000.5):
+            histogram.record(value)
+
+        decoded = LatencyHistogram.from_json(histogram.to_json())
+
+        self.assertEqual(decoded.counts, histogram.counts)
+        self.assertEqual(decoded.summary(), histogram.summary())
+
+    def test_empty_summary(self):
+        summary = LatencyHistogram().summary([50])
+        self.assertEqual(
+            summary, {"count": 0, "min": None, "max": None, "mean": None, "p50": None}
+        )
+
+    def test_percentile_name(self):
+        self.assertEqual(percentile_name(50), "p50")
+        self.assertEqual(percentile_name(99.9), "p99_9")
+
+
+class HistogramSummariesTest(unittest.TestCase):
+    def test_summary_per_field(self):
+        summaries = HistogramSummaries(interval_ms=1000, percentiles=[50])
+        summaries.record({"EVENT_TIME": "t", "stage": 10, "flag": True}, now_ms=0)
+        summaries.record({"EVENT_TIME": "t", "stage": 30}, now_ms=500)
+
+        self.assertFalse(summaries.is_due(999))
+        self.assertTrue(summaries.is_due(1000))
+        summary = summaries.pop_summary(1200, "now")
+
+        self.assertEqual(summary["EVENT_TIME"], "now")
+        self.assertEqual(summary["summary_interval_ms"], 1200)
+        self.assertEqual(summary["stage_count"], 2)
+        self.assertEqual(summary["stage_mean"], 20)
+        self.assertAlmostEqual(summary["stage_p50"], 10, delta=0.1)
+        self.assertNotIn("flag_count", summary)
+        self.assertIsNone(summaries.pop_summary(1300, "now"))
+
+    def test_include_buckets(self):
+        summaries = HistogramSummaries(include_buckets=True)
+        summaries.record({"stage": 10}, now_ms=0)
+
+        summary = summaries.pop_summary(10, "now")
+
+        self.assertEqual(LatencyHistogram.from_json(summary["stage_hist"]).count, 1)
+
+    def test_config(self):
+        self.assertIsNone(metrics_summary_config("{}"))
+        self.assertIsNone(metrics_summary_config(None))
+        config = metrics_summary_config('{"raw_sample_rate": 0.01}')
+        self.assertEqual(config["raw_sample_rate"], 0.01)
+        self.assertEqual(config["interval_sec"], 60)
+        with self.assertRaises(Exception):
+            metrics_summary_config({"interval": 60})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.payload_codec.
+
+Runnable with plain stdlib (no pytest/moto): `python3 -m unittest test_payload_codec`.
+The msgpack and numpy tests are skipped when those packages are not installed.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import pickle
+import sys
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils import payload_codec  # noqa: E402
+from utils.payload_codec import (  # noqa: E402
+    PAYLOAD_CODEC_JSON,
+    PAYLOAD_CODEC_LEGACY,
+    PAYLOAD_CODEC_MSGPACK,
+    PAYLOAD_CODEC_PICKLE,
+    PAYLOAD_CODEC_RAW,
+    PayloadCodecException,
+    decode_json_payload,
+    decode_payload,
+    encode_payload,
+    get_payload_codec,
+    payload_to_json_bytes,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TASK = {"worker_arguments": ["1000", "1", "1"], "values": [1.5, 2.5]}
+
+
+class PayloadCodecTest(unittest.TestCase):
+    def test_round_trip_every_codec(self):
+        codecs = [PAYLOAD_CODEC_LEGACY, PAYLOAD_CODEC_JSON, PAYLOAD_CODEC_PICKLE]
+        if payload_codec.msgpack is not None:
+            codecs.append(PAYLOAD_CODEC_MSGPACK)
+
+        for codec in codecs:
+            with self.subTest(codec=codec):
+                data = encode_payload(TASK, codec)
+                self.assertEqual(get_payload_codec(data), codec)
+                self.assertEqual(decode_payload(data, allow_pickle=True), TASK)
+
+    def test_legacy_format_is_unchanged(self):
+        legacy = base64.b64encode(json.dumps(TASK).encode("utf-8"))
+
+        self.assertEqual(encode_payload(TASK, PAYLOAD_CODEC_LEGACY), legacy)
+        self.assertEqual(decode_payload(legacy), TASK)
+
+    def test_legacy_urlsafe_session(self):
+        session = {"session_id": "s", "tasks_list": {"tasks": ["s_0"]}, "k": "??>>"}
+        legacy = base64.urlsafe_b64encode(json.dumps(session).encode("utf-8"))
+
+        decoded = decode_payload(legacy, legacy_b64decode=base64.urlsafe_b64decode)
+
+        self.assertEqual(decoded, session)
+
+    def test_raw_bytes(self):
+        data = encode_payload(b"\x00\x01binary", PAYLOAD_CODEC_RAW)
+
+        self.assertEqual(decode_payload(data), b"\x00\x01binary")
+
+    def test_raw_rejects_objects_that_are_not_bytes(self):
+        for obj in (5, {"a": 1}):
+            with self.subTest(obj=obj):
+                with self.assertRaises(PayloadCodecException):
+                    encode_payload(obj, PAYLOAD_CODEC_RAW)
+
+    def test_json_bytes_are_forwarded_without_reparsing(self):
+        self.assertEqual(
+            payload_to_json_bytes(encode_payload(TASK, PAYLOAD_CODEC_JSON)),
+            json.dumps(TASK, separators=(",", ":")).encode("utf-8"),
+        )
+        self.assertEqual(
+            json.loads(payload_to_json_bytes(encode_payload(TASK, PAYLOAD_CODEC_LEGACY))),
+            TASK,
+        )
+        self.assertEqual(
+            json.loads(
+                payload_to_json_bytes(
+                    encode_payload(TASK, PAYLOAD_CODEC_PICKLE), allow_pickle=True
+                )
+            ),
+            TASK,
+        )
+
+    def test_bytes_are_passed_to_the_worker_in_tagged_form(self):
+        task = {"a": b"xyz", "items": [b"\x00\xff", 1]}
+        codecs = [PAYLOAD_CODEC_PICKLE]
+        if payload_codec.msgpack is not None:
+            codecs.append(PAYLOAD_CODEC_MSGPACK)
+
+        for codec in codecs:
+            document = payload_to_json_bytes(encode_payload(task, codec), allow_pickle=True)
+
+            self.assertEqual(json.loads(document)["a"], {"__bytes__": "eHl6"})
+            self.assertEqual(decode_json_payload(document), task)
+            self.assertEqual(decode_json_payload(json.loads(document)), task)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_arrays_are_passed_to_the_worker_in_tagged_form(self):
+        array = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+        task = {"x": array, "n": numpy.int64(7)}
+
+        decoded = decode_json_payload(
+            payload_to_json_bytes(
+                encode_payload(task, PAYLOAD_CODEC_PICKLE), allow_pickle=True
+            )
+        )
+
+        self.assertEqual(decoded["n"], 7)
+        self.assertEqual(decoded["x"].dtype, numpy.float32)
+        self.assertTrue(numpy.array_equal(decoded["x"], array))
+
+    def test_values_without_json_form_are_rejected(self):
+        with self.assertRaises(PayloadCodecException):
+            payload_to_json_bytes(
+                encode_payload({"s": {1, 2}}, PAYLOAD_CODEC_PICKLE), allow_pickle=True
+            )
+
+    def test_pickle_requires_opt_in(self):
+        data = encode_payload(TASK, PAYLOAD_CODEC_PICKLE)
+
+        with self.assertRaises(PayloadCodecException):
+            decode_payload(data)
+        with self.assertRaises(PayloadCodecException):
+            payload_to_json_bytes(data)
+
+    def test_pickle_buffers_are_out_of_band(self):
+        blob = bytearray(range(256)) * 64
+        data = encode_payload(pickle.PickleBuffer(blob), PAYLOAD_CODEC_PICKLE)
+
+        # Header, buffer count, one buffer length, the buffer and a short pickle stream.
+        self.assertLess(len(data), len(blob) + 64)
+        self.assertEqual(bytes(decode_payload(data, allow_pickle=True)), bytes(blob))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_pickle_numpy_array(self):
+        array = numpy.arange(10000, dtype=numpy.float64)
+
+        decoded = decode_payload(
+            encode_payload({"x": array}, PAYLOAD_CODEC_PICKLE), allow_pickle=True
+        )
+
+        self.assertTrue(numpy.array_equal(decoded["x"], array))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(PayloadCodecException):
+            encode_payload(TASK, "xml")
+        with self.assertRaises(PayloadCodecException):
+            decode_payload(bytes([payload_codec.PAYLOAD_FORMAT_VERSION, 0x7F]))
+
+
+if __name__ == "__main__":
+    unittest.main()
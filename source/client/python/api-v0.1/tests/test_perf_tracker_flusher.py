@@ -0,0 +1,121 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.perf_tracker_flusher.
+
+Runnable with plain stdlib: `python3 -m unittest test_perf_tracker_flusher`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.perf_tracker_flusher import BackgroundFlusher  # noqa: E402
+
+
+class RecordingConnector:
+    """Connector recording the submitted batches, submissions block while `blocked` is
+    cleared and fail while `failing` is set"""
+
+    def __init__(self):
+        self.samples_buffer = []
+        self.batches = []
+        self.blocked = threading.Event()
+        self.blocked.set()
+        self.failing = False
+
+    def add_sample(self, sample):
+        self.samples_buffer.append(sample)
+
+    def submit_measurements(self):
+        self.blocked.wait()
+        try:
+            if self.failing:
+                raise Exception("firehose unavailable")
+            self.batches.append(self.samples_buffer)
+        finally:
+            self.samples_buffer = []
+
+
+class BackgroundFlusherTest(unittest.TestCase):
+    def flusher(self, connector, **kwargs):
+        flusher = BackgroundFlusher(connector, **kwargs)
+        self.addCleanup(flusher.stop, 1)
+        return flusher
+
+    def test_batches_by_size(self):
+        connector = RecordingConnector()
+        flusher = self.flusher(connector, max_batch_size=3, max_batching_delay_ms=60000)
+
+        for i in range(7):
+            flusher.put({"i": i})
+        self.assertTrue(flusher.flush(1))
+
+        self.assertEqual([len(batch) for batch in connector.batches], [3, 3, 1])
+        self.assertEqual(flusher.get_stats()["samples_submitted"], 7)
+
+    def test_batches_by_time(self):
+        connector = RecordingConnector()
+        flusher = self.flusher(connector, max_batch_size=100, max_batching_delay_ms=50)
+
+        flusher.put({"i": 0})
+        deadline = time.monotonic() + 2
+        while not connector.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(connector.batches, [[{"i": 0}]])
+
+    def test_put_does_not_wait_for_a_slow_connector(self):
+        connector = RecordingConnector()
+        connector.blocked.clear()
+        flusher = self.flusher(
+            connector, max_queue_size=10, max_batch_size=1, overload_sampling=0
+        )
+
+        t_start = time.monotonic()
+        kept = [flusher.put({"i": i}) for i in range(20)]
+        self.assertLess(time.monotonic() - t_start, 0.5)
+
+        connector.blocked.set()
+        self.assertTrue(flusher.flush(1))
+        stats = flusher.get_stats()
+        # Once half full, the queue only accepts sampled samples
+        self.assertLessEqual(kept.count(True), 6)
+        self.assertEqual(
+            stats["samples_sampled_out"] + stats["samples_dropped"], kept.count(False)
+        )
+        self.assertEqual(stats["samples_submitted"], kept.count(True))
+
+    def test_failed_submission_is_counted(self):
+        connector = RecordingConnector()
+        connector.failing = True
+        flusher = self.flusher(connector)
+
+        flusher.put({"i": 0})
+        self.assertTrue(flusher.flush(1))
+
+        self.assertEqual(flusher.get_stats()["submission_failures"], 1)
+        self.assertEqual(connector.samples_buffer, [])
+
+    def test_stop_submits_the_queued_samples(self):
+        connector = RecordingConnector()
+        flusher = BackgroundFlusher(connector, max_batching_delay_ms=60000)
+
+        flusher.put({"i": 0})
+        self.assertTrue(flusher.stop(1))
+
+        self.assertEqual(connector.batches, [[{"i": 0}]])
+        self.assertFalse(flusher.thread.is_alive())
+        self.assertFalse(flusher.flush(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.perf_tracker_prometheus_connector.
+
+Runnable with plain stdlib: `python3 -m unittest test_perf_tracker_prometheus_connector`.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import sys
+import unittest
+import urllib.request
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.perf_tracker_prometheus_connector import (  # noqa: E402
+    MetricsRegistry,
+    PerfTrackerPrometheusConnector,
+    metric_name,
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_render(self):
+        registry = MetricsRegistry(latency_buckets_ms=[10, 100])
+        registry.inc("events", 2)
+        registry.inc("events")
+        registry.set("in_flight", 1)
+        for value in (5, 10, 50, 500):
+            registry.observe("latency_ms", value)
+
+        self.assertEqual(
+            registry.render().splitlines(),
+            [
+                "# TYPE events counter",
+                "events_total 3",
+                "# TYPE in_flight gauge",
+                "in_flight 1",
+                "# TYPE latency_ms histogram",
+                'latency_ms_bucket{le="10"} 2',
+                'latency_ms_bucket{le="100"} 3',
+                'latency_ms_bucket{le="+Inf"} 4',
+                "latency_ms_sum 565",
+                "latency_ms_count 4",
+            ],
+        )
+
+    def test_metric_name(self):
+        self.assertEqual(
+            metric_name("agent_pre", "S3 upload-ms"), "agent_pre_S3_upload_ms"
+        )
+        self.assertEqual(metric_name("", "1st"), "_1st")
+
+
+class PerfTrackerPrometheusConnectorTest(unittest.TestCase):
+    def test_connectors_share_the_endpoint(self):
+        port = free_port()
+        pre = PerfTrackerPrometheusConnector("{} agent_pre".format(port))
+        post = PerfTrackerPrometheusConnector("{} agent_post".format(port))
+
+        pre.observe({"sqs_queuing_time_ms": 20}, {"agent_cache_misses": 1}, {})
+        pre.observe({"sqs_queuing_time_ms": 40}, {"agent_cache_misses": 2}, {})
+        post.observe({}, {"str_pod_id": "pod"}, {"lookup_size": 7})
+        post.set_gauge("agent_tasks_in_flight", 1)
+
+        url = "http://127.0.0.1:{}/metrics".format(port)
+        with urllib.request.urlopen(url, timeout=5) as response:  # nosec B310
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+            lines = response.read().decode("utf-8").splitlines()
+
+        self.assertIn("agent_pre_agent_cache_misses_total 3", lines)
+        self.assertIn("agent_pre_sqs_queuing_time_ms_count 2", lines)
+        self.assertIn("agent_pre_sqs_queuing_time_ms_sum 60", lines)
+        self.assertIn("agent_post_lookup_size 7", lines)
+        self.assertIn("agent_post_agent_tasks_in_flight 1", lines)
+        self.assertFalse(any("str_pod_id" in line for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for QueueDepthProvider and the per-priority depth of QueuePrioritySQS.
+
+Runnable with plain stdlib (no pytest/moto): `python3 -m unittest test_queue_depth_provider`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+# grid_error_logger reads these at import; supply harmless values so the import doesn't KeyError.
+os.environ.setdefault("ERROR_LOG_GROUP", "test")
+os.environ.setdefault("ERROR_LOGGING_STREAM", "test")
+os.environ.setdefault("REGION", "eu-west-1")
+
+from api.queue_depth_provider import QueueDepthProvider  # noqa: E402
+
+
+class _FakeQueueSQS:
+    """Counts depth reads; the depth is taken from the (mutable) `depth` attribute."""
+
+    def __init__(self, queue_name, visible=0, in_flight=0, delayed=0):
+        self.queue_name = queue_name
+        self.depth = {"visible": visible, "in_flight": in_flight, "delayed": delayed}
+        self.reads = 0
+
+    def get_queue_depth(self):
+        self.reads += 1
+        return dict(queue_name=self.queue_name, **self.depth)
+
+
+def _make_priority_queue(fakes):
+    from api.task_queue_priority_sqs import QueuePrioritySQS
+
+    with mock.patch("api.task_queue_priority_sqs.QueueSQS", side_effect=fakes):
+        return QueuePrioritySQS(
+            None, '{"priorities": %d}' % len(fakes), "q__0", "eu-west-1"
+        )
+
+
+class _FakeCloudWatch:
+    def __init__(self, ages):
+        self.ages = ages
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, **kwargs):
+        self.calls.append(MetricDataQueries)
+        return {
+            "MetricDataResults": [
+                {"Id": q["Id"], "Label": q["Label"], "Values": self.ages.get(q["Label"], [])}
+                for q in MetricDataQueries
+            ]
+        }
+
+
+class QueuePrioritySQSDepthTest(unittest.TestCase):
+    def test_depth_by_priority_and_total_length(self):
+        fakes = [_FakeQueueSQS("q__0", 1, 2, 3), _FakeQueueSQS("q__1", 10, 20, 30)]
+        q = _make_priority_queue(fakes)
+
+        depth = q.get_queue_depth_by_priority()
+
+        self.assertEqual(depth[0]["visible"], 1)
+        self.assertEqual(depth[1]["in_flight"], 20)
+        self.assertEqual(q.get_queue_length(), 11)
+
+
+class QueueDepthProviderTest(unittest.TestCase):
+    def test_totals_are_summed_across_priorities(self):
+        fakes = [_FakeQueueSQS("q__0", 1, 2, 3), _FakeQueueSQS("q__1", 10, 20, 30)]
+        provider = QueueDepthProvider(_make_priority_queue(fakes))
+
+        depth = provider.get_queue_depth()
+
+        self.assertEqual(depth["total"]["visible"], 11)
+        self.assertEqual(depth["total"]["in_flight"], 22)
+        self.assertEqual(depth["total"]["delayed"], 33)
+        self.assertIsNone(depth["total"]["oldest_message_age_sec"])
+        self.assertEqual(provider.get_queue_length(), 11)
+
+    def test_sweep_is_reused_within_ttl(self):
+        fakes = [_FakeQueueSQS("q__0", 5)]
+        provider = QueueDepthProvider(_make_priority_queue(fakes), cache_ttl_sec=60)
+
+        self.assertEqual(provider.get_queue_length(), 5)
+        fakes[0].depth["visible"] = 7
+        self.assertEqual(provider.get_queue_length(), 5)
+        self.assertEqual(fakes[0].reads, 1)
+
+        provider.invalidate()
+        self.assertEqual(provider.get_queue_length(), 7)
+
+    def test_zero_ttl_disables_caching(self):
+        fakes = [_FakeQueueSQS("q__0", 5)]
+        provider = QueueDepthProvider(_make_priority_queue(fakes), cache_ttl_sec=0)
+
+        provider.get_queue_length()
+        fakes[0].depth["visible"] = 7
+
+        self.assertEqual(provider.get_queue_length(), 7)
+        self.assertEqual(fakes[0].reads, 2)
+
+    def test_oldest_age_is_read_in_one_call(self):
+        fakes = [_FakeQueueSQS("q__0"), _FakeQueueSQS("q__1"), _FakeQueueSQS("q__2")]
+        cw = _FakeCloudWatch({"q__0": [42.0, 12.0], "q__2": [7.0]})
+        provider = QueueDepthProvider(_make_priority_queue(fakes), cloudwatch_client=cw)
+
+        depth = provider.get_queue_depth()
+
+        self.assertEqual(len(cw.calls), 1)
+        self.assertEqual(len(cw.calls[0]), 3)
+        self.assertEqual(depth["priorities"][0]["oldest_message_age_sec"], 42)
+        self.assertIsNone(depth["priorities"][1]["oldest_message_age_sec"])
+        self.assertEqual(depth["total"]["oldest_message_age_sec"], 42)
+
+    def test_cloudwatch_failure_does_not_fail_the_sweep(self):
+        cw = mock.MagicMock()
+        cw.get_metric_data.side_effect = Exception("throttled")
+        provider = QueueDepthProvider(
+            _make_priority_queue([_FakeQueueSQS("q__0", 3)]), cloudwatch_client=cw
+        )
+
+        depth = provider.get_queue_depth()
+
+        self.assertEqual(depth["total"]["visible"], 3)
+        self.assertIsNone(depth["total"]["oldest_message_age_sec"])
+
+
+if __name__ == "__main__":
+    unittest.main()
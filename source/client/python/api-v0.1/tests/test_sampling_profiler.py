@@ -0,0 +1,148 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.sampling_profiler.
+
+Runnable with plain stdlib: `python3 -m unittest test_sampling_profiler`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils.sampling_profiler import (  # noqa: E402
+    DataPlaneProfileSink,
+    SamplingProfiler,
+    profiler_config,
+    profiler_from_config,
+)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.profiles = []
+
+    def write(self, name, timestamp_ms, profile):
+        self.profiles.append((name, profile.decode("utf-8")))
+
+
+class BlobStore:
+    def __init__(self):
+        self.blobs = {}
+
+    def put_blob_from_bytes(self, blob_key, data):
+        self.blobs[blob_key] = data
+
+
+def busy_task(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def profiled_thread(self, profiler, stage):
+        stop = threading.Event()
+
+        def run():
+            profiler.set_stage(stage)
+            busy_task(stop)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        profiler.target_thread_id = thread.ident
+        return thread
+
+    def test_folded_stacks_are_tagged_by_stage(self):
+        sink = RecordingSink()
+        profiler = SamplingProfiler([sink], name="agent-1")
+        self.profiled_thread(profiler, "execute")
+
+        for _ in range(5):
+            profiler.sample()
+        profiler.flush()
+
+        [(name, profile)] = sink.profiles
+        self.assertEqual(name, "agent-1")
+        frames = profile.splitlines()[0].rsplit(" ", 1)[0].split(";")
+        self.assertEqual(frames[0], "execute")
+        self.assertIn("test_sampling_profiler.py:busy_task", frames)
+        self.assertEqual(
+            sum(int(line.rsplit(" ", 1)[1]) for line in profile.splitlines()), 5
+        )
+        self.assertEqual(profiler.get_stats()["samples"], 5)
+
+    def test_only_the_target_thread_is_sampled(self):
+        sink = RecordingSink()
+        profiler = SamplingProfiler([sink])
+        self.profiled_thread(profiler, "execute")
+
+        profiler.sample()
+        profiler.flush()
+
+        self.assertEqual(len(sink.profiles[0][1].splitlines()), 1)
+
+    def test_nothing_written_without_samples(self):
+        sink = RecordingSink()
+        SamplingProfiler([sink]).flush()
+
+        self.assertEqual(sink.profiles, [])
+
+    def test_toggle_samples_in_background_and_writes_on_stop(self):
+        sink = RecordingSink()
+        profiler = SamplingProfiler([sink], interval_ms=1, flush_interval_sec=60)
+        self.profiled_thread(profiler, "acquire")
+
+        profiler.toggle()
+        deadline = time.monotonic() + 2
+        while profiler.get_stats()["samples"] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        profiler.toggle()
+        deadline = time.monotonic() + 2
+        while not sink.profiles and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertFalse(profiler.is_running)
+        self.assertTrue(sink.profiles[0][1].startswith("acquire;"))
+
+    def test_from_config(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = BlobStore()
+            profiler = profiler_from_config(
+                {"directory": directory, "data_plane": True}, "agent-1", store
+            )
+            self.assertFalse(profiler.is_running)
+            self.profiled_thread(profiler, "execute")
+
+            profiler.sample()
+            profiler.flush()
+
+            [file_name] = os.listdir(directory)
+            self.assertTrue(file_name.startswith("agent-1-"))
+            self.assertTrue(file_name.endswith(".folded"))
+            [blob_key] = store.blobs
+            self.assertTrue(blob_key.startswith("profile-agent-1-"))
+
+    def test_unknown_setting_is_rejected(self):
+        with self.assertRaises(Exception):
+            profiler_config('{"interval": 10}')
+
+    def test_data_plane_sink(self):
+        store = BlobStore()
+        DataPlaneProfileSink(store).write("agent-1", 42, b"idle;a 1\n")
+
+        self.assertEqual(store.blobs, {"profile-agent-1-42": b"idle;a 1\n"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for utils.stage_clock.
+
+Runnable with plain stdlib: `python3 -m unittest test_stage_clock`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+
+from utils import stage_clock  # noqa: E402
+from utils.stage_clock import (  # noqa: E402
+    AnchoredClock,
+    mark_stage,
+    new_task_stats,
+    stage_latencies,
+    stage_ms,
+)
+
+SEC = 1000000000
+
+
+class FakeTime:
+    def __init__(self, wall_ns, monotonic_ns=0):
+        self.wall_ns = wall_ns
+        self.mono_ns = monotonic_ns
+
+    def advance(self, ns, wall_step_ns=0):
+        self.mono_ns += ns
+        self.wall_ns += ns + wall_step_ns
+
+    def patch(self, test):
+        for name, value in (
+            ("time_ns", lambda: self.wall_ns),
+            ("monotonic_ns", lambda: self.mono_ns),
+        ):
+            patcher = mock.patch.object(stage_clock.time, name, value)
+            patcher.start()
+            test.addCleanup(patcher.stop)
+
+
+class AnchoredClockTest(unittest.TestCase):
+    def test_follows_the_monotonic_clock_between_refreshes(self):
+        fake = FakeTime(wall_ns=1000 * SEC)
+        fake.patch(self)
+        clock = AnchoredClock(refresh_interval_sec=60)
+
+        t1 = clock.wall_clock_ns()
+        # The wall clock steps back, the anchored clock does not
+        fake.advance(1500, wall_step_ns=-5 * SEC)
+        t2 = clock.wall_clock_ns()
+
+        self.assertEqual(t1, 1000 * SEC)
+        self.assertEqual(t2 - t1, 1500)
+
+    def test_steps_forward_at_refresh(self):
+        fake = FakeTime(wall_ns=1000 * SEC)
+        fake.patch(self)
+        clock = AnchoredClock(refresh_interval_sec=60)
+
+        fake.advance(61 * SEC, wall_step_ns=2 * SEC)
+
+        self.assertEqual(clock.wall_clock_ns(), fake.wall_ns)
+
+    def test_slews_backward_steps(self):
+        fake = FakeTime(wall_ns=1000 * SEC)
+        fake.patch(self)
+        clock = AnchoredClock(refresh_interval_sec=60, max_slew=0.001)
+        t1 = clock.wall_clock_ns()
+
+        fake.advance(100 * SEC, wall_step_ns=-1 * SEC)
+        t2 = clock.wall_clock_ns()
+        fake.advance(100 * SEC)
+        t3 = clock.wall_clock_ns()
+        fake.advance(1000 * SEC)
+        t4 = clock.wall_clock_ns()
+
+        # The step back is seen at the refresh, then slewed by 1 ms per s
+        self.assertEqual(t2 - t1, 100 * SEC)
+        self.assertEqual(t3 - t2, 100 * SEC - 100000000)
+        # Caught up with the wall clock
+        self.assertEqual(t4, fake.wall_ns)
+
+    def test_never_goes_backwards_across_a_refresh(self):
+        fake = FakeTime(wall_ns=1000 * SEC)
+        fake.patch(self)
+        clock = AnchoredClock(refresh_interval_sec=60, max_slew=0.001)
+
+        fake.advance(60 * SEC - 1000000)
+        t1 = clock.wall_clock_ns()
+        fake.advance(1000000, wall_step_ns=-5 * SEC)
+        t2 = clock.wall_clock_ns()
+        fake.advance(1000000)
+        t3 = clock.wall_clock_ns()
+
+        self.assertGreater(t2, t1)
+        self.assertGreater(t3, t2)
+        self.assertEqual(t3 - t2, 1000000 - 1000)
+
+
+class StageStatsTest(unittest.TestCase):
+    def test_latencies_in_ms_and_us(self):
+        stats = new_task_stats(1000 * SEC, 1000 * SEC + 250000)
+
+        latencies = stage_latencies(
+            stats,
+            "stage1_grid_api_01_task_creation_tstmp",
+            "stage1_grid_api_02_task_submission_tstmp",
+        )
+
+        self.assertEqual(latencies["upload_data_to_storage"], 0)
+        self.assertEqual(latencies["upload_data_to_storage_us"], 250)
+        self.assertEqual(latencies["clock_skew_corrections"], 0)
+
+    def test_negative_cross_component_latency_is_clock_skew(self):
+        stats = new_task_stats(1000 * SEC, 1000 * SEC)
+        mark_stage(stats, "stage2_sbmtlmba_01_invocation_tstmp", 1000 * SEC - 3000000)
+        mark_stage(stats, "stage2_sbmtlmba_02_before_batch_write_tstmp", 1000 * SEC)
+
+        latencies = stage_latencies(
+            stats,
+            "stage1_grid_api_01_task_creation_tstmp",
+            "stage2_sbmtlmba_02_before_batch_write_tstmp",
+        )
+
+        self.assertEqual(latencies["grid_api_2_lambda_ms"], 0)
+        self.assertEqual(latencies["clock_skew_corrections"], 1)
+        self.assertEqual(latencies["task_construction_ms"], 3)
+        self.assertEqual(latencies["task_construction_us"], 3000)
+
+    def test_stats_of_a_previous_version(self):
+        stats = {
+            "stage5_getres_01_invocation_tstmp": {"label": "None", "tstmp": 1000},
+        }
+        mark_stage(stats, "stage5_getres_02_invocation_over_tstmp", 1012 * 1000000)
+
+        self.assertEqual(stage_ms(stats, "stage5_getres_02_invocation_over_tstmp"), 1012)
+        self.assertEqual(
+            stage_latencies(
+                stats,
+                "stage5_getres_01_invocation_tstmp",
+                "stage5_getres_02_invocation_over_tstmp",
+            ),
+            {"get_results_invocation_time": 12},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
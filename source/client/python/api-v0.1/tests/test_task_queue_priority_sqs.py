@@ -0,0 +1,408 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for QueuePrioritySQS receive strategies and scheduling policies.
+
+The per-priority QueueSQS objects are replaced by in-memory fakes, so the tests exercise only the
+priority wrapper logic (which queue is polled, which message wins, what is handed back).
+
+Runnable with plain stdlib (no pytest/moto): `python3 -m unittest test_task_queue_priority_sqs`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+# grid_error_logger reads these at import; supply harmless values so the import doesn't KeyError.
+os.environ.setdefault("ERROR_LOG_GROUP", "test")
+os.environ.setdefault("ERROR_LOGGING_STREAM", "test")
+os.environ.setdefault("REGION", "eu-west-1")
+
+
+class _FakeQueueSQS:
+    """Stands in for QueueSQS: serves queued bodies, long polls by blocking until a message or timeout."""
+
+    def __init__(self, endpoint_url, queue_name, region):
+        self.queue_name = queue_name
+        self.messages = []
+        self.in_flight = {}
+        self.receive_calls = []
+        self.visibility_changes = []
+        self.deleted = []
+        self.arrived = threading.Event()
+
+    def put(self, body):
+        self.messages.append(body)
+        self.arrived.set()
+
+    def receive_message(self, wait_time_sec=10):
+        self.receive_calls.append(wait_time_sec)
+        if not self.messages and wait_time_sec > 0:
+            self.arrived.wait(wait_time_sec)
+        if not self.messages:
+            return {}
+        body = self.messages.pop(0)
+        if not self.messages:
+            self.arrived.clear()
+        handle = f"{self.queue_name}/{body}"
+        self.in_flight[handle] = body
+        return {"body": body, "properties": {"message_handle_id": handle}}
+
+    def change_visibility(self, message_handle_id, visibility_timeout_sec, task_priority=None):
+        self.visibility_changes.append((message_handle_id, visibility_timeout_sec))
+        if visibility_timeout_sec == 0:
+            # Released messages go back to the front of the queue.
+            self.messages.insert(0, self.in_flight.pop(message_handle_id))
+            self.arrived.set()
+
+    def delete_message(self, message_handle_id, task_priority=None):
+        self.deleted.append(message_handle_id)
+
+    def delete_messages(self, message_handle_ids, task_priorities=None):
+        if self.queue_name.endswith("__broken"):
+            raise RuntimeError("queue unavailable")
+        self.deleted += message_handle_ids
+        return {"Successful": list(message_handle_ids), "Failed": []}
+
+    def change_visibility_batch(self, message_handle_ids, visibility_timeout_sec, task_priorities=None):
+        for h in message_handle_ids:
+            self.visibility_changes.append((h, visibility_timeout_sec))
+        return {"Successful": list(message_handle_ids), "Failed": []}
+
+
+def _make_queue(visibility_timeout_sec=None, **config):
+    from api.task_queue_priority_sqs import QueuePrioritySQS
+
+    config.setdefault("priorities", 3)
+    with mock.patch("api.task_queue_priority_sqs.QueueSQS", _FakeQueueSQS):
+        return QueuePrioritySQS(
+            None,
+            json.dumps(config),
+            "htc_task_queue-test__0",
+            "eu-west-1",
+            visibility_timeout_sec=visibility_timeout_sec,
+        )
+
+
+class SequentialReceiveTest(unittest.TestCase):
+    def test_highest_priority_first(self):
+        q = _make_queue()
+        q.priority_to_queue_lookup[0].put("low")
+        q.priority_to_queue_lookup[2].put("high")
+
+        self.assertEqual(q.receive_message(wait_time_sec=10)["body"], "high")
+        self.assertEqual(q.receive_message(wait_time_sec=10)["body"], "low")
+
+    def test_short_polls_every_queue(self):
+        q = _make_queue()
+        self.assertEqual(q.receive_message(wait_time_sec=10), {})
+        for queue in q.priority_to_queue_lookup.values():
+            self.assertEqual(queue.receive_calls, [0])
+
+    def test_rejects_unknown_strategy(self):
+        from utils.task_queue_common import TaskQueueException
+
+        with self.assertRaises(TaskQueueException):
+            _make_queue(receive_strategy="random")
+
+
+class ConcurrentReceiveTest(unittest.TestCase):
+    def test_picks_highest_priority_without_receiving_the_rest(self):
+        q = _make_queue(receive_strategy="concurrent")
+        for p, body in ((0, "low"), (1, "mid"), (2, "high")):
+            q.priority_to_queue_lookup[p].put(body)
+
+        bodies = [q.receive_message(wait_time_sec=1)["body"] for _ in range(3)]
+
+        self.assertEqual(bodies, ["high", "mid", "low"])
+        # Short polls in scheduling order: a queue is only read once the preferred ones are
+        # empty, no long poll is started and no message is handed back.
+        self.assertEqual(q.priority_to_queue_lookup[2].receive_calls, [0, 0, 0])
+        self.assertEqual(q.priority_to_queue_lookup[0].receive_calls, [0])
+        for queue in q.priority_to_queue_lookup.values():
+            self.assertEqual(queue.visibility_changes, [])
+
+    def test_received_handle_is_routed_to_owning_queue(self):
+        q = _make_queue(receive_strategy="concurrent")
+        q.priority_to_queue_lookup[1].put("mid")
+
+        msg = q.receive_message(wait_time_sec=1)
+        handle = msg["properties"]["message_handle_id"]
+        q.delete_message(handle)
+
+        self.assertEqual(q.priority_to_queue_lookup[1].deleted, [handle])
+
+    def test_long_polls_with_requested_wait_time_once_queues_are_empty(self):
+        q = _make_queue(receive_strategy="concurrent")
+        threading.Timer(0.2, q.priority_to_queue_lookup[0].put, args=("low",)).start()
+
+        q.receive_message(wait_time_sec=1)
+
+        self.assertEqual(q.priority_to_queue_lookup[0].receive_calls, [0, 1])
+
+    def test_message_arriving_during_long_poll_is_returned(self):
+        q = _make_queue(receive_strategy="concurrent")
+        threading.Timer(0.2, q.priority_to_queue_lookup[1].put, args=("late",)).start()
+
+        t0 = time.time()
+        msg = q.receive_message(wait_time_sec=2)
+
+        self.assertEqual(msg["body"], "late")
+        self.assertLess(time.time() - t0, 1.5)
+
+    def test_empty_queues_return_empty_dict(self):
+        q = _make_queue(receive_strategy="concurrent")
+        self.assertEqual(q.receive_message(wait_time_sec=0), {})
+
+    def test_lower_priority_message_of_the_arbitration_window_is_handed_back(self):
+        q = _make_queue(receive_strategy="concurrent", receive_arbitration_window_sec=1)
+        threading.Timer(0.1, q.priority_to_queue_lookup[0].put, args=("low",)).start()
+        threading.Timer(0.3, q.priority_to_queue_lookup[1].put, args=("mid",)).start()
+
+        msg = q.receive_message(wait_time_sec=2)
+
+        low = q.priority_to_queue_lookup[0]
+        self.assertEqual(msg["body"], "mid")
+        self.assertEqual(low.visibility_changes, [("htc_task_queue-test__0/low", 0)])
+        self.assertEqual(low.messages, ["low"])
+
+    def test_message_received_by_a_late_poll_is_handed_back(self):
+        q = _make_queue(receive_strategy="concurrent", receive_arbitration_window_sec=0)
+        threading.Timer(0.1, q.priority_to_queue_lookup[2].put, args=("high",)).start()
+
+        self.assertEqual(q.receive_message(wait_time_sec=2)["body"], "high")
+
+        # The lower priority long polls are still in flight; a message they pick up while the
+        # agent is busy is made visible again right away rather than held for this agent.
+        low = q.priority_to_queue_lookup[0]
+        low.put("late")
+        for _ in range(100):
+            if low.visibility_changes:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(low.visibility_changes, [("htc_task_queue-test__0/late", 0)])
+        msg = q.receive_message(wait_time_sec=2)
+        self.assertEqual(msg["body"], "late")
+        self.assertEqual(msg["properties"]["task_priority"], 0)
+
+    def test_close_stops_the_long_polls(self):
+        q = _make_queue(receive_strategy="concurrent")
+        self.assertEqual(q.receive_message(wait_time_sec=0.1), {})
+        executor = q.receive_executor
+
+        q.close()
+
+        self.assertIsNone(q.receive_executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(time.sleep, 0)
+        # A receive after close only short polls
+        self.assertEqual(q.receive_message(wait_time_sec=1), {})
+        self.assertEqual(q.priority_to_queue_lookup[0].receive_calls, [0, 0.1, 0])
+
+    def test_poll_errors_are_raised_when_nothing_was_received(self):
+        q = _make_queue(receive_strategy="concurrent")
+        q.priority_to_queue_lookup[1].receive_message = mock.Mock(
+            side_effect=RuntimeError("throttled")
+        )
+
+        with self.assertRaises(RuntimeError):
+            q.receive_message(wait_time_sec=0)
+
+
+class WeightedSchedulingTest(unittest.TestCase):
+    def _drain(self, q, n):
+        return [q.receive_message()["properties"]["task_priority"] for _ in range(n)]
+
+    def test_strict_policy_starves_low_priority(self):
+        q = _make_queue(priorities=2)
+        for i in range(10):
+            q.priority_to_queue_lookup[0].put(f"low{i}")
+            q.priority_to_queue_lookup[1].put(f"high{i}")
+
+        self.assertEqual(self._drain(q, 10), [1] * 10)
+
+    def test_weighted_policy_shares_dequeues_by_weight(self):
+        q = _make_queue(priorities=3, scheduling_policy="weighted", priority_weights=[1, 2, 5])
+        for i in range(100):
+            for p in q.priorities:
+                q.priority_to_queue_lookup[p].put(f"{p}-{i}")
+
+        served = self._drain(q, 80)
+
+        self.assertEqual([served.count(p) for p in (0, 1, 2)], [10, 20, 50])
+        self.assertEqual(q.dequeue_counts, {0: 10, 1: 20, 2: 50})
+        # Smooth round-robin interleaves instead of serving bursts of one priority.
+        self.assertIn(0, served[:8])
+
+    def test_weighted_policy_is_work_conserving(self):
+        q = _make_queue(priorities=2, scheduling_policy="weighted", priority_weights={"0": 1, "1": 1})
+        for i in range(4):
+            q.priority_to_queue_lookup[1].put(f"high{i}")
+
+        self.assertEqual(self._drain(q, 4), [1, 1, 1, 1])
+
+    def test_idle_queue_does_not_burst_after_refill(self):
+        q = _make_queue(priorities=2, scheduling_policy="weighted", priority_weights=[1, 1])
+        for i in range(10):
+            q.priority_to_queue_lookup[1].put(f"high{i}")
+        self._drain(q, 6)
+
+        for i in range(10):
+            q.priority_to_queue_lookup[0].put(f"low{i}")
+
+        self.assertEqual(self._drain(q, 4), [0, 1, 0, 1])
+
+    def test_weighted_policy_with_concurrent_receive(self):
+        q = _make_queue(
+            priorities=2,
+            scheduling_policy="weighted",
+            priority_weights=[1, 1],
+            receive_strategy="concurrent",
+        )
+        for i in range(4):
+            q.priority_to_queue_lookup[0].put(f"low{i}")
+            q.priority_to_queue_lookup[1].put(f"high{i}")
+
+        self.assertEqual(
+            [q.receive_message(wait_time_sec=1)["body"] for _ in range(4)],
+            ["high0", "low0", "high1", "low1"],
+        )
+
+    def test_rejects_missing_weights(self):
+        from utils.task_queue_common import TaskQueueException
+
+        with self.assertRaises(TaskQueueException):
+            _make_queue(priorities=3, scheduling_policy="weighted", priority_weights=[1, 2])
+
+
+class BatchOperationsTest(unittest.TestCase):
+    def test_handles_are_grouped_by_owning_queue(self):
+        q = _make_queue(receive_strategy="concurrent")
+        q.priority_to_queue_lookup[2].put("high")
+        received = q.receive_message(wait_time_sec=1)["properties"]["message_handle_id"]
+
+        result = q.delete_messages(
+            [received, "ext-low", "ext-mid"], task_priorities=[None, 0, 1]
+        )
+
+        self.assertEqual(q.priority_to_queue_lookup[2].deleted, [received])
+        self.assertEqual(q.priority_to_queue_lookup[0].deleted, ["ext-low"])
+        self.assertEqual(q.priority_to_queue_lookup[1].deleted, ["ext-mid"])
+        self.assertEqual(sorted(result["Successful"]), sorted([received, "ext-low", "ext-mid"]))
+
+    def test_change_visibility_batch_uses_priorities(self):
+        q = _make_queue()
+
+        q.change_visibility_batch(["a", "b"], 0, task_priorities=[1, 1])
+
+        self.assertEqual(q.priority_to_queue_lookup[1].visibility_changes, [("a", 0), ("b", 0)])
+
+    def test_unknown_and_failing_queues_are_reported_per_entry(self):
+        q = _make_queue()
+        q.priority_to_queue_lookup[0].queue_name += "__broken"
+
+        result = q.delete_messages(["unknown", "x", "y"], task_priorities=[None, 0, 1])
+
+        self.assertEqual(result["Successful"], ["y"])
+        self.assertEqual(
+            sorted((f["message_handle_id"], f["code"]) for f in result["Failed"]),
+            [("unknown", "UnknownQueue"), ("x", "RuntimeError")],
+        )
+
+
+class MessageHandleLookupTest(unittest.TestCase):
+    def _lookup(self, max_size=3, ttl_sec=60):
+        from api.task_queue_priority_sqs import MessageHandleLookup
+
+        return MessageHandleLookup(max_size, ttl_sec)
+
+    def test_evicts_least_recently_used_beyond_max_size(self):
+        lookup = self._lookup(max_size=3)
+        for h in ("a", "b", "c"):
+            lookup.put(h, h.upper())
+        lookup.touch("a", 60)
+        lookup.put("d", "D")
+
+        self.assertEqual(len(lookup), 3)
+        self.assertIsNone(lookup.get("b"))
+        self.assertEqual(lookup.get("a"), "A")
+
+    def test_entries_expire_after_ttl(self):
+        lookup = self._lookup(ttl_sec=60)
+        with mock.patch("api.task_queue_priority_sqs.time.monotonic", return_value=1000.0):
+            lookup.put("a", "A")
+            lookup.put("b", "B", ttl_sec=3600)
+        with mock.patch("api.task_queue_priority_sqs.time.monotonic", return_value=1061.0):
+            self.assertNotIn("a", lookup)
+            self.assertEqual(lookup.get("b"), "B")
+            lookup.put("c", "C")
+        self.assertEqual(len(lookup), 2)
+
+    def test_ttl_follows_the_visibility_timeout_of_the_agent(self):
+        from api.task_queue_priority_sqs import (
+            DEFAULT_MSG_HANDLE_LOOKUP_TTL_SEC,
+            MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC,
+        )
+
+        self.assertEqual(
+            _make_queue().msg_handle_to_queue_lookup.ttl_sec,
+            DEFAULT_MSG_HANDLE_LOOKUP_TTL_SEC,
+        )
+        q = _make_queue(visibility_timeout_sec=3600)
+        self.assertEqual(
+            q.msg_handle_to_queue_lookup.ttl_sec, 3600 + MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC
+        )
+        self.assertEqual(
+            _make_queue(visibility_timeout_sec=3600, msg_handle_lookup_ttl_sec=10)
+            .msg_handle_to_queue_lookup.ttl_sec,
+            10,
+        )
+
+        q.priority_to_queue_lookup[1].put("m1")
+        with mock.patch("api.task_queue_priority_sqs.time.monotonic", return_value=1000.0):
+            handle = q.receive_message()["properties"]["message_handle_id"]
+            q.change_visibility(handle, 120)
+        limit = 1000.0 + 120 + MSG_HANDLE_LOOKUP_TTL_MARGIN_SEC
+        with mock.patch("api.task_queue_priority_sqs.time.monotonic", return_value=limit - 1):
+            self.assertIn(handle, q.msg_handle_to_queue_lookup)
+        with mock.patch("api.task_queue_priority_sqs.time.monotonic", return_value=limit):
+            self.assertNotIn(handle, q.msg_handle_to_queue_lookup)
+
+    def test_delete_and_release_remove_entries(self):
+        q = _make_queue(receive_strategy="concurrent")
+        q.priority_to_queue_lookup[1].put("m1")
+        q.priority_to_queue_lookup[1].put("m2")
+        h1 = q.receive_message(wait_time_sec=1)["properties"]["message_handle_id"]
+        h2 = q.receive_message(wait_time_sec=1)["properties"]["message_handle_id"]
+        self.assertEqual(len(q.msg_handle_to_queue_lookup), 2)
+
+        q.delete_message(h1)
+        q.change_visibility(h2, 0)
+
+        self.assertEqual(len(q.msg_handle_to_queue_lookup), 0)
+
+    def test_evicted_handle_falls_back_to_priority(self):
+        q = _make_queue(msg_handle_lookup_max_size=1)
+        q.priority_to_queue_lookup[2].put("m1")
+        q.priority_to_queue_lookup[2].put("m2")
+        h1 = q.receive_message()["properties"]["message_handle_id"]
+        q.receive_message()
+
+        q.delete_message(h1, task_priority=2)
+
+        self.assertEqual(q.priority_to_queue_lookup[2].deleted, [h1])
+
+
+if __name__ == "__main__":
+    unittest.main()
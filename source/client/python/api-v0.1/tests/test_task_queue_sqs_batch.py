@@ -0,0 +1,92 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Unit tests for the batched delete / visibility APIs of QueueSQS.
+
+Runnable with plain stdlib (no pytest/moto): `python3 -m unittest test_task_queue_sqs_batch`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+_HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..")))                  # api-v0.1 (api.*)
+sys.path.insert(0, os.path.abspath(os.path.join(_HERE, "..", "..", "utils")))   # utils.*
+# grid_error_logger reads these at import; supply harmless values so the import doesn't KeyError.
+os.environ.setdefault("ERROR_LOG_GROUP", "test")
+os.environ.setdefault("ERROR_LOGGING_STREAM", "test")
+os.environ.setdefault("REGION", "eu-west-1")
+
+
+class _FakeSqsClient:
+    """Records batch calls; entries whose receipt handle starts with "bad" are reported as failed."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _batch(self, QueueUrl, Entries):
+        self.calls.append(Entries)
+        return {
+            "Successful": [{"Id": e["Id"]} for e in Entries if not e["ReceiptHandle"].startswith("bad")],
+            "Failed": [
+                {"Id": e["Id"], "Code": "ReceiptHandleIsInvalid", "Message": "invalid", "SenderFault": True}
+                for e in Entries
+                if e["ReceiptHandle"].startswith("bad")
+            ],
+        }
+
+    delete_message_batch = _batch
+    change_message_visibility_batch = _batch
+
+
+def _make_queue():
+    with mock.patch("boto3.resource") as m_res, mock.patch("boto3.client") as m_client:
+        m_res.return_value.get_queue_by_name.return_value = mock.MagicMock(url="https://sqs/q__0")
+        fake_client = _FakeSqsClient()
+        m_client.return_value = fake_client
+        from api.task_queue_sqs import QueueSQS
+
+        return QueueSQS(endpoint_url=None, queue_name="q__0", region="eu-west-1"), fake_client
+
+
+class QueueSQSBatchTest(unittest.TestCase):
+    def test_delete_messages_chunks_by_ten(self):
+        q, client = _make_queue()
+        handles = [f"h{i}" for i in range(23)]
+
+        result = q.delete_messages(handles)
+
+        self.assertEqual([len(c) for c in client.calls], [10, 10, 3])
+        self.assertEqual(result, {"Successful": handles, "Failed": []})
+
+    def test_change_visibility_batch_sets_timeout_on_every_entry(self):
+        q, client = _make_queue()
+
+        q.change_visibility_batch(["h0", "h1"], 0)
+
+        self.assertEqual([e["VisibilityTimeout"] for e in client.calls[0]], [0, 0])
+        self.assertEqual([e["ReceiptHandle"] for e in client.calls[0]], ["h0", "h1"])
+
+    def test_per_entry_failures_are_reported(self):
+        q, _ = _make_queue()
+
+        result = q.delete_messages(["h0", "bad1", "h2"])
+
+        self.assertEqual(result["Successful"], ["h0", "h2"])
+        self.assertEqual(len(result["Failed"]), 1)
+        self.assertEqual(result["Failed"][0]["message_handle_id"], "bad1")
+        self.assertEqual(result["Failed"][0]["code"], "ReceiptHandleIsInvalid")
+
+    def test_empty_list_makes_no_call(self):
+        q, client = _make_queue()
+        self.assertEqual(q.delete_messages([]), {"Successful": [], "Failed": []})
+        self.assertEqual(client.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
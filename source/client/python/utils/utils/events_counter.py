@@ -0,0 +1,231 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import itertools
+import threading
+
+from utils.latency_histogram import LatencyHistogram, percentile_name
+
+# Statistics of each histogram in the samples (<name>_count, <name>_p99...)
+DEFAULT_HISTOGRAM_PERCENTILES = [50, 99]
+
+
+def _default_value(event_name):
+    return "" if event_name.startswith("str") else 0
+
+
+class _Shard:
+    """Events recorded by one thread. Only its thread updates it: counters and gauges are
+    read by collect() from atomic copies of their dicts, without lock, the histograms under
+    a lock only contended while collect() drains them."""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        # Totals since the thread started and the totals at the last collect()
+        self.counters = {}
+        self.collected_counters = {}
+        # event name -> (sequence number of the set() call, value)
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+
+class EventsSnapshot:
+    """Events collected from an EventsCounter, typed as counters (increment), gauges (set)
+    and histograms (observe)"""
+
+    def __init__(
+        self,
+        counters,
+        gauges,
+        histograms,
+        expected_events=(),
+        expected_histograms=(),
+        percentiles=None,
+    ):
+        self.counters = counters
+        self.gauges = gauges
+        self.histograms = histograms
+        self.expected_events = expected_events
+        self.expected_histograms = expected_histograms
+        self.percentiles = percentiles or DEFAULT_HISTOGRAM_PERCENTILES
+
+    def histogram_stats(self):
+        return ["count", "min", "max", "mean"] + [
+            percentile_name(p) for p in self.percentiles
+        ]
+
+    def histogram_fields(self):
+        """Flattened histogram statistics, e.g. {"lease_renewal_ms_p99": 12.1}"""
+        fields = {}
+        for name in self.expected_histograms:
+            for stat in self.histogram_stats():
+                fields["{}_{}".format(name, stat)] = 0
+        for name, histogram in self.histograms.items():
+            for stat, value in histogram.summary(self.percentiles).items():
+                fields["{}_{}".format(name, stat)] = 0 if value is None else value
+        return fields
+
+    def to_fields(self):
+        """Fields added to a metric sample: always the expected events and histograms,
+        even if they did not occur, because ElasticSearch can not change the mapping of an
+        index when new fields appear"""
+        fields = {e: _default_value(e) for e in self.expected_events}
+        fields.update(self.counters)
+        fields.update(self.gauges)
+        fields.update(self.histogram_fields())
+        return fields
+
+
+class EventsCounter:
+    """Counts the events of a component between two metric samples.
+
+    increment() adds to a counter, set() holds the last value of a gauge and observe() adds
+    a value to a histogram. Safe to use from any number of threads: each thread records in
+    its own shard, merged by collect(), so increment() and set() take no lock and threads
+    do not contend on the task path.
+    """
+
+    def __init__(
+        self, expected_events=None, expected_histograms=None, percentiles=None
+    ):
+        """
+        Args:
+            expected_events(list): counters and gauges always present in the samples
+                (events starting with "str" default to "", the others to 0)
+            expected_histograms(list): histograms always present in the samples
+            percentiles(list): percentiles of the histograms in the samples
+        """
+        self.expected_events = list(expected_events or [])
+        self.expected_histograms = list(expected_histograms or [])
+        self.percentiles = percentiles or DEFAULT_HISTOGRAM_PERCENTILES
+
+        self.shards = []
+        self.shards_lock = threading.Lock()
+        self.local = threading.local()
+        # Orders the set() calls of different threads, next() is atomic
+        self.sequence = itertools.count()
+        self.merge_lock = threading.Lock()
+        self.known_counters = set()
+        # Gauge name -> sequence number of its last set() reported by collect(). Kept per
+        # gauge: a set() stores its value after drawing its number, so a collect() can
+        # report a later set() of another gauge before it.
+        self.collected_sequences = {}
+
+    def increment(self, event_name, value=1):
+        try:
+            counters = self.local.shard.counters
+        except AttributeError:
+            counters = self.__shard().counters
+        counters[event_name] = counters.get(event_name, 0) + value
+
+    def set(self, event_name, value):
+        try:
+            gauges = self.local.shard.gauges
+        except AttributeError:
+            gauges = self.__shard().gauges
+        gauges[event_name] = (next(self.sequence), value)
+
+    def observe(self, event_name, value):
+        shard = self.__shard()
+        with shard.lock:
+            histogram = shard.histograms.get(event_name)
+            if histogram is None:
+                histogram = shard.histograms[event_name] = LatencyHistogram()
+            histogram.record(value)
+
+    def collect(self):
+        """Returns the events recorded since the previous collect() as an
+        EventsSnapshot and starts counting again from zero"""
+        return self.__merge(reset=True)
+
+    def peek(self):
+        """Same as collect() without resetting the events"""
+        return self.__merge(reset=False)
+
+    @property
+    def evcounter(self):
+        """Counters and gauges recorded since the last reset, expected events included"""
+        snapshot = self.peek()
+        events = {e: _default_value(e) for e in self.expected_events}
+        events.update(snapshot.counters)
+        events.update(snapshot.gauges)
+        return events
+
+    def get_counter(self, name):
+        return self.evcounter.get(name, _default_value(name))
+
+    def reset(self):
+        self.collect()
+
+    def __shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = _Shard()
+            with self.shards_lock:
+                self.shards.append(shard)
+        return shard
+
+    def __merge(self, reset):
+        with self.merge_lock:
+            with self.shards_lock:
+                shards = list(self.shards)
+            # Threads which exited before their shard is read can not record anymore
+            exited = [shard for shard in shards if not shard.thread.is_alive()]
+
+            # Counters seen once are reported in every sample, see EventsSnapshot.to_fields
+            counters = dict.fromkeys(self.known_counters, 0)
+            gauges, histograms = {}, {}
+            for shard in shards:
+                totals = shard.counters.copy()
+                for name, total in totals.items():
+                    delta = total - shard.collected_counters.get(name, 0)
+                    counters[name] = counters.get(name, 0) + delta
+
+                for name, (sequence, value) in shard.gauges.copy().items():
+                    if sequence <= self.collected_sequences.get(name, -1):
+                        continue
+                    if name not in gauges or gauges[name][0] < sequence:
+                        gauges[name] = (sequence, value)
+
+                with shard.lock:
+                    shard_histograms = shard.histograms
+                    if reset:
+                        shard.histograms = {}
+                    else:
+                        shard_histograms = {
+                            name: _copy(histogram)
+                            for name, histogram in shard_histograms.items()
+                        }
+                for name, histogram in shard_histograms.items():
+                    if name in histograms:
+                        histograms[name].merge(histogram)
+                    else:
+                        histograms[name] = histogram
+
+                if reset:
+                    shard.collected_counters = totals
+
+            if reset:
+                self.known_counters.update(counters)
+                for name, (sequence, _) in gauges.items():
+                    self.collected_sequences[name] = sequence
+                if exited:
+                    with self.shards_lock:
+                        self.shards = [s for s in self.shards if s not in exited]
+
+        return EventsSnapshot(
+            counters,
+            {name: value for name, (_, value) in gauges.items()},
+            histograms,
+            self.expected_events,
+            self.expected_histograms,
+            self.percentiles,
+        )
+
+
+def _copy(histogram):
+    copy = LatencyHistogram(histogram.sub_buckets)
+    copy.merge(histogram)
+    return copy
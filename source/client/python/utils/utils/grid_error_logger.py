@@ -1,13 +1,16 @@
-# Copyright 2024 Amazon.com, Inc. or its affiliates. 
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
 # SPDX-License-Identifier: Apache-2.0
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
 
+import atexit
 import boto3
 import sys
+import threading
 import time
 import os
 import json
+from collections import OrderedDict
 
 try:
     agent_config_file = os.environ["AGENT_CONFIG_FILE"]
@@ -29,6 +32,227 @@ except OSError:
 
 cw = boto3.client("logs", agent_config_data["region"])
 
+# CloudWatch Logs limits of a put_log_events call
+MAX_EVENTS_PER_BATCH = 10000
+MAX_BATCH_BYTES = 1048576
+EVENT_OVERHEAD_BYTES = 26
+
+
+class CloudWatchLogsSink:
+    """Writes batches of events with put_log_events, keeping the sequence token of each
+    stream locally instead of calling describe_log_streams before each write"""
+
+    def __init__(self, client):
+        self.client = client
+        self.sequence_tokens = {}
+
+    def write(self, log_group_name, log_stream_name, log_events):
+        stream = (log_group_name, log_stream_name)
+        kwargs = {
+            "logGroupName": log_group_name,
+            "logStreamName": log_stream_name,
+            "logEvents": log_events,
+        }
+        if self.sequence_tokens.get(stream):
+            kwargs["sequenceToken"] = self.sequence_tokens[stream]
+        try:
+            response = self.client.put_log_events(**kwargs)
+        except (
+            self.client.exceptions.InvalidSequenceTokenException,
+            self.client.exceptions.DataAlreadyAcceptedException,
+        ) as e:
+            # Stream written by another process, retry once with the expected token
+            kwargs["sequenceToken"] = e.response.get("expectedSequenceToken")
+            if kwargs["sequenceToken"] is None:
+                del kwargs["sequenceToken"]
+            response = self.client.put_log_events(**kwargs)
+        self.sequence_tokens[stream] = response.get("nextSequenceToken")
+
+
+class LocalFileSink:
+    """Appends the events to a local file, one JSON document per line (tests and local
+    runs)"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def write(self, log_group_name, log_stream_name, log_events):
+        with open(self.file_name, "a") as f:
+            for event in log_events:
+                f.write(
+                    json.dumps(
+                        {
+                            "logGroupName": log_group_name,
+                            "logStreamName": log_stream_name,
+                            "timestamp": event["timestamp"],
+                            "message": event["message"],
+                        }
+                    )
+                    + "\n"
+                )
+
+
+class BufferedErrorLogger:
+    """Error logger which never blocks the caller: messages are buffered in memory and
+    written by a background thread, by batches of max_batch_size or every
+    max_batching_delay_ms.
+
+    A message repeated while it waits in the buffer is only counted and written once with
+    its number of occurrences. New messages are rate limited to max_messages_per_sec (the
+    number of suppressed messages is logged) and dropped when max_pending messages are
+    already waiting.
+    """
+
+    def __init__(
+        self,
+        sink,
+        max_batch_size=500,
+        max_batching_delay_ms=2000,
+        max_pending=10000,
+        max_messages_per_sec=50,
+    ):
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.max_batching_delay_ms = max_batching_delay_ms
+        self.max_pending = max_pending
+        self.max_messages_per_sec = max_messages_per_sec
+
+        self.lock = threading.Lock()
+        # (log_group_name, log_stream_name, message) -> [first timestamp ms, count]
+        self.pending = OrderedDict()
+        self.suppressed = {}
+        self.tokens = float(max_messages_per_sec)
+        self.tokens_timestamp = time.monotonic()
+        self.stats = {
+            "messages_logged": 0,
+            "messages_deduplicated": 0,
+            "messages_suppressed": 0,
+            "events_written": 0,
+            "write_failures": 0,
+        }
+
+        # Serializes the writes of the background thread and flush()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def log(self, message, log_group_name, log_stream_name):
+        key = (log_group_name, log_stream_name, message)
+        with self.lock:
+            self.stats["messages_logged"] += 1
+            entry = self.pending.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self.stats["messages_deduplicated"] += 1
+                return
+            if not self.__take_token() or len(self.pending) >= self.max_pending:
+                stream = (log_group_name, log_stream_name)
+                self.suppressed[stream] = self.suppressed.get(stream, 0) + 1
+                self.stats["messages_suppressed"] += 1
+                return
+            self.pending[key] = [int(time.time() * 1000), 1]
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.__run, name="grid-error-logger", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+            full = len(self.pending) >= self.max_batch_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Writes the buffered messages from the calling thread"""
+        with self.write_lock:
+            self.__write_pending()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def __take_token(self):
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.max_messages_per_sec),
+            self.tokens + (now - self.tokens_timestamp) * self.max_messages_per_sec,
+        )
+        self.tokens_timestamp = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def __run(self):
+        while True:
+            self.wakeup.wait(self.max_batching_delay_ms / 1000)
+            self.wakeup.clear()
+            with self.write_lock:
+                self.__write_pending()
+
+    def __write_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+            suppressed, self.suppressed = self.suppressed, {}
+
+        streams = {}
+        for (group, stream, message), (timestamp, count) in pending.items():
+            if count > 1:
+                message = "{} [repeated {} times]".format(message, count)
+            streams.setdefault((group, stream), []).append(
+                {"timestamp": timestamp, "message": message}
+            )
+        now_ms = int(time.time() * 1000)
+        for (group, stream), count in suppressed.items():
+            streams.setdefault((group, stream), []).append(
+                {
+                    "timestamp": now_ms,
+                    "message": "{} error messages suppressed by rate limiting".format(
+                        count
+                    ),
+                }
+            )
+
+        for (group, stream), log_events in streams.items():
+            for batch in _batches(log_events):
+                try:
+                    self.sink.write(group, stream, batch)
+                    with self.lock:
+                        self.stats["events_written"] += len(batch)
+                except Exception as e:
+                    print("Cannot log errors because {}".format(e), file=sys.stderr)
+                    with self.lock:
+                        self.stats["write_failures"] += 1
+
+
+def _batches(log_events):
+    """Chronological batches within the put_log_events limits"""
+    batch, batch_bytes = [], 0
+    for event in sorted(log_events, key=lambda e: e["timestamp"]):
+        event_bytes = len(event["message"].encode("utf-8")) + EVENT_OVERHEAD_BYTES
+        if batch and (
+            len(batch) >= MAX_EVENTS_PER_BATCH
+            or batch_bytes + event_bytes > MAX_BATCH_BYTES
+        ):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(event)
+        batch_bytes += event_bytes
+    if batch:
+        yield batch
+
+
+def __create_logger():
+    # A local file instead of CloudWatch Logs, e.g. for tests
+    error_log_file = agent_config_data.get("error_log_file") or os.environ.get(
+        "ERROR_LOG_FILE"
+    )
+    if error_log_file:
+        return BufferedErrorLogger(LocalFileSink(error_log_file))
+    return BufferedErrorLogger(CloudWatchLogsSink(cw))
+
+
+logger = __create_logger()
+
 
 # DEBUGGING
 def log(
@@ -36,28 +260,12 @@ def log(
     log_group_name=agent_config_data["error_log_group"],
     log_stream_name=agent_config_data["error_logging_stream"],
 ):
+    """Buffers the message, written in the background (see BufferedErrorLogger)"""
     # print("ERROR-PRINT: {}".format(message))
+    logger.log(message, log_group_name, log_stream_name)
 
-    try:
-        # retreive seq number
-        response = cw.describe_log_streams(logGroupName=log_group_name)
-        seq = None
-        logEvents = [{"timestamp": int(time.time() * 1000), "message": message}]
-        for lg in response.get("logStreams"):
-            if lg.get("logStreamName") == log_stream_name:
-                seq = lg.get("uploadSequenceToken")
-        if seq is None:
-            response = cw.put_log_events(
-                logGroupName=log_group_name,
-                logStreamName=log_stream_name,
-                logEvents=logEvents,
-            )
-        else:
-            response = cw.put_log_events(
-                logGroupName=log_group_name,
-                logStreamName=log_stream_name,
-                logEvents=logEvents,
-                sequenceToken=seq,
-            )
-    except Exception as e:
-        print("Cannot log errors because {}".format(e), file=sys.stderr)
+
+def flush():
+    """Writes the buffered messages, e.g. before a Lambda invocation returns (the
+    background thread is frozen between invocations)"""
+    logger.flush()
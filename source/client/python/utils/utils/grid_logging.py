@@ -0,0 +1,146 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import itertools
+import json
+import logging
+
+DEFAULT_LOGGING_CONFIG = {
+    "level": "INFO",
+    # Level of some loggers, e.g. {"agent": "WARNING", "api.connector": "DEBUG"}
+    "loggers": {},
+    # Longest rendering of the payloads logged through truncated()
+    "max_payload_chars": 512,
+    # "text" keeps the formatter of the process, "json" writes one JSON document per
+    # record with its structured fields (see log_fields)
+    "format": "text",
+}
+
+_max_payload_chars = DEFAULT_LOGGING_CONFIG["max_payload_chars"]
+
+
+def logging_config(config=None):
+    """Returns the logging settings from the "logging" configuration, a JSON document (or
+    dict) overriding DEFAULT_LOGGING_CONFIG"""
+    if not config:
+        config = {}
+    elif isinstance(config, str):
+        config = json.loads(config)
+
+    unknown = set(config) - set(DEFAULT_LOGGING_CONFIG)
+    if unknown:
+        raise Exception(
+            "logging: unknown settings {}, valid settings are {}".format(
+                sorted(unknown), list(DEFAULT_LOGGING_CONFIG)
+            )
+        )
+    if config.get("format", "text") not in ("text", "json"):
+        raise Exception("logging: format must be text or json")
+
+    settings = dict(DEFAULT_LOGGING_CONFIG)
+    settings.update(config)
+    return settings
+
+
+def _shortened(value, max_chars, depth=3):
+    """Copy of a payload with its strings cut to max_chars characters and its containers
+    to 16 items, so that the cost of its repr does not grow with the size of the task"""
+    if isinstance(value, (str, bytes)):
+        if len(value) <= max_chars:
+            return value
+        return value[:max_chars] + (b"..." if isinstance(value, bytes) else "...")
+    if isinstance(value, dict):
+        if depth == 0:
+            return {...: ...} if value else value
+        shortened = {}
+        for key, item in itertools.islice(value.items(), 16):
+            if isinstance(key, str):
+                key = _shortened(key, max_chars)
+            shortened[key] = _shortened(item, max_chars, depth - 1)
+        return shortened
+    if isinstance(value, (list, tuple)):
+        if depth == 0:
+            return [...] if value else value
+        items = [_shortened(item, max_chars, depth - 1) for item in value[:16]]
+        return tuple(items) if isinstance(value, tuple) else items
+    return value
+
+
+class TruncatedPayload:
+    """Payload rendered when, and only if, the log record is formatted, see truncated"""
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value, max_chars=None):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self):
+        max_chars = self.max_chars or _max_payload_chars
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = repr(_shortened(self.value, max_chars))
+        if len(text) > max_chars:
+            return "{}... [{} chars]".format(text[:max_chars], len(text))
+        return text
+
+    __repr__ = __str__
+
+
+def truncated(value, max_chars=None):
+    """Wraps a payload (task, message, response...) logged as an argument of the record,
+    rendered as at most max_chars (by default max_payload_chars) characters:
+
+        logger.info("Running Task: %s", truncated(task))
+    """
+    return TruncatedPayload(value, max_chars)
+
+
+def log_fields(**fields):
+    """Structured fields of a record, written as JSON keys by JsonFormatter:
+
+    logger.info("Task claimed", extra=log_fields(task_id=task_id))
+    """
+    return {"fields": fields}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON document per record: time, level, logger, location, message and the
+    structured fields of the record"""
+
+    def format(self, record):
+        document = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "filename": record.filename,
+            "functionName": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            for key, value in fields.items():
+                document.setdefault(key, value)
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+def configure_logging(config=None):
+    """Applies a "logging" configuration (see logging_config) to the loggers of the
+    process, once logging.basicConfig has been called"""
+    global _max_payload_chars
+
+    settings = logging_config(config)
+    _max_payload_chars = settings["max_payload_chars"]
+    root = logging.getLogger()
+    root.setLevel(settings["level"])
+    for name, level in settings["loggers"].items():
+        logging.getLogger(name).setLevel(level)
+    if settings["format"] == "json":
+        for handler in root.handlers:
+            handler.setFormatter(JsonFormatter())
+    return settings
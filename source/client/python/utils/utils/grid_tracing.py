@@ -0,0 +1,369 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+
+from utils.perf_tracker_flusher import BackgroundFlusher
+
+DEFAULT_TRACING_CONFIG = {
+    # Share of the sessions traced, decided once by the client for the whole session
+    "sample_rate": 0.0,
+    # OTLP/JSON export, to a local file (one export request per line) and/or a collector
+    "file": "",
+    "otlp_endpoint": "",
+    "service_name": "htc-grid",
+}
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span status codes
+STATUS_CODE_ERROR = 2
+
+
+def tracing_config(config=None):
+    """Returns the tracing settings from the "tracing" configuration, a JSON document (or
+    dict) overriding DEFAULT_TRACING_CONFIG"""
+    if not config:
+        config = {}
+    elif isinstance(config, str):
+        config = json.loads(config)
+
+    unknown = set(config) - set(DEFAULT_TRACING_CONFIG)
+    if unknown:
+        raise Exception(
+            "tracing: unknown settings {}, valid settings are {}".format(
+                sorted(unknown), list(DEFAULT_TRACING_CONFIG)
+            )
+        )
+
+    settings = dict(DEFAULT_TRACING_CONFIG)
+    settings.update(config)
+    return settings
+
+
+def is_session_sampled(session_id, sample_rate):
+    """Same decision for a session wherever it is taken"""
+    if sample_rate <= 0:
+        return False
+    if sample_rate >= 1:
+        return True
+    if session_id is None or session_id == "None":
+        return random.random() < sample_rate  # nosec B311
+    digest = hashlib.sha256(str(session_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 < sample_rate
+
+
+def _now_ns():
+    return time.time_ns()
+
+
+class SpanContext:
+    """Identifies a span across processes, serialized as a W3C traceparent header"""
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def to_traceparent(self):
+        return "00-{}-{}-{}".format(
+            self.trace_id, self.span_id, "01" if self.sampled else "00"
+        )
+
+    @staticmethod
+    def from_traceparent(traceparent):
+        """Returns None for a missing or malformed traceparent"""
+        if not traceparent:
+            return None
+        match = _TRACEPARENT.match(str(traceparent))
+        if match is None:
+            return None
+        trace_id, span_id, flags = match.groups()
+        return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span:
+    """A timed operation of a trace, exported when ended. Spans of traces which are not
+    sampled are not recorded (context is None)."""
+
+    def __init__(self, tracer, name, context, parent_span_id, start_ns, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_span_id = parent_span_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    @property
+    def recording(self):
+        return self.context is not None
+
+    def traceparent(self):
+        """Context to propagate to the children of the span, None if not sampled"""
+        return self.context.to_traceparent() if self.recording else None
+
+    def set_attribute(self, key, value):
+        if self.recording:
+            self.attributes[key] = value
+
+    def end(self, end_ns=None, error=None):
+        if not self.recording or self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else _now_ns()
+        if error is not None:
+            self.error = str(error)
+        self.tracer._export(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end(error=exc_value)
+        return False
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.error is not None:
+            span["status"] = {"code": STATUS_CODE_ERROR, "message": self.error}
+        return span
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _OtlpJsonExporter:
+    """Buffers spans and exports them as an OTLP/JSON ExportTraceServiceRequest, with the
+    add_sample / submit_measurements interface of the metrics connectors so that it can be
+    driven by a BackgroundFlusher"""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.samples_buffer = []
+
+    def add_sample(self, span):
+        self.samples_buffer.append(span)
+
+    def submit_measurements(self):
+        if not self.samples_buffer:
+            return
+        try:
+            self._write(self._export_request(self.samples_buffer))
+        finally:
+            self.samples_buffer = []
+
+    def _export_request(self, spans):
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            _otlp_attribute("service.name", self.service_name)
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "htc-grid"}, "spans": list(spans)}
+                    ],
+                }
+            ]
+        }
+
+    def _write(self, export_request):
+        raise NotImplementedError()
+
+
+class FileSpanExporter(_OtlpJsonExporter):
+    """Appends one export request per line, the format read by the OpenTelemetry
+    collector otlpjsonfile receiver"""
+
+    def __init__(self, file_name, service_name="htc-grid"):
+        super().__init__(service_name)
+        self.file_name = file_name
+        self.lock = threading.Lock()
+
+    def _write(self, export_request):
+        line = json.dumps(export_request, separators=(",", ":")) + "\n"
+        with self.lock:
+            with open(self.file_name, "a") as f:
+                f.write(line)
+
+
+class OtlpHttpSpanExporter(_OtlpJsonExporter):
+    """Posts the export requests to an OTLP/HTTP collector, e.g. http://collector:4318"""
+
+    def __init__(self, endpoint, service_name="htc-grid", timeout_sec=5):
+        super().__init__(service_name)
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout_sec = timeout_sec
+
+    def _write(self, export_request):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(export_request).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(  # nosec B310
+            request, timeout=self.timeout_sec
+        ) as response:
+            response.read()
+
+
+class _MultiExporter:
+    def __init__(self, exporters):
+        self.exporters = exporters
+        self.samples_buffer = []
+
+    def add_sample(self, span):
+        for exporter in self.exporters:
+            exporter.add_sample(span)
+
+    def submit_measurements(self):
+        for exporter in self.exporters:
+            exporter.submit_measurements()
+
+
+class Tracer:
+    """Creates spans and exports the ended ones, from a background thread if background is
+    set (see BackgroundFlusher) or from flush() otherwise.
+
+    Traces start on the client and are sampled per session. Other components only record
+    spans whose parent, received in the task messages, is sampled. Without exporter spans
+    are not recorded but contexts are still propagated.
+    """
+
+    def __init__(self, exporter=None, sample_rate=0.0, background=False):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.flusher = None
+        if exporter is not None and background:
+            self.flusher = BackgroundFlusher(exporter, max_batching_delay_ms=2000)
+
+    def start_trace(self, name, session_id=None, attributes=None, start_ms=None):
+        """Root span of a session, recorded if the session is sampled"""
+        context = None
+        if is_session_sampled(session_id, self.sample_rate):
+            context = SpanContext(_random_id(16), _random_id(8))
+        return self.__span(name, context, None, start_ms, attributes)
+
+    def start_span(self, name, parent, attributes=None, start_ms=None):
+        """Child span of parent, a Span, a SpanContext or a traceparent string"""
+        parent_context = _context_of(parent)
+        context = None
+        if parent_context is not None and parent_context.sampled:
+            context = SpanContext(parent_context.trace_id, _random_id(8))
+        return self.__span(
+            name,
+            context,
+            parent_context.span_id if parent_context is not None else None,
+            start_ms,
+            attributes,
+        )
+
+    def record_span(self, name, parent, start_ms, end_ms, attributes=None):
+        """Span of an operation already over, e.g. from the task stats timestamps"""
+        span = self.start_span(name, parent, attributes=attributes, start_ms=start_ms)
+        span.end(end_ns=int(end_ms) * 1000000)
+        return span
+
+    def flush(self, timeout_sec=10):
+        """Exports the ended spans, e.g. before a Lambda invocation returns"""
+        if self.exporter is None:
+            return True
+        if self.flusher is not None:
+            return self.flusher.flush(timeout_sec)
+        try:
+            with self.lock:
+                self.exporter.submit_measurements()
+        except Exception as e:
+            logging.error("Failed to export spans: {}".format(e))
+        return True
+
+    def __span(self, name, context, parent_span_id, start_ms, attributes):
+        if self.exporter is None and context is not None:
+            # Propagated but not recorded
+            return _PropagatedSpan(context)
+        start_ns = int(start_ms) * 1000000 if start_ms else _now_ns()
+        return Span(self, name, context, parent_span_id, start_ns, attributes)
+
+    def _export(self, span):
+        if self.flusher is not None:
+            self.flusher.put(span.to_otlp())
+            return
+        with self.lock:
+            self.exporter.add_sample(span.to_otlp())
+
+
+class _PropagatedSpan(Span):
+    """Span of a sampled trace in a process without exporter"""
+
+    def __init__(self, context):
+        super().__init__(None, None, context, None, 0, None)
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, end_ns=None, error=None):
+        pass
+
+
+def _context_of(parent):
+    if parent is None:
+        return None
+    if isinstance(parent, Span):
+        return parent.context
+    if isinstance(parent, SpanContext):
+        return parent
+    return SpanContext.from_traceparent(parent)
+
+
+def _random_id(n_bytes):
+    random_id = os.urandom(n_bytes).hex()
+    # all zero ids are invalid
+    return random_id if int(random_id, 16) else _random_id(n_bytes)
+
+
+def tracer_from_config(config=None, background=False):
+    """Returns the Tracer described by a "tracing" configuration, see tracing_config"""
+    settings = tracing_config(config)
+    exporters = []
+    if settings["file"]:
+        exporters.append(FileSpanExporter(settings["file"], settings["service_name"]))
+    if settings["otlp_endpoint"]:
+        exporters.append(
+            OtlpHttpSpanExporter(settings["otlp_endpoint"], settings["service_name"])
+        )
+    exporter = None
+    if len(exporters) == 1:
+        exporter = exporters[0]
+    elif exporters:
+        exporter = _MultiExporter(exporters)
+    return Tracer(exporter, settings["sample_rate"], background)
@@ -0,0 +1,217 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import json
+import math
+
+DEFAULT_SUB_BUCKETS = 64
+DEFAULT_PERCENTILES = [50, 90, 99, 99.9]
+
+# Bucket of the values <= 0 (e.g. stage deltas measured across hosts with skewed clocks)
+_ZERO_BUCKET = -(2**31)
+
+
+class LatencyHistogram:
+    """Log-linear histogram: each power of two is split in sub_buckets linear buckets, so a
+    value is known within 1 / (2 * sub_buckets) relative error whatever its magnitude.
+
+    Buckets are sparse and histograms with the same sub_buckets merge by adding their
+    counts, so the percentiles of a fleet can be computed from the histograms of its hosts.
+    """
+
+    def __init__(self, sub_buckets=DEFAULT_SUB_BUCKETS):
+        self.sub_buckets = sub_buckets
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        bucket = self.__bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.sub_buckets != self.sub_buckets:
+            raise Exception(
+                "LatencyHistogram: cannot merge {} sub buckets into {}".format(
+                    other.sub_buckets, self.sub_buckets
+                )
+            )
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile):
+        """Returns the value below which percentile % of the recorded values are, None if
+        the histogram is empty"""
+        if not self.count:
+            return None
+        if percentile >= 100:
+            return self.max
+
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(max(self.__bucket_value(bucket), self.min), self.max)
+        return self.max
+
+    def summary(self, percentiles=None):
+        """Returns count, min, max, mean and the percentiles (p50, p99, p99_9...)"""
+        summary = {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+        }
+        for percentile in percentiles or DEFAULT_PERCENTILES:
+            summary[percentile_name(percentile)] = self.percentile(percentile)
+        return summary
+
+    def to_json(self):
+        """Compact encoding of the histogram, see from_json"""
+        return json.dumps(
+            [self.sub_buckets, self.count, self.total, self.min, self.max, self.counts],
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, encoded):
+        sub_buckets, count, total, min_value, max_value, counts = json.loads(encoded)
+        histogram = cls(sub_buckets)
+        histogram.counts = {int(bucket): c for bucket, c in counts.items()}
+        histogram.count = count
+        histogram.total = total
+        histogram.min = min_value
+        histogram.max = max_value
+        return histogram
+
+    def __bucket(self, value):
+        if value <= 0:
+            return _ZERO_BUCKET
+        mantissa, exponent = math.frexp(value)
+        # mantissa is in [0.5, 1)
+        return exponent * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def __bucket_value(self, bucket):
+        """Middle of the bucket"""
+        if bucket == _ZERO_BUCKET:
+            return 0
+        exponent, sub_bucket = divmod(bucket, self.sub_buckets)
+        return math.ldexp(0.5 + (sub_bucket + 0.5) / (2 * self.sub_buckets), exponent)
+
+
+def percentile_name(percentile):
+    """p50, p99, p99_9..."""
+    return "p" + ("%g" % percentile).replace(".", "_")
+
+
+DEFAULT_SUMMARY_CONFIG = {
+    "interval_sec": 60,
+    "raw_sample_rate": 1.0,
+    "percentiles": DEFAULT_PERCENTILES,
+    "include_buckets": False,
+}
+
+
+def metrics_summary_config(summary_config=None):
+    """Returns the summary settings from the "metrics_summary" configuration, a JSON
+    document (or dict) overriding DEFAULT_SUMMARY_CONFIG such as:
+
+    {"interval_sec": 60, "raw_sample_rate": 0.01}
+
+    Returns None, summaries disabled, for an empty configuration.
+    """
+    if not summary_config:
+        return None
+    if isinstance(summary_config, str):
+        summary_config = json.loads(summary_config)
+        if not summary_config:
+            return None
+
+    unknown = set(summary_config) - set(DEFAULT_SUMMARY_CONFIG)
+    if unknown:
+        raise Exception(
+            "metrics_summary: unknown settings {}, valid settings are {}".format(
+                sorted(unknown), list(DEFAULT_SUMMARY_CONFIG)
+            )
+        )
+
+    config = dict(DEFAULT_SUMMARY_CONFIG)
+    config.update(summary_config)
+    return config
+
+
+class HistogramSummaries:
+    """Histograms of the numeric fields of metric samples (stage latencies and counters),
+    turned into one summary record per interval"""
+
+    def __init__(
+        self,
+        interval_ms=60000,
+        percentiles=None,
+        include_buckets=False,
+        sub_buckets=DEFAULT_SUB_BUCKETS,
+    ):
+        """
+        Args:
+            interval_ms(int): time covered by a summary record
+            percentiles(list): percentiles of each field in the summary
+            include_buckets(bool): adds the encoded histogram of each field (<field>_hist)
+                so that summaries can be merged downstream
+        """
+        self.interval_ms = interval_ms
+        self.percentiles = percentiles or DEFAULT_PERCENTILES
+        self.include_buckets = include_buckets
+        self.sub_buckets = sub_buckets
+        self.histograms = {}
+        self.interval_start_ms = None
+
+    def record(self, sample, now_ms):
+        if self.interval_start_ms is None:
+            self.interval_start_ms = now_ms
+        for field, value in sample.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            histogram = self.histograms.get(field)
+            if histogram is None:
+                histogram = self.histograms[field] = LatencyHistogram(self.sub_buckets)
+            histogram.record(value)
+
+    def is_due(self, now_ms):
+        return (
+            self.interval_start_ms is not None
+            and now_ms - self.interval_start_ms >= self.interval_ms
+        )
+
+    def pop_summary(self, now_ms, event_time):
+        """Returns the summary record of the interval and starts a new one, None if no
+        sample was recorded"""
+        if self.interval_start_ms is None:
+            return None
+
+        summary = {
+            "EVENT_TIME": event_time,
+            "summary_interval_ms": now_ms - self.interval_start_ms,
+        }
+        for field, histogram in sorted(self.histograms.items()):
+            for stat, value in histogram.summary(self.percentiles).items():
+                summary["{}_{}".format(field, stat)] = value
+            if self.include_buckets:
+                summary[field + "_hist"] = histogram.to_json()
+
+        self.histograms = {}
+        self.interval_start_ms = None
+        return summary
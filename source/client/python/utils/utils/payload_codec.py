@@ -0,0 +1,291 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+"""Encoding of the payloads exchanged through the grid storage (task inputs, outputs and
+session submissions).
+
+Payloads written by this module are framed: the first byte is PAYLOAD_FORMAT_VERSION and the
+second byte identifies the codec of the body. Payloads written by older clients and agents are
+base64 text, which can never start with PAYLOAD_FORMAT_VERSION, so readers accept both formats
+and old and new components can coexist during an upgrade.
+
+Valid codec names:
+
+"base64"  legacy format, JSON encoded then base64 encoded (no frame)
+"json"    compact JSON
+"msgpack" MessagePack, requires the msgpack package
+"pickle"  pickle protocol 5, large buffers (e.g. numpy arrays) are stored out-of-band without
+          being copied into the pickle stream. Unpickling runs arbitrary code, so readers must
+          opt in with allow_pickle=True.
+"raw"     bytes stored as is
+
+Workers are invoked with JSON, so payload_to_json_bytes writes the values JSON has no type for
+in a tagged form: bytes as {"__bytes__": <base64>} and numpy arrays as
+{"__ndarray__": <base64>, "dtype": ..., "shape": [...]}. Workers restore them with
+decode_json_payload.
+"""
+
+import base64
+import json
+import pickle  # nosec B403
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PAYLOAD_FORMAT_VERSION = 0x01
+
+PAYLOAD_CODEC_LEGACY = "base64"
+PAYLOAD_CODEC_JSON = "json"
+PAYLOAD_CODEC_MSGPACK = "msgpack"
+PAYLOAD_CODEC_PICKLE = "pickle"
+PAYLOAD_CODEC_RAW = "raw"
+
+PAYLOAD_CODEC_IDS = {
+    PAYLOAD_CODEC_RAW: 0,
+    PAYLOAD_CODEC_JSON: 1,
+    PAYLOAD_CODEC_MSGPACK: 2,
+    PAYLOAD_CODEC_PICKLE: 3,
+}
+PAYLOAD_CODEC_NAMES = {i: name for name, i in PAYLOAD_CODEC_IDS.items()}
+
+PAYLOAD_CODECS = [PAYLOAD_CODEC_LEGACY] + list(PAYLOAD_CODEC_IDS)
+
+PICKLE_PROTOCOL = 5
+
+# Number of out-of-band buffers, followed by the length of each buffer.
+_PICKLE_BUFFER_COUNT = struct.Struct("!I")
+_PICKLE_BUFFER_LENGTH = struct.Struct("!Q")
+
+JSON_BYTES_TAG = "__bytes__"
+JSON_NDARRAY_TAG = "__ndarray__"
+
+
+class PayloadCodecException(Exception):
+    pass
+
+
+def validate_payload_codec(codec):
+    """Raises PayloadCodecException if codec cannot be used to encode payloads"""
+    if codec not in PAYLOAD_CODECS:
+        raise PayloadCodecException(
+            f"Unknown payload codec [{codec}], valid codecs are {PAYLOAD_CODECS}"
+        )
+    if codec == PAYLOAD_CODEC_MSGPACK and msgpack is None:
+        raise PayloadCodecException(
+            "Payload codec [msgpack] requires the msgpack package to be installed"
+        )
+    if codec == PAYLOAD_CODEC_PICKLE and pickle.HIGHEST_PROTOCOL < PICKLE_PROTOCOL:
+        raise PayloadCodecException(
+            "Payload codec [pickle] requires pickle protocol 5 (Python 3.8+)"
+        )
+
+
+def encode_payload(obj, codec=PAYLOAD_CODEC_JSON):
+    """Encodes an object into a self-describing payload
+
+    Args:
+        obj(object): the object to encode, must be bytes-like for the raw codec
+        codec(str): one of PAYLOAD_CODECS
+
+    Returns:
+        bytes: the encoded payload
+    """
+    validate_payload_codec(codec)
+
+    if codec == PAYLOAD_CODEC_LEGACY:
+        return base64.b64encode(json.dumps(obj).encode("utf-8"))
+
+    header = bytes([PAYLOAD_FORMAT_VERSION, PAYLOAD_CODEC_IDS[codec]])
+
+    if codec == PAYLOAD_CODEC_RAW:
+        # bytes() would turn an int into as many zero bytes
+        if not isinstance(obj, (bytes, bytearray, memoryview)):
+            raise PayloadCodecException(
+                "Payload codec [raw] only encodes bytes-like objects, not [{}]".format(
+                    type(obj).__name__
+                )
+            )
+        return header + bytes(obj)
+
+    elif codec == PAYLOAD_CODEC_JSON:
+        return header + json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    elif codec == PAYLOAD_CODEC_MSGPACK:
+        return header + msgpack.packb(obj, use_bin_type=True)
+
+    else:
+        buffers = []
+        stream = pickle.dumps(
+            obj, protocol=PICKLE_PROTOCOL, buffer_callback=buffers.append
+        )
+        raw_buffers = [b.raw() for b in buffers]
+
+        return b"".join(
+            [header, _PICKLE_BUFFER_COUNT.pack(len(raw_buffers))]
+            + [_PICKLE_BUFFER_LENGTH.pack(b.nbytes) for b in raw_buffers]
+            + raw_buffers
+            + [stream]
+        )
+
+
+def get_payload_codec(data):
+    """Returns the name of the codec used to encode a payload"""
+    if len(data) >= 2 and data[0] == PAYLOAD_FORMAT_VERSION:
+        try:
+            return PAYLOAD_CODEC_NAMES[data[1]]
+        except KeyError:
+            raise PayloadCodecException(f"Unknown payload codec id [{data[1]}]")
+
+    return PAYLOAD_CODEC_LEGACY
+
+
+def decode_payload(data, legacy_b64decode=base64.b64decode, allow_pickle=False):
+    """Decodes a payload written by encode_payload or by a legacy (base64) writer
+
+    Args:
+        data(bytes): the payload
+        legacy_b64decode(function): decoder of legacy payloads, session submissions
+            are base64url encoded while task inputs use the standard alphabet
+        allow_pickle(bool): accept pickle payloads, only for payloads from trusted producers
+
+    Returns:
+        object: the decoded object, bytes for the raw codec
+    """
+    codec = get_payload_codec(data)
+
+    if codec == PAYLOAD_CODEC_LEGACY:
+        return json.loads(legacy_b64decode(data).decode("utf-8"))
+
+    body = memoryview(data)[2:]
+
+    if codec == PAYLOAD_CODEC_RAW:
+        return bytes(body)
+
+    elif codec == PAYLOAD_CODEC_JSON:
+        return json.loads(bytes(body).decode("utf-8"))
+
+    elif codec == PAYLOAD_CODEC_MSGPACK:
+        validate_payload_codec(codec)
+        return msgpack.unpackb(body, raw=False)
+
+    else:
+        if not allow_pickle:
+            raise PayloadCodecException(
+                "Pickle payloads are not accepted by this reader"
+            )
+
+        (count,) = _PICKLE_BUFFER_COUNT.unpack_from(body)
+        offset = _PICKLE_BUFFER_COUNT.size
+        lengths = [
+            _PICKLE_BUFFER_LENGTH.unpack_from(
+                body, offset + i * _PICKLE_BUFFER_LENGTH.size
+            )[0]
+            for i in range(count)
+        ]
+        offset += count * _PICKLE_BUFFER_LENGTH.size
+
+        buffers = []
+        for length in lengths:
+            end = offset + length
+            buffers.append(body[offset:end])
+            offset = end
+
+        return pickle.loads(body[offset:], buffers=buffers)  # nosec B301
+
+
+def payload_to_json_bytes(
+    data, legacy_b64decode=base64.b64decode, allow_pickle=False
+):
+    """Returns a payload as UTF-8 JSON, e.g. to be passed to a Lambda invocation.
+    JSON, raw and legacy payloads are returned without being parsed and serialized again,
+    the bytes and numpy arrays of msgpack and pickle payloads are written in tagged form
+    (see decode_json_payload).
+
+    Args:
+        data(bytes): the payload
+        legacy_b64decode(function): decoder of legacy payloads
+        allow_pickle(bool): accept pickle payloads, see decode_payload
+
+    Returns:
+        bytes: the JSON document
+
+    Raises:
+        PayloadCodecException: if the payload holds values that have no JSON form
+    """
+    codec = get_payload_codec(data)
+
+    if codec == PAYLOAD_CODEC_LEGACY:
+        return legacy_b64decode(data)
+
+    elif codec in (PAYLOAD_CODEC_JSON, PAYLOAD_CODEC_RAW):
+        return bytes(memoryview(data)[2:])
+
+    obj = decode_payload(data, allow_pickle=allow_pickle)
+    try:
+        return json.dumps(obj, separators=(",", ":"), default=_to_json).encode("utf-8")
+    except (TypeError, ValueError) as e:
+        raise PayloadCodecException(
+            f"[{codec}] payload cannot be passed to the worker as JSON: {e}"
+        )
+
+
+def _to_json(obj):
+    """json.dumps default: tagged form of bytes and numpy arrays, see decode_json_payload"""
+    if isinstance(obj, (bytes, bytearray, memoryview, pickle.PickleBuffer)):
+        return {JSON_BYTES_TAG: base64.b64encode(obj).decode("ascii")}
+
+    # numpy is not a dependency, arrays and scalars are recognized by their attributes
+    if hasattr(obj, "dtype") and hasattr(obj, "shape"):
+        if obj.shape == () and hasattr(obj, "item"):
+            return obj.item()
+        if obj.dtype.hasobject:
+            raise TypeError("numpy arrays of objects are not supported")
+        return {
+            JSON_NDARRAY_TAG: base64.b64encode(obj.tobytes(order="C")).decode("ascii"),
+            "dtype": obj.dtype.str,
+            "shape": list(obj.shape),
+        }
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _from_json(obj):
+    if JSON_BYTES_TAG in obj and len(obj) == 1:
+        return base64.b64decode(obj[JSON_BYTES_TAG])
+
+    if JSON_NDARRAY_TAG in obj and set(obj) == {JSON_NDARRAY_TAG, "dtype", "shape"}:
+        import numpy
+
+        return numpy.frombuffer(
+            base64.b64decode(obj[JSON_NDARRAY_TAG]), dtype=obj["dtype"]
+        ).reshape(obj["shape"])
+
+    return obj
+
+
+def _restore(obj):
+    if isinstance(obj, dict):
+        return _from_json({key: _restore(value) for key, value in obj.items()})
+    if isinstance(obj, list):
+        return [_restore(item) for item in obj]
+    return obj
+
+
+def decode_json_payload(data):
+    """Parses the JSON passed to a worker by payload_to_json_bytes, restoring the bytes and
+    numpy arrays (numpy must then be installed) of msgpack and pickle payloads
+
+    Args:
+        data(bytes|str|dict): the JSON document, or the event the Lambda runtime parsed
+            from it
+
+    Returns:
+        object: the decoded object
+    """
+    if isinstance(data, (bytes, bytearray, str)):
+        return json.loads(data, object_hook=_from_json)
+    return _restore(data)
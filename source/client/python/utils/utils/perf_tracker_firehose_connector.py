@@ -45,10 +45,11 @@ class PerfTrackerFirehoseConnector:
         self.samples_buffer.append(sample)
 
     def submit_measurements(self):
-        res = self.firehose_client.put_record_batch(
-            DeliveryStreamName=self.delivery_stream_name, Records=self.samples_buffer
-        )
-
-        self.samples_buffer = []
-
-        return res
+        try:
+            return self.firehose_client.put_record_batch(
+                DeliveryStreamName=self.delivery_stream_name,
+                Records=self.samples_buffer,
+            )
+        finally:
+            # A failed batch is discarded rather than resent with the next one
+            self.samples_buffer = []
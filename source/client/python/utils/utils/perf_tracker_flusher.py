@@ -0,0 +1,160 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+
+class _FlushRequest:
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class BackgroundFlusher:
+    """Submits the samples of a metrics connector from a background thread, so that adding
+    a sample never waits for Firehose or InfluxDB.
+
+    Samples wait in a bounded queue and are submitted by batches of max_batch_size, or
+    max_batching_delay_ms after the first sample of the batch. Once the queue is half full
+    samples are kept with probability overload_sampling, and dropped when it is full. Only
+    the background thread uses the connector.
+    """
+
+    def __init__(
+        self,
+        connector,
+        max_queue_size=10000,
+        max_batch_size=500,
+        max_batching_delay_ms=5000,
+        overload_sampling=0.1,
+    ):
+        """
+        Args:
+            connector(object): a metrics connector (add_sample / submit_measurements)
+            max_queue_size(int): samples waiting for the background thread
+            max_batch_size(int): samples per submission (500 is the Firehose limit)
+            max_batching_delay_ms(int): maximum time a sample waits for its batch
+            overload_sampling(float): share of the samples kept when the queue is half full
+        """
+        self.connector = connector
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.max_batch_size = max_batch_size
+        self.max_batching_delay_ms = max_batching_delay_ms
+        self.overload_threshold = max_queue_size // 2
+        self.overload_sampling = overload_sampling
+
+        self.lock = threading.Lock()
+        self.stats = {
+            "samples_dropped": 0,
+            "samples_sampled_out": 0,
+            "samples_submitted": 0,
+            "submission_failures": 0,
+        }
+        self.last_batch_submission_delay_ms = 0
+
+        self.thread = threading.Thread(
+            target=self.__run, name="perf-tracker-flusher", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def put(self, sample):
+        """Queues a sample, never blocks
+
+        Returns:
+            bool: False if the sample was dropped or sampled out
+        """
+        if self.queue.qsize() >= self.overload_threshold:
+            if random.random() >= self.overload_sampling:  # nosec B311
+                self.__count("samples_sampled_out")
+                return False
+        try:
+            self.queue.put_nowait(sample)
+            return True
+        except queue.Full:
+            self.__count("samples_dropped")
+            return False
+
+    def flush(self, timeout_sec=10):
+        """Waits until the samples queued so far have been submitted
+
+        Returns:
+            bool: False if the samples were not submitted within timeout_sec
+        """
+        return self.__request(_FlushRequest(), timeout_sec)
+
+    def stop(self, timeout_sec=10):
+        """Submits the queued samples and stops the background thread"""
+        if not self.thread.is_alive():
+            return True
+        stopped = self.__request(_FlushRequest(stop=True), timeout_sec)
+        self.thread.join(timeout_sec)
+        return stopped
+
+    def get_stats(self):
+        """Returns the number of samples dropped, sampled out and submitted and the number of
+        failed submissions since the start"""
+        with self.lock:
+            return dict(self.stats)
+
+    def __request(self, request, timeout_sec):
+        if not self.thread.is_alive():
+            return False
+        try:
+            self.queue.put(request, timeout=timeout_sec)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout_sec)
+
+    def __count(self, stat, value=1):
+        with self.lock:
+            self.stats[stat] += value
+
+    def __run(self):
+        pending = 0
+        batch_deadline = None
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, batch_deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _FlushRequest):
+                if pending:
+                    self.__submit(pending)
+                    pending = 0
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+
+            if item is not None:
+                self.connector.add_sample(item)
+                pending += 1
+                if pending == 1:
+                    batch_deadline = time.monotonic() + self.max_batching_delay_ms / 1000
+
+            if pending >= self.max_batch_size or (
+                pending and time.monotonic() >= batch_deadline
+            ):
+                self.__submit(pending)
+                pending = 0
+
+    def __submit(self, pending):
+        t_start = time.monotonic()
+        try:
+            self.connector.submit_measurements()
+            self.__count("samples_submitted", pending)
+        except Exception as e:
+            logging.error("Failed to submit {} metrics samples: {}".format(pending, e))
+            self.__count("submission_failures")
+        self.last_batch_submission_delay_ms = int((time.monotonic() - t_start) * 1000)
@@ -50,8 +50,8 @@ class PerfTrackerInfluxDBConnector:
 
     def submit_measurements(self):
         print(self.samples_buffer)
-        res = self.influxdb_client.write_points(self.samples_buffer)
-
-        self.samples_buffer = []
-
-        return res
+        try:
+            return self.influxdb_client.write_points(self.samples_buffer)
+        finally:
+            # A failed batch is discarded rather than resent with the next one
+            self.samples_buffer = []
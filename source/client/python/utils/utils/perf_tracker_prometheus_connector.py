@@ -0,0 +1,213 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import bisect
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (ms) of the stage latency histogram buckets
+DEFAULT_LATENCY_BUCKETS_MS = [
+    1,
+    2,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+    60000,
+    300000,
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_:]")
+
+
+def metric_name(*parts):
+    """Prometheus metric name from parts such as ("agent_post", "sqs_queuing_time_ms")"""
+    name = _INVALID_NAME_CHARACTERS.sub("_", "_".join(str(p) for p in parts if p))
+    if name[:1].isdigit():
+        name = "_" + name
+    return name
+
+
+def _is_number(value):
+    return not isinstance(value, bool) and isinstance(value, (int, float))
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # one bucket per bound and the +Inf bucket
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms of a process, rendered in the Prometheus text
+    exposition format. Updates only take a lock and touch a few dicts, rendering happens on
+    the scraping thread."""
+
+    def __init__(self, latency_buckets_ms=None):
+        self.latency_buckets_ms = sorted(
+            latency_buckets_ms or DEFAULT_LATENCY_BUCKETS_MS
+        )
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = _Histogram(self.latency_buckets_ms)
+            histogram.observe(value)
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {
+                name: (list(h.counts), h.total) for name, h in self.histograms.items()
+            }
+
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines.append("# TYPE {} counter".format(name))
+            lines.append("{}_total {}".format(name, _format_value(value)))
+        for name, value in sorted(gauges.items()):
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{} {}".format(name, _format_value(value)))
+        for name, (counts, total) in sorted(histograms.items()):
+            lines.append("# TYPE {} histogram".format(name))
+            cumulative = 0
+            for bound, count in zip(self.latency_buckets_ms + [float("inf")], counts):
+                cumulative += count
+                lines.append(
+                    '{}_bucket{{le="{}"}} {}'.format(
+                        name, _format_value(bound), cumulative
+                    )
+                )
+            lines.append("{}_sum {}".format(name, _format_value(total)))
+            lines.append("{}_count {}".format(name, cumulative))
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the agent logs
+        pass
+
+
+# One registry and HTTP server per port, shared by the connectors of the process (e.g. the
+# pre-agent and post-agent trackers)
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port, address="0.0.0.0"):  # nosec B104
+    """Returns the registry served on http://<address>:<port>/metrics, starting the server
+    on the first call for this port"""
+    port = int(port)
+    with _exporters_lock:
+        server = _exporters.get(port)
+        if server is None:
+            server = ThreadingHTTPServer((address, port), _MetricsHandler)
+            server.daemon_threads = True
+            server.registry = MetricsRegistry()
+            threading.Thread(
+                target=server.serve_forever, name="metrics-exporter", daemon=True
+            ).start()
+            _exporters[port] = server
+            logging.info("Serving metrics on {}:{}/metrics".format(address, port))
+        return server.registry
+
+
+class PerfTrackerPrometheusConnector:
+    """Pull based metrics connector: samples update in-process counters, gauges and
+    histograms which Prometheus scrapes over HTTP, nothing is sent from the task path"""
+
+    # Samples are recorded by observe() instead of add_sample / submit_measurements
+    pull_based = True
+
+    def __init__(self, connector_string):
+        """
+        Expected format of the connection string:
+        "<port> <metric_prefix>"
+        example:
+        "9101 agent_post"
+        """
+
+        tokens = connector_string.split(" ")
+        self.port = int(tokens[0])
+        self.prefix = tokens[1] if len(tokens) > 1 else ""
+        self.registry = start_metrics_server(self.port)
+
+        self.samples_buffer = []
+
+    def observe(self, latencies, counters, gauges):
+        """Adds the stage latencies of a task to the latency histograms, the event counts
+        accumulated since the previous sample to the counters and sets the gauges"""
+        for label, value in latencies.items():
+            self.registry.observe(metric_name(self.prefix, label), value)
+        for event, value in counters.items():
+            if _is_number(value):
+                self.registry.inc(metric_name(self.prefix, event), value)
+        for event, value in gauges.items():
+            if _is_number(value):
+                self.set_gauge(event, value)
+
+    def set_gauge(self, name, value):
+        self.registry.set(metric_name(self.prefix, name), value)
+
+    def add_sample(self, json_data_sample):
+        """Samples built elsewhere (e.g. percentile summaries): numeric fields become
+        gauges"""
+        for k, v in json_data_sample.items():
+            if _is_number(v):
+                self.set_gauge(k, v)
+
+    def submit_measurements(self):
+        pass
@@ -3,20 +3,34 @@
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
 import datetime
-import time
+import random
+import threading
 
+from utils.events_counter import EventsCounter  # noqa: F401
+from utils.latency_histogram import HistogramSummaries, metrics_summary_config
 from utils.perf_tracker_firehose_connector import PerfTrackerFirehoseConnector
+from utils.perf_tracker_flusher import BackgroundFlusher
 from utils.perf_tracker_influxdb_connector import PerfTrackerInfluxDBConnector
-
-
-def get_time_now_ms():
-    return int(round(time.time() * 1000))
+from utils.perf_tracker_prometheus_connector import PerfTrackerPrometheusConnector
+from utils.stage_clock import get_time_now_ms, stage_latencies
 
 
 # TODO: remove dependencies on influxdb
 def performance_tracker_initializer(
-    metrics_are_enabled, connection_string, influxdb_ip
+    metrics_are_enabled,
+    connection_string,
+    influxdb_ip,
+    background=False,
+    summary_config=None,
 ):
+    """Returns a PerformanceTracker sending its samples to the connector described by
+    connection_string, from a background thread if background is set (see
+    BackgroundFlusher) or synchronously from submit_measurements otherwise.
+    summary_config enables the percentile summaries, see metrics_summary_config.
+
+    With the "prometheus" connector the samples are not sent anywhere but scraped from
+    the process (see PerfTrackerPrometheusConnector), background and summary_config are
+    then ignored"""
     metrics_are_enabled = bool(int(metrics_are_enabled))
     if metrics_are_enabled:
         tokens = connection_string.split(" ", 1)  # Pick up first word in the string
@@ -25,21 +39,30 @@ def performance_tracker_initializer(
             firehost_connector = PerfTrackerFirehoseConnector(
                 connector_string=tokens[1]
             )
-            perf_tracker = PerformanceTracker(firehost_connector)
+            perf_tracker = PerformanceTracker(
+                firehost_connector, background, summary_config
+            )
             return perf_tracker
         if connector_type == "influxdb":
             influxdb_connector = PerfTrackerInfluxDBConnector(
                 connector_string=tokens[1], influxdb_ip=influxdb_ip
             )
-            perf_tracker = PerformanceTracker(influxdb_connector)
+            perf_tracker = PerformanceTracker(
+                influxdb_connector, background, summary_config
+            )
             return perf_tracker
+        if connector_type == "prometheus":
+            prometheus_connector = PerfTrackerPrometheusConnector(
+                connector_string=tokens[1]
+            )
+            return PerformanceTracker(prometheus_connector)
         else:
             print(
                 "ERROR Undefined metrics connector type, no metrics will be collected: {}".format(
                     connector_type
                 )
             )
-            return __create_empty_performance_tracker
+            return __create_empty_performance_tracker()
     else:
         return __create_empty_performance_tracker()
 
@@ -48,47 +71,13 @@ def __create_empty_performance_tracker():
     return PerformanceTracker(None)
 
 
-class EventsCounter:
-    def __init__(self, expected_events=None):
-        if expected_events is None:
-            expected_events = []
-        self.expected_events = expected_events
-        self.evcounter = {}
-        self.reset()
-
-    def increment(self, event_name, value=1):
-        if event_name in self.evcounter:
-            self.evcounter[event_name] += value
-        else:
-            self.evcounter[event_name] = 1
-
-    def set(self, event_name, value):
-        self.evcounter[event_name] = value
-
-    def get_counter(self, name):
-        if name in self.evcounter:
-            return self.evcounter[name]
-        elif name.startswith("str"):
-            return ""
-        else:
-            return 0
-
-    def reset(self):
-        """When resetting counter we need to prebuild keys for expected counters,
-        because elastic search can not change index mapping when new counters are added"""
-
-        self.evcounter = {}
-
-        for e in self.expected_events:
-            if e.startswith("str"):
-                self.evcounter[e] = ""
-            else:
-                self.evcounter[e] = 0
-
-
 class PerformanceTracker:
-    def __init__(self, buffered_storage_connector):
+    def __init__(
+        self, buffered_storage_connector, background=False, summary_config=None
+    ):
         self.buffered_storage_connector = buffered_storage_connector
+        # Pull based connectors keep the metrics in process, nothing is submitted
+        self.pull_based = getattr(buffered_storage_connector, "pull_based", False)
 
         self.stats_batch = []
 
@@ -96,48 +85,125 @@ class PerformanceTracker:
         self.last_batch_submission_timestamp_ms = 0
         self.max_batching_delay_ms = 5 * 1000
 
+        self.flusher = None
+        if buffered_storage_connector and background:
+            self.flusher = BackgroundFlusher(
+                buffered_storage_connector,
+                max_batching_delay_ms=self.max_batching_delay_ms,
+            )
+
+        # Per field histograms summarized every interval, the raw samples being sampled
+        self.summaries = None
+        self.raw_sample_rate = 1.0
+        self.summaries_lock = threading.Lock()
+        summary_config = metrics_summary_config(summary_config)
+        if summary_config is not None:
+            self.summaries = HistogramSummaries(
+                interval_ms=summary_config["interval_sec"] * 1000,
+                percentiles=summary_config["percentiles"],
+                include_buckets=summary_config["include_buckets"],
+            )
+            self.raw_sample_rate = summary_config["raw_sample_rate"]
+
     def add_metric_sample(
         self, stats_dic, event_counter, from_event, to_event, event_time=None
     ):
         if not event_time:
             event_time = datetime.datetime.now().isoformat()
 
-        # print(stats_dic)
-        sorted_keys = sorted(stats_dic.keys())
-        # for k in sorted_keys:
-        #     print(k)
-        start_index = sorted_keys.index(from_event)
-        end_index = sorted_keys.index(to_event)
-
         data = {"EVENT_TIME": event_time}
+        data.update(stage_latencies(stats_dic, from_event, to_event))
 
-        for i in range(start_index, end_index):
-            # print([sorted_keys[i]])
-            # print(stats_dic[sorted_keys[i]])
-            # print([sorted_keys[i+1]])
-            # print(stats_dic[sorted_keys[i+1]])
-            # print("--------")
-            key = stats_dic[sorted_keys[i + 1]]["label"]
-            value = (
-                stats_dic[sorted_keys[i + 1]]["tstmp"]
-                - stats_dic[sorted_keys[i]]["tstmp"]
-            )
-            data[key] = value
+        events = event_counter.collect() if event_counter is not None else None
 
-        if event_counter is not None:
-            for key, value in sorted(event_counter.evcounter.items()):
+        if self.pull_based:
+            self.__observe(data, events)
+            return
+
+        if events is not None:
+            for key, value in sorted(events.to_fields().items()):
                 data[key] = value
 
-            event_counter.reset()
+        if self.summaries is not None:
+            with self.summaries_lock:
+                self.summaries.record(data, get_time_now_ms())
+            self.__add_due_summary()
+            if random.random() >= self.raw_sample_rate:  # nosec B311
+                return
+
+        self.__add_sample(data)
+
+    def __observe(self, data, events):
+        # Histograms are bucketed in ms, the us resolution of the stages is not exported
+        latencies = {
+            k: v
+            for k, v in data.items()
+            if k not in ("EVENT_TIME", "clock_skew_corrections") and not k.endswith("_us")
+        }
+        counters, gauges = {}, {}
+        if "clock_skew_corrections" in data:
+            counters["clock_skew_corrections"] = data["clock_skew_corrections"]
+        if events is not None:
+            counters.update(events.counters)
+            gauges = dict(events.gauges)
+            gauges.update(events.histogram_fields())
+        self.buffered_storage_connector.observe(latencies, counters, gauges)
+
+    def set_gauge(self, name, value):
+        """Exposes a level, e.g. the number of tasks in flight, with pull based connectors
+        (no-op with the others, which only report per task samples)"""
+        if self.pull_based:
+            self.buffered_storage_connector.set_gauge(name, value)
+
+    def __add_due_summary(self, force=False):
+        now_ms = get_time_now_ms()
+        with self.summaries_lock:
+            if not (force or self.summaries.is_due(now_ms)):
+                return
+            summary = self.summaries.pop_summary(
+                now_ms, datetime.datetime.now().isoformat()
+            )
+        if summary is not None:
+            self.__add_sample(summary)
 
+    def __add_sample(self, data):
         # Self profiling on the batch submission delays
+        if self.flusher is not None:
+            data[
+                "last_batch_submission_delay_ms"
+            ] = self.flusher.last_batch_submission_delay_ms
+            for stat, value in self.flusher.get_stats().items():
+                data["metrics_" + stat] = value
+            self.flusher.put(data)
+            return
+
         data["last_batch_submission_delay_ms"] = self.last_batch_submission_delay_ms
 
         if self.buffered_storage_connector:
             self.buffered_storage_connector.add_sample(data)
 
+    def flush(self, timeout_sec=10):
+        """Submits the samples added so far, e.g. before the process stops
+
+        Returns:
+            bool: False if the samples were not submitted within timeout_sec
+        """
+        if self.summaries is not None:
+            self.__add_due_summary(force=True)
+        if self.flusher is not None:
+            return self.flusher.flush(timeout_sec)
+        if self.buffered_storage_connector and getattr(
+            self.buffered_storage_connector, "samples_buffer", None
+        ):
+            self.buffered_storage_connector.submit_measurements()
+            self.last_batch_submission_timestamp_ms = get_time_now_ms()
+        return True
+
     def submit_measurements(self):
-        if self.buffered_storage_connector:
+        if self.summaries is not None:
+            self.__add_due_summary()
+        # With a background flusher the samples are submitted by its thread
+        if self.buffered_storage_connector and self.flusher is None:
             if (
                 self.max_batching_delay_ms
                 < get_time_now_ms() - self.last_batch_submission_timestamp_ms
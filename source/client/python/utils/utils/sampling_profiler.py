@@ -0,0 +1,248 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+DEFAULT_PROFILER_CONFIG = {
+    # Sampling from the start, otherwise SIGUSR2 starts and stops it
+    "enabled": False,
+    "interval_ms": 10,
+    # A profile is written every flush_interval_sec and when sampling stops
+    "flush_interval_sec": 60,
+    # Local directory of the profiles and/or blobs of the data plane
+    "directory": "",
+    "data_plane": False,
+    "max_depth": 64,
+    # Samples the threads of the agent (metrics flusher, scheduler...) and not only the
+    # main one
+    "all_threads": False,
+}
+
+# Stage of the threads which did not set one
+DEFAULT_STAGE = "other"
+
+
+def profiler_config(config=None):
+    """Returns the profiler settings from the "profiler" configuration, a JSON document
+    (or dict) overriding DEFAULT_PROFILER_CONFIG"""
+    if not config:
+        config = {}
+    elif isinstance(config, str):
+        config = json.loads(config)
+
+    unknown = set(config) - set(DEFAULT_PROFILER_CONFIG)
+    if unknown:
+        raise Exception(
+            "profiler: unknown settings {}, valid settings are {}".format(
+                sorted(unknown), list(DEFAULT_PROFILER_CONFIG)
+            )
+        )
+
+    settings = dict(DEFAULT_PROFILER_CONFIG)
+    settings.update(config)
+    return settings
+
+
+class LocalDirectoryProfileSink:
+    """Writes each profile to <directory>/<name>-<timestamp ms>.folded"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, name, timestamp_ms, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = os.path.join(
+            self.directory, "{}-{}.folded".format(name, timestamp_ms)
+        )
+        with open(file_name, "wb") as f:
+            f.write(profile)
+
+
+class DataPlaneProfileSink:
+    """Stores each profile as the blob profile-<name>-<timestamp ms> of the data plane"""
+
+    def __init__(self, in_out_manager):
+        self.in_out_manager = in_out_manager
+
+    def write(self, name, timestamp_ms, profile):
+        self.in_out_manager.put_blob_from_bytes(
+            "profile-{}-{}".format(name, timestamp_ms), profile
+        )
+
+
+class SamplingProfiler:
+    """Statistical profiler: a background thread reads the stack of the profiled threads
+    every interval_ms and counts identical stacks. Profiles are written in the folded
+    format of flame graph tools, one "<stage>;<frame>;...;<frame> <samples>" line per
+    stack, the root frame being the stage set by the thread (see set_stage).
+
+    The profiled code is not instrumented: its only cost is the GIL taken by the sampling
+    thread, a few microseconds per sample.
+    """
+
+    def __init__(
+        self,
+        sinks=(),
+        name="agent",
+        interval_ms=10,
+        flush_interval_sec=60,
+        max_depth=64,
+        all_threads=False,
+    ):
+        self.sinks = list(sinks)
+        self.name = name
+        self.interval_sec = interval_ms / 1000
+        self.flush_interval_sec = flush_interval_sec
+        self.max_depth = max_depth
+        self.all_threads = all_threads
+        self.target_thread_id = threading.main_thread().ident
+
+        self.lock = threading.Lock()
+        # Serializes the writes of the sampling thread and stop()
+        self.write_lock = threading.Lock()
+        # folded stack -> number of samples
+        self.counts = {}
+        # thread id -> stage
+        self.stages = {}
+        # code object -> frame label
+        self.labels = {}
+        self.running = threading.Event()
+        self.thread = None
+        self.stats = {
+            "samples": 0,
+            "sampling_time_ms": 0.0,
+            "profiles_written": 0,
+            "write_failures": 0,
+        }
+
+    def set_stage(self, stage):
+        """Tags the next samples of the calling thread"""
+        self.stages[threading.get_ident()] = stage
+
+    @property
+    def is_running(self):
+        return self.running.is_set()
+
+    def start(self):
+        if not self.sinks:
+            logging.warning("Profiler not started: no directory nor data plane sink")
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.__run, name="sampling-profiler", daemon=True
+                )
+                self.thread.start()
+        self.running.set()
+        logging.info("Profiler started, sampling every {}s".format(self.interval_sec))
+
+    def stop(self):
+        """Stops sampling and writes the samples not written yet"""
+        self.running.clear()
+        self.flush()
+
+    def toggle(self, signum=None, frame=None):
+        """Starts or stops sampling, usable as a signal handler: the profile is then written
+        by the sampling thread, not from the handler"""
+        if self.running.is_set():
+            self.running.clear()
+            logging.info("Profiler stopped")
+        else:
+            self.start()
+
+    def sample(self):
+        t_start = time.perf_counter()
+        own_thread_id = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            if not self.all_threads and thread_id != self.target_thread_id:
+                continue
+            stacks.append(
+                self.stages.get(thread_id, DEFAULT_STAGE) + ";" + self.__fold(frame)
+            )
+        with self.lock:
+            for stack in stacks:
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+            self.stats["samples"] += len(stacks)
+            self.stats["sampling_time_ms"] += (time.perf_counter() - t_start) * 1000
+
+    def flush(self):
+        """Writes the samples taken since the previous profile, if any"""
+        with self.write_lock:
+            with self.lock:
+                counts, self.counts = self.counts, {}
+            if not counts:
+                return
+            profile = "".join(
+                "{} {}\n".format(stack, n) for stack, n in sorted(counts.items())
+            ).encode("utf-8")
+            timestamp_ms = int(time.time() * 1000)
+            for sink in self.sinks:
+                try:
+                    sink.write(self.name, timestamp_ms, profile)
+                    with self.lock:
+                        self.stats["profiles_written"] += 1
+                except Exception as e:
+                    logging.error("Failed to write the profile: {}".format(e))
+                    with self.lock:
+                        self.stats["write_failures"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def __fold(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = self.labels[code] = "{}:{}".format(
+                    os.path.basename(code.co_filename), code.co_name
+                )
+            labels.append(label)
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def __run(self):
+        last_flush = time.monotonic()
+        while True:
+            if not self.running.is_set():
+                self.flush()
+                self.running.wait()
+                last_flush = time.monotonic()
+            self.sample()
+            if time.monotonic() - last_flush >= self.flush_interval_sec:
+                self.flush()
+                last_flush = time.monotonic()
+            time.sleep(self.interval_sec)
+
+
+def profiler_from_config(config=None, name="agent", in_out_manager=None):
+    """Returns the SamplingProfiler described by a "profiler" configuration, see
+    profiler_config. It is started if enabled."""
+    settings = profiler_config(config)
+    sinks = []
+    if settings["directory"]:
+        sinks.append(LocalDirectoryProfileSink(settings["directory"]))
+    if settings["data_plane"] and in_out_manager is not None:
+        sinks.append(DataPlaneProfileSink(in_out_manager))
+    profiler = SamplingProfiler(
+        sinks,
+        name=name,
+        interval_ms=settings["interval_ms"],
+        flush_interval_sec=settings["flush_interval_sec"],
+        max_depth=settings["max_depth"],
+        all_threads=settings["all_threads"],
+    )
+    if settings["enabled"]:
+        profiler.start()
+    return profiler
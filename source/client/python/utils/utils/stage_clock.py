@@ -0,0 +1,173 @@
+# Copyright 2024 Amazon.com, Inc. or its affiliates.
+# SPDX-License-Identifier: Apache-2.0
+# Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
+
+import threading
+import time
+
+# stage -> (label of the delta with the previous stage, component recording the stage)
+STAGES = {
+    "stage1_grid_api_01_task_creation_tstmp": (" ", "client"),
+    "stage1_grid_api_02_task_submission_tstmp": ("upload_data_to_storage", "client"),
+    "stage2_sbmtlmba_01_invocation_tstmp": ("grid_api_2_lambda_ms", "submit_tasks"),
+    "stage2_sbmtlmba_02_before_batch_write_tstmp": (
+        "task_construction_ms",
+        "submit_tasks",
+    ),
+    "stage2_sbmtlmba_03_invocation_over_tstmp": ("dynamo_db_submit_ms", "submit_tasks"),
+    "stage3_agent_01_task_acquired_sqs_tstmp": ("sqs_queuing_time_ms", "agent"),
+    "stage3_agent_02_task_acquired_ddb_tstmp": ("ddb_task_claiming_time_ms", "agent"),
+    "stage4_agent_01_user_code_finished_tstmp": ("user_code_exec_time_ms", "agent"),
+    "stage4_agent_02_S3_stdout_delivered_tstmp": ("S3_stdout_upload_time_ms", "agent"),
+    "stage5_getres_01_invocation_tstmp": ("None", "get_results"),
+    "stage5_getres_02_invocation_over_tstmp": (
+        "get_results_invocation_time",
+        "get_results",
+    ),
+    "01_invocation_tstmp": ("None", "ttl_checker"),
+    "02_completion_tstmp": ("ttl_execution_time", "ttl_checker"),
+}
+
+# Stages of the "stats" of a task, from its creation by the client to its completion
+TASK_STAGES = [
+    "stage1_grid_api_01_task_creation_tstmp",
+    "stage1_grid_api_02_task_submission_tstmp",
+    "stage2_sbmtlmba_01_invocation_tstmp",
+    "stage2_sbmtlmba_02_before_batch_write_tstmp",
+    "stage3_agent_01_task_acquired_sqs_tstmp",
+    "stage3_agent_02_task_acquired_ddb_tstmp",
+    "stage4_agent_01_user_code_finished_tstmp",
+    "stage4_agent_02_S3_stdout_delivered_tstmp",
+]
+
+NS_PER_MS = 1000000
+NS_PER_US = 1000
+
+
+class AnchoredClock:
+    """Wall clock time derived from time.monotonic_ns(): timestamps of a process never go
+    backwards and their differences are exact monotonic durations, while timestamps of
+    different hosts stay comparable (up to their clock skew).
+
+    The wall clock is re-read every refresh_interval_sec. Steps forward are applied at
+    once, steps backward are slewed: from the refresh on, the anchored clock runs slower
+    by max_slew until it has caught up with the wall clock, so that it still moves
+    forward.
+    """
+
+    def __init__(self, refresh_interval_sec=60, max_slew=0.001):
+        self.refresh_interval_ns = int(refresh_interval_sec * 1e9)
+        self.max_slew = max_slew
+        self.lock = threading.Lock()
+        anchor_monotonic_ns = time.monotonic_ns()
+        offset_ns = time.time_ns() - anchor_monotonic_ns
+        # (anchor, offset at the anchor, offset slewed to), replaced as a whole so that
+        # readers never see a partial refresh
+        self.anchor = (anchor_monotonic_ns, offset_ns, offset_ns)
+
+    def wall_clock_ns(self):
+        monotonic_ns = time.monotonic_ns()
+        if monotonic_ns - self.anchor[0] >= self.refresh_interval_ns:
+            self.__refresh()
+        return monotonic_ns + self.__offset_ns(self.anchor, monotonic_ns)
+
+    def __offset_ns(self, anchor, monotonic_ns):
+        anchor_monotonic_ns, offset_ns, target_offset_ns = anchor
+        elapsed_ns = max(0, monotonic_ns - anchor_monotonic_ns)
+        return max(target_offset_ns, offset_ns - int(elapsed_ns * self.max_slew))
+
+    def __refresh(self):
+        with self.lock:
+            monotonic_ns = time.monotonic_ns()
+            if monotonic_ns - self.anchor[0] < self.refresh_interval_ns:
+                return
+            offset_ns = self.__offset_ns(self.anchor, monotonic_ns)
+            wall_offset_ns = time.time_ns() - monotonic_ns
+            if wall_offset_ns >= offset_ns:
+                self.anchor = (monotonic_ns, wall_offset_ns, wall_offset_ns)
+            else:
+                self.anchor = (monotonic_ns, offset_ns, wall_offset_ns)
+
+
+_clock = AnchoredClock()
+
+
+def wall_clock_ns():
+    """Current time in ns since the epoch, monotonic within the process"""
+    return _clock.wall_clock_ns()
+
+
+def get_time_now_ms():
+    """Current time in ms since the epoch, monotonic within the process"""
+    return _clock.wall_clock_ns() // NS_PER_MS
+
+
+def new_task_stats(creation_ns, submission_ns=None):
+    """Stats of a new task: the timestamp (ns) of each of the TASK_STAGES, 0 until the
+    stage is reached"""
+    stats = dict.fromkeys(TASK_STAGES, 0)
+    stats["stage1_grid_api_01_task_creation_tstmp"] = creation_ns
+    stats["stage1_grid_api_02_task_submission_tstmp"] = (
+        submission_ns if submission_ns is not None else wall_clock_ns()
+    )
+    return stats
+
+
+def _is_legacy(stats):
+    """Stats built by a previous version: {stage: {"label": ..., "tstmp": <ms>}}"""
+    return any(isinstance(value, dict) for value in stats.values())
+
+
+def mark_stage(stats, stage, timestamp_ns=None):
+    """Records that stage is reached now (or at timestamp_ns)"""
+    if timestamp_ns is None:
+        timestamp_ns = wall_clock_ns()
+    if _is_legacy(stats):
+        entry = stats.setdefault(stage, {"label": STAGES[stage][0]})
+        entry["tstmp"] = timestamp_ns // NS_PER_MS
+    else:
+        stats[stage] = timestamp_ns
+
+
+def stage_ms(stats, stage):
+    """Timestamp of stage in ms, whatever the version of the stats"""
+    value = stats[stage]
+    if isinstance(value, dict):
+        return value["tstmp"]
+    return value // NS_PER_MS
+
+
+def _us_label(label):
+    if label.endswith("_ms"):
+        return label[:-3] + "_us"
+    return label + "_us"
+
+
+def stage_latencies(stats, from_stage, to_stage):
+    """Latency of each stage between from_stage and to_stage (stages sorted by name),
+    labelled with the label of the stage reached.
+
+    Latencies are integer ms, plus integer us (<label>_us, "_ms" suffix replaced) for
+    stats recorded in ns. A stage recorded by another component than the previous one may
+    be reached before it according to the clocks of the two hosts: such a negative latency
+    is clock skew, reported as 0 and counted in clock_skew_corrections.
+    """
+    keys = sorted(stats)
+    keys = keys[keys.index(from_stage): keys.index(to_stage) + 1]
+
+    if _is_legacy(stats):
+        return {
+            stats[current]["label"]: stats[current]["tstmp"] - stats[previous]["tstmp"]
+            for previous, current in zip(keys, keys[1:])
+        }
+
+    latencies = {"clock_skew_corrections": 0}
+    for previous, current in zip(keys, keys[1:]):
+        label, component = STAGES[current]
+        delta_ns = stats[current] - stats[previous]
+        if delta_ns < 0 and STAGES[previous][1] != component:
+            delta_ns = 0
+            latencies["clock_skew_corrections"] += 1
+        latencies[label] = int(round(delta_ns / NS_PER_MS))
+        latencies[_us_label(label)] = int(round(delta_ns / NS_PER_US))
+    return latencies
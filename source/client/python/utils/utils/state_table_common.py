@@ -8,6 +8,8 @@ TASK_STATE_PENDING = "pending"
 TASK_STATE_FAILED = "failed"
 TASK_STATE_FINISHED = "finished"
 TASK_STATE_PROCESSING = "processing"
+TASK_STATE_RETRYING = "retrying"
+TASK_STATE_INCONSISTENT = "inconsistent"
 
 
 class StateTableException(Exception):
@@ -23,12 +23,30 @@ from aws_xray_sdk.core import patch
 from aws_xray_sdk import global_sdk_config
 
 from botocore.exceptions import ClientError
-from api.in_out_manager import in_out_manager
+from api.in_out_cache import TieredCache
+from api.in_out_redis_pool import redis_pool_stats
+from api.in_out_manager import (
+    in_out_manager,
+    parse_task_input_blob_ref,
+    resolve_shared_data_refs,
+)
 from api.queue_manager import queue_manager
+from utils.grid_tracing import tracer_from_config
 from utils.performance_tracker import EventsCounter, performance_tracker_initializer
+from utils.sampling_profiler import profiler_from_config
+from utils.grid_logging import configure_logging, log_fields, truncated
+from utils.stage_clock import get_time_now_ms, mark_stage, stage_ms, wall_clock_ns
 from utils.state_table_common import TASK_STATE_CANCELLED, StateTableException
 from api.state_table_manager import state_table_manager
 from utils.ttl_experation_generator import TTLExpirationGenerator
+from utils.payload_codec import (
+    PAYLOAD_CODEC_LEGACY,
+    PAYLOAD_CODEC_PICKLE,
+    PAYLOAD_CODEC_RAW,
+    encode_payload,
+    payload_to_json_bytes,
+    validate_payload_codec,
+)
 import utils.grid_error_logger as errlog
 
 # Uncomment to get tracing on interruption
@@ -48,12 +66,13 @@ logging.basicConfig(
 )
 
 logging.getLogger("aws_xray_sdk").setLevel(logging.DEBUG)
+logger = logging.getLogger("agent")
 
 # Uncomment to get DEBUG logging
 # boto3.set_stream_logger('', logging.DEBUG)
 
 rand_delay = random.randint(5, 15)
-logging.info("SLEEP DELAY {}".format(rand_delay))
+logger.info("SLEEP DELAY %s", rand_delay)
 time.sleep(rand_delay)
 
 session = boto3.session.Session()
@@ -66,6 +85,9 @@ except KeyError:
 with open(agent_config_file, "r") as file:
     agent_config_data = json.loads(file.read())
 
+# Levels per logger, payload truncation and JSON output of the agent logs
+configure_logging(agent_config_data.get("logging"))
+
 # If there are no tasks in the queue we do not attempt to retrieve new tasks for that interval
 
 empty_task_queue_backoff_timeout_sec = agent_config_data[
@@ -82,6 +104,22 @@ task_input_passed_via_external_storage = agent_config_data[
 agent_task_visibility_timeout_sec = agent_config_data[
     "agent_task_visibility_timeout_sec"
 ]
+# Codec used to write task outputs, inputs are decoded whatever codec wrote them.
+# Pickle inputs are only accepted when the grid is configured to use pickle.
+payload_codec = agent_config_data.get("payload_codec", PAYLOAD_CODEC_LEGACY)
+validate_payload_codec(payload_codec)
+# Local cache of the blobs (deduplicated task inputs and shared data) read by the agent,
+# in memory then in agent_cache_dir which can be shared by the agents of a node
+agent_cache_memory_size_mb = agent_config_data.get("agent_cache_memory_size_mb", 16)
+agent_cache_dir = agent_config_data.get("agent_cache_dir", "")
+agent_cache_disk_size_mb = agent_config_data.get("agent_cache_disk_size_mb", 1024)
+# With S3+REDIS, outputs are acknowledged once in Redis and persisted to S3 in background
+grid_storage_write_behind = agent_config_data.get("grid_storage_write_behind", 0)
+grid_storage_local_hard_links = agent_config_data.get("grid_storage_local_hard_links", 0)
+# Metrics are submitted by a background thread, off the task completion path
+metrics_background_flush = agent_config_data.get("metrics_background_flush", 1)
+# Percentile summaries of the metrics, sent every interval next to the raw samples
+metrics_summary = agent_config_data.get("metrics_summary", "{}")
 USE_CC = agent_config_data["agent_use_congestion_control"]
 IS_XRAY_ENABLE = agent_config_data["enable_xray"]
 region = agent_config_data["region"]
@@ -89,6 +127,8 @@ region = agent_config_data["region"]
 
 AGENT_EXEC_TIMESTAMP_MS = 0
 execution_is_completed_flag = 0
+# Span of the task being processed, child of the submit_tasks span in the task message
+task_span = None
 
 try:
     SELF_ID = os.environ["MY_POD_NAME"]
@@ -107,6 +147,7 @@ tasks_queue = queue_manager(
     task_queue_config=agent_config_data["task_queue_config"],
     tasks_queue_name=agent_config_data["tasks_queue_name"],
     region=region,
+    visibility_timeout_sec=agent_task_visibility_timeout_sec,
 )
 
 lambda_cfg = botocore.config.Config(
@@ -135,12 +176,30 @@ stdout_iom = in_out_manager(
     agent_config_data["redis_url"],
     agent_config_data["redis_password"],
     s3_region=region,
+    compression_config=agent_config_data.get("grid_storage_compression"),
+    write_behind=grid_storage_write_behind == 1,
+    transfer_config=agent_config_data.get("grid_storage_transfer"),
+    redis_pool_config=agent_config_data.get("grid_storage_redis_pool"),
+    ttl_config=agent_config_data.get("grid_storage_ttl"),
+    local_dir=agent_config_data.get("grid_storage_local_dir"),
+    local_hard_links=grid_storage_local_hard_links == 1,
+)
+agent_cache = TieredCache(
+    memory_max_bytes=agent_cache_memory_size_mb * 1024 * 1024,
+    disk_dir=agent_cache_dir or None,
+    disk_max_bytes=agent_cache_disk_size_mb * 1024 * 1024,
+)
+# Opt-in sampling profiler of the agent loop, started by the configuration or by SIGUSR2
+profiler = profiler_from_config(
+    agent_config_data.get("profiler"), name=SELF_ID, in_out_manager=stdout_iom
 )
 
 perf_tracker_pre = performance_tracker_initializer(
     agent_config_data["metrics_are_enabled"],
     agent_config_data["metrics_pre_agent_connection_string"],
     agent_config_data["metrics_grafana_private_ip"],
+    background=metrics_background_flush == 1,
+    summary_config=metrics_summary,
 )
 event_counter_pre = EventsCounter(
     [
@@ -149,6 +208,17 @@ event_counter_pre = EventsCounter(
         "agent_successful_acquire_a_task",
         "agent_auto_throttling_event",
         "rc_cubic_decrease_event",
+        "agent_msg_handle_lookup_size",
+        "agent_cache_hits_memory",
+        "agent_cache_hits_disk",
+        "agent_cache_misses",
+        "agent_cache_evictions_memory",
+        "agent_cache_evictions_disk",
+    ]
+    # Per-priority dequeue counters, only meaningful with PrioritySQS
+    + [
+        "agent_dequeued_priority_{}".format(p)
+        for p in getattr(tasks_queue, "priorities", [])
     ]
 )
 
@@ -156,6 +226,8 @@ perf_tracker_post = performance_tracker_initializer(
     agent_config_data["metrics_are_enabled"],
     agent_config_data["metrics_post_agent_connection_string"],
     agent_config_data["metrics_grafana_private_ip"],
+    background=metrics_background_flush == 1,
+    summary_config=metrics_summary,
 )
 event_counter_post = EventsCounter(
     [
@@ -168,6 +240,18 @@ event_counter_post = EventsCounter(
         "task_exec_time_ms",
         "agent_total_time_ms",
         "str_pod_id",
+        "storage_compression_ratio",
+        "storage_compress_time_ms",
+        "storage_decompress_time_ms",
+        "storage_write_behind_backlog",
+        "storage_write_behind_flushed",
+        "storage_write_behind_flush_latency_ms",
+        "storage_write_behind_flush_latency_ms_max",
+        "storage_write_behind_retried",
+        "storage_write_behind_failed",
+        "redis_pool_wait_ms",
+        "redis_pool_wait_ms_max",
+        "redis_connections_created",
     ]
 )
 
@@ -179,7 +263,12 @@ class GracefulKiller:
 
     kill_now = False
 
-    def __init__(self):
+    def __init__(self, shutdown_hooks=()):
+        """
+        Args:
+            shutdown_hooks (list) : functions called by shutdown once the agent has stopped
+        """
+        self.shutdown_hooks = list(shutdown_hooks)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
 
     def exit_gracefully(self, signum, frame):
@@ -190,24 +279,25 @@ class GracefulKiller:
         Returns:
             Nothing
         """
-        logging.warning("Received SIGTERM: self.kill_now --> True")
+        logger.warning("Received SIGTERM: self.kill_now --> True")
         self.kill_now = True
         return 0
 
-
-def get_time_now_ms():
-    """This function returns the time in millisecond
-    Returns:
-        Current Integer time in ms
-
-    """
-    return int(round(time.time() * 1000))
+    def shutdown(self):
+        """Runs the shutdown hooks, outside of the signal handler"""
+        for hook in self.shutdown_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error("Shutdown hook %s failed: %s", hook, e)
 
 
 ttl_gen = TTLExpirationGenerator(
     task_ttl_refresh_interval_sec, task_ttl_expiration_offset_sec
 )
 
+tracer = tracer_from_config(agent_config_data.get("tracing"), background=True)
+
 
 # {'Items': [{'session_size': Decimal('10'), 'submission_timestamp': Decimal('1612276891690'), 'task_id': 'bd88ea18-6564-11eb-b5fb-060372291b89-part007_9', 'task_status': 'processing-part007', 'task_definition': 'passed_via_storage_size_75_bytes', 'task_owner': 'htc-agent-6d54fd8dfd-7wgpk', 'heartbeat_expiration_timestamp': Decimal('1612277256'), 'session_id': 'bd88ea18-6564-11eb-b5fb-060372291b89-part007', 'sqs_handler_id': 'AQEB19gkPrI8MNJlqfdu+kH4Xr/QOnZWvH9E6qcMTVuHOEKZdhvCeGdW3opZ38k5uIngM94MEzaIZyciDpZYNuwNgXozpp2vpRz5x952R80GAt26FsPmuQQoJ6gdm7dJabHqblYghXw8r+92yTdmSZRnzAr7fpkF2f7C6LoP3AEPVa8DV/6MYbrkKBqjeQLWctQmmTwvcqVkIWJH4KqokjMx+WQt1tGHLBrdd8xPwFlb8kGgwq1d6qeu5hHkdTizoaUDqbLShSYhSWlfysZ7r9its9owIkiZiYDc5/SdPKEi2hga9SH7E1GTtKetk9mUgoH2p4lCFdH2jIDnpY5EVHoicyviCWA2AMOolDZrIeTBtPklWXOnw3Wkljr2qtWbCHS7s6R1Qpis82n+5pVJUjoNfA==', 'task_completion_timestamp': Decimal('0'), 'retries': Decimal('1'), 'parent_session_id': 'bd88ea18-6564-11eb-b5fb-060372291b89-part007'}]
 
@@ -224,8 +314,10 @@ def is_task_has_been_cancelled(task_id):
 
     task_row = state_table.get_task_by_id(task_id, consistent_read=True)
 
-    logging.info(
-        "is_task_has_been_cancelled: task_id [{}] resp: [{}]".format(task_id, task_row)
+    logger.info(
+        "is_task_has_been_cancelled: task_id [%s] resp: [%s]",
+        task_id,
+        truncated(task_row),
     )
 
     if task_row is not None:
@@ -250,29 +342,34 @@ def try_to_acquire_a_task():
     """
     global AGENT_EXEC_TIMESTAMP_MS
 
-    logging.info("Waiting for a task in the queue...")
+    logger.info("Waiting for a task in the queue...")
     message = tasks_queue.receive_message(wait_time_sec=10)
 
-    task_pick_up_from_sqs_ms = get_time_now_ms()
+    task_pick_up_from_sqs_ns = wall_clock_ns()
 
-    logging.info(f"try_to_acquire_a_task, message: {message}")
+    logger.info("try_to_acquire_a_task, message: %s", truncated(message))
     # print(len(messages))
 
     if "body" not in message:
         event_counter_pre.increment("agent_no_messages_in_tasks_queue")
         return None, None
 
+    if "task_priority" in message["properties"]:
+        event_counter_pre.increment(
+            "agent_dequeued_priority_{}".format(message["properties"]["task_priority"])
+        )
+
     AGENT_EXEC_TIMESTAMP_MS = get_time_now_ms()
 
     task = json.loads(message["body"])
-    logging.debug(f"try_to_acquire_a_task, task: {task}")
+    logger.debug("try_to_acquire_a_task, task: %s", truncated(task))
 
     # Since we read this message from the task queue, now we need to associate
     # message handler with this message, so it is possible to manipulate this message via handler
     task["sqs_handle_id"] = message["properties"]["message_handle_id"]
     try:
-        logging.info(
-            f"Calling: {__name__} task_id: {task['task_id']}, agent_id: {SELF_ID}"
+        logger.info(
+            "Calling: %s task_id: %s, agent_id: %s", __name__, task["task_id"], SELF_ID
         )
 
         claim_result = state_table.claim_task_for_agent(
@@ -282,19 +379,20 @@ def try_to_acquire_a_task():
             expiration_timestamp=ttl_gen.generate_next_ttl().get_next_expiration_timestamp(),
         )
 
-        logging.info("State Table claim_task_for_agent result: {}".format(claim_result))
+        logger.info("State Table claim_task_for_agent result: %s", claim_result)
 
     except StateTableException as e:
         if e.caused_by_condition or e.caused_by_throttling:
             event_counter_pre.increment("agent_failed_to_claim_ddb_task")
 
             if is_task_has_been_cancelled(task["task_id"]):
-                logging.info(
-                    "Task [{}] has been already cancelled, skipping".format(
-                        task["task_id"]
-                    )
+                logger.info(
+                    "Task [%s] has been already cancelled, skipping", task["task_id"]
+                )
+                tasks_queue.delete_message(
+                    message_handle_id=task["sqs_handle_id"],
+                    task_priority=task.get("task_priority"),
                 )
-                tasks_queue.delete_message(message_handle_id=task["sqs_handle_id"])
                 return None, None
 
             else:
@@ -313,19 +411,49 @@ def try_to_acquire_a_task():
     tasks_queue.change_visibility(
         message["properties"]["message_handle_id"],
         visibility_timeout_sec=agent_task_visibility_timeout_sec,
+        task_priority=task.get("task_priority"),
     )
 
-    task["stats"]["stage3_agent_01_task_acquired_sqs_tstmp"][
-        "tstmp"
-    ] = task_pick_up_from_sqs_ms
-    task["stats"]["stage3_agent_02_task_acquired_ddb_tstmp"][
-        "tstmp"
-    ] = get_time_now_ms()
+    mark_stage(
+        task["stats"], "stage3_agent_01_task_acquired_sqs_tstmp", task_pick_up_from_sqs_ns
+    )
+    mark_stage(task["stats"], "stage3_agent_02_task_acquired_ddb_tstmp")
     event_counter_pre.increment("agent_successful_acquire_a_task")
 
+    start_task_span(task)
+
     return message, task
 
 
+def start_task_span(task):
+    """Starts the span of the task in the agent and records the time spent in the queue
+    and claiming the task, if its session is traced"""
+    global task_span
+    stats = task["stats"]
+    acquired_sqs_ms = stage_ms(stats, "stage3_agent_01_task_acquired_sqs_tstmp")
+    attributes = {"task_id": task["task_id"], "session_id": task["session_id"]}
+
+    tracer.record_span(
+        "sqs.queued",
+        task.get("trace_context"),
+        stage_ms(stats, "stage2_sbmtlmba_02_before_batch_write_tstmp"),
+        acquired_sqs_ms,
+        attributes,
+    )
+    task_span = tracer.start_span(
+        "agent.task",
+        task.get("trace_context"),
+        attributes=dict(attributes, agent_id=SELF_ID),
+        start_ms=acquired_sqs_ms,
+    )
+    tracer.record_span(
+        "agent.claim",
+        task_span,
+        acquired_sqs_ms,
+        stage_ms(stats, "stage3_agent_02_task_acquired_ddb_tstmp"),
+    )
+
+
 def process_subprocess_completion(
     perf_tracker, task, sqs_msg, fname_stdout, stdout=None
 ):
@@ -343,28 +471,35 @@ def process_subprocess_completion(
         Nothing
 
     """
-    task["stats"]["stage4_agent_01_user_code_finished_tstmp"][
-        "tstmp"
-    ] = get_time_now_ms()
+    profiler.set_stage("complete")
+    mark_stage(task["stats"], "stage4_agent_01_user_code_finished_tstmp")
 
     # <1.> Store stdout/stderr into persistent storage
     if stdout is not None:
-        b64output = base64.b64encode(stdout.encode("utf-8"))
-        stdout_iom.put_output_from_bytes(task["task_id"], data=b64output)
+        if payload_codec == PAYLOAD_CODEC_LEGACY:
+            output = base64.b64encode(stdout.encode("utf-8"))
+        else:
+            output = encode_payload(stdout.encode("utf-8"), PAYLOAD_CODEC_RAW)
+        stdout_iom.put_output_from_bytes(task["task_id"], data=output)
     else:
         stdout_iom.put_output_from_file(task["task_id"], file_name=fname_stdout)
-        # logging.info("\n===========STDOUT: ================")
-        # logging.info(open(fname_stdout, "r").read())
+        # logger.info("\n===========STDOUT: ================")
+        # logger.info(open(fname_stdout, "r").read())
 
         # ret = stdout_iom.put_error_from_file(task["task_id"], file_name=fname_stderr)
 
-        # logging.info("\n===========STDERR: ================")
-        # logging.info(open(fname_stderr, "r").read())
+        # logger.info("\n===========STDERR: ================")
+        # logger.info(open(fname_stderr, "r").read())
 
-    task["stats"]["stage4_agent_02_S3_stdout_delivered_tstmp"][
-        "tstmp"
-    ] = get_time_now_ms()
+    mark_stage(task["stats"], "stage4_agent_02_S3_stdout_delivered_tstmp")
+    tracer.record_span(
+        "agent.upload_output",
+        task_span,
+        stage_ms(task["stats"], "stage4_agent_01_user_code_finished_tstmp"),
+        stage_ms(task["stats"], "stage4_agent_02_S3_stdout_delivered_tstmp"),
+    )
 
+    set_finished_span = tracer.start_span("agent.set_task_finished", task_span)
     count = 0
     is_update_successful = False
     while True:
@@ -376,7 +511,7 @@ def process_subprocess_completion(
                 task_id=task["task_id"], agent_id=SELF_ID
             )
 
-            logging.info(f"Task status has been set to Finished: {task['task_id']}")
+            logger.info("Task status has been set to Finished: %s", task["task_id"])
 
             break
 
@@ -403,26 +538,34 @@ def process_subprocess_completion(
             )
             raise e
 
+    set_finished_span.set_attribute("attempts", count)
+    set_finished_span.end()
+    task_span.set_attribute("finished", is_update_successful)
+
     if not is_update_successful:
         # We can get here if task has been taken over by the watchdog lambda
         # in this case we ignore results and proceed to the next task.
         event_counter_post.increment("ddb_set_task_finished_failed")
-        logging.warning(
-            f"Could not set completion state for a task {task['task_id']} to Finish"
+        logger.warning(
+            "Could not set completion state for a task %s to Finish", task["task_id"]
         )
 
     else:
         event_counter_post.increment("ddb_set_task_finished_succeeded")
-        logging.info(
+        logger.info(
             "We have successfully marked task as completed in dynamodb."
-            " Deleting message from the SQS... for task [{}]".format(task["task_id"])
+            " Deleting message from the SQS... for task [%s]",
+            task["task_id"],
         )
-        tasks_queue.delete_message(sqs_msg["properties"]["message_handle_id"])
-
-    logging.info(
-        "Exec time1: {} {}".format(
-            get_time_now_ms() - AGENT_EXEC_TIMESTAMP_MS, AGENT_EXEC_TIMESTAMP_MS
+        tasks_queue.delete_message(
+            sqs_msg["properties"]["message_handle_id"],
+            task_priority=task.get("task_priority"),
         )
+
+    logger.info(
+        "Exec time1: %s %s",
+        get_time_now_ms() - AGENT_EXEC_TIMESTAMP_MS,
+        AGENT_EXEC_TIMESTAMP_MS,
     )
     event_counter_post.increment(
         "agent_total_time_ms", get_time_now_ms() - AGENT_EXEC_TIMESTAMP_MS
@@ -435,6 +578,25 @@ def process_subprocess_completion(
 def submit_post_agent_measurements(task, perf=None):
     if perf is None:
         perf = perf_tracker_post
+    compression_stats = stdout_iom.compressor.get_and_reset_stats()
+    event_counter_post.set(
+        "storage_compression_ratio", compression_stats["compression_ratio"]
+    )
+    event_counter_post.set(
+        "storage_compress_time_ms", compression_stats["compress_time_ms"]
+    )
+    event_counter_post.set(
+        "storage_decompress_time_ms", compression_stats["decompress_time_ms"]
+    )
+    if getattr(stdout_iom, "write_behind", None) is not None:
+        for stat, value in stdout_iom.write_behind.get_and_reset_stats().items():
+            event_counter_post.set("storage_write_behind_" + stat, value)
+    pool_stats = redis_pool_stats.get_and_reset_stats()
+    event_counter_post.set("redis_pool_wait_ms", pool_stats["pool_wait_ms"])
+    event_counter_post.set("redis_pool_wait_ms_max", pool_stats["pool_wait_ms_max"])
+    event_counter_post.set(
+        "redis_connections_created", pool_stats["connections_created"]
+    )
     perf.add_metric_sample(
         task["stats"],
         event_counter_post,
@@ -445,6 +607,12 @@ def submit_post_agent_measurements(task, perf=None):
 
 
 def submit_pre_agent_measurements(task):
+    if hasattr(tasks_queue, "msg_handle_to_queue_lookup"):
+        event_counter_pre.set(
+            "agent_msg_handle_lookup_size", len(tasks_queue.msg_handle_to_queue_lookup)
+        )
+    for stat, value in agent_cache.get_and_reset_stats().items():
+        event_counter_pre.set("agent_cache_" + stat, value)
     perf_tracker_pre.add_metric_sample(
         task["stats"],
         event_counter_pre,
@@ -482,14 +650,14 @@ async def do_task_local_execution_thread(
         await asyncio.sleep(work_proc_status_pull_interval_sec)
 
 
-async def do_task_local_lambda_execution_thread(perf_tracker, task, sqs_msg, task_def):
+async def do_task_local_lambda_execution_thread(perf_tracker, task, sqs_msg, payload):
     global execution_is_completed_flag
 
     t_start = get_time_now_ms()
 
     # TODO How big of a payload we can pass here?
-    payload = json.dumps(task_def).encode()
     xray_recorder.begin_subsegment("lambda")
+    execute_span = tracer.start_span("agent.execute", task_span)
     loop = asyncio.get_event_loop()
     response = await loop.run_in_executor(
         None,
@@ -501,15 +669,18 @@ async def do_task_local_lambda_execution_thread(perf_tracker, task, sqs_msg, tas
             LogType="Tail",
         ),
     )
-    logging.info("TASK FINISHED!!!\nRESPONSE: [{}]".format(response))
+    logger.info("TASK FINISHED!!!\nRESPONSE: [%s]", truncated(response))
     #  logs = base64.b64decode(response['LogResult']).decode('utf-8')
-    #  logging.info("logs : {}".format(logs))
+    #  logger.info("logs : {}".format(logs))
 
     ret_value = response["Payload"].read().decode("utf-8")
-    logging.info("retValue : {}".format(ret_value))
+    logger.info("retValue : %s", truncated(ret_value))
 
     execution_is_completed_flag = 1
 
+    execute_span.end(
+        error="bootstrap failure" if "BOOTSTRAP ERROR" in ret_value else None
+    )
     if "BOOTSTRAP ERROR" in ret_value:
         event_counter_post.increment("bootstrap_failure", 1)
     else:
@@ -532,7 +703,7 @@ def update_ttl_if_required(task, sqs_msg):
         ttl_gen.get_next_refresh_timestamp()
         < time.time() + work_proc_status_pull_interval_sec
     ):
-        logging.info("***Updating TTL***")
+        logger.info("***Updating TTL***")
         # event_counter_post.increment("counter_update_ttl")
 
         count = 0
@@ -569,8 +740,9 @@ def update_ttl_if_required(task, sqs_msg):
                     terminate_worker_lambda_container()
 
                     # <3.> Then terminate/restart the agent container;
-                    logging.warning(
-                        f"Task {task['task_id']} has been cancelled during processing, restarting pod."
+                    logger.warning(
+                        "Task %s has been cancelled during processing, restarting pod.",
+                        task["task_id"],
                     )
                     os.kill(os.getpid(), signal.SIGKILL)
 
@@ -597,15 +769,15 @@ def update_ttl_if_required(task, sqs_msg):
 
 async def do_ttl_updates_thread(task, sqs_msg):
     global execution_is_completed_flag
-    logging.info("START TTL-1")
+    logger.info("START TTL-1")
     while not bool(execution_is_completed_flag):
-        logging.info("Check TTL")
+        logger.info("Check TTL")
 
         ddb_res = update_ttl_if_required(task, sqs_msg)
 
         if not ddb_res:
             event_counter_post.increment("counter_update_ttl_failed")
-            logging.info("Could not set TTL Expiration timestamp.")
+            logger.info("Could not set TTL Expiration timestamp.")
             submit_post_agent_measurements(task)
             return False
 
@@ -618,76 +790,141 @@ async def do_ttl_updates_thread(task, sqs_msg):
         await asyncio.sleep(required_sleep)
 
 
+def get_execution_payload_from_storage(stored_input):
+    return payload_to_json_bytes(
+        stored_input, allow_pickle=payload_codec == PAYLOAD_CODEC_PICKLE
+    )
+
+
+def get_execution_payload_from_blob(blob_key):
+    """Blobs are stored by content hash and never change, tasks sharing an input or shared
+    data are served from the agent cache after the first download on the node"""
+    return agent_cache.get_or_load(
+        blob_key,
+        lambda: get_execution_payload_from_storage(
+            stdout_iom.get_blob_to_bytes(blob_key)
+        ),
+    )
+
+
 def prepare_arguments_for_execution(task):
+    """Returns the JSON document passed to the worker lambda. JSON and legacy inputs are
+    forwarded as they are stored, without being parsed and serialized again."""
     if task_input_passed_via_external_storage == 1:
-        execution_payload = stdout_iom.get_input_to_bytes(task["task_id"])
-        execution_payload = base64.b64decode(execution_payload)
+        blob_key = parse_task_input_blob_ref(task.get("task_definition"))
+        if blob_key is not None:
+            execution_payload = get_execution_payload_from_blob(blob_key)
+        else:
+            execution_payload = get_execution_payload_from_storage(
+                stdout_iom.get_input_to_bytes(task["task_id"])
+            )
     else:
-        execution_payload = task["task_definition"]
+        execution_payload = task["task_definition"].encode("utf-8")
 
-    return execution_payload
+    return resolve_shared_data_refs(execution_payload, get_execution_payload_from_blob)
 
 
 async def run_task(task, sqs_msg):
     global execution_is_completed_flag
     xray_recorder.begin_segment("run_task")
-    logging.info("Running Task: {}".format(task))
+    logger.info(
+        "Running Task: %s",
+        truncated(task),
+        extra=log_fields(task_id=task["task_id"], session_id=task["session_id"]),
+    )
+    profiler.set_stage("prepare_input")
     xray_recorder.begin_subsegment("encoding")
-    bin_protobuf = prepare_arguments_for_execution(task)
-    tast_str = bin_protobuf.decode("utf-8")
-    task_def = json.loads(tast_str)
+    with tracer.start_span("agent.prepare_input", task_span):
+        execution_payload = prepare_arguments_for_execution(task)
 
     submit_pre_agent_measurements(task)
 
     xray_recorder.end_subsegment()
     execution_is_completed_flag = 0
 
-    task_execution = asyncio.create_task(
-        do_task_local_lambda_execution_thread(
-            perf_tracker_post, task, sqs_msg, task_def
+    # Scraped by Prometheus/KEDA when the metrics connector is pull based
+    perf_tracker_post.set_gauge("agent_tasks_in_flight", 1)
+    profiler.set_stage("execute")
+    try:
+        task_execution = asyncio.create_task(
+            do_task_local_lambda_execution_thread(
+                perf_tracker_post, task, sqs_msg, execution_payload
+            )
         )
-    )
 
-    task_ttl_update = asyncio.create_task(do_ttl_updates_thread(task, sqs_msg))
-    await asyncio.gather(task_execution, task_ttl_update)
+        task_ttl_update = asyncio.create_task(do_ttl_updates_thread(task, sqs_msg))
+        await asyncio.gather(task_execution, task_ttl_update)
+    finally:
+        perf_tracker_post.set_gauge("agent_tasks_in_flight", 0)
+        # No-op if the span already ended with the task completion
+        task_span.end()
 
     xray_recorder.end_segment()
-    logging.info("Finished Task: {}".format(task))
+    logger.info(
+        "Finished Task: %s",
+        task["task_id"],
+        extra=log_fields(task_id=task["task_id"], session_id=task["session_id"]),
+    )
     return True
 
 
 def terminate_worker_lambda_container():
     for proc in psutil.process_iter():
-        logging.info("running process : {}".format(proc.name()))
+        logger.info("running process : %s", proc.name())
         # check whether the process name matches
         if proc.name() == "aws-lambda-rie":
-            logging.info("stop lambda emulated environment after the last request")
+            logger.info("stop lambda emulated environment after the last request")
             proc.terminate()
 
 
+def process_next_task():
+    """One iteration of the event loop: acquires a task from the queue and runs it
+
+    Returns:
+        True if a task has been run, False if none could be acquired
+    """
+    profiler.set_stage("acquire")
+    sqs_msg, task = try_to_acquire_a_task()
+
+    if task is None:
+        return False
+
+    asyncio.run(run_task(task, sqs_msg))
+    logger.info("Back to main loop")
+    return True
+
+
 def event_loop():
-    logging.info("Starting main event loop")
-    killer = GracefulKiller()
+    logger.info("Starting main event loop")
+    # Long polls of the task queues are stopped first, outputs still queued by the
+    # write-behind mode are persisted before the pod stops
+    killer = GracefulKiller(
+        shutdown_hooks=[
+            tasks_queue.close,
+            stdout_iom.flush,
+            perf_tracker_pre.flush,
+            perf_tracker_post.flush,
+            tracer.flush,
+            errlog.flush,
+            profiler.stop,
+        ]
+    )
+    signal.signal(signal.SIGUSR2, profiler.toggle)
     while not killer.kill_now:
-        sqs_msg, task = try_to_acquire_a_task()
-
-        if task is not None:
-            asyncio.run(run_task(task, sqs_msg))
-            logging.info("Back to main loop")
-        else:
+        if not process_next_task():
+            profiler.set_stage("idle")
             timeout = random.uniform(
                 empty_task_queue_backoff_timeout_sec,
                 2 * empty_task_queue_backoff_timeout_sec,
             )
-            logging.info(
-                "Could not acquire a task from the queue, backing off for {}".format(
-                    timeout
-                )
+            logger.info(
+                "Could not acquire a task from the queue, backing off for %s", timeout
             )
             time.sleep(timeout)
 
+    killer.shutdown()
     terminate_worker_lambda_container()
-    logging.info("agent and lambda gracefully stopped")
+    logger.info("agent and lambda gracefully stopped")
 
 
 if __name__ == "__main__":
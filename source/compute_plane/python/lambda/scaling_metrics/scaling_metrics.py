@@ -9,10 +9,32 @@ import os
 
 
 from api.queue_manager import queue_manager
+from api.queue_depth_provider import (
+    DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC,
+    QueueDepthProvider,
+)
 
 # TODO - retrieve the endpoint url from Terraform
 region = os.environ["REGION"]
 
+# Created once per Lambda execution environment and reused by warm invocations.
+task_queue = queue_manager(
+    task_queue_service=os.environ["TASK_QUEUE_SERVICE"],
+    task_queue_config=os.environ["TASK_QUEUE_CONFIG"],
+    tasks_queue_name=os.environ["TASKS_QUEUE_NAME"],
+    region=region,
+)
+
+queue_depth_provider = QueueDepthProvider(
+    task_queue,
+    cache_ttl_sec=float(
+        os.environ.get("QUEUE_DEPTH_CACHE_TTL_SEC", DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC)
+    ),
+)
+
+# Create CloudWatch client
+cloudwatch = boto3.client("cloudwatch")
+
 
 def lambda_handler(event, context):
     # For every x minute
@@ -21,18 +43,15 @@ def lambda_handler(event, context):
     # - namespace: given in the environment variable NAMESPACE
     # - DimensionName: given in the environment variable DIMENSION_NAME
 
-    # TODO - retrieve the endpoint url from Terraform
-    task_queue = queue_manager(
-        task_queue_service=os.environ["TASK_QUEUE_SERVICE"],
-        task_queue_config=os.environ["TASK_QUEUE_CONFIG"],
-        tasks_queue_name=os.environ["TASKS_QUEUE_NAME"],
-        region=region,
-    )
-
-    task_pending = task_queue.get_queue_length()
+    queue_depth = queue_depth_provider.get_queue_depth()
+    task_pending = queue_depth["total"]["visible"]
     logging.info("Scaling Metrics: pending task in DDB = {}".format(task_pending))
-    # Create CloudWatch client
-    cloudwatch = boto3.client("cloudwatch")
+    for priority, depth in queue_depth["priorities"].items():
+        logging.info(
+            "Scaling Metrics: priority {} visible = {} in flight = {} delayed = {}".format(
+                priority, depth["visible"], depth["in_flight"], depth["delayed"]
+            )
+        )
     period = int(os.environ["PERIOD"])
     cloudwatch.put_metric_data(
         MetricData=[
@@ -148,3 +148,6 @@ def lambda_handler(event, context):
             "Lambda cancel_tasks error: {} trace: {}".format(e, traceback.format_exc())
         )
         return {"statusCode": 542, "body": "{}".format(e)}
+    finally:
+        # The logging thread is frozen once the invocation returns
+        errlog.flush()
@@ -3,7 +3,6 @@
 # Licensed under the Apache License, Version 2.0 https://aws.amazon.com/apache-2-0/
 
 import json
-import time
 import os
 import base64
 import traceback
@@ -19,6 +18,8 @@ from utils.state_table_common import (
 )
 
 import utils.grid_error_logger as errlog
+from utils.grid_tracing import tracer_from_config
+from utils.stage_clock import mark_stage
 
 state_table = state_table_manager(
     os.environ["STATE_TABLE_SERVICE"],
@@ -28,6 +29,8 @@ state_table = state_table_manager(
 
 event_counter = EventsCounter(["invocations", "retrieved_rows"])
 
+tracer = tracer_from_config(os.environ.get("TRACING_CONFIG"))
+
 perf_tracker = performance_tracker_initializer(
     os.environ["METRICS_ARE_ENABLED"],
     os.environ["METRICS_GET_RESULTS_LAMBDA_CONNECTION_STRING"],
@@ -35,10 +38,6 @@ perf_tracker = performance_tracker_initializer(
 )
 
 
-def get_time_now_ms():
-    return int(round(time.time() * 1000))
-
-
 def get_tasks_statuses_in_session(session_id):
     assert session_id is not None
     response = {
@@ -94,13 +93,13 @@ def get_tasks_statuses_in_session(session_id):
     return response
 
 
-def get_session_id_from_event(event):
+def get_request_from_event(event):
     """
     Args:
         lambda's invocation event
 
     Returns:
-        str: session id encoded in the event
+        dict: the request encoded in the event (session id and trace context)
     """
 
     # If lambda are called through ALB - extracting actual event
@@ -114,9 +113,7 @@ def get_session_id_from_event(event):
         decoded_json_tasks = base64.urlsafe_b64decode(encoded_json_tasks).decode(
             "utf-8"
         )
-        event = json.loads(decoded_json_tasks)
-
-        return event["session_id"]
+        return json.loads(decoded_json_tasks)
 
     else:
         errlog.log("Uniplemented path, exiting")
@@ -129,19 +126,12 @@ def book_keeping(response):
     """
 
     event_counter.increment("invocations")
-    stats_obj = {
-        "stage5_getres_01_invocation_tstmp": {
-            "label": "None",
-            "tstmp": get_time_now_ms(),
-        }
-    }
+    stats_obj = {}
+    mark_stage(stats_obj, "stage5_getres_01_invocation_tstmp")
 
     event_counter.increment("retrieved_rows", response["metadata"]["tasks_in_response"])
 
-    stats_obj["stage5_getres_02_invocation_over_tstmp"] = {
-        "label": "get_results_invocation_time",
-        "tstmp": get_time_now_ms(),
-    }
+    mark_stage(stats_obj, "stage5_getres_02_invocation_over_tstmp")
     perf_tracker.add_metric_sample(
         stats_obj,
         event_counter=event_counter,
@@ -155,9 +145,18 @@ def lambda_handler(event, context):
     session_id = None
 
     try:
-        session_id = get_session_id_from_event(event)
-
-        lambda_responce = get_tasks_statuses_in_session(session_id)
+        request = get_request_from_event(event)
+        session_id = request["session_id"]
+
+        with tracer.start_span(
+            "get_results",
+            request.get("trace_context"),
+            attributes={"session_id": session_id},
+        ) as trace_span:
+            lambda_responce = get_tasks_statuses_in_session(session_id)
+            trace_span.set_attribute(
+                "tasks_in_response", lambda_responce["metadata"]["tasks_in_response"]
+            )
 
         book_keeping(lambda_responce)
 
@@ -175,3 +174,7 @@ def lambda_handler(event, context):
             "Lambda get_result error: {} trace: {}".format(e, traceback.format_exc())
         )
         return {"statusCode": 542, "body": "{}".format(e)}
+    finally:
+        tracer.flush()
+        # The logging thread is frozen once the invocation returns
+        errlog.flush()
@@ -5,7 +5,6 @@
 import json
 import base64
 import boto3
-import time
 import os
 import uuid
 import traceback
@@ -18,9 +17,13 @@ from utils.performance_tracker import EventsCounter, performance_tracker_initial
 from boto3.dynamodb.conditions import Key
 
 import utils.grid_error_logger as errlog
+from utils.grid_logging import truncated
+from utils.grid_tracing import tracer_from_config
+from utils.stage_clock import NS_PER_MS, get_time_now_ms, mark_stage, wall_clock_ns
 from utils.state_table_common import TASK_STATE_PENDING
+from utils.payload_codec import decode_payload
 
-from api.in_out_manager import in_out_manager
+from api.in_out_manager import in_out_manager, task_input_blob_ref
 from api.queue_manager import queue_manager
 from api.state_table_manager import state_table_manager
 
@@ -48,6 +51,8 @@ perf_tracker = performance_tracker_initializer(
     os.environ["METRICS_GRAFANA_PRIVATE_IP"],
 )
 
+tracer = tracer_from_config(os.environ.get("TRACING_CONFIG"))
+
 task_input_passed_via_external_storage = os.environ[
     "TASK_INPUT_PASSED_VIA_EXTERNAL_STORAGE"
 ]
@@ -56,6 +61,7 @@ stdin_iom = in_out_manager(
     os.environ["S3_BUCKET"],
     os.environ["REDIS_URL"],
     os.environ["REDIS_PASSWORD"],
+    compression_config=os.environ.get("GRID_STORAGE_COMPRESSION"),
 )
 
 
@@ -92,7 +98,7 @@ def write_to_sqs(sqs_batch_entries, session_priority=0):
             message_bodies=sqs_batch_entries,
             message_attributes={"priority": session_priority},
         )
-        if response.get("Failed") is not None:
+        if response.get("Failed"):
             # Should also send to DLQ
             raise Exception("Batch write to SQS failed - check DLQ")
     except Exception as e:
@@ -102,18 +108,6 @@ def write_to_sqs(sqs_batch_entries, session_priority=0):
     return response
 
 
-def get_time_now_ms():
-    """This method returns the current time in millisecond (ms)
-
-    Args:
-
-    Returns:
-        int: the current  time in millisecond
-
-    """
-    return int(round(time.time() * 1000))
-
-
 def verify_passed_sessionid_is_unique(session_id):
     """This function if a given session has already been used by DynamoDB
 
@@ -158,17 +152,17 @@ def lambda_handler(event, context):
         all_params = event.get("queryStringParameters")
         if task_input_passed_via_external_storage == "1":
             session_id = all_params.get("submission_content")
-            encoded_json_tasks = stdin_iom.get_payload_to_utf8_string(session_id)
+            # Legacy base64url JSON or a framed payload, see utils.payload_codec
+            encoded_tasks = stdin_iom.get_payload_to_bytes(session_id)
         else:
-            encoded_json_tasks = all_params.get("submission_content")
-        if encoded_json_tasks is None:
+            encoded_tasks = all_params.get("submission_content")
+        if encoded_tasks is None:
             raise Exception(
                 "Invalid submission format, expect submission_content parameter"
             )
-        decoded_json_tasks = base64.urlsafe_b64decode(encoded_json_tasks).decode(
-            "utf-8"
-        )
-        event = json.loads(decoded_json_tasks)
+        if isinstance(encoded_tasks, str):
+            encoded_tasks = encoded_tasks.encode("utf-8")
+        event = decode_payload(encoded_tasks, legacy_b64decode=base64.urlsafe_b64decode)
     else:
         encoded_json_tasks = event["body"]
         decoded_json_tasks = base64.urlsafe_b64decode(encoded_json_tasks).decode(
@@ -176,10 +170,12 @@ def lambda_handler(event, context):
         )
         event = json.loads(decoded_json_tasks)
 
+    trace_span = None
     try:
-        invocation_tstmp = get_time_now_ms()
+        invocation_ns = wall_clock_ns()
 
-        print(event)
+        # Submissions can hold thousands of tasks, only their beginning is logged
+        print(truncated(event))
 
         # Session ID that will be used for all tasks in this event.
         if event["session_id"] == "None":
@@ -195,19 +191,32 @@ def lambda_handler(event, context):
 
         parent_session_id = event["session_id"]
 
+        # Child of the client span, parent of the spans of the agents
+        trace_span = tracer.start_span(
+            "submit_tasks",
+            event.get("trace_context"),
+            attributes={"session_id": session_id},
+            start_ms=invocation_ns // NS_PER_MS,
+        )
+
         lambda_response = {"session_id": session_id, "task_ids": []}
 
         sqs_batch_entries = []
         last_submitted_task_ref = None
 
         tasks_list = event["tasks_list"]["tasks"]
+        trace_span.set_attribute("tasks", len(tasks_list))
+        # Content keys of the inputs when the client deduplicates them, see content_key
+        input_refs = event["tasks_list"].get("input_refs")
         ddb_batch_write_times = []
         backoff_count = 0
 
         state_table_entries = []
-        for task_id in tasks_list:
+        for i, task_id in enumerate(tasks_list):
             time_now_ms = get_time_now_ms()
             task_definition = "none"
+            if input_refs:
+                task_definition = task_input_blob_ref(input_refs[i])
 
             task_json = {
                 "session_id": session_id,
@@ -231,12 +240,16 @@ def lambda_handler(event, context):
             task_json_4_sqs: dict = copy.deepcopy(task_json)
 
             task_json_4_sqs["stats"] = event["stats"]
-            task_json_4_sqs["stats"]["stage2_sbmtlmba_01_invocation_tstmp"][
-                "tstmp"
-            ] = invocation_tstmp
-            task_json_4_sqs["stats"]["stage2_sbmtlmba_02_before_batch_write_tstmp"][
-                "tstmp"
-            ] = get_time_now_ms()
+            mark_stage(
+                task_json_4_sqs["stats"],
+                "stage2_sbmtlmba_01_invocation_tstmp",
+                invocation_ns,
+            )
+            mark_stage(
+                task_json_4_sqs["stats"], "stage2_sbmtlmba_02_before_batch_write_tstmp"
+            )
+            if trace_span.recording:
+                task_json_4_sqs["trace_context"] = trace_span.traceparent()
 
             # task_json["scheduler_data"] = event["scheduler_data"]
 
@@ -273,10 +286,9 @@ def lambda_handler(event, context):
         )
         event_counter.increment("count_submitted_tasks", len(sqs_batch_entries))
 
-        last_submitted_task_ref["stats"]["stage2_sbmtlmba_03_invocation_over_tstmp"] = {
-            "label": "dynamo_db_submit_ms",
-            "tstmp": get_time_now_ms(),
-        }
+        mark_stage(
+            last_submitted_task_ref["stats"], "stage2_sbmtlmba_03_invocation_over_tstmp"
+        )
 
         event_counter.increment("count_ddb_batch_backoffs", backoff_count)
 
@@ -303,7 +315,7 @@ def lambda_handler(event, context):
             event_counter=event_counter,
             from_event="stage1_grid_api_01_task_creation_tstmp",
             to_event="stage2_sbmtlmba_03_invocation_over_tstmp",
-            # event_time=(datetime.datetime.fromtimestamp(invocation_tstmp/1000.0)).isoformat()
+            # event_time=(datetime.datetime.fromtimestamp(invocation_ns/1e9)).isoformat()
         )
         perf_tracker.submit_measurements()
 
@@ -318,6 +330,8 @@ def lambda_handler(event, context):
                 e.response["Error"]["Code"], traceback.format_exc()
             )
         )
+        if trace_span is not None:
+            trace_span.end(error=e)
 
         return {"statusCode": 543, "body": e.response["Error"]["Message"]}
 
@@ -325,8 +339,16 @@ def lambda_handler(event, context):
         errlog.log(
             "Exception in Submit Tasks {} [{}]".format(e, traceback.format_exc())
         )
+        if trace_span is not None:
+            trace_span.end(error=e)
 
         return {"statusCode": 543, "body": "{}".format(e)}
+    finally:
+        if trace_span is not None:
+            trace_span.end()
+        tracer.flush()
+        # The logging thread is frozen once the invocation returns
+        errlog.flush()
 
 
 # From 3.7, we can check if UUID is safe (i.e. unique even in case of mutliprocessing)
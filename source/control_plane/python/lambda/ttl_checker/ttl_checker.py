@@ -4,7 +4,6 @@
 
 import logging
 import boto3
-import time
 import os
 from datetime import datetime, timedelta
 
@@ -12,6 +11,7 @@ from botocore.exceptions import ClientError
 
 from utils.performance_tracker import EventsCounter, performance_tracker_initializer
 from utils import grid_error_logger as errlog
+from utils.stage_clock import mark_stage
 
 from utils.state_table_common import (
     TASK_STATE_RETRYING,
@@ -20,6 +20,10 @@ from utils.state_table_common import (
     StateTableException,
 )
 from api.queue_manager import queue_manager
+from api.queue_depth_provider import (
+    DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC,
+    QueueDepthProvider,
+)
 
 region = os.environ["REGION"]
 
@@ -54,6 +58,16 @@ dlq = queue_manager(
 
 cw_client = boto3.client("cloudwatch")
 
+# The provider lives with the Lambda execution environment, so warm invocations within
+# the cache TTL reuse the last depth sweep instead of querying every priority queue again.
+queue_depth_provider = QueueDepthProvider(
+    queue,
+    cache_ttl_sec=float(
+        os.environ.get("QUEUE_DEPTH_CACHE_TTL_SEC", DEFAULT_QUEUE_DEPTH_CACHE_TTL_SEC)
+    ),
+    cloudwatch_client=cw_client,
+)
+
 TTL_LAMBDA_ID = "TTL_LAMBDA"
 TTL_LAMBDA_TMP_STATE = TASK_STATE_RETRYING
 TTL_LAMBDA_FAILED_STATE = TASK_STATE_FAILED
@@ -77,18 +91,18 @@ def lambda_handler(event, context):
     Returns:
 
     """
-    stats_obj = {
-        "01_invocation_tstmp": {
-            "label": "None",
-            "tstmp": int(round(time.time() * 1000)),
-        }
-    }
+    stats_obj = {}
+    mark_stage(stats_obj, "01_invocation_tstmp")
     event_counter = EventsCounter(
         [
             "counter_expired_tasks",
             "counter_failed_tasks",
             "counter_retried_tasks",
-            "counter_retried_tasks_vto_reset_fail" "counter_tasks_queue_size",
+            "counter_retried_tasks_vto_reset_fail",
+            "counter_tasks_queue_size",
+            "counter_tasks_queue_in_flight",
+            "counter_tasks_queue_delayed",
+            "counter_tasks_queue_oldest_age_sec",
             "counter_skip_check_under_throttling",
         ]
     )
@@ -101,59 +115,60 @@ def lambda_handler(event, context):
         event_counter.increment("counter_skip_check_under_throttling", 1)
 
     else:
+        # Queue depth is read once per invocation rather than once per page of expired tasks.
+        queue_depth = queue_depth_provider.get_queue_depth()["total"]
+        event_counter.set("counter_tasks_queue_size", queue_depth["visible"])
+        event_counter.set("counter_tasks_queue_in_flight", queue_depth["in_flight"])
+        event_counter.set("counter_tasks_queue_delayed", queue_depth["delayed"])
+        if queue_depth["oldest_message_age_sec"] is not None:
+            event_counter.set(
+                "counter_tasks_queue_oldest_age_sec",
+                queue_depth["oldest_message_age_sec"],
+            )
+
         for expired_tasks in state_table.query_expired_tasks():
             event_counter.increment("counter_expired_tasks", len(expired_tasks))
-            event_counter.increment(
-                "counter_tasks_queue_size", queue.get_queue_length()
-            )
 
-            for item in expired_tasks:
-                print("Processing expired task: {}".format(item))
-                task_id = item.get("task_id")
-                owner_id = item.get("task_owner")
-
-                # retreive current number of retries and task message handler
-                (
-                    retries,
-                    task_sqs_handler_id,
-                    task_priority,
-                ) = retreive_retries_and_task_handler_and_priority(task_id)
-                print(
-                    f"Number of retires for task[{task_id}]: {retries} Priority: {task_priority}"
-                )
-                print(f"Last owner for task [{task_id}]: {owner_id}")
-
-                if retries == MAX_RETRIES:
-                    # TODO: MAX_RETRIES should be extracted from task definition... Store in DDB?
-                    print(f"Failing task {task_id} after {retries} retries")
-                    event_counter.increment("counter_failed_tasks")
-                    fail_task(task_id, task_sqs_handler_id, task_priority)
-                    continue
-
-                if do_retry_task(task_id, retries + 1):
-                    event_counter.increment("counter_retried_tasks")
-
-                    try:
-                        reset_task_msg_vto(task_sqs_handler_id, task_priority)
-                        print("SUCCESS FIX for {}".format(task_id))
-
-                    except ClientError as e:
-                        print(e.response)
-                        event_counter.increment("counter_retried_tasks_vto_reset_fail")
-                        logging.warning(
-                            "Could not reset VTO on a task that is being retried, continue..."
-                        )
-
-                    except Exception as e:
-                        errlog.log(
-                            f"TTL Lambda unexpected error during VTO reset: [{task_id}] [{e}]"
-                        )
-                        raise e
-
-    stats_obj["02_completion_tstmp"] = {
-        "label": "ttl_execution_time",
-        "tstmp": int(round(time.time() * 1000)),
-    }
+            # Queue updates are collected for the whole page of expired tasks and sent
+            # with the batch APIs of the task queue (one call per 10 messages). They are
+            # flushed even if a task of the page fails, so that the tasks already failed or
+            # set for retry do not keep their message in the queue.
+            msgs_to_delete = []
+            msgs_to_reset = []
+
+            try:
+                for item in expired_tasks:
+                    print("Processing expired task: {}".format(item))
+                    task_id = item.get("task_id")
+                    owner_id = item.get("task_owner")
+
+                    # retreive current number of retries and task message handler
+                    (
+                        retries,
+                        task_sqs_handler_id,
+                        task_priority,
+                    ) = retreive_retries_and_task_handler_and_priority(task_id)
+                    print(
+                        f"Number of retires for task[{task_id}]: {retries} Priority: {task_priority}"
+                    )
+                    print(f"Last owner for task [{task_id}]: {owner_id}")
+
+                    if retries == MAX_RETRIES:
+                        # TODO: MAX_RETRIES should be extracted from task definition... Store in DDB?
+                        print(f"Failing task {task_id} after {retries} retries")
+                        event_counter.increment("counter_failed_tasks")
+                        fail_task(task_id)
+                        msgs_to_delete.append((task_sqs_handler_id, task_priority))
+                        continue
+
+                    if do_retry_task(task_id, retries + 1):
+                        event_counter.increment("counter_retried_tasks")
+                        msgs_to_reset.append((task_sqs_handler_id, task_priority))
+
+            finally:
+                flush_queue_updates(msgs_to_delete, msgs_to_reset, event_counter)
+
+    mark_stage(stats_obj, "02_completion_tstmp")
     perf_tracker.add_metric_sample(
         stats_obj,
         event_counter=event_counter,
@@ -161,6 +176,8 @@ def lambda_handler(event, context):
         to_event="02_completion_tstmp",
     )
     perf_tracker.submit_measurements()
+    # The logging thread is frozen once the invocation returns
+    errlog.flush()
 
 
 def is_state_table_under_throttling():
@@ -231,13 +248,12 @@ def do_retry_task(task_id, new_retry_count):
         raise e
 
 
-def fail_task(task_id, task_sqs_handler_id, task_priority):
-    """This function set the task_status of task to fail
+def fail_task(task_id):
+    """This function set the task_status of task to fail. The task's message is removed
+    from the task queue separately, see delete_messages_from_queue.
 
     Args:
       task_id(str): the id of the task to update
-      task_sqs_handler_id(str): the task handler associated to this task
-      task_priority(int): the priority of the task.
 
     Returns:
       Nothing
@@ -247,8 +263,6 @@ def fail_task(task_id, task_sqs_handler_id, task_priority):
 
     """
     try:
-        delete_message_from_queue(task_sqs_handler_id, task_priority)
-
         state_table.update_task_status_to_failed(task_id)
 
     except ClientError as e:
@@ -256,26 +270,52 @@ def fail_task(task_id, task_sqs_handler_id, task_priority):
         raise e
 
 
-def delete_message_from_queue(task_sqs_handler_id, task_priority):
-    """This function delete the message from the task queue
+def flush_queue_updates(msgs_to_delete, msgs_to_reset, event_counter):
+    """Deletes the messages of the failed tasks and makes the messages of the retried tasks
+    re-appear in the tasks queue, in batches
 
     Args:
-      task_sqs_handler_id(str): the task handler associated of the message to be deleted
-      task_priority(int): priority of the task
+      msgs_to_delete(list): (task_sqs_handler_id, task_priority) tuples of the failed tasks
+      msgs_to_reset(list): (task_sqs_handler_id, task_priority) tuples of the retried tasks
+      event_counter(EventsCounter): counters of the invocation
 
     Returns:
-      Nothing
 
-    Raises:
-      ClientError: if task queue cannot be updated
+    """
+    if msgs_to_delete:
+        delete_messages_from_queue(msgs_to_delete)
+
+    if msgs_to_reset:
+        failed = reset_tasks_msg_vto(msgs_to_reset)
+        if failed:
+            event_counter.increment("counter_retried_tasks_vto_reset_fail", len(failed))
+            logging.warning(
+                f"Could not reset VTO on {len(failed)} tasks that are being retried, continue..."
+            )
+
+
+def delete_messages_from_queue(messages):
+    """This function deletes a batch of messages from the task queue
+
+    Args:
+      messages(list): (task_sqs_handler_id, task_priority) tuples of the messages to be deleted
+
+    Returns:
+      list: the entries that could not be deleted
 
     """
 
-    try:
-        queue.delete_message(task_sqs_handler_id, task_priority)
-    except ClientError as e:
-        errlog.log("Cannot delete message {} : {}".format(task_sqs_handler_id, e))
-        raise e
+    handler_ids, priorities = zip(*messages)
+    response = queue.delete_messages(list(handler_ids), list(priorities))
+
+    for failed in response["Failed"]:
+        errlog.log(
+            "Cannot delete message {} : {}".format(
+                failed["message_handle_id"], failed["message"]
+            )
+        )
+
+    return response["Failed"]
 
 
 def retreive_retries_and_task_handler_and_priority(task_id):
@@ -310,23 +350,31 @@ def retreive_retries_and_task_handler_and_priority(task_id):
         raise e
 
 
-def reset_task_msg_vto(handler_id, task_priority):
-    """Function makes message re-appear in the tasks queue.
+def reset_tasks_msg_vto(messages):
+    """Function makes a batch of messages re-appear in the tasks queue.
 
     Args:
-      handler_id: reference of the message/task.
-      task_priority: priority of the task. Identifies which queue to use (if applicable)
+      messages(list): (handler_id, task_priority) tuples, the priority identifies which
+        queue to use (if applicable)
 
-    Returns: Nothing
+    Returns:
+      list: the entries whose visibility could not be reset
 
     """
-    try:
-        visibility_timeout_sec = 0
-        queue.change_visibility(handler_id, visibility_timeout_sec, task_priority)
+    visibility_timeout_sec = 0
+    handler_ids, priorities = zip(*messages)
+    response = queue.change_visibility_batch(
+        list(handler_ids), visibility_timeout_sec, list(priorities)
+    )
 
-    except ClientError as e:
-        errlog.log("Cannot reset VTO for message {} : {}".format(handler_id, e))
-        raise e
+    for failed in response["Failed"]:
+        errlog.log(
+            "Cannot reset VTO for message {} : {}".format(
+                failed["message_handle_id"], failed["message"]
+            )
+        )
+
+    return response["Failed"]
 
 
 def send_to_dlq(item):